@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+'''
+Timing of the RPA screening and the quasiparticle equations of G0W0 for
+water clusters of increasing size.
+
+The full RPA diagonalization is compared to the Davidson solver which only
+keeps the lowest gw.nroots excitations in the screened interaction.
+'''
+
+import time
+from pyscf import gto, scf, gw
+
+water = [['O', ( 0.000, 0.000, 0.000)],
+         ['H', ( 0.000,-0.757, 0.587)],
+         ['H', ( 0.000, 0.757, 0.587)]]
+
+for nmol in (1, 2, 3):
+    atoms = []
+    for i in range(nmol):
+        atoms.extend([[s, (x+3.*i, y, z)] for s, (x, y, z) in water])
+    mol = gto.M(atom=atoms, basis='631g', verbose=0)
+    mf = scf.RHF(mol).run()
+
+    for nroots in (None, 50):
+        t0 = time.time()
+        mygw = gw.GW(mf)
+        mygw.nroots = nroots
+        t1 = time.time()
+        egw = mygw.kernel()
+        t2 = time.time()
+        print('nmol = %d  nroots = %-4s  integrals %8.2f s  GW %8.2f s  '
+              'HOMO %.6f' % (nmol, nroots, t1-t0, t2-t1,
+                             egw[mol.nelectron//2-1]))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Scaling of the point group detection for large clusters.
+
+The fcc clusters have small shells of equidistant atoms.  All atoms of the Ih
+clusters are on the same sphere, which is the worst case for the search of
+symmetry operations.
+'''
+
+import time
+import numpy
+from pyscf import lib
+from pyscf import symm
+
+def fcc_cluster(radius, u):
+    n = int(radius) + 1
+    g = numpy.arange(-n, n+1)
+    coords = lib.cartesian_prod((g, g, g))
+    coords = coords[coords.sum(axis=1) % 2 == 0]
+    coords = coords[numpy.einsum('ix,ix->i', coords, coords) <= radius**2]
+    return [['Cu', c] for c in numpy.dot(coords*1.8, u)]
+
+def ih_sphere(norbits, u):
+    # The 120 operations of Ih, generated by a C5, a C3 and the inversion
+    t = (1 + 5**.5) / 2
+    gens = [symm.rotation_mat((0, 1, t), numpy.pi*2/5),
+            symm.rotation_mat((1, 1, 1), numpy.pi*2/3)]
+    ops = [numpy.eye(3)]
+    for op in ops:
+        for g in gens:
+            op1 = numpy.dot(g, op)
+            if all(abs(op1-x).max() > 1e-8 for x in ops):
+                ops.append(op1)
+    ops = numpy.array(ops + [-x for x in ops])
+    points = numpy.random.random((norbits,3)) - .5
+    points *= 8 / numpy.linalg.norm(points, axis=1).reshape(-1,1)
+    coords = numpy.einsum('gxy,py->pgx', ops, points).reshape(-1,3)
+    return [['C', c] for c in numpy.dot(coords, u)]
+
+numpy.random.seed(1)
+u = numpy.linalg.svd(numpy.random.random((3,3)))[0]
+
+for radius in (4.1, 6.1, 8.1, 12.1, 16.1):
+    atoms = fcc_cluster(radius, u)
+    t0 = time.time()
+    gpname, orig, axes = symm.detect_symm(atoms)
+    print('fcc cluster  natm = %6d  %-4s  %8.3f s' %
+          (len(atoms), gpname, time.time()-t0))
+
+for norbits in (2, 5, 10, 20, 50, 100):
+    atoms = ih_sphere(norbits, u)
+    t0 = time.time()
+    gpname, orig, axes = symm.detect_symm(atoms)
+    print('Ih sphere    natm = %6d  %-4s  %8.3f s' %
+          (len(atoms), gpname, time.time()-t0))
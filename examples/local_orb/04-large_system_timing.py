@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+'''
+Timing of Boys and Pipek-Mezey localization for about 1000 occupied
+orbitals, and Edmiston-Ruedenberg localization for 300 occupied orbitals.
+
+The MO dipole integrals (Boys), the atomic population factors (Pipek-Mezey)
+and the MO density fitting integrals (Edmiston-Ruedenberg) are computed once
+and rotated in each iteration.  Set OMP_NUM_THREADS to control the number of
+threads of the Hessian-vector products.
+
+Edmiston-Ruedenberg localization holds the MO DF integrals (naux*nmo^2) and
+the orbital J/K tensors (2*nmo^3) in memory.  For 1000 orbitals of the water
+chain below, this is about 100 GB.  It is timed on a chain of 60 water
+molecules (naux ~ 3400, nmo = 300), which needs about 8 GB.
+'''
+
+import time
+import numpy
+from pyscf import gto, scf, lo
+
+# A chain of n water molecules, 5n doubly occupied orbitals
+def water_chain(n):
+    atoms = []
+    for i in range(n):
+        x = i * 3.0
+        atoms.append('O %f 0.      0.' % x)
+        atoms.append('H %f 0.757   0.587' % x)
+        atoms.append('H %f -0.757  0.587' % x)
+    return gto.M(atom=';'.join(atoms), basis='sto-3g', verbose=4,
+                 max_memory=16000)
+
+mol = water_chain(200)
+mf = scf.RHF(mol).density_fit().run()
+mo_occ = mf.mo_coeff[:,mf.mo_occ>0]
+print('Number of occupied orbitals %d' % mo_occ.shape[1])
+
+t0 = time.time()
+loc_orb = lo.Boys(mol, mo_occ).kernel()
+print('Boys localization  %.2f s' % (time.time() - t0))
+
+t0 = time.time()
+loc = lo.PM(mol, mo_occ)
+loc.init_guess = 'jacobi'
+loc_orb = loc.kernel()
+print('Pipek-Mezey localization  %.2f s' % (time.time() - t0))
+
+mol = water_chain(60)
+mf = scf.RHF(mol).density_fit().run()
+mo_occ = mf.mo_coeff[:,mf.mo_occ>0]
+print('Number of occupied orbitals %d' % mo_occ.shape[1])
+
+t0 = time.time()
+loc_orb = lo.ER(mol, mo_occ).density_fit().kernel()
+print('Edmiston-Ruedenberg localization (DF)  %.2f s' % (time.time() - t0))
@@ -264,14 +264,10 @@ class DMRGCI(pyscf.lib.StreamObject):
         # are written as E2[i1,j2,k2,l1] (right?)
         # and stored here as E2[i1,l1,j2,k2] (weird?)
         # This is NOT done with SQA in mind.
-        with open(os.path.join(self.scratchDirectory, "node0", file2pdm), "r") as f:
-            norb_read = int(f.readline().split()[0])
-            assert(norb_read == norb)
-
-            for line in f:
-                linesp = line.split()
-                i, k, l, j = [int(x) for x in linesp[:4]]
-                twopdm[i,j,k,l] = 2.0 * float(linesp[4])
+        idx, val = read_npdm_text(os.path.join(self.scratchDirectory, "node0",
+                                               file2pdm), norb, 2)
+        i, k, l, j = idx
+        twopdm[i,j,k,l] = 2.0 * val
 
         # (this is coherent with previous statement about indexes) (right?)
         onepdm = numpy.einsum('ikjj->ik', twopdm)
@@ -312,14 +308,10 @@ class DMRGCI(pyscf.lib.StreamObject):
         # are written as E2[i1,j2,k2,l1] (right?)
         # and stored here as E2[i1,l1,j2,k2] (weird?)
         # This is NOT done with SQA in mind.
-        with open(os.path.join(self.scratchDirectory, "node0", file2pdm), "r") as f:
-            norb_read = int(f.readline().split()[0])
-            assert(norb_read == norb)
-
-            for line in f:
-                linesp = line.split()
-                i, k, l, j = [int(x) for x in linesp[:4]]
-                twopdm[i,j,k,l] = 2.0 * float(linesp[4])
+        idx, val = read_npdm_text(os.path.join(self.scratchDirectory, "node0",
+                                               file2pdm), norb, 2)
+        i, k, l, j = idx
+        twopdm[i,j,k,l] = 2.0 * val
 
         # (this is coherent with previous statement about indexes) (right?)
         onepdm = numpy.einsum('ikjj->ik', twopdm)
@@ -352,14 +344,9 @@ class DMRGCI(pyscf.lib.StreamObject):
         # are written as E3[i1,j2,k3,l3,m2,n1]
         # and are also stored here as E3[i1,j2,k3,l3,m2,n1]
         # This is NOT done with SQA in mind.
-        with open(os.path.join(self.scratchDirectory, "node0", file3pdm), "r") as f:
-            norb_read = int(f.readline().split()[0])
-            assert(norb_read == norb)
-
-            for line in f:
-                linesp = line.split()
-                i, j, k, l, m, n = [int(x) for x in linesp[:6]]
-                threepdm[i,j,k,l,m,n] = float(linesp[6])
+        idx, val = read_npdm_text(os.path.join(self.scratchDirectory, "node0",
+                                               file3pdm), norb, 3)
+        threepdm[tuple(idx)] = val
 
         # (this is coherent with previous statement about indexes)
         twopdm = numpy.einsum('ijkklm->ijlm',threepdm)
@@ -419,8 +406,8 @@ class DMRGCI(pyscf.lib.StreamObject):
               print 'Reading binary 3RDM from STACKBLOCK'
               fnameout = os.path.join(self.scratchDirectory,"node0", "spatial_threepdm.%d.%d.bin.unpack" %(state, state))
               libunpack.unpackE3(ctypes.c_char_p(fname), ctypes.c_char_p(fnameout), ctypes.c_int(norb))
-              E3 = numpy.fromfile(fnameout, dtype=numpy.dtype('Float64'))
-              E3 = numpy.reshape(E3, (norb, norb, norb, norb, norb, norb), order='F')
+              E3 = numpy.memmap(fnameout, dtype=numpy.double, mode='r',
+                                shape=(norb,)*6, order='F')
             else:
               print 'Reading binary 3RDM from BLOCK'
               E3 = DMRGCI.unpackE3_BLOCK(self,fname,norb)
@@ -432,24 +419,9 @@ class DMRGCI(pyscf.lib.StreamObject):
         else:
             print 'Reading text-file 3RDM'
             fname = os.path.join(self.scratchDirectory,"node0", "spatial_threepdm.%d.%d.txt" %(state, state))
-            f = open(fname, 'r')
-            lines = f.readlines()
             E3 = numpy.zeros(shape=(norb, norb, norb, norb, norb, norb), dtype=dt, order='F')
-            assert(int(lines[0])==norb)
-            for line in lines[1:]:
-              linesp = line.split()
-              if (len(linesp) != 7) :
-                  continue
-              a, b, c, d, e, f, integral = int(linesp[0]), int(linesp[1]), int(linesp[2]), int(linesp[3]), int(linesp[4]), int(linesp[5]), float(linesp[6])
-              if (False):
-                E3[a,b,c, f,e,d] = integral
-                E3[a,c,b, f,d,e] = integral
-                E3[b,a,c, e,f,d] = integral
-                E3[b,c,a, e,d,f] = integral
-                E3[c,a,b, d,f,e] = integral
-                E3[c,b,a, d,e,f] = integral
-              else:
-                self.populate(E3, [a,b,c,  f,e,d], integral)
+            idx, integral = read_npdm_text(fname, norb, 3)
+            self.populate(E3, idx[[0,1,2, 5,4,3]], integral)
         print ''
         return E3
 
@@ -489,8 +461,8 @@ class DMRGCI(pyscf.lib.StreamObject):
               print 'Reading binary 4RDM from STACKBLOCK'
               fnameout = os.path.join(self.scratchDirectory,"node0", "spatial_fourpdm.%d.%d.bin.unpack" %(state, state))
               libunpack.unpackE4(ctypes.c_char_p(fname), ctypes.c_char_p(fnameout), ctypes.c_int(norb))
-              E4 = numpy.fromfile(fnameout, dtype=numpy.dtype('Float64'))
-              E4 = numpy.reshape(E4, (norb, norb, norb, norb, norb, norb, norb, norb), order='F')
+              E4 = numpy.memmap(fnameout, dtype=numpy.double, mode='r',
+                                shape=(norb,)*8, order='F')
             else:
               print 'Reading binary 4RDM from BLOCK'
               E4 = DMRGCI.unpackE4_BLOCK(self,fname,norb)
@@ -502,37 +474,18 @@ class DMRGCI(pyscf.lib.StreamObject):
         else:
             print 'Reading text-file 4RDM'
             fname = os.path.join(self.scratchDirectory,"node0", "spatial_fourpdm.%d.%d.txt" %(state, state))
-            f = open(fname, 'r')
-            lines = f.readlines()
             E4 = numpy.zeros(shape=(norb, norb, norb, norb, norb, norb, norb, norb), dtype=dt, order='F')
-            assert(int(lines[0])==norb)
-            for line in lines[1:]:
-              linesp = line.split()
-              if (len(linesp) != 9) :
-                  continue
-              a, b, c, d, e, f, g, h, integral = int(linesp[0]), int(linesp[1]), int(linesp[2]), int(linesp[3]), int(linesp[4]), int(linesp[5]), int(linesp[6]), int(linesp[7]), float(linesp[8])
-              if (False):
-                up_indexes=[a,b,c,d]
-                dn_indexes=[h,g,f,e]
-                for i in range(4):
-                  for j in range(4):
-                    if (i==j):
-                      continue
-                    for k in range(4):
-                      if ((i==k)or(j==k)):
-                        continue
-                      for l in range(4):
-                        if ((i==l)or(j==l)or(k==l)):
-                          continue
-                        E4[up_indexes[i],up_indexes[j],up_indexes[k],up_indexes[l],\
-                           dn_indexes[i],dn_indexes[j],dn_indexes[k],dn_indexes[l]] = integral
-              else:
-                self.populate(E4, [a,b,c,d,  h,g,f,e], integral)
+            idx, integral = read_npdm_text(fname, norb, 4)
+            self.populate(E4, idx[[0,1,2,3, 7,6,5,4]], integral)
         print ''
         return E4
 
     def populate(self, array, list, value):
-        dim=len(list)/2
+        '''Assign value to the elements of array which are related to the
+        element "list" by the simultaneous permutations of the creation and
+        the annihilation indices.  "list" can be a (2N,nelem) index array and
+        value an array of nelem elements.'''
+        dim=len(list)//2
         up=list[:dim]
         dn=list[dim:]
         import itertools
@@ -545,40 +498,16 @@ class DMRGCI(pyscf.lib.StreamObject):
         # are written as E3[i1,j2,k3,l3,m2,n1]
         # and are stored here as E3[i1,j2,k3,n1,m2,l3]
         # This is done with SQA in mind.
-        E3=numpy.zeros((norb,norb,norb,norb,norb,norb), order='F')
-        fil=open(fname,"rb")
-        fil.seek(93)
-        for a in range(norb):
-          for b in range(norb):
-            for c in range(norb):
-              for d in range(norb):
-                for e in range(norb):
-                  for f in range(norb):
-                    (value,)=struct.unpack('d',fil.read(8))
-                    E3[a,b,c,  f,e,d]=value
-        fil.close()
-        return E3
+        # The returned array is a read-only view of the memory-mapped file.
+        return read_npdm_binary(fname, norb, 3)
 
     def unpackE4_BLOCK(self,fname,norb):
         # The 4RDMs written by "Fourpdm_container::save_spatial_npdm_binary" in BLOCK
         # are written as E4[i1,j2,k3,l4,m4,n3,o2,p1]
         # and are stored here as E4[i1,j2,k3,l4,p1,o2,n3,m4]
         # This is done with SQA in mind.
-        E4=numpy.zeros((norb,norb,norb,norb,norb,norb,norb,norb), order='F')
-        fil=open(fname,"rb")
-        fil.seek(109)
-        for a in range(norb):
-          for b in range(norb):
-            for c in range(norb):
-              for d in range(norb):
-                for e in range(norb):
-                  for f in range(norb):
-                    for g in range(norb):
-                      for h in range(norb):
-                        (value,)=struct.unpack('d',fil.read(8))
-                        E4[a,b,c,d,  h,g,f,e]=value
-        fil.close()
-        return E4
+        # The returned array is a read-only view of the memory-mapped file.
+        return read_npdm_binary(fname, norb, 4)
 
     def clearSchedule(self):
         self.scheduleSweeps = []
@@ -603,14 +532,9 @@ class DMRGCI(pyscf.lib.StreamObject):
 
         a16 = numpy.zeros( (norb, norb, norb, norb, norb, norb) )
         filename = "%s_matrix.%d.%d.txt" % (tag, state, state)
-        with open(os.path.join(self.scratchDirectory, "node0", filename), "r") as f:
-            norb_read = int(f.readline().split()[0])
-            assert(norb_read == norb)
-
-            for line in f:
-                linesp = line.split()
-                i, j, k, l, m, n = [int(x) for x in linesp[:6]]
-                a16[i,j,k,l,m,n] = float(linesp[6])
+        idx, val = read_npdm_text(os.path.join(self.scratchDirectory, "node0",
+                                               filename), norb, 3)
+        a16[tuple(idx)] = val
 
         return a16
 
@@ -853,6 +777,43 @@ def readEnergy(DMRGCI):
     else:
         return numpy.asarray(calc_e)
 
+# Size (in bytes) of the header of the binary spatial N-PDM files written by
+# "Npdm_container::save_spatial_npdm_binary" in BLOCK
+NPDM_BINARY_HEADER = {3: 93, 4: 109}
+
+def read_npdm_binary(fname, norb, nparticle, offset=None):
+    '''Memory-map the binary spatial N-PDM file written by BLOCK.
+
+    The file holds all elements of E[i1,j2,...,kN,lN,...,n1] (the annihilation
+    indices are in the reversed order).  The returned array is a read-only
+    view of the file in the order E[i1,j2,...,kN,n1,...,lN] (SQA order).  No
+    data are read until the elements are accessed.  The blocks of the N-PDM,
+    eg E[p0:p1], can be loaded and contracted one at a time without holding
+    the entire tensor in memory.
+    '''
+    if offset is None:
+        offset = NPDM_BINARY_HEADER[nparticle]
+    raw = numpy.memmap(fname, dtype=numpy.double, mode='r', offset=offset,
+                       shape=(norb,)*(nparticle*2))
+    axes = list(range(nparticle)) + list(range(nparticle*2-1, nparticle-1, -1))
+    return raw.transpose(axes)
+
+def read_npdm_text(fname, norb, nparticle):
+    '''Read the spatial N-PDM text file written by BLOCK.
+
+    Returns:
+        idx : (nparticle*2, nelem) int array.  The indices of each element in
+            the order of the file.
+        val : (nelem,) array
+    '''
+    ncol = nparticle * 2 + 1
+    with open(fname, 'r') as f:
+        norb_read = int(f.readline().split()[0])
+        assert(norb_read == norb)
+        dat = [x for x in (line.split() for line in f) if len(x) == ncol]
+    dat = numpy.asarray(dat, dtype=numpy.double).reshape(-1,ncol)
+    return dat[:,:-1].T.astype(int), dat[:,-1]
+
 
 def DMRGSCF(mf, norb, nelec, maxM=1000, tol=1.e-8, *args, **kwargs):
     '''Shortcut function to setup CASSCF using the DMRG solver.  The DMRG
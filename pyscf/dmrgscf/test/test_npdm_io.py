@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import unittest
+import itertools
+import tempfile
+import numpy
+from pyscf.dmrgscf import dmrgci
+
+def write_npdm_binary(fname, dat, header_size):
+    with open(fname, 'wb') as f:
+        f.write(b'\0' * header_size)
+        dat.tofile(f)
+
+def write_npdm_text(fname, norb, idx, val):
+    with open(fname, 'w') as f:
+        f.write('%d\n' % norb)
+        for i, v in zip(idx.T, val):
+            f.write(' '.join(['%d' % x for x in i]) + ' %.16g\n' % v)
+
+class KnowValues(unittest.TestCase):
+    def test_read_npdm_binary(self):
+        norb = 3
+        ftmp = tempfile.NamedTemporaryFile()
+        dat = numpy.random.random((norb,)*6)
+        write_npdm_binary(ftmp.name, dat, 93)
+        ref = numpy.zeros_like(dat)
+        for a, b, c, d, e, f in itertools.product(range(norb), repeat=6):
+            ref[a,b,c, f,e,d] = dat[a,b,c,d,e,f]
+        e3 = dmrgci.read_npdm_binary(ftmp.name, norb, 3)
+        self.assertAlmostEqual(abs(e3 - ref).max(), 0, 14)
+
+        dat = numpy.random.random((norb,)*8)
+        write_npdm_binary(ftmp.name, dat, 109)
+        ref = numpy.zeros_like(dat)
+        for a, b, c, d, e, f, g, h in itertools.product(range(norb), repeat=8):
+            ref[a,b,c,d, h,g,f,e] = dat[a,b,c,d,e,f,g,h]
+        e4 = dmrgci.read_npdm_binary(ftmp.name, norb, 4)
+        self.assertAlmostEqual(abs(e4 - ref).max(), 0, 14)
+        self.assertAlmostEqual(abs(e4[1:3] - ref[1:3]).max(), 0, 14)
+
+    def test_read_npdm_text(self):
+        norb = 4
+        ftmp = tempfile.NamedTemporaryFile()
+        idx = numpy.random.randint(norb, size=(6,20))
+        val = numpy.random.random(20)
+        write_npdm_text(ftmp.name, norb, idx, val)
+        idx1, val1 = dmrgci.read_npdm_text(ftmp.name, norb, 3)
+        self.assertTrue(numpy.all(idx1 == idx))
+        self.assertAlmostEqual(abs(val1 - val).max(), 0, 14)
+
+        # Unique elements so that the order of assignments does not matter
+        idx = numpy.array([[0,1,2,3,2,1], [1,1,3,0,0,2]]).T
+        val = numpy.array([.5, .25])
+        e3 = numpy.zeros((norb,)*6)
+        dmrgci.DMRGCI.populate(None, e3, idx[[0,1,2,5,4,3]], val)
+        ref = numpy.zeros((norb,)*6)
+        for (a,b,c,d,e,f), v in zip(idx.T, val):
+            for t in itertools.permutations(range(3)):
+                up = [(a,b,c)[i] for i in t]
+                dn = [(f,e,d)[i] for i in t]
+                ref[tuple(up+dn)] = v
+        self.assertAlmostEqual(abs(e3 - ref).max(), 0, 14)
+
+if __name__ == "__main__":
+    print("Full Tests for reading N-PDM files of Block")
+    unittest.main()
@@ -16,7 +16,10 @@ Simple usage::
     >>> e = fci.select_ci.kernel(h1, h2, mf.mo_coeff.shape[1], mol.nelectron)[0]
 '''
 
+import time
 import ctypes
+import tempfile
+from multiprocessing.pool import ThreadPool
 import numpy
 from pyscf import lib
 from pyscf.lib import logger
@@ -284,6 +287,357 @@ def make_hdiag(h1e, eri, ci_strs, norb, nelec):
                              occslstb.ctypes.data_as(ctypes.c_void_p))
     return hdiag
 
+def _str_masks(orbs, nset):
+    '''Bit masks of the orbitals in uint64 words.  Orbital p is the bit p%64
+    of the word nset-1-p//64, following hci.toggle_bit.'''
+    orbs = numpy.asarray(orbs)
+    masks = numpy.zeros(orbs.shape+(nset,), dtype=numpy.uint64)
+    for k in range(nset):
+        sel = orbs // 64 == nset-1-k
+        masks[sel,k] = numpy.left_shift(numpy.uint64(1),
+                                        (orbs[sel] % 64).astype(numpy.uint64))
+    return masks
+
+def _occ_mask(strs, norb):
+    '''Occupancy (n,norb) of the strings (n,nset) of uint64 words'''
+    n, nset = strs.shape
+    bits = numpy.arange(64, dtype=numpy.uint64)
+    occ = numpy.empty((n,nset*64), dtype=bool)
+    for k in range(nset):
+        g = nset - 1 - k
+        occ[:,g*64:(g+1)*64] = (strs[:,k,None] >> bits) & numpy.uint64(1)
+    return occ[:,:norb]
+
+def _expand(starts, counts):
+    '''The owner k and the index starts[k]+t (0 <= t < counts[k]) for all
+    elements of the segments'''
+    owner = numpy.repeat(numpy.arange(len(counts)), counts)
+    offsets = numpy.cumsum(counts) - counts
+    idx = numpy.arange(owner.size) - offsets[owner] + starts[owner]
+    return owner, idx
+
+def _spin_excitations(h1e, eri, strs, norb, nelec, lookup, max_memory):
+    '''Single and double excitations which connect the strings of one spin.
+
+    Args:
+        strs : (n,nset) uint64 array
+        lookup : function
+            Maps the strings to their indices in strs, -1 if not found.
+
+    Returns:
+        singles : (src, dst, i, a, sign, f) for the strings dst = E_{ai} src.
+            f = h1e[a,i] + sum_k (ai|kk) - (ak|ki) of the occupied orbitals k
+            of the same spin.  Sorted by src.
+        doubles : (src, dst, v), v is the Hamiltonian matrix element between
+            the strings which differ by two orbitals.  Sorted by src.
+    '''
+    n, nset = strs.shape
+    nvir = norb - nelec
+    occ = _occ_mask(strs, norb)
+    occlst = numpy.where(occ)[1].reshape(n,nelec)
+    virlst = numpy.where(~occ)[1].reshape(n,nvir)
+    cnt = numpy.cumsum(occ, axis=1, dtype=numpy.int32)
+    masks = _str_masks(numpy.arange(norb), nset)
+    def between(src, p, q):
+        lo = numpy.minimum(p, q)
+        hi = numpy.maximum(p, q)
+        return cnt[src,hi-1] - cnt[src,lo]
+
+    oi, oj = numpy.triu_indices(nelec, 1)
+    va, vb = numpy.triu_indices(nvir, 1)
+    ncand = max(1, nelec * nvir + len(oi) * len(va))
+    blksize = max(1, int(max_memory*1e6/8/(ncand*(nset+8))))
+    singles = []
+    doubles = []
+    for s0, s1 in lib.prange(0, n, blksize):
+        occ_blk = occlst[s0:s1]
+        vir_blk = virlst[s0:s1]
+        i = numpy.repeat(occ_blk, nvir, axis=1)
+        a = numpy.tile(vir_blk, (1,nelec))
+        keys = strs[s0:s1,None] ^ masks[i] ^ masks[a]
+        dst = lookup(keys.reshape(-1,nset)).reshape(i.shape)
+        r, c = numpy.where(dst >= 0)
+        i = i[r,c]
+        a = a[r,c]
+        src = r + s0
+        sign = 1 - 2 * (between(src, i, a) % 2)
+        k = occlst[src]
+        f = h1e[a,i] + (eri[a[:,None],i[:,None],k,k] -
+                        eri[a[:,None],k,k,i[:,None]]).sum(axis=1)
+        singles.append((src, dst[r,c], i, a, sign, f))
+
+        if len(oi) > 0 and len(va) > 0:
+            i = occ_blk[:,oi]
+            j = occ_blk[:,oj]
+            a = vir_blk[:,va]
+            b = vir_blk[:,vb]
+            keys = (strs[s0:s1,None,None] ^ (masks[i] ^ masks[j])[:,:,None] ^
+                    (masks[a] ^ masks[b])[:,None,:])
+            dst = lookup(keys.reshape(-1,nset)).reshape(s1-s0,len(oi),len(va))
+            r, po, pv = numpy.where(dst >= 0)
+            dst = dst[r,po,pv]
+            i = i[r,po]
+            j = j[r,po]
+            a = a[r,pv]
+            b = b[r,pv]
+            src = r + s0
+            # E_{bj} E_{ai} src, the sign of E_{bj} is counted in the
+            # intermediate string E_{ai} src
+            lo = numpy.minimum(j, b)
+            hi = numpy.maximum(j, b)
+            nperm = (between(src, i, a) + between(src, j, b) -
+                     ((lo < i) & (i < hi)) + ((lo < a) & (a < hi)))
+            v = (1 - 2 * (nperm % 2)) * (eri[a,i,b,j] - eri[a,j,b,i])
+            doubles.append((src, dst, v))
+
+    singles = [numpy.hstack(x) for x in zip(*singles)]
+    if doubles:
+        doubles = [numpy.hstack(x) for x in zip(*doubles)]
+    else:
+        doubles = [numpy.zeros(0, dtype=int)] * 2 + [numpy.zeros(0)]
+    return singles, doubles
+
+def _make_sparse_h(h1e, eri, norb, nelec, strsa, lookupa, strsb, lookupb,
+                   addra, addrb, lookup_det, hdiag, max_memory, log):
+    '''Off-diagonal Hamiltonian matrix elements between the determinants
+    (strsa[addra[I]], strsb[addrb[I]]) in CSR format.
+
+    lookup_det maps the pairs of the alpha and beta string indices to the
+    determinant indices, -1 for the determinants not in the space.
+    '''
+    t0 = (time.clock(), time.time())
+    eri = ao2mo.restore(1, eri, norb)
+    h1e = numpy.asarray(h1e)
+    ndet = len(addra)
+    mem_now = lib.current_memory()[0]
+    max_memory = max(400, max_memory-mem_now)
+    singlesa, doublesa = _spin_excitations(h1e, eri, strsa, norb, nelec[0],
+                                           lookupa, max_memory*.2)
+    singlesb, doublesb = _spin_excitations(h1e, eri, strsb, norb, nelec[1],
+                                           lookupb, max_memory*.2)
+    t0 = log.timer_debug1('string excitations', *t0)
+
+    def seg(src, nstr):
+        count = numpy.bincount(src, minlength=nstr)
+        return numpy.cumsum(count) - count, count
+    sa_start, sa_count = seg(singlesa[0], len(strsa))
+    sb_start, sb_count = seg(singlesb[0], len(strsb))
+    da_start, da_count = seg(doublesa[0], len(strsa))
+    db_start, db_count = seg(doublesb[0], len(strsb))
+    occlsta = numpy.where(_occ_mask(strsa, norb))[1].reshape(-1,nelec[0])
+    occlstb = numpy.where(_occ_mask(strsb, norb))[1].reshape(-1,nelec[1])
+    eri_aikk = numpy.einsum('aikk->aik', eri)
+
+    def singles_x(singles, start, count, addr_s, addr_o, occlst_o):
+        owner, k = _expand(start[addr_s], count[addr_s])
+        src, dst, i, a, sign, f = [x[k] for x in singles]
+        vj = eri_aikk[a[:,None],i[:,None],occlst_o[addr_o[owner]]].sum(axis=1)
+        return owner, dst, addr_o[owner], sign * (f + vj)
+
+    cand = (sa_count[addra] + da_count[addra] + sb_count[addrb] +
+            db_count[addrb] + sa_count[addra] * sb_count[addrb])
+    cand_cum = numpy.cumsum(cand)
+    blk_cand = max(1024, int(max_memory*.4e6/8/(12+max(nelec))))
+
+    dtype = numpy.int32 if ndet < 2**31 else numpy.int64
+    indptr = numpy.zeros(ndet+1, dtype=numpy.int64)
+    writer = _CSRWriter(dtype, max_memory*.4)
+    r0 = 0
+    while r0 < ndet:
+        cum0 = cand_cum[r0-1] if r0 > 0 else 0
+        r1 = max(r0+1, int(numpy.searchsorted(cand_cum, cum0+blk_cand, 'right')))
+        r1 = min(r1, ndet)
+        ua = addra[r0:r1]
+        ub = addrb[r0:r1]
+        rows = []
+        cols = []
+        vals = []
+        # alpha -> alpha
+        owner, dst, ub1, v = singles_x(singlesa, sa_start, sa_count, ua, ub, occlstb)
+        rows.append(owner)
+        cols.append(lookup_det(dst, ub1))
+        vals.append(v)
+        # beta -> beta
+        owner, dst, ua1, v = singles_x(singlesb, sb_start, sb_count, ub, ua, occlsta)
+        rows.append(owner)
+        cols.append(lookup_det(ua1, dst))
+        vals.append(v)
+        # alpha,alpha -> alpha,alpha
+        owner, k = _expand(da_start[ua], da_count[ua])
+        rows.append(owner)
+        cols.append(lookup_det(doublesa[1][k], ub[owner]))
+        vals.append(doublesa[2][k])
+        # beta,beta -> beta,beta
+        owner, k = _expand(db_start[ub], db_count[ub])
+        rows.append(owner)
+        cols.append(lookup_det(ua[owner], doublesb[1][k]))
+        vals.append(doublesb[2][k])
+        # alpha,beta -> alpha,beta
+        nb = sb_count[ub]
+        owner, t = _expand(numpy.zeros_like(nb), sa_count[ua] * nb)
+        ka = sa_start[ua[owner]] + t // nb[owner]
+        kb = sb_start[ub[owner]] + t % nb[owner]
+        rows.append(owner)
+        cols.append(lookup_det(singlesa[1][ka], singlesb[1][kb]))
+        vals.append(singlesa[4][ka] * singlesb[4][kb] *
+                    eri[singlesa[3][ka],singlesa[2][ka],
+                        singlesb[3][kb],singlesb[2][kb]])
+
+        rows = numpy.hstack(rows)
+        cols = numpy.hstack(cols)
+        vals = numpy.hstack(vals)
+        mask = cols >= 0
+        rows = rows[mask]
+        order = numpy.argsort(rows, kind='mergesort')
+        indptr[r0+1:r1+1] = numpy.cumsum(numpy.bincount(rows, minlength=r1-r0))
+        indptr[r0+1:r1+1] += indptr[r0]
+        writer.append(cols[mask][order], vals[mask][order])
+        r0 = r1
+
+    indices, data, tmpfiles = writer.finalize()
+    log.timer('sparse Hamiltonian (%d non-zeros)' % indptr[-1], *t0)
+    return SparseHamiltonian(hdiag, indptr, indices, data, tmpfiles)
+
+class _CSRWriter(object):
+    '''Collect the column indices and the matrix elements of a CSR matrix in
+    memory.  When they exceed max_memory (MB), they are moved to temporary
+    files, which are memory-mapped at the end.'''
+    def __init__(self, dtype, max_memory):
+        self.dtype = dtype
+        self.max_memory = max_memory
+        self.nnz = 0
+        self.indices = []
+        self.data = []
+        self.ftmp = None
+
+    def append(self, indices, data):
+        self.nnz += len(indices)
+        if (self.ftmp is None and
+            self.nnz*(8+numpy.dtype(self.dtype).itemsize) > self.max_memory*1e6):
+            self.ftmp = (tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR),
+                         tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR))
+            for idx, dat in zip(self.indices, self.data):
+                idx.tofile(self.ftmp[0].file)
+                dat.tofile(self.ftmp[1].file)
+            self.indices = self.data = None
+        if self.ftmp is None:
+            self.indices.append(numpy.asarray(indices, dtype=self.dtype))
+            self.data.append(numpy.asarray(data, dtype=numpy.double))
+        else:
+            numpy.asarray(indices, dtype=self.dtype).tofile(self.ftmp[0].file)
+            numpy.asarray(data, dtype=numpy.double).tofile(self.ftmp[1].file)
+
+    def finalize(self):
+        if self.ftmp is None:
+            indices = numpy.hstack(self.indices + [numpy.zeros(0, self.dtype)])
+            data = numpy.hstack(self.data + [numpy.zeros(0)])
+            return indices, data, ()
+        for f in self.ftmp:
+            f.file.flush()
+        indices = numpy.memmap(self.ftmp[0].name, dtype=self.dtype, mode='r',
+                               shape=(self.nnz,))
+        data = numpy.memmap(self.ftmp[1].name, dtype=numpy.double, mode='r',
+                            shape=(self.nnz,))
+        return indices, data, self.ftmp
+
+class SparseHamiltonian(object):
+    '''Selected-CI Hamiltonian.  The diagonal hdiag and the off-diagonal
+    matrix elements in CSR format (indptr, indices, data).  indices and data
+    may be memory-mapped temporary files.
+
+    The object is callable, H(c) = H*c.  :meth:`dot` evaluates H*c for
+    several vectors in one pass over the matrix, in parallel threads.
+    '''
+    def __init__(self, hdiag, indptr, indices, data, tmpfiles=()):
+        self.hdiag = numpy.asarray(hdiag)
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self._tmpfiles = tmpfiles
+        # Split rows into chunks of about the same number of non-zeros
+        nnz = indptr[-1]
+        nchunks = max(lib.num_threads(), nnz // (1<<20)) + 1
+        bounds = numpy.searchsorted(indptr, numpy.linspace(0, nnz, nchunks))
+        bounds[-1] = len(indptr) - 1
+        self._chunks = [(int(r0), int(r1)) for r0, r1 in zip(bounds[:-1], bounds[1:])
+                        if r1 > r0]
+
+    @property
+    def nnz(self):
+        return int(self.indptr[-1])
+
+    def __call__(self, civec):
+        return self.dot(civec)
+
+    def dot(self, civecs):
+        '''H*c for a vector or a list of vectors'''
+        is_list = isinstance(civecs, (tuple, list))
+        x = numpy.asarray(civecs).reshape(-1,self.hdiag.size)
+        hx = x * self.hdiag
+
+        def contract(rows):
+            r0, r1 = rows
+            p0, p1 = self.indptr[r0], self.indptr[r1]
+            if p1 == p0:
+                return
+            count = numpy.diff(self.indptr[r0:r1+1])
+            nz = numpy.where(count > 0)[0]
+            v = numpy.asarray(self.data[p0:p1]) * x[:,self.indices[p0:p1]]
+            hx[:,r0+nz] += numpy.add.reduceat(v, self.indptr[r0+nz]-p0, axis=1)
+
+        nthreads = min(lib.num_threads(), len(self._chunks))
+        if nthreads > 1:
+            pool = ThreadPool(nthreads)
+            try:
+                pool.map(contract, self._chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for rows in self._chunks:
+                contract(rows)
+
+        if is_list:
+            return list(hx)
+        else:
+            return hx.reshape(numpy.shape(civecs))
+
+def make_sparse_h(h1e, eri, ci_strs, norb, nelec, hdiag=None,
+                  max_memory=lib.param.MAX_MEMORY, verbose=logger.NOTE):
+    '''Hamiltonian of the selected-CI space ci_strs in sparse format.
+
+    The matrix elements are computed once.  When they do not fit in
+    max_memory, they are stored in memory-mapped temporary files.
+
+    Returns:
+        A :class:`SparseHamiltonian` object
+    '''
+    log = logger.new_logger(None, verbose)
+    ci_coeff, nelec, ci_strs = _unpack(None, nelec, ci_strs)
+    if hdiag is None:
+        hdiag = make_hdiag(h1e, eri, ci_strs, norb, nelec)
+    na = len(ci_strs[0])
+    nb = len(ci_strs[1])
+    strsa = ci_strs[0].astype(numpy.uint64).reshape(-1,1)
+    strsb = ci_strs[1].astype(numpy.uint64).reshape(-1,1)
+    addra = numpy.repeat(numpy.arange(na), nb)
+    addrb = numpy.tile(numpy.arange(nb), na)
+    lookup_det = lambda ia, ib: ia * nb + ib
+    return _make_sparse_h(h1e, eri, norb, nelec,
+                          strsa, _strs_lookup(strsa[:,0]),
+                          strsb, _strs_lookup(strsb[:,0]),
+                          addra, addrb, lookup_det, hdiag, max_memory, log)
+
+def _strs_lookup(strs):
+    order = numpy.argsort(strs)
+    sorted_strs = strs[order]
+    def lookup(keys):
+        keys = keys.ravel()
+        pos = numpy.searchsorted(sorted_strs, keys)
+        pos[pos == len(strs)] = 0
+        return numpy.where(sorted_strs[pos] == keys, order[pos], -1)
+    return lookup
+
 def kernel_fixed_space(myci, h1e, eri, norb, nelec, ci_strs, ci0=None,
                        tol=None, lindep=None, max_cycle=None, max_space=None,
                        nroots=None, davidson_only=None,
@@ -321,9 +675,12 @@ def kernel_fixed_space(myci, h1e, eri, norb, nelec, ci_strs, ci0=None,
     else:
         ci0 = myci.get_init_guess(ci_strs, norb, nelec, nroots, hdiag)
 
-    def hop(c):
-        hc = myci.contract_2e(h2e, _as_SCIvector(c, ci_strs), norb, nelec, link_index)
-        return hc.reshape(-1)
+    if myci.cache_hamiltonian:
+        hop = make_sparse_h(h1e, eri, ci_strs, norb, nelec, hdiag, max_memory, log)
+    else:
+        def hop(c):
+            hc = myci.contract_2e(h2e, _as_SCIvector(c, ci_strs), norb, nelec, link_index)
+            return hc.reshape(-1)
     precond = lambda x, e, *args: x/(hdiag-e+1e-4)
 
     #e, c = lib.davidson(hop, ci0, precond, tol=myci.conv_tol)
@@ -437,6 +794,8 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
     ci0 = [c.ravel() for c in ci0]
     link_index = _all_linkstr_index(ci_strs, norb, nelec)
     hdiag = myci.make_hdiag(h1e, eri, ci_strs, norb, nelec)
+    if myci.cache_hamiltonian:
+        hop = make_sparse_h(h1e, eri, ci_strs, norb, nelec, hdiag, max_memory, log)
     e, c = myci.eig(hop, ci0, precond, tol=tol, lindep=lindep,
                     max_cycle=max_cycle, max_space=max_space, nroots=nroots,
                     max_memory=max_memory, verbose=log, **kwargs)
@@ -451,6 +810,58 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
         log.info('Selected CI  E = %.15g', e+ecore)
         return e+ecore, _as_SCIvector(c.reshape(na,nb), ci_strs)
 
+def enpt2(myci, h1e, eri, civec_strs, norb, nelec, e0=None, verbose=None):
+    '''Epstein-Nesbet second order correction from the determinants outside
+    the selected space.  See :func:`pyscf.hci.hci.enpt2`.
+
+    Returns:
+        e2, e2_err : the PT2 corrections and the stochastic errors (0 for the
+        deterministic algorithm).  Lists if civec_strs is a list.
+    '''
+    from pyscf.hci import hci
+    log = logger.new_logger(myci, verbose)
+    nelec = direct_spin1._unpack_nelec(nelec, myci.spin)
+    if isinstance(civec_strs, (tuple, list)):
+        civecs = civec_strs
+    else:
+        civecs = [civec_strs]
+    strsa, strsb = _unpack(civecs[0], nelec, myci._strs)[2]
+    na = len(strsa)
+    nb = len(strsb)
+    strs = numpy.empty((na*nb,2), dtype=numpy.uint64)
+    strs[:,0] = numpy.repeat(strsa, nb)
+    strs[:,1] = numpy.tile(strsb, na)
+    if e0 is None:
+        h2e = direct_spin1.absorb_h1e(h1e, eri, norb, nelec, .5)
+        e0 = []
+        for c in civecs:
+            c = _as_SCIvector_if_not(c, (strsa, strsb))
+            hc = contract_2e(h2e, c, norb, nelec)
+            e0.append(numpy.dot(c.ravel(), hc.ravel()) / numpy.dot(c.ravel(), c.ravel()))
+    elif not isinstance(e0, (tuple, list, numpy.ndarray)):
+        e0 = [e0]
+    e2, e2_err = hci._enpt2(myci, h1e, eri, strs, [c.ravel() for c in civecs],
+                            norb, nelec, e0, log)
+    if isinstance(civec_strs, (tuple, list)):
+        return e2, e2_err
+    else:
+        return e2[0], e2_err[0]
+
+def eig(myci, op, x0=None, precond=None, **kwargs):
+    '''Davidson diagonalization.  If op is a SparseHamiltonian, it is applied
+    to all trial vectors of a Davidson iteration at once.
+    '''
+    if not isinstance(op, SparseHamiltonian):
+        return direct_spin1.FCISolver.eig(myci, op, x0, precond, **kwargs)
+
+    myci.converged, e, ci = lib.davidson1(op.dot, x0, precond, **kwargs)
+    if kwargs['nroots'] == 1:
+        myci.converged = myci.converged[0]
+        e = e[0]
+        ci = ci[0]
+    return e, ci
+
+
 def kernel(h1e, eri, norb, nelec, ci0=None, level_shift=1e-3, tol=1e-10,
            lindep=1e-14, max_cycle=50, max_space=12, nroots=1,
            davidson_only=False, pspace_size=400, orbsym=None, wfnsym=None,
@@ -685,6 +1096,17 @@ class SelectedCI(direct_spin1.FCISolver):
         self.ci_coeff_cutoff = .5e-3
         self.select_cutoff = .5e-3
         self.conv_tol = 1e-9
+        # Compute the Hamiltonian matrix once and store it in sparse format
+        # when the selected space is fixed (kernel_fixed_space and the last
+        # diagonalization of kernel_float_space)
+        self.cache_hamiltonian = False
+        # EN-PT2 correction: the terms |c_i H_ai| below pt2_cutoff are
+        # dropped.  The terms between pt2_cutoff and pt2_cutoff_dtm are
+        # estimated stochastically if pt2_cutoff_dtm is given.
+        self.pt2_cutoff = 0
+        self.pt2_cutoff_dtm = None
+        self.pt2_nsamples = 200
+        self.pt2_nbatch = 10
 
 ##################################################
 # don't modify the following attributes, they are not input options
@@ -697,6 +1119,7 @@ class SelectedCI(direct_spin1.FCISolver):
         direct_spin1.FCISolver.dump_flags(self, verbose)
         logger.info(self, 'ci_coeff_cutoff %g', self.ci_coeff_cutoff)
         logger.info(self, 'select_cutoff   %g', self.select_cutoff)
+        logger.info(self, 'cache_hamiltonian %s', self.cache_hamiltonian)
 
     def contract_2e(self, eri, civec_strs, norb, nelec, link_index=None, **kwargs):
 # The argument civec_strs is a CI vector in function FCISolver.contract_2e.
@@ -723,6 +1146,8 @@ class SelectedCI(direct_spin1.FCISolver):
     enlarge_space = enlarge_space
     kernel = kernel_float_space
     kernel_fixed_space = kernel_fixed_space
+    eig = eig
+    enpt2 = enpt2
 
 #    def approx_kernel(self, h1e, eri, norb, nelec, ci0=None, link_index=None,
 #                      tol=None, lindep=None, max_cycle=None,
@@ -225,6 +225,35 @@ class KnowValues(unittest.TestCase):
         c_index1[:,:,1] = 0
         self.assertTrue(numpy.all(c_index0 == c_index1))
 
+    def test_sparse_h(self):
+        h2e = direct_spin1.absorb_h1e(h1, eri, norb, nelec, .5)
+        c1 = select_ci.contract_2e(h2e, civec_strs, norb, nelec)
+        hsparse = select_ci.make_sparse_h(h1, eri, ci_strs, norb, nelec)
+        c2 = hsparse.dot(civec_strs.ravel())
+        self.assertAlmostEqual(abs(c1.ravel()-c2).max(), 0, 9)
+        c3 = hsparse.dot([civec_strs.ravel(), c1.ravel()])
+        self.assertAlmostEqual(abs(c3[0]-c2).max(), 0, 12)
+
+        myci = select_ci.SCI()
+        e1, c1 = myci.kernel_fixed_space(h1, eri, norb, nelec, ci_strs)
+        myci.cache_hamiltonian = True
+        e2, c2 = myci.kernel_fixed_space(h1, eri, norb, nelec, ci_strs)
+        self.assertAlmostEqual(e1, e2, 9)
+
+    def test_enpt2(self):
+        myci = select_ci.SCI()
+        e2 = myci.enpt2(h1, eri, civec_strs, norb, nelec)[0]
+
+        ci0 = select_ci.to_fci(civec_strs, norb, nelec)
+        ci0 /= numpy.linalg.norm(ci0)
+        h2e = direct_spin1.absorb_h1e(h1, eri, norb, nelec, .5)
+        hc = direct_spin1.contract_2e(h2e, ci0, norb, nelec)
+        e0 = numpy.dot(ci0.ravel(), hc.ravel())
+        hdiag = direct_spin1.make_hdiag(h1, eri, norb, nelec).reshape(hc.shape)
+        v = select_ci._as_SCIvector(numpy.ones_like(ci_coeff), ci_strs)
+        ext = select_ci.to_fci(v, norb, nelec) == 0
+        self.assertAlmostEqual(e2, (hc[ext]**2/(e0-hdiag[ext])).sum(), 9)
+
     def test_from_to_fci(self):
         ci0 = select_ci.to_fci(civec_strs, norb, nelec)
         ci1 = select_ci.from_fci(ci0, ci_strs, norb, nelec)
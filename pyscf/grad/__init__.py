@@ -18,9 +18,10 @@ from pyscf.grad import rhf
 from pyscf.grad import dhf
 from pyscf.grad import rks
 from pyscf.grad import ccsd
+from pyscf.grad import numeric
 from pyscf.grad.rhf  import Gradients as RHF
 from pyscf.grad.dhf  import Gradients as DHF
 from pyscf.grad.rks  import Gradients as RKS
 #from pyscf.grad.ccsd import Gradients as CCSD
 
-from pyscf.grad.rhf import grad_nuc
+from pyscf.grad.rhf import grad_nuc, grad_batch
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Nuclear gradients and Hessian by finite differences
+
+The driver evaluates a scanner (or any function which takes a Mole object and
+returns the energy) on the displaced geometries.  It can be used for the
+methods which do not have analytical nuclear gradients, eg
+
+    >>> from pyscf import gto, scf, mcscf, mrpt, grad
+    >>> mol = gto.M(atom='N 0 0 0; N 0 0 1.1', basis='ccpvdz', symmetry=True)
+    >>> def nevpt2_energy(mol):
+    ...     mc = mcscf.CASSCF(scf.RHF(mol).run(), 6, 6).run()
+    ...     return mc.e_tot + mrpt.NEVPT(mc).kernel()
+    >>> de = grad.numeric.kernel(nevpt2_energy, mol, nproc=4)
+
+The displacements which are equivalent by the D2h (sub)group symmetry of mol
+are computed only once.  When nproc > 1, the displaced geometries are
+evaluated in a pool of processes.  Each process is forked from the driver
+after the scanner was applied to the reference geometry, so that every
+displaced geometry starts from the reference wavefunction.
+'''
+
+import time
+import numpy
+from pyscf import lib
+from pyscf.lib import logger
+from pyscf import symm
+
+# Central finite difference coefficients of the first and second derivatives,
+# indexed by the number of points of the stencil
+FIRST_DERIV_STENCILS = {
+    3: (-1./2, 0, 1./2),
+    5: (1./12, -2./3, 0, 2./3, -1./12),
+    7: (-1./60, 3./20, -3./4, 0, 3./4, -3./20, 1./60),
+}
+SECOND_DERIV_STENCILS = {
+    3: (1., -2., 1.),
+    5: (-1./12, 4./3, -5./2, 4./3, -1./12),
+    7: (1./90, -3./20, 3./2, -49./18, 3./2, -3./20, 1./90),
+}
+
+
+def kernel(scanner, mol=None, step=1e-3, stencil=3, nproc=1, verbose=None):
+    '''Finite difference nuclear gradients
+
+    Args:
+        scanner : callable
+            A scanner (eg the output of mf.as_scanner()) or a function which
+            takes a Mole object and returns the energy.
+
+    Kwargs:
+        mol : Mole
+            Reference geometry.  Default is scanner.mol
+        step : float
+            Displacement in Bohr
+        stencil : int
+            Number of points of the central difference formula, 3, 5 or 7.
+        nproc : int
+            Number of processes to evaluate the displaced geometries.
+
+    Returns:
+        Gradients in array (natm,3)
+    '''
+    if mol is None: mol = scanner.mol
+    log = logger.new_logger(mol, verbose)
+    time0 = time.clock(), time.time()
+    scanner = _as_scanner(scanner)
+    stencil = _stencil(FIRST_DERIV_STENCILS, stencil)
+    natm = mol.natm
+
+    disps = []
+    for i in range(natm*3):
+        for k, c in stencil:
+            disps.append(_displacement(natm, ((i, k),)))
+    e0, results = _scan(scanner, mol, disps, step, nproc, log)
+
+    de = numpy.zeros(natm*3)
+    n = 0
+    for i in range(natm*3):
+        for k, c in stencil:
+            de[i] += c * _energy(results[n])
+            n += 1
+    log.timer('finite difference gradients', *time0)
+    return de.reshape(natm,3) / step
+
+def hessian(scanner, mol=None, step=5e-3, stencil=3, nproc=1, verbose=None):
+    '''Finite difference nuclear Hessian
+
+    If scanner is a gradients scanner (eg the output of
+    mf.nuc_grad_method().as_scanner()), the Hessian is computed by the finite
+    differences of the gradients.  Otherwise, it is the second order finite
+    differences of the energies.  See :func:`kernel` for the arguments.
+
+    Returns:
+        Hessian in array (natm,natm,3,3)
+    '''
+    if mol is None: mol = scanner.mol
+    log = logger.new_logger(mol, verbose)
+    time0 = time.clock(), time.time()
+    scanner = _as_scanner(scanner)
+    natm = mol.natm
+    ncoord = natm * 3
+
+    if isinstance(scanner, lib.GradScanner):
+        stencil = _stencil(FIRST_DERIV_STENCILS, stencil)
+        disps = []
+        for i in range(ncoord):
+            for k, c in stencil:
+                disps.append(_displacement(natm, ((i, k),)))
+        e0, results = _scan(scanner, mol, disps, step, nproc, log)
+
+        h = numpy.zeros((ncoord,ncoord))
+        n = 0
+        for i in range(ncoord):
+            for k, c in stencil:
+                h[i] += c * results[n][1].ravel()
+                n += 1
+        h = (h + h.T) * (.5 / step)
+
+    else:
+        stencil1 = _stencil(FIRST_DERIV_STENCILS, stencil)
+        stencil2 = SECOND_DERIV_STENCILS[stencil]
+        c0 = stencil2[len(stencil2)//2]
+        stencil2 = _stencil(SECOND_DERIV_STENCILS, stencil)
+        disps = []
+        for i in range(ncoord):
+            for k, c in stencil2:
+                disps.append(_displacement(natm, ((i, k),)))
+            for j in range(i):
+                for k, ci in stencil1:
+                    for l, cj in stencil1:
+                        disps.append(_displacement(natm, ((i, k), (j, l))))
+        e0, results = _scan(scanner, mol, disps, step, nproc, log)
+
+        h = numpy.zeros((ncoord,ncoord))
+        n = 0
+        for i in range(ncoord):
+            h[i,i] = c0 * e0
+            for k, c in stencil2:
+                h[i,i] += c * _energy(results[n])
+                n += 1
+            for j in range(i):
+                for k, ci in stencil1:
+                    for l, cj in stencil1:
+                        h[i,j] += ci * cj * _energy(results[n])
+                        n += 1
+                h[j,i] = h[i,j]
+        h *= 1. / step**2
+
+    log.timer('finite difference hessian', *time0)
+    return h.reshape(natm,3,natm,3).transpose(0,2,1,3)
+
+
+def symm_ops(mol):
+    '''The operations of the D2h (sub)group of mol as atom permutations and
+    the (diagonal) transformations of the Cartesian components.
+
+    Returns:
+        perms : (nop,natm) int array, the atom that each atom is mapped to.
+        axes : (nop,3) array, the sign of x, y, z under each operation.
+    '''
+    if not mol.symmetry:
+        return numpy.arange(mol.natm).reshape(1,-1), numpy.ones((1,3))
+
+    gpname = mol.groupname
+    if gpname == 'Dooh':
+        gpname = 'D2h'
+    elif gpname == 'Coov':
+        gpname = 'C2v'
+    coords = mol.atom_coords()
+    charges = mol.atom_charges()
+    perms = []
+    axes = []
+    for op in symm.param.OPERATOR_TABLE[gpname]:
+        opmat = symm.param.D2H_OPS[op]
+        dc = abs(numpy.dot(coords, opmat)[:,None,:] - coords).sum(axis=2)
+        perm = dc.argmin(axis=1)
+        if ((dc.min(axis=1) > symm.geom.TOLERANCE).any() or
+            (charges[perm] != charges).any()):
+            raise RuntimeError('Molecule geometry is not invariant under '
+                               'operation %s of %s' % (op, gpname))
+        perms.append(perm)
+        axes.append(opmat.diagonal())
+    return numpy.asarray(perms), numpy.asarray(axes)
+
+def _transform(v, perm, axis):
+    '''Apply the operation (perm, axis) to the displacement or gradients v'''
+    v1 = numpy.empty_like(v)
+    v1[perm] = v * axis.astype(v.dtype)
+    return v1
+
+def uniq_displacements(disps, perms, axes):
+    '''Drop the displacements which are equivalent under the symmetry
+    operations.
+
+    Returns:
+        uniq : list of the symmetry-unique displacements
+        maps : list of (uniq_id, op_id) for each displacement.  Displacement
+            disps[i] is uniq[uniq_id] transformed by the operation op_id.
+    '''
+    uniq = []
+    index = {}
+    maps = []
+    for d in disps:
+        # All operations of D2h are involutions, g(d) == u means d == g(u)
+        for iop, (perm, axis) in enumerate(zip(perms, axes)):
+            key = _transform(d, perm, axis).tobytes()
+            if key in index:
+                maps.append((index[key], iop))
+                break
+        else:
+            index[d.tobytes()] = len(uniq)
+            maps.append((len(uniq), 0))
+            uniq.append(d)
+    return uniq, maps
+
+
+def _stencil(stencils, npoints):
+    if npoints not in stencils:
+        raise ValueError('Finite difference stencil of %s points is not '
+                         'available.  Choose from %s' %
+                         (npoints, sorted(stencils.keys())))
+    coeffs = stencils[npoints]
+    n = len(coeffs) // 2
+    return [(k-n, c) for k, c in enumerate(coeffs) if k != n]
+
+def _displacement(natm, coords_and_steps):
+    d = numpy.zeros(natm*3, dtype=int)
+    for i, k in coords_and_steps:
+        d[i] = k
+    return d.reshape(natm,3)
+
+def _energy(result):
+    if isinstance(result, tuple):  # gradients scanner returns (e_tot, grad)
+        return result[0]
+    else:
+        return result
+
+def _as_scanner(method):
+    if (not isinstance(method, (lib.SinglePointScanner, lib.GradScanner)) and
+        hasattr(method, 'as_scanner')):
+        method = method.as_scanner()
+    return method
+
+def _displaced_mol(mol, coords):
+    '''Mole object at the given geometry (in Bohr).  Symmetry is switched off
+    since the displacements break the symmetry of the reference geometry.'''
+    mol1 = mol.copy()
+    mol1.atom = [(mol.atom_symbol(i), coords[i]) for i in range(mol.natm)]
+    mol1.unit = 'Bohr'
+    mol1.symmetry = False
+    mol1.build(False, False)
+    return mol1
+
+def _scan(scanner, mol, disps, step, nproc, log):
+    '''Apply scanner on the reference and the displaced geometries. Returns
+    the result of the reference geometry and the results of all
+    displacements.'''
+    perms, axes = symm_ops(mol)
+    uniq, maps = uniq_displacements(disps, perms, axes)
+    log.info('%d displaced geometries, %d are symmetry-unique',
+             len(disps), len(uniq))
+
+    coords = mol.atom_coords()
+    # The reference calculation also provides the initial guess of the
+    # calculations of the displaced geometries
+    result0 = scanner(_displaced_mol(mol, coords))
+    geoms = [coords + d * step for d in uniq]
+
+    if nproc > 1 and len(geoms) > 1:
+        results = _run_in_pool(scanner, mol, geoms, nproc)
+    else:
+        results = [scanner(_displaced_mol(mol, c)) for c in geoms]
+
+    out = []
+    for u, iop in maps:
+        r = results[u]
+        if isinstance(r, tuple):
+            r = (r[0], _transform(numpy.asarray(r[1]), perms[iop], axes[iop]))
+        out.append(r)
+    return _energy(result0), out
+
+_pool_args = None
+def _pool_init(nthreads):
+    lib.num_threads(nthreads)
+
+def _pool_kernel(coords):
+    scanner, mol = _pool_args
+    return scanner(_displaced_mol(mol, coords))
+
+def _run_in_pool(scanner, mol, geoms, nproc):
+    import multiprocessing
+    global _pool_args
+    if hasattr(multiprocessing, 'get_context'):
+        # The scanner is passed to the workers by forking the driver process
+        multiprocessing = multiprocessing.get_context('fork')
+    nproc = min(nproc, len(geoms))
+    nthreads = max(1, lib.num_threads() // nproc)
+    _pool_args = (scanner, mol)
+    # A new worker is forked for each geometry (maxtasksperchild=1) so that
+    # all displaced geometries are seeded with the reference wavefunction
+    pool = multiprocessing.Pool(nproc, _pool_init, (nthreads,),
+                                maxtasksperchild=1)
+    try:
+        return pool.map(_pool_kernel, geoms, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        _pool_args = None
+
+
+if __name__ == '__main__':
+    from pyscf import gto
+    from pyscf import scf
+    from pyscf import grad
+    mol = gto.M(atom='O 0 0 0; H 0 -.757 .587; H 0 .757 .587',
+                basis='631g', symmetry=True, verbose=0)
+    mf = scf.RHF(mol)
+    mf.conv_tol = 1e-12
+    print(kernel(mf.as_scanner(), nproc=2))
+    print(grad.RHF(mf.run()).kernel())
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import unittest
+import numpy
 from pyscf import scf
 from pyscf import gto
 from pyscf import grad
@@ -37,6 +38,49 @@ class KnowValues(unittest.TestCase):
         g.level = 'LLLL'
         self.assertAlmostEqual(finger(g.grad_elec()), 7.924684281032623, 7)
 
+    def test_grad_rinv_dm(self):
+        rhf = scf.RHF(mol).run()
+        g = grad.RHF(rhf)
+        dm = rhf.make_rdm1()
+        ref = [numpy.einsum('xij,ij->x', g._grad_rinv(mol, ia), dm)
+               for ia in range(mol.natm)]
+        self.assertAlmostEqual(abs(grad.rhf.grad_rinv_dm(mol, dm) - ref).max(), 0, 9)
+
+    def test_grad_rinv_hook(self):
+        rhf = scf.RHF(mol).run()
+        g = grad.RHF(rhf)
+        de0 = g.grad_elec()
+        dm = rhf.make_rdm1()
+        g._grad_rinv = lambda mol, ia: grad.RHF._grad_rinv(g, mol, ia) * .5
+        de1 = g.grad_elec()
+        self.assertAlmostEqual(abs(de0 - de1 - grad.rhf.grad_rinv_dm(mol, dm)).max(), 0, 9)
+
+    def test_atom_without_basis(self):
+        for atom in ('H 0 0 .9; He 0 1. 0; F 0 0 0',
+                     'H 0 0 .9; F 0 0 0; He 0 1. 0'):
+            mol1 = gto.M(atom=atom, basis={'H': '6-31g', 'F': '6-31g'},
+                         verbose=0)
+            mf = scf.RHF(mol1).run()
+            g = grad.RHF(mf)
+            dm = mf.make_rdm1()
+            f1 = g.get_hcore() + g.get_veff(mol1, dm)
+            s1 = g.get_ovlp()
+            dme = g.make_rdm1e()
+            ref = numpy.zeros((mol1.natm,3))
+            for ia, (sh0, sh1, p0, p1) in enumerate(mol1.aoslice_by_atom()):
+                ref[ia] += numpy.einsum('xij,ij->x', f1[:,p0:p1], dm[p0:p1]) * 2
+                ref[ia] -= numpy.einsum('xij,ij->x', s1[:,p0:p1], dme[p0:p1]) * 2
+                ref[ia] += numpy.einsum('xij,ij->x', g._grad_rinv(mol1, ia), dm) * 2
+            self.assertAlmostEqual(abs(g.grad_elec() - ref).max(), 0, 9)
+
+    def test_grad_batch(self):
+        mol1 = mol.copy()
+        mol1.set_geom_([[1, (0. , 0.1, .9)], ["F" , (0. , 0. , 0.)]])
+        mfs = [scf.RHF(m).set(conv_tol=1e-12).run() for m in (mol, mol1)]
+        des = grad.rhf.grad_batch(mfs, 2)
+        for mf, de in zip(mfs, des):
+            self.assertAlmostEqual(abs(de - grad.RHF(mf).kernel()).max(), 0, 9)
+
     def test_energy_nuc(self):
         rhf = scf.RHF(mol)
         rhf.scf()
@@ -88,6 +132,22 @@ class KnowValues(unittest.TestCase):
         e, de = cc_scanner(mol1)
         self.assertAlmostEqual(finger(de), 0.10534638975831109, 5)
 
+    def test_numeric(self):
+        mf = scf.RHF(mol).set(conv_tol=1e-12)
+        e, de_ref = grad.RHF(mf).as_scanner()(mol)
+        de = grad.numeric.kernel(mf.as_scanner(), mol, stencil=5)
+        self.assertAlmostEqual(abs(de - de_ref).max(), 0, 6)
+
+        h2o = gto.M(atom='O 0 0 0; H 0 -.757 .587; H 0 .757 .587',
+                    basis='631g', symmetry=True, verbose=0)
+        mf = scf.RHF(h2o).set(conv_tol=1e-12)
+        de = grad.numeric.kernel(mf.as_scanner(), h2o, nproc=2)
+        self.assertAlmostEqual(abs(de - grad.RHF(mf.run()).kernel()).max(), 0, 6)
+
+        h = grad.numeric.hessian(grad.RHF(mf).as_scanner(), h2o, nproc=2)
+        self.assertAlmostEqual(abs(h - h.transpose(1,0,3,2)).max(), 0, 9)
+        self.assertAlmostEqual(abs(h.sum(axis=1)).max(), 0, 4)
+
 
 if __name__ == "__main__":
     print("Full Tests for HF")
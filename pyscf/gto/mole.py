@@ -479,6 +479,37 @@ def conc_mol(mol1, mol2):
         mol3._ecp.update(mol1._ecp)
     return mol3
 
+def fakemol_for_charges(coords, expnt=1e16):
+    '''Construct a fake Mole object that holds one s-type Gaussian function
+    (normalized to unit charge) at each given point.  With the very sharp
+    Gaussian functions, the 3-center 2-electron integrals (ij|k) of the
+    fake Mole are the potential of the point charges (ij|1/|r-R_k|).
+    '''
+    coords = numpy.asarray(coords).reshape(-1,3)
+    nbas = len(coords)
+    fakeatm = numpy.zeros((nbas,ATM_SLOTS), dtype=numpy.int32)
+    fakebas = numpy.zeros((nbas,BAS_SLOTS), dtype=numpy.int32)
+    fakeenv = [numpy.zeros(PTR_ENV_START)]
+    ptr = PTR_ENV_START
+    fakeatm[:,PTR_COORD] = numpy.arange(ptr, ptr+nbas*3, 3)
+    fakeenv.append(coords.ravel())
+    ptr += nbas*3
+    fakebas[:,ATOM_OF] = numpy.arange(nbas)
+    fakebas[:,NPRIM_OF] = 1
+    fakebas[:,NCTR_OF] = 1
+    fakebas[:,PTR_EXP] = ptr
+    fakebas[:,PTR_COEFF] = ptr+1
+    # The angular part of s function is 1/sqrt(4pi)
+    # coeff * 1/sqrt(4pi) * (pi/expnt)^{3/2} = 1
+    fakeenv.append([expnt, 2*expnt**1.5/numpy.pi])
+
+    fakemol = Mole()
+    fakemol._atm = fakeatm
+    fakemol._bas = fakebas
+    fakemol._env = numpy.hstack(fakeenv)
+    fakemol._built = True
+    return fakemol
+
 # <bas-of-mol1|intor|bas-of-mol2>
 def intor_cross(intor, mol1, mol2, comp=1):
     r'''1-electron integrals from two molecules like
@@ -1301,8 +1332,25 @@ def aoslice_by_atom(mol, ao_loc=None):
     aorange = numpy.empty((mol.natm,4), dtype=int)
     bas_atom = mol._bas[:,ATOM_OF]
     delimiter = numpy.where(bas_atom[0:-1] != bas_atom[1:])[0] + 1
-    aorange[:,0] = shell_start = numpy.append(0, delimiter)
-    aorange[:,1] = shell_end = numpy.append(delimiter, mol.nbas)
+    if mol.natm == len(delimiter) + 1:
+        shell_start = numpy.append(0, delimiter)
+        shell_end = numpy.append(delimiter, mol.nbas)
+    else:
+        # Some atoms have no basis functions.  Their shell ranges are empty.
+        shell_start = numpy.empty(mol.natm, dtype=int)
+        shell_end = numpy.empty(mol.natm, dtype=int)
+        shell_start[:] = -1
+        if mol.nbas > 0:
+            starts = numpy.append(0, delimiter)
+            shell_start[bas_atom[starts]] = starts
+            shell_end[bas_atom[starts]] = numpy.append(delimiter, mol.nbas)
+        end = 0
+        for ia in range(mol.natm):
+            if shell_start[ia] == -1:
+                shell_start[ia] = shell_end[ia] = end
+            end = shell_end[ia]
+    aorange[:,0] = shell_start
+    aorange[:,1] = shell_end
     aorange[:,2] = ao_loc[shell_start]
     aorange[:,3] = ao_loc[shell_end]
     return aorange
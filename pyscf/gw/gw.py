@@ -9,8 +9,8 @@ Spin-orbital G0W0
 
 import numpy as np
 import scipy.linalg
-from scipy.optimize import newton
 
+from pyscf import lib
 from pyscf.lib import logger
 import pyscf.ao2mo
 
@@ -30,21 +30,32 @@ def kernel(gw, so_energy, so_coeff, verbose=logger.NOTE):
             The GW-corrected spatial orbital energies.
     '''
     print "# --- Performing RPA calculation ...",
-    e_rpa, t_rpa = rpa(gw, method=gw.screening)
+    e_rpa, t_rpa = rpa(gw, method=gw.screening, nroots=gw.nroots)
     print "done."
     print "# --- Calculating GW QP corrections ...",
-    egw = np.zeros(gw.nso/2)
-    for p in range(0,gw.nso,2): 
-        def quasiparticle(omega):
-            sigma_c_ppw, sigma_x_ppw = sigma(gw, p, p, omega, e_rpa, t_rpa)
-            sigma_ppw = sigma_c_ppw + sigma_x_ppw
-            return omega - gw.e_mf[p] - (sigma_ppw.real - gw.v_mf[p,p])
-        try:
-            egw[p/2] = newton(quasiparticle, gw.e_mf[p], tol=1e-6, maxiter=100)
-        except RuntimeError:
-            print "Newton-Raphson unconverged, setting GW eval to MF eval."
-            egw[p/2] = gw.e_mf[p]
-        print egw[p/2]
+    # Solve the quasiparticle equations of all spatial orbitals together by
+    # Newton-Raphson iterations
+    #   omega - e_mf[p] - (Re Sigma_pp(omega) - v_mf[p,p]) = 0
+    orbs = np.arange(0, gw.nso, 2)
+    e_mf = gw.e_mf[orbs]
+    v_mf = gw.v_mf[orbs,orbs]
+    egw = e_mf.copy()
+    conv = np.zeros(len(orbs), dtype=bool)
+    for cycle in range(100):
+        todo = ~conv
+        sigma_c, sigma_x, dsigma_c = sigma_diag(gw, orbs[todo], egw[todo],
+                                                e_rpa, t_rpa, deriv=True)
+        f = egw[todo] - e_mf[todo] - (sigma_c.real + sigma_x - v_mf[todo])
+        domega = f / (1 - dsigma_c.real)
+        egw[todo] -= domega
+        conv[todo] = abs(domega) < 1e-6
+        if conv.all():
+            break
+    if not conv.all():
+        print "Newton-Raphson unconverged, setting GW eval to MF eval."
+        egw[~conv] = e_mf[~conv]
+    for e in egw:
+        print e
     print "done."
 
     return egw
@@ -61,26 +72,17 @@ def sigma(gw, p, q, omegas, e_rpa, t_rpa, vir_sgn=1):
     if gw._M is None:
         gw._M = get_m_rpa(gw, e_rpa, t_rpa)
 
-    nso = gw.nso
     nocc = gw.nocc
-
-    sigma_c = []
-    sigma_x = []
-    for omega in omegas:
-        sigma_cw = 0.
-        sigma_xw = 0.
-        for L in range(len(e_rpa)):
-            for i in range(nocc):
-                sigma_cw += gw._M[i,q,L]*gw._M[i,p,L]/(
-                            omega - gw.e_mf[i] + e_rpa[L] - 1j*gw.eta )
-            for a in range(nocc, nso):
-                sigma_cw += gw._M[a,q,L]*gw._M[a,p,L]/(
-                            omega - gw.e_mf[a] - e_rpa[L] + vir_sgn*1j*gw.eta )
-        for i in range(nocc):
-            sigma_xw += -gw.eri[p,i,i,q]
-
-        sigma_c.append(sigma_cw)
-        sigma_x.append(sigma_xw)
+    omegas = np.asarray(omegas)
+    poles = _sigma_poles(gw, e_rpa, vir_sgn)
+    mpq = gw._M[:,q,:] * gw._M[:,p,:]
+    nw = omegas.size
+    sigma_c = np.empty(nw, dtype=np.complex128)
+    blksize = max(1, int(gw.max_memory*.5e6/16/poles.size))
+    for w0, w1 in lib.prange(0, nw, blksize):
+        g = 1. / (omegas[w0:w1,None,None] - poles)
+        sigma_c[w0:w1] = np.einsum('nl,wnl->w', mpq, g)
+    sigma_x = np.repeat(-gw.eri[p,:nocc,:nocc,q].trace(), nw)
 
     if single_point:
         return sigma_c[0], sigma_x[0]
@@ -88,6 +90,60 @@ def sigma(gw, p, q, omegas, e_rpa, t_rpa, vir_sgn=1):
         return sigma_c, sigma_x
 
 
+def sigma_diag(gw, orbs, omegas, e_rpa, t_rpa, vir_sgn=1, deriv=False):
+    '''Diagonal elements of the self-energy Sigma_pp(omega) for many
+    orbitals and frequencies in one pass.
+
+    Args:
+        orbs : (norb,) array of spin-orbital indices
+        omegas : (norb,) or (norb,nw) array
+            The frequencies for each orbital
+
+    Returns:
+        sigma_c : complex array with the shape of omegas
+        sigma_x : (norb,) array
+        dsigma_c : complex array with the shape of omegas
+            d Sigma_c / d omega.  Only returned when deriv is True
+    '''
+    if gw._M is None:
+        gw._M = get_m_rpa(gw, e_rpa, t_rpa)
+
+    nocc = gw.nocc
+    orbs = np.asarray(orbs)
+    omegas = np.asarray(omegas)
+    norb = len(orbs)
+    poles = _sigma_poles(gw, e_rpa, vir_sgn)
+    mpp = gw._M[:,orbs,:]**2
+    ws = omegas.reshape(norb,-1)
+    nw = ws.shape[1]
+    # Flatten the (orbital, frequency) pairs and evaluate them in blocks
+    orb_idx = np.repeat(np.arange(norb), nw)
+    ws = ws.ravel()
+    sigma_c = np.empty(ws.size, dtype=np.complex128)
+    dsigma_c = np.empty(ws.size, dtype=np.complex128)
+    blksize = max(1, int(gw.max_memory*.3e6/16/poles.size))
+    for k0, k1 in lib.prange(0, ws.size, blksize):
+        g = 1. / (ws[k0:k1,None,None] - poles)
+        mg = mpp[:,orb_idx[k0:k1]].transpose(1,0,2) * g
+        sigma_c[k0:k1] = mg.sum(axis=(1,2))
+        if deriv:
+            dsigma_c[k0:k1] = -np.einsum('knl,knl->k', mg, g)
+
+    ii = np.arange(nocc)
+    sigma_x = -gw.eri[orbs[:,None],ii,ii,orbs[:,None]].sum(axis=1)
+    sigma_c = sigma_c.reshape(omegas.shape)
+    if deriv:
+        return sigma_c, sigma_x, dsigma_c.reshape(omegas.shape)
+    else:
+        return sigma_c, sigma_x
+
+def _sigma_poles(gw, e_rpa, vir_sgn=1):
+    '''Poles of the correlation self-energy, (nso, nroots) array'''
+    nocc = gw.nocc
+    return np.vstack((gw.e_mf[:nocc,None] - e_rpa + 1j*gw.eta,
+                      gw.e_mf[nocc:,None] + e_rpa - vir_sgn*1j*gw.eta))
+
+
 def g0(gw, omega):
     '''Return the 0th order GF matrix [G0]_{pq} in the basis of MF eigenvectors.'''
     g0 = np.zeros((gw.nso,gw.nso), dtype=np.complex128)
@@ -106,22 +162,15 @@ def get_m_rpa(gw, e_rpa, t_rpa):
     nso = gw.nso
     nocc = gw.nocc
     nvir = nso - nocc
-    t_by_e = t_rpa.copy()
-    for L in range(len(e_rpa)):
-        t_by_e[:,L] /= np.sqrt(e_rpa[L])
-    sqrt_eps = np.zeros(nocc*nvir)
-    eri_product = np.zeros((nocc*nvir, nso, nso))
-    ai = 0
-    for i in range(nocc):
-        for a in range(nocc,nso):
-            sqrt_eps[ai] = np.sqrt(gw.e_mf[a]-gw.e_mf[i])
-            eri_product[ai,:,:] = gw.eri[a,i,:,:]
-            ai += 1
-    M = np.einsum('a,al,apq->pql', sqrt_eps, t_by_e, eri_product)
-    return M 
-
-
-def rpa(gw, using_tda=False, using_casida=True, method='TDH'):
+    t_by_e = t_rpa / np.sqrt(e_rpa)
+    sqrt_eps = np.sqrt(gw.e_mf[nocc:] - gw.e_mf[:nocc,None]).ravel()
+    # (ai|pq) with the compound index ai ordered as in the RPA matrices
+    eri_product = gw.eri[nocc:,:nocc].transpose(1,0,2,3).reshape(nocc*nvir,-1)
+    M = np.dot(eri_product.T, sqrt_eps[:,None] * t_by_e)
+    return M.reshape(nso,nso,-1)
+
+
+def rpa(gw, using_tda=False, using_casida=True, method='TDH', nroots=None):
     '''Get the RPA eigenvalues and eigenvectors.
 
     Q^\dagger = \sum_{ia} X_{ia} a^+ i - Y_{ia} i^+ a
@@ -134,6 +183,10 @@ def rpa(gw, using_tda=False, using_casida=True, method='TDH'):
     
     See, e.g. Stratmann, Scuseria, and Frisch, 
               J. Chem. Phys., 109, 8218 (1998)
+
+    If nroots is given (and smaller than the dimension of the RPA problem),
+    the lowest nroots excitations of the Casida equation are solved by the
+    Davidson method instead of the full diagonalization.
     '''
     A, B = rpa_AB_matrices(gw, method=method)
 
@@ -148,13 +201,45 @@ def rpa(gw, using_tda=False, using_casida=True, method='TDH'):
             e, xy = eig_asymm(ham_rpa)
             return e, xy
         else:
-            assert is_positive_def(A-B)
-            sqrt_A_minus_B = scipy.linalg.sqrtm(A-B)
-            ham_rpa = np.dot(sqrt_A_minus_B, np.dot((A+B),sqrt_A_minus_B))
-            esq, t = eig(ham_rpa)
+            a_minus_b = A - B
+            a_plus_b = A + B
+            A = B = None
+            assert is_positive_def(a_minus_b)
+            d = a_minus_b.diagonal()
+            if np.allclose(a_minus_b, np.diag(d)):
+                # For TDH (with real orbitals) A-B is the diagonal matrix of
+                # the orbital energy differences
+                sqrt_d = np.sqrt(d)
+                ham_rpa = sqrt_d[:,None] * a_plus_b * sqrt_d
+            else:
+                sqrt_A_minus_B = scipy.linalg.sqrtm(a_minus_b).real
+                ham_rpa = np.dot(sqrt_A_minus_B, np.dot(a_plus_b, sqrt_A_minus_B))
+
+            if nroots is None or nroots >= ham_rpa.shape[0]:
+                esq, t = eig(ham_rpa)
+            else:
+                esq, t = _davidson(gw, ham_rpa, nroots)
             return np.sqrt(esq), t
 
 
+def _davidson(gw, ham, nroots):
+    '''The lowest nroots eigenpairs of the symmetric matrix ham'''
+    hdiag = ham.diagonal()
+    x0 = []
+    for i in np.argsort(hdiag)[:nroots]:
+        x = np.zeros_like(hdiag)
+        x[i] = 1
+        x0.append(x)
+    aop = lambda xs: list(np.dot(np.asarray(xs), ham))
+    precond = lambda dx, e, x0: dx / (hdiag - e + 1e-8)
+    conv, e, t = lib.davidson1(aop, x0, precond, tol=1e-10, nroots=nroots,
+                               max_cycle=100, max_space=max(12, nroots*3),
+                               max_memory=gw.max_memory, verbose=gw.verbose)
+    if not all(conv):
+        logger.warn(gw, 'Davidson diagonalization of RPA not converged')
+    return np.asarray(e), np.asarray(t).T
+
+
 def rpa_AB_matrices(gw, method='TDH'):
     '''Get the RPA A and B matrices, using TDH, TDHF, or TDDFT.
     '''
@@ -162,25 +247,20 @@ def rpa_AB_matrices(gw, method='TDH'):
     nso = gw.nso
     nocc = gw.nocc
     nvir = nso - nocc
+    eri = gw.eri
 
     dim_rpa = nocc*nvir
-    A = np.zeros((dim_rpa,dim_rpa))
-    B = np.zeros((dim_rpa,dim_rpa))
-
-    ai = 0
-    for i in range(nocc):
-        for a in range(nocc,nso):
-            A[ai,ai] = gw.e_mf[a] - gw.e_mf[i]
-            bj = 0
-            for j in range(nocc): 
-                for b in range(nocc,nso):
-                    A[ai,bj] += gw.eri[a,i,j,b]
-                    B[ai,bj] += gw.eri[a,i,b,j]
-                    if method == 'TDHF':
-                        A[ai,bj] -= gw.eri[a,b,j,i]
-                        B[ai,bj] -= gw.eri[a,j,b,i]
-                    bj += 1 
-            ai += 1 
+    # The compound index ai runs over i first, then a, ie ai = i*nvir+a-nocc
+    # A[ia,jb] = (ai|jb),  B[ia,jb] = (ai|bj)
+    # The reshape may return a view of gw.eri (eg nocc == 1).  Copy the
+    # matrices so that the integrals are not modified.
+    A = eri[nocc:,:nocc,:nocc,nocc:].transpose(1,0,2,3).reshape(dim_rpa,dim_rpa).copy()
+    B = eri[nocc:,:nocc,nocc:,:nocc].transpose(1,0,3,2).reshape(dim_rpa,dim_rpa).copy()
+    if method == 'TDHF':
+        # A[ia,jb] -= (ab|ji),  B[ia,jb] -= (aj|bi)
+        A = A - eri[nocc:,nocc:,:nocc,:nocc].transpose(3,0,2,1).reshape(dim_rpa,dim_rpa)
+        B = B - eri[nocc:,:nocc,nocc:,:nocc].transpose(3,0,1,2).reshape(dim_rpa,dim_rpa)
+    A[np.diag_indices(dim_rpa)] += (gw.e_mf[nocc:] - gw.e_mf[:nocc,None]).ravel()
 
     assert np.allclose(A, A.transpose())
     assert np.allclose(B, B.transpose())
@@ -222,7 +302,7 @@ def is_positive_def(A):
 
 class GW(object):
     def __init__(self, mf, ao2mofn=pyscf.ao2mo.outcore.general_iofree,
-                 screening='TDH', eta=1e-2):
+                 screening='TDH', eta=1e-2, nroots=None):
         assert screening in ('TDH', 'TDHF', 'TDDFT')
         self.mol = mf.mol
         self._scf = mf
@@ -272,6 +352,9 @@ class GW(object):
 
         self.screening = screening
         self.eta = eta
+        # Number of RPA excitations in the screened interaction.  By default
+        # all excitations are included.
+        self.nroots = nroots
         self._M = None
 
         self.egw = None
@@ -295,8 +378,11 @@ class GW(object):
     def get_m_rpa(self, e_rpa, t_rpa):
         return get_m_rpa(self, e_rpa, t_rpa)
 
-    def rpa(self, using_tda=False, using_casida=True, method='TDH'):
-        return rpa(self, using_tda, using_casida, method)
+    def sigma_diag(self, orbs, omegas, e_rpa, t_rpa, vir_sgn=1, deriv=False):
+        return sigma_diag(self, orbs, omegas, e_rpa, t_rpa, vir_sgn, deriv)
+
+    def rpa(self, using_tda=False, using_casida=True, method='TDH', nroots=None):
+        return rpa(self, using_tda, using_casida, method, nroots)
 
     def rpa_AB_matrices(self, method='TDH'):
         return rpa_AB_matrices(self, method)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import unittest
+import numpy
+from pyscf.gw import gw
+
+def rpa_AB_matrices_ref(mygw, method='TDH'):
+    nso = mygw.nso
+    nocc = mygw.nocc
+    dim_rpa = nocc*(nso-nocc)
+    A = numpy.zeros((dim_rpa,dim_rpa))
+    B = numpy.zeros((dim_rpa,dim_rpa))
+    ai = 0
+    for i in range(nocc):
+        for a in range(nocc,nso):
+            A[ai,ai] = mygw.e_mf[a] - mygw.e_mf[i]
+            bj = 0
+            for j in range(nocc):
+                for b in range(nocc,nso):
+                    A[ai,bj] += mygw.eri[a,i,j,b]
+                    B[ai,bj] += mygw.eri[a,i,b,j]
+                    if method == 'TDHF':
+                        A[ai,bj] -= mygw.eri[a,b,j,i]
+                        B[ai,bj] -= mygw.eri[a,j,b,i]
+                    bj += 1
+            ai += 1
+    return A, B
+
+def make_gw(nso, nocc):
+    numpy.random.seed(1)
+    eri = numpy.random.random((nso,nso,nso,nso))
+    eri = eri + eri.transpose(1,0,2,3)
+    eri = eri + eri.transpose(0,1,3,2)
+    eri = eri + eri.transpose(2,3,0,1)
+    mygw = gw.GW.__new__(gw.GW)
+    mygw.nso = nso
+    mygw.nocc = nocc
+    mygw.eri = eri
+    mygw.e_mf = numpy.sort(numpy.random.random(nso))
+    return mygw
+
+class KnowValues(unittest.TestCase):
+    def test_rpa_AB_matrices(self):
+        for nso, nocc in ((8, 3), (6, 1), (6, 5)):
+            mygw = make_gw(nso, nocc)
+            eri0 = mygw.eri.copy()
+            for method in ('TDH', 'TDHF'):
+                A, B = gw.rpa_AB_matrices(mygw, method)
+                Aref, Bref = rpa_AB_matrices_ref(mygw, method)
+                self.assertAlmostEqual(abs(A-Aref).max(), 0, 12)
+                self.assertAlmostEqual(abs(B-Bref).max(), 0, 12)
+                self.assertTrue(numpy.array_equal(mygw.eri, eri0))
+
+
+if __name__ == "__main__":
+    print("Full Tests for GW")
+    unittest.main()
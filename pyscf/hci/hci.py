@@ -15,11 +15,14 @@ Simple usage::
 import numpy
 import time
 import ctypes
+import collections
+from multiprocessing.pool import ThreadPool
 from pyscf import lib
 from pyscf import ao2mo
 from pyscf.lib import logger
 from pyscf.fci import cistring
 from pyscf.fci import direct_spin1
+from pyscf.fci import select_ci
 
 libhci = lib.load_library('libhci')
 
@@ -145,6 +148,33 @@ def contract_2e(h1_h2, civec, norb, nelec, hdiag=None, **kwargs):
 
     return ci1
 
+def make_sparse_h(h1, eri, strs, norb, nelec, hdiag=None,
+                  max_memory=lib.param.MAX_MEMORY, verbose=logger.NOTE):
+    '''Hamiltonian of the determinants strs in sparse format.  See also
+    :func:`select_ci.make_sparse_h`.
+
+    Returns:
+        A :class:`select_ci.SparseHamiltonian` object
+    '''
+    log = logger.new_logger(None, verbose)
+    strs = numpy.asarray(strs, dtype=numpy.uint64)
+    ndet, nset = strs.shape
+    nset = nset // 2
+    if hdiag is None:
+        hdiag = make_hdiag(h1, eri, strs, norb, nelec)
+    tab_a = StringTable(nwords=nset)
+    tab_b = StringTable(nwords=nset)
+    addra = tab_a.insert(strs[:,:nset])
+    addrb = tab_b.insert(strs[:,nset:])
+    nb = len(tab_b)
+    tab_det = StringTable((addra * nb + addrb).astype(numpy.uint64).reshape(-1,1))
+    lookup_det = lambda ia, ib: tab_det.lookup((ia * nb + ib).astype(numpy.uint64))
+    return select_ci._make_sparse_h(h1, eri, norb, nelec,
+                                    tab_a.strs, tab_a.lookup,
+                                    tab_b.strs, tab_b.lookup,
+                                    addra, addrb, lookup_det, hdiag,
+                                    max_memory, log)
+
 def spin_square(civec, norb, nelec):
     ss = numpy.dot(civec.T, contract_ss(civec, norb, nelec))
     s = numpy.sqrt(ss+.25) - .5
@@ -174,17 +204,21 @@ def make_hdiag(h1e, eri, strs, norb, nelec):
     eri = ao2mo.restore(1, eri, norb)
     diagj = numpy.einsum('iijj->ij',eri)
     diagk = numpy.einsum('ijji->ij',eri)
+    h1diag = numpy.diag(h1e)
 
+    strs = numpy.asarray(strs, dtype=numpy.uint64)
     ndet = len(strs)
-    hdiag = numpy.zeros(ndet)
-    for idet, (stra, strb) in enumerate(strs.reshape(ndet,2,-1)):
-        aocc = str2orblst(stra, norb)[0]
-        bocc = str2orblst(strb, norb)[0]
-        e1 = h1e[aocc,aocc].sum() + h1e[bocc,bocc].sum()
-        e2 = diagj[aocc][:,aocc].sum() + diagj[aocc][:,bocc].sum() \
-           + diagj[bocc][:,aocc].sum() + diagj[bocc][:,bocc].sum() \
-           - diagk[aocc][:,aocc].sum() - diagk[bocc][:,bocc].sum()
-        hdiag[idet] = e1 + e2*.5
+    nset = strs.shape[1] // 2
+    hdiag = numpy.empty(ndet)
+    for p0, p1 in lib.prange(0, ndet, 20000):
+        occa = select_ci._occ_mask(strs[p0:p1,:nset], norb).astype(numpy.double)
+        occb = select_ci._occ_mask(strs[p0:p1,nset:], norb).astype(numpy.double)
+        occ = occa + occb
+        e1 = numpy.dot(occ, h1diag)
+        e2 = (numpy.einsum('pi,pi->p', numpy.dot(occ, diagj), occ)
+              - numpy.einsum('pi,pi->p', numpy.dot(occa, diagk), occa)
+              - numpy.einsum('pi,pi->p', numpy.dot(occb, diagk), occb))
+        hdiag[p0:p1] = e1 + e2*.5
     return hdiag
 
 def cre_des_sign(p, q, string):
@@ -294,12 +328,175 @@ def toggle_bit(s, place):
     s[-1-g] ^= numpy.uint64(1<<b)
     return s
 
-def select_strs_ctypes(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, nelec):
+class StringTable(object):
+    '''Hash table of determinant strings.
+
+    Each determinant is a row of uint64 words (the alpha string followed by
+    the beta string).  The determinants are kept in the order of insertion
+    and indexed by an open addressing (linear probing) table, so that
+    membership tests and insertions take O(1) time and need no sorting.
+    Batches of strings are inserted or looked up in vectorized steps.
+
+    Attributes:
+        strs : 2D uint64 array
+            Determinant strings in the order of insertion
+    '''
+    def __init__(self, strs=None, nwords=None, capacity=1024):
+        if strs is not None:
+            strs = numpy.asarray(strs, dtype=numpy.uint64)
+            nwords = strs.shape[1]
+            capacity = max(capacity, len(strs))
+        self.ndet = 0
+        self._strs = numpy.empty((capacity,nwords), dtype=numpy.uint64)
+        self._slots = numpy.empty(0, dtype=numpy.int64)
+        if strs is not None:
+            self.insert(strs)
+
+    def __len__(self):
+        return self.ndet
+
+    def __contains__(self, string):
+        return self.lookup(string)[0] >= 0
+
+    @property
+    def strs(self):
+        return self._strs[:self.ndet]
+
+    def _reserve(self, ndet):
+        if ndet > self._strs.shape[0]:
+            buf = numpy.empty((max(ndet, self._strs.shape[0]*2),
+                               self._strs.shape[1]), dtype=numpy.uint64)
+            buf[:self.ndet] = self.strs
+            self._strs = buf
+
+        # Load factor of the table is kept below 0.5
+        nslots = 1 << max(4, int(2*ndet-1).bit_length())
+        if nslots > self._slots.size:
+            self._slots = numpy.empty(nslots, dtype=numpy.int64)
+            self._slots[:] = -1
+            if self.ndet > 0:
+                self._probe(self.strs, numpy.arange(self.ndet))
+
+    def _probe(self, strs, new_idx=None):
+        '''Search strs in the table.  If new_idx is given, the strings which
+        are not found are assigned to empty slots with the index new_idx.
+        self._strs[new_idx] needs to hold the strings.
+
+        Returns the index of each string (-1 for the strings not found), the
+        slot of each string and the mask of the strings which were assigned
+        to new slots.
+        '''
+        mask = self._slots.size - 1
+        pos = (hash_strs(strs) & numpy.uint64(mask)).astype(numpy.int64)
+        idx = numpy.empty(len(strs), dtype=numpy.int64)
+        idx[:] = -1
+        assigned = numpy.zeros(len(strs), dtype=bool)
+        pending = numpy.arange(len(strs))
+        while pending.size > 0:
+            found = self._slots[pos[pending]]
+            occupied = found >= 0
+            if new_idx is None:
+                retry = pending[:0]
+            else:
+                empty = pending[~occupied]
+                # One of the strings which hit the same empty slot takes
+                # the slot (the first one, as the last write is kept).  The
+                # others see an occupied slot in next round.
+                self._slots[pos[empty[::-1]]] = new_idx[empty[::-1]]
+                won = self._slots[pos[empty]] == new_idx[empty]
+                idx[empty[won]] = new_idx[empty[won]]
+                assigned[empty[won]] = True
+                retry = empty[~won]
+            occ = pending[occupied]
+            found = found[occupied]
+            same = (self._strs[found] == strs[occ]).all(axis=1)
+            idx[occ[same]] = found[same]
+            miss = occ[~same]
+            pos[miss] = (pos[miss] + 1) & mask
+            pending = numpy.hstack((retry, miss))
+        return idx, pos, assigned
+
+    def lookup(self, strs):
+        '''Index of each string in the table, -1 if not found'''
+        nwords = self._strs.shape[1]
+        strs = numpy.asarray(strs, dtype=numpy.uint64).reshape(-1,nwords)
+        if self.ndet == 0:
+            return numpy.zeros(len(strs), dtype=numpy.int64) - 1
+        return self._probe(strs)[0]
+
+    def insert(self, strs):
+        '''Add the strings which are not in the table.  Duplicated strings in
+        the input are added once.
+
+        Returns the indices of the input strings in the table.
+        '''
+        nwords = self._strs.shape[1]
+        strs = numpy.asarray(strs, dtype=numpy.uint64).reshape(-1,nwords)
+        n = len(strs)
+        ndet0 = self.ndet
+        if n == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        self._reserve(ndet0 + n)
+
+        # Stage all input strings after the existing strings, then compact
+        # the strings which were assigned to new slots.
+        self._strs[ndet0:ndet0+n] = strs
+        idx, pos, assigned = self._probe(strs, numpy.arange(ndet0, ndet0+n))
+        new_pos = numpy.where(assigned)[0]
+        nnew = new_pos.size
+        remap = numpy.empty(n, dtype=numpy.int64)
+        remap[new_pos] = numpy.arange(ndet0, ndet0+nnew)
+        self._strs[ndet0:ndet0+nnew] = strs[new_pos]
+        self._slots[pos[new_pos]] = remap[new_pos]
+        staged = idx >= ndet0
+        idx[staged] = remap[idx[staged]-ndet0]
+        self.ndet = ndet0 + nnew
+        return idx
+
+def hash_strs(strs):
+    '''Hash keys of the determinant strings (rows of uint64 words)'''
+    strs = numpy.asarray(strs, dtype=numpy.uint64)
+    h = numpy.zeros(len(strs), dtype=numpy.uint64)
+    with numpy.errstate(over='ignore'):
+        for k in range(strs.shape[1]):
+            h ^= strs[:,k]
+            h *= numpy.uint64(0x9e3779b97f4a7c15)
+            h ^= h >> numpy.uint64(29)
+    return h
+
+def _imap_bounded(pool, func, args, nmax):
+    '''Similar to pool.imap, but at most nmax tasks are submitted to the pool
+    ahead of the results which were consumed.  The results are yielded in
+    the order of args.
+    '''
+    args = iter(args)
+    tasks = collections.deque()
+    for x in args:
+        tasks.append(pool.apply_async(func, (x,)))
+        if len(tasks) >= nmax:
+            break
+    while tasks:
+        result = tasks.popleft().get()
+        for x in args:
+            tasks.append(pool.apply_async(func, (x,)))
+            break
+        yield result
+
+def select_strs_ctypes(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, nelec,
+                       table=None):
+    '''Select the strings connected to civec.  The selected strings are
+    added to the StringTable table.  Returns the strings which were not in
+    the table.
+
+    Batches of determinants are processed in parallel threads.
+    '''
     strs = civec._strs
-    ndet = strs.shape[0]
     ndet, nset = strs.shape
     nset = nset // 2
     neleca, nelecb = nelec
+    if table is None:
+        table = StringTable(strs)
+    ndet0 = len(table)
 
     h1 = numpy.asarray(h1, order='C')  
     eri = numpy.asarray(eri, order='C')
@@ -309,20 +506,16 @@ def select_strs_ctypes(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, ne
     eri_sorted = numpy.asarray(eri_sorted, order='C')
     jk_sorted = numpy.asarray(jk_sorted, order='C')
 
-    str_add = numpy.empty((0,strs.shape[1]), dtype=numpy.uint64)
-
-    ndet_batch = int(myci.max_memory * 1024**2) // (8 * 4 * neleca * nelecb * (norb-neleca) * (norb-nelecb))
-    nbatches = ndet // ndet_batch + 1
-
-    for i in range(nbatches):
-        ndet_start = ndet_batch * i
-        ndet_finish = min(ndet_batch * (i + 1), ndet)
-        ndet_select_max = 4 * neleca * nelecb * (norb-neleca) * (norb-nelecb) * ndet_batch
+    nthreads = max(1, min(lib.num_threads(), ndet))
+    nconnect = neleca * nelecb * (norb-neleca) * (norb-nelecb)
+    ndet_batch = int(myci.max_memory * 1024**2) // (8 * 4 * nconnect * nthreads)
+    ndet_batch = max(1, min(ndet_batch, (ndet+nthreads-1) // nthreads))
+    ndet_select_max = 4 * nconnect * ndet_batch
 
+    def select_batch(ndet_start):
+        ndet_finish = min(ndet_start + ndet_batch, ndet)
         str_add_batch = numpy.empty((ndet_select_max, strs.shape[1]), dtype=numpy.uint64)
-        n_str_add_batch = numpy.array([str_add_batch.shape[0]])
-
-        str_add_batch = numpy.asarray(str_add_batch, order='C')
+        n_str_add_batch = numpy.array([str_add_batch.shape[0]], dtype=numpy.uint64)
 
         libhci.select_strs(h1.ctypes.data_as(ctypes.c_void_p), 
                            eri.ctypes.data_as(ctypes.c_void_p), 
@@ -339,13 +532,27 @@ def select_strs_ctypes(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, ne
                            ctypes.c_double(myci.select_cutoff),
                            str_add_batch.ctypes.data_as(ctypes.c_void_p),
                            n_str_add_batch.ctypes.data_as(ctypes.c_void_p))
+        # Copy the selected strings to release the buffer of the batch
+        return str_add_batch[:n_str_add_batch[0]].copy()
+
+    # The ctypes calls release the GIL.  The batches are merged into the
+    # table in order, so the order of the strings does not depend on the
+    # number of threads.  At most nthreads batches are in flight so that the
+    # buffers fit in max_memory.
+    starts = range(0, ndet, ndet_batch)
+    if nthreads > 1 and len(starts) > 1:
+        pool = ThreadPool(nthreads)
+        try:
+            for str_add in _imap_bounded(pool, select_batch, starts, nthreads):
+                table.insert(str_add)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for ndet_start in starts:
+            table.insert(select_batch(ndet_start))
 
-        n_str_add_batch = n_str_add_batch[0]
-        str_add_batch = str_add_batch[:n_str_add_batch]
-        str_add = numpy.vstack((str_add, str_add_batch))
-
-    str_add = numpy.asarray(str_add)
-    return str_add
+    return table.strs[ndet0:]
 
 def enlarge_space(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, nelec):
     if not isinstance(civec, (tuple, list)):
@@ -362,27 +569,292 @@ def enlarge_space(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, nelec):
     strs = strs[cidx]
 
     ci_coeff = [as_SCIvector(c[cidx], strs) for c in civec]
- 
-    strs_new = strs.copy()
 
+    # The retained strings come first, followed by the strings selected for
+    # each root.  Strings already in the table are not added again.
+    table = StringTable(strs)
     for p in range(nroots):
-        str_add = select_strs_ctypes(myci, ci_coeff[p], h1, eri, jk, eri_sorted, jk_sorted, norb, nelec)
-        strs_new = numpy.vstack((strs, str_add))
-
-    # Add strings together and remove duplicate strings
-    tmp = numpy.ascontiguousarray(strs_new).view(numpy.dtype((numpy.void, strs_new.dtype.itemsize * strs_new.shape[1])))
-    _, tmpidx = numpy.unique(tmp, return_index=True)
+        select_strs_ctypes(myci, ci_coeff[p], h1, eri, jk, eri_sorted, jk_sorted,
+                           norb, nelec, table)
+    strs_new = table.strs.copy()
 
     new_ci = []
     for p in range(nroots):
         c = numpy.zeros(strs_new.shape[0])
         c[:ci_coeff[p].shape[0]] = ci_coeff[p]
-        new_ci.append(c[tmpidx])
-
-    strs_new = strs_new[tmpidx]
+        new_ci.append(c)
 
     return [as_SCIvector(ci, strs_new) for ci in new_ci]
 
+def _excitations(h1, eri, strs, norb, nelec):
+    '''All single and double excitations of the determinants strs.
+
+    Returns:
+        owner : the index of the determinant in strs which generates the
+            excitation
+        keys : the strings of the excited determinants
+        hij : the Hamiltonian matrix elements <keys|H|strs[owner]>
+    '''
+    ndet, nset = strs.shape
+    nset = nset // 2
+    neleca, nelecb = nelec
+    masks = select_ci._str_masks(numpy.arange(norb), nset)
+    rows = numpy.arange(ndet)
+
+    def spin_lists(part, nel):
+        occ = select_ci._occ_mask(strs[:,part], norb)
+        occlst = numpy.where(occ)[1].reshape(ndet,nel)
+        virlst = numpy.where(~occ)[1].reshape(ndet,norb-nel)
+        cnt = numpy.cumsum(occ, axis=1, dtype=numpy.int32)
+        return occlst, virlst, cnt
+    parta = slice(0, nset)
+    partb = slice(nset, nset*2)
+    occa, vira, cnta = spin_lists(parta, neleca)
+    occb, virb, cntb = spin_lists(partb, nelecb)
+
+    def between(cnt, owner, p, q):
+        lo = numpy.minimum(p, q)
+        hi = numpy.maximum(p, q)
+        return cnt[owner,hi-1] - cnt[owner,lo]
+
+    def singles(occ, vir, cnt):
+        nocc, nvir = occ.shape[1], vir.shape[1]
+        i = numpy.repeat(occ, nvir, axis=1).ravel()
+        a = numpy.tile(vir, (1,nocc)).ravel()
+        owner = numpy.repeat(rows, nocc*nvir)
+        sign = 1 - 2 * (between(cnt, owner, i, a) % 2)
+        return owner, i, a, sign
+
+    def fock_ai(owner, i, a, occ, occ_o):
+        k = occ[owner]
+        ko = occ_o[owner]
+        ai = (a[:,None], i[:,None])
+        return (h1[a,i] + (eri[ai+(k,k)] - eri[a[:,None],k,k,i[:,None]]).sum(axis=1)
+                + eri[ai+(ko,ko)].sum(axis=1))
+
+    def doubles(occ, vir, cnt):
+        oi, oj = numpy.triu_indices(occ.shape[1], 1)
+        va, vb = numpy.triu_indices(vir.shape[1], 1)
+        npo, npv = len(oi), len(va)
+        owner = numpy.repeat(rows, npo*npv)
+        i = numpy.repeat(occ[:,oi], npv, axis=1).ravel()
+        j = numpy.repeat(occ[:,oj], npv, axis=1).ravel()
+        a = numpy.tile(vir[:,va], (1,npo)).ravel()
+        b = numpy.tile(vir[:,vb], (1,npo)).ravel()
+        lo = numpy.minimum(j, b)
+        hi = numpy.maximum(j, b)
+        nperm = (between(cnt, owner, i, a) + between(cnt, owner, j, b) -
+                 ((lo < i) & (i < hi)) + ((lo < a) & (a < hi)))
+        v = (1 - 2 * (nperm % 2)) * (eri[a,i,b,j] - eri[a,j,b,i])
+        return owner, masks[i] ^ masks[j] ^ masks[a] ^ masks[b], v
+
+    owners = []
+    keys = []
+    hij = []
+    def add(owner, part, mask, v):
+        k = strs[owner]
+        k[:,part] ^= mask
+        owners.append(owner)
+        keys.append(k)
+        hij.append(v)
+
+    sa = singles(occa, vira, cnta)
+    sb = singles(occb, virb, cntb)
+    owner, i, a, sign = sa
+    add(owner, parta, masks[i] ^ masks[a], sign * fock_ai(owner, i, a, occa, occb))
+    owner, i, a, sign = sb
+    add(owner, partb, masks[i] ^ masks[a], sign * fock_ai(owner, i, a, occb, occa))
+    owner, mask, v = doubles(occa, vira, cnta)
+    add(owner, parta, mask, v)
+    owner, mask, v = doubles(occb, virb, cntb)
+    add(owner, partb, mask, v)
+
+    # alpha,beta -> alpha,beta
+    nsa = occa.shape[1] * vira.shape[1]
+    nsb = occb.shape[1] * virb.shape[1]
+    ka = (numpy.arange(ndet)[:,None] * nsa + numpy.arange(nsa)).repeat(nsb, axis=1).ravel()
+    kb = numpy.tile(numpy.arange(ndet)[:,None] * nsb + numpy.arange(nsb), (1,nsa)).ravel()
+    owner = sa[0][ka]
+    k = strs[owner]
+    k[:,parta] ^= masks[sa[1][ka]] ^ masks[sa[2][ka]]
+    k[:,partb] ^= masks[sb[1][kb]] ^ masks[sb[2][kb]]
+    owners.append(owner)
+    keys.append(k)
+    hij.append(sa[3][ka] * sb[3][kb] * eri[sa[2][ka],sa[1][ka],sb[2][kb],sb[1][kb]])
+
+    return numpy.hstack(owners), numpy.vstack(keys), numpy.hstack(hij)
+
+def _pt2_kernel(myci, h1, eri, strs, civec, norb, nelec, e0, table, gens,
+                fac1, fac2, cutoffs, max_memory, log):
+    '''sum_a (S1_a^2 + S2_a) / (e0 - H_aa) for the determinants a outside
+    the variational space, where
+    S1_a = sum_i fac1_i c_i H_ai,  S2_a = sum_i fac2_i (c_i H_ai)^2
+    over the generators i in gens.  The terms |c_i H_ai| <= cutoff are
+    dropped.  Returns the sum for each cutoff.
+
+    The external determinants are kept in a StringTable.  If they do not fit
+    in max_memory, the external space is split into shards by the hash keys
+    and the shards are computed one after another.  At most nthreads batches
+    of excitations are generated ahead of the accumulation.
+    '''
+    ndet, nset2 = strs.shape
+    ncut = len(cutoffs)
+    neleca, nelecb = nelec
+    nexc = (neleca * (norb-neleca) + nelecb * (norb-nelecb) +
+            neleca * (norb-neleca) * nelecb * (norb-nelecb) +
+            (neleca * (norb-neleca))**2 // 4 + (nelecb * (norb-nelecb))**2 // 4)
+    mem_now = lib.current_memory()[0]
+    max_memory = max(400, max_memory-mem_now)
+    nthreads = max(1, lib.num_threads())
+    blksize = int(max_memory*.25e6/8 / (nexc*(nset2+12)) / nthreads)
+    blksize = max(1, min(blksize, (len(gens)+nthreads-1)//nthreads))
+    max_ext = max(1024, int(max_memory*.5e6/8 / (nset2+5+ncut*2)))
+    cutoffs = numpy.asarray(cutoffs)
+    c = civec[gens]
+    hshift = numpy.uint64(40)
+
+    def generate(p0):
+        p1 = min(p0+blksize, len(gens))
+        owner, keys, hij = _excitations(h1, eri, strs[gens[p0:p1]], norb, nelec)
+        hc = hij * c[p0:p1][owner]
+        mask = abs(hc) > cutoffs.min()
+        owner, keys, hc = owner[mask]+p0, keys[mask], hc[mask]
+        mask = table.lookup(keys) < 0
+        owner, keys, hc = owner[mask], keys[mask], hc[mask]
+        return owner, keys, hc, hash_strs(keys) >> hshift
+
+    e2 = numpy.zeros(ncut)
+    shards = [(0, 1)]
+    while shards:
+        r, n = shards.pop(0)
+        ext = StringTable(nwords=nset2)
+        s1 = numpy.zeros((ncut,0))
+        s2 = numpy.zeros((ncut,0))
+        pool = ThreadPool(nthreads)
+        try:
+            for owner, keys, hc, h in _imap_bounded(pool, generate,
+                                                    range(0, len(gens), blksize),
+                                                    nthreads):
+                mask = h % numpy.uint64(n) == r
+                owner, keys, hc = owner[mask], keys[mask], hc[mask]
+                idx = ext.insert(keys)
+                if len(ext) > s1.shape[1]:
+                    size = max(len(ext), s1.shape[1]*2)
+                    s1 = numpy.hstack((s1, numpy.zeros((ncut,size-s1.shape[1]))))
+                    s2 = numpy.hstack((s2, numpy.zeros((ncut,size-s2.shape[1]))))
+                for k, cutoff in enumerate(cutoffs):
+                    mask = abs(hc) > cutoff
+                    s1[k] += numpy.bincount(idx[mask], hc[mask]*fac1[owner[mask]],
+                                            minlength=s1.shape[1])
+                    if fac2 is not None:
+                        s2[k] += numpy.bincount(idx[mask], hc[mask]**2*fac2[owner[mask]],
+                                                minlength=s2.shape[1])
+
+                if len(ext) > max_ext:
+                    # Split the shard.  Keep the determinants of the first
+                    # half and compute the second half later.
+                    shards.append((r+n, n*2))
+                    r, n = r, n*2
+                    keep = (hash_strs(ext.strs) >> hshift) % numpy.uint64(n) == r
+                    s1 = s1[:,:len(ext)][:,keep]
+                    s2 = s2[:,:len(ext)][:,keep]
+                    ext = StringTable(ext.strs[keep])
+                    log.debug1('PT2 external space exceeds max_memory. '
+                               'Split the external space into %d shards', n)
+        finally:
+            pool.close()
+            pool.join()
+
+        if len(ext) > 0:
+            hdiag = make_hdiag(h1, eri, ext.strs, norb, nelec)
+            e2 += ((s1[:,:len(ext)]**2 + s2[:,:len(ext)]) / (e0 - hdiag)).sum(axis=1)
+            log.debug1('PT2 shard %d/%d  %d external determinants', r, n, len(ext))
+    return e2
+
+def _enpt2(myci, h1, eri, strs, civecs, norb, nelec, e0, log):
+    eri = ao2mo.restore(1, eri, norb)
+    table = StringTable(strs)
+    cutoff = myci.pt2_cutoff
+    cutoff_dtm = myci.pt2_cutoff_dtm
+    stochastic = cutoff_dtm is not None and cutoff_dtm > cutoff
+    if not stochastic:
+        cutoff_dtm = cutoff
+
+    e2 = []
+    e2_err = []
+    for k, civec in enumerate(civecs):
+        t0 = (time.clock(), time.time())
+        civec = numpy.asarray(civec).ravel()
+        civec = civec / numpy.linalg.norm(civec)
+        gens = numpy.where(civec != 0)[0]
+        ed = _pt2_kernel(myci, h1, eri, strs, civec, norb, nelec, e0[k],
+                         table, gens, numpy.ones(len(gens)), None,
+                         [cutoff_dtm], myci.max_memory, log)[0]
+        err = 0
+        if stochastic:
+            # Semistochastic estimator for the correction from the terms
+            # cutoff < |c_i H_ai| <= cutoff_dtm (JCTC 13, 1595)
+            nsamp = myci.pt2_nsamples
+            prob = abs(civec) / abs(civec).sum()
+            es = []
+            for ibatch in range(myci.pt2_nbatch):
+                w = numpy.random.multinomial(nsamp, prob)
+                gens = numpy.where(w > 0)[0]
+                w = w[gens]
+                p = prob[gens]
+                fac1 = w / p
+                fac2 = w * (nsamp-1) / p - (w / p)**2
+                e = _pt2_kernel(myci, h1, eri, strs, civec, norb, nelec, e0[k],
+                                table, gens, fac1, fac2, [cutoff, cutoff_dtm],
+                                myci.max_memory, log)
+                es.append((e[0] - e[1]) / (nsamp * (nsamp-1)))
+            ed += numpy.mean(es)
+            err = numpy.std(es, ddof=1) / numpy.sqrt(len(es))
+        log.timer('EN-PT2 of root %d' % k, *t0)
+        log.info('Root %d  E(PT2) = %.15g  +/- %.3g', k, ed, err)
+        e2.append(ed)
+        e2_err.append(err)
+    return e2, e2_err
+
+def enpt2(myci, h1, eri, civec, norb, nelec, e0=None, verbose=None):
+    '''Epstein-Nesbet second order correction from the determinants outside
+    the selected space.
+
+    The external determinants connected to civec are enumerated in batches
+    of the variational determinants on a pool of threads.  The terms
+    |c_i H_ai| below myci.pt2_cutoff are dropped.  If myci.pt2_cutoff_dtm
+    is larger than pt2_cutoff, the terms between the two thresholds are
+    computed by the semistochastic estimator with myci.pt2_nbatch batches of
+    myci.pt2_nsamples samples.
+
+    Args:
+        civec : an SCIvector or a list of SCIvectors
+        e0 : the variational energies (without the core energy).  They are
+            computed from civec by default.
+
+    Returns:
+        e2, e2_err : the PT2 corrections and the stochastic errors (0 for the
+        deterministic algorithm).  Lists if civec is a list.
+    '''
+    log = logger.new_logger(myci, verbose)
+    nelec = direct_spin1._unpack_nelec(nelec, myci.spin)
+    if isinstance(civec, (tuple, list)):
+        civecs = civec
+    else:
+        civecs = [civec]
+    strs = numpy.asarray(civecs[0]._strs, dtype=numpy.uint64)
+    if e0 is None:
+        e0 = [numpy.dot(c, contract_2e_ctypes((h1, eri), c, norb, nelec)) /
+              numpy.dot(c, c) for c in civecs]
+    elif not isinstance(e0, (tuple, list, numpy.ndarray)):
+        e0 = [e0]
+    eri = ao2mo.restore(1, eri, norb)
+    e2, e2_err = _enpt2(myci, h1, eri, strs, civecs, norb, nelec, e0, log)
+    if isinstance(civec, (tuple, list)):
+        return e2, e2_err
+    else:
+        return e2[0], e2_err[0]
+
 def str2orblst(string, norb):
     occ = []
     vir = []
@@ -504,6 +976,8 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
     log.info('\nExtra CI in the final selected space')
     log.info('Number of CI configurations: %d', ci_strs.shape[0])
     hdiag = myci.make_hdiag(h1e, eri, ci_strs, norb, nelec)
+    if myci.cache_hamiltonian:
+        hop = make_sparse_h(h1e, eri, ci_strs, norb, nelec, hdiag, max_memory, log)
     e, c = myci.eig(hop, ci0, precond, tol=tol, lindep=lindep,
                     max_cycle=max_cycle, max_space=max_space, nroots=nroots,
                     max_memory=max_memory, verbose=log, **kwargs)
@@ -693,6 +1167,16 @@ class SelectedCI(direct_spin1.FCISolver):
         self.max_iter = 10
         # Maximum memory in MB for storing lists of selected strings
         self.max_memory = 1000
+        # Compute the Hamiltonian matrix once and store it in sparse format
+        # for the last diagonalization in the final selected space
+        self.cache_hamiltonian = False
+        # EN-PT2 correction: the terms |c_i H_ai| below pt2_cutoff are
+        # dropped.  The terms between pt2_cutoff and pt2_cutoff_dtm are
+        # estimated stochastically if pt2_cutoff_dtm is given.
+        self.pt2_cutoff = 0
+        self.pt2_cutoff_dtm = None
+        self.pt2_nsamples = 200
+        self.pt2_nbatch = 10
 
 ##################################################
 # don't modify the following attributes, they are not input options
@@ -705,6 +1189,7 @@ class SelectedCI(direct_spin1.FCISolver):
         direct_spin1.FCISolver.dump_flags(self, verbose)
         logger.info(self, 'ci_coeff_cutoff %g', self.ci_coeff_cutoff)
         logger.info(self, 'select_cutoff   %g', self.select_cutoff)
+        logger.info(self, 'cache_hamiltonian %s', self.cache_hamiltonian)
 
     # define absorb_h1e for compatibility to other FCI solver
     def absorb_h1e(h1, eri, *args, **kwargs):
@@ -760,6 +1245,8 @@ class SelectedCI(direct_spin1.FCISolver):
 
     enlarge_space = enlarge_space
     kernel = kernel_float_space
+    eig = select_ci.eig
+    enpt2 = enpt2
 
 SCI = SelectedCI
 
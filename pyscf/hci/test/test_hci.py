@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import unittest
+import numpy
+from pyscf.fci import cistring
+from pyscf.fci import direct_spin1
+from pyscf.hci import hci
+
+norb = 6
+nelec = 3, 3
+hf_str = numpy.hstack([hci.orblst2str(range(nelec[0]), norb),
+                       hci.orblst2str(range(nelec[1]), norb)]).reshape(1,-1)
+numpy.random.seed(3)
+h1 = numpy.random.random([norb]*2)**4 * 1e-2
+h1 = h1 + h1.T
+eri = numpy.random.random([norb]*4)**4 * 1e-2
+eri = eri + eri.transpose(0,1,3,2)
+eri = eri + eri.transpose(1,0,2,3)
+eri = eri + eri.transpose(2,3,0,1)
+eri_sorted = abs(eri).argsort()[::-1]
+jk = eri.reshape([norb]*4)
+jk = jk - jk.transpose(2,1,0,3)
+jk = jk.ravel()
+jk_sorted = abs(jk).argsort()[::-1]
+ci1 = [hci.as_SCIvector(numpy.ones(1), hf_str)]
+
+myci = hci.SelectedCI()
+myci.select_cutoff = .001
+myci.ci_coeff_cutoff = .001
+
+def uniq_rows(strs):
+    return set(tuple(s) for s in strs)
+
+class KnowValues(unittest.TestCase):
+    def test_string_table(self):
+        numpy.random.seed(1)
+        strs = (numpy.random.random((300,2)) * 40).astype(numpy.uint64)
+        table = hci.StringTable(nwords=2, capacity=16)
+        idx = table.insert(strs[:200])
+        idx = numpy.hstack((idx, table.insert(strs[200:])))
+
+        ref = []
+        for s in strs:
+            if tuple(s) not in ref:
+                ref.append(tuple(s))
+        self.assertEqual(len(table), len(ref))
+        self.assertTrue(numpy.all(table.strs == numpy.array(ref)))
+        self.assertTrue(numpy.all(table.strs[idx] == strs))
+        self.assertTrue(numpy.all(table.lookup(strs) == idx))
+
+        missing = numpy.array([[41,0], [0,41]], dtype=numpy.uint64)
+        self.assertTrue(numpy.all(table.lookup(missing) == -1))
+        self.assertTrue(strs[5] in table)
+        self.assertFalse(missing[0] in table)
+
+    def test_enlarge_space(self):
+        ci2 = hci.enlarge_space(myci, ci1, h1, eri, jk, eri_sorted, jk_sorted,
+                                norb, nelec)
+        strs = ci2[0]._strs
+        self.assertTrue(numpy.all(strs[0] == hf_str[0]))
+        self.assertEqual(len(uniq_rows(strs)), len(strs))
+
+        # Every root contributes to the selected space
+        numpy.random.seed(1)
+        c0 = numpy.random.random(len(strs)) + .1
+        c1 = numpy.zeros(len(strs))
+        c1[-1] = 1
+        civec = [hci.as_SCIvector(c, strs) for c in (c0, c1)]
+        ci3 = hci.enlarge_space(myci, civec, h1, eri, jk, eri_sorted, jk_sorted,
+                                norb, nelec)
+        strs3 = ci3[0]._strs
+        self.assertEqual(len(uniq_rows(strs3)), len(strs3))
+        self.assertTrue(numpy.all(strs3[:len(strs)] == strs))
+        ref = set()
+        for c in civec:
+            s = hci.enlarge_space(myci, c, h1, eri, jk, eri_sorted, jk_sorted,
+                                  norb, nelec)[0]._strs
+            ref.update(uniq_rows(s))
+        self.assertEqual(uniq_rows(strs3), ref)
+        self.assertTrue(numpy.all(ci3[0][:len(strs)] == c0))
+        self.assertTrue(numpy.all(ci3[1][:len(strs)] == c1))
+        self.assertAlmostEqual(abs(ci3[0][len(strs):]).max(), 0, 14)
+
+    def test_select_strs_batches(self):
+        ci2 = hci.enlarge_space(myci, ci1, h1, eri, jk, eri_sorted, jk_sorted,
+                                norb, nelec)
+        numpy.random.seed(2)
+        civec = hci.as_SCIvector(numpy.random.random(len(ci2[0])), ci2[0]._strs)
+        ref = hci.select_strs_ctypes(myci, civec, h1, eri, jk, eri_sorted,
+                                     jk_sorted, norb, nelec)
+        # Small max_memory to select the strings in many batches
+        myci1 = hci.SelectedCI()
+        myci1.select_cutoff = myci.select_cutoff
+        myci1.max_memory = 1e-4
+        strs = hci.select_strs_ctypes(myci1, civec, h1, eri, jk, eri_sorted,
+                                      jk_sorted, norb, nelec)
+        self.assertTrue(numpy.all(strs == ref))
+
+    def test_make_sparse_h(self):
+        strsa = cistring.gen_strings4orblist(range(norb), nelec[0])
+        strsb = cistring.gen_strings4orblist(range(norb), nelec[1])
+        strs = numpy.array([(a, b) for a in strsa for b in strsb],
+                           dtype=numpy.uint64)
+        numpy.random.seed(5)
+        strs = strs[numpy.random.random(len(strs)) > .6]
+        c0 = hci.as_SCIvector(numpy.random.random(len(strs)) - .5, strs)
+        c1 = hci.as_SCIvector(numpy.random.random(len(strs)) - .5, strs)
+        hop = hci.make_sparse_h(h1, eri, strs, norb, nelec)
+        ref0 = hci.contract_2e_ctypes((h1, eri), c0, norb, nelec)
+        ref1 = hci.contract_2e_ctypes((h1, eri), c1, norb, nelec)
+        self.assertAlmostEqual(abs(hop(c0) - ref0).max(), 0, 12)
+        hc0, hc1 = hop.dot([c0, c1])
+        self.assertAlmostEqual(abs(hc0 - ref0).max(), 0, 12)
+        self.assertAlmostEqual(abs(hc1 - ref1).max(), 0, 12)
+
+    def test_enpt2(self):
+        strsa = cistring.gen_strings4orblist(range(norb), nelec[0])
+        strsb = cistring.gen_strings4orblist(range(norb), nelec[1])
+        strs = numpy.array([(a, b) for a in strsa for b in strsb],
+                           dtype=numpy.uint64)
+        numpy.random.seed(4)
+        mask = numpy.random.random(len(strs)) > .7
+        mask[0] = True
+        strs = strs[mask]
+        civec = hci.as_SCIvector(numpy.random.random(len(strs)) - .5, strs)
+        e2 = hci.enpt2(myci, h1, eri, civec, norb, nelec)[0]
+
+        ci0 = hci.to_fci([civec], norb, nelec)
+        ci0 /= numpy.linalg.norm(ci0)
+        h2e = direct_spin1.absorb_h1e(h1, eri, norb, nelec, .5)
+        hc = direct_spin1.contract_2e(h2e, ci0, norb, nelec)
+        e0 = numpy.dot(ci0.ravel(), hc.ravel())
+        hdiag = direct_spin1.make_hdiag(h1, eri, norb, nelec).reshape(hc.shape)
+        v = hci.as_SCIvector(numpy.ones(len(strs)), strs)
+        ext = hci.to_fci([v], norb, nelec) == 0
+        self.assertAlmostEqual(e2, (hc[ext]**2/(e0-hdiag[ext])).sum(), 9)
+
+
+if __name__ == "__main__":
+    print("Full Tests for hci")
+    unittest.main()
@@ -16,6 +16,10 @@ from pyscf.lib import logger
 from pyscf.scf import _vhf
 from pyscf.scf import cphf
 
+# The first order density matrices smaller than this threshold are not
+# included in the J/K builds of the CPHF iterations
+DM1_SCREEN = 1e-14
+
 
 def hess_elec(hess_mf, mo_energy=None, mo_coeff=None, mo_occ=None,
               atmlst=None, max_memory=4000, verbose=None):
@@ -208,10 +212,14 @@ def solve_mo1(mf, mo_energy, mo_coeff, mo_occ, h1ao_or_chkfile,
 
     if fx is None:
         def fx(mo1):
-            dm1 = numpy.einsum('xai,pa,qi->xpq', mo1, mo_coeff, mocc*2)
+            dm1 = lib.einsum('xai,pa,qi->xpq', mo1, mo_coeff, mocc*2)
             dm1 = dm1 + dm1.transpose(0,2,1)
-            v1 = mf.get_veff(mol, dm1)
-            return numpy.einsum('xpq,pa,qi->xai', v1, mo_coeff, mocc)
+            # Skip the J/K builds for the negligible first order densities
+            mask = abs(dm1).reshape(len(dm1),-1).max(axis=1) > DM1_SCREEN
+            v1 = numpy.zeros_like(dm1)
+            if mask.any():
+                v1[mask] = mf.get_veff(mol, dm1[mask])
+            return lib.einsum('xpq,pa,qi->xai', v1, mo_coeff, mocc)
 
     offsetdic = mol.offset_nr_by_atom()
     mem_now = lib.current_memory()[0]
@@ -238,7 +246,8 @@ def solve_mo1(mf, mo_energy, mo_coeff, mo_occ, h1ao_or_chkfile,
             h1vo.append(numpy.einsum('xpq,pi,qj->xij', h1ao, mo_coeff, mocc))
         h1vo = numpy.vstack(h1vo)
         s1vo = numpy.vstack(s1vo)
-        mo1, e1 = cphf.solve(fx, mo_energy, mo_occ, h1vo, s1vo)
+        mo1, e1 = cphf.solve(fx, mo_energy, mo_occ, h1vo, s1vo, block=True,
+                             verbose=log)
         mo1 = numpy.einsum('pq,xqi->xpi', mo_coeff, mo1).reshape(-1,3,nmo,nocc)
         if isinstance(h1ao_or_chkfile, str):
             for k in range(ia1-ia0):
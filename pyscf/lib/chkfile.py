@@ -3,9 +3,12 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
+import os
 import json
+import numpy
 import h5py
 import pyscf.gto
+from pyscf.lib.misc import call_in_background
 
 def load_chkfile_key(chkfile, key):
     return load(chkfile, key)
@@ -36,26 +39,30 @@ def load(chkfile, key):
     >>> scfdat.keys()
     ['e_tot', 'mo_occ', 'mo_energy', 'mo_coeff']
     '''
-    def load_as_dic(key, group):
-        if key in group:
-            val = group[key]
-        elif key + '__from_list__' in group:
-            key = key + '__from_list__'
-            val = group[key]
-        else:
-            return None
-
-        if isinstance(val, h5py.Group):
-            if key.endswith('__from_list__'):
-                return [load_as_dic(k, val) for k in val]
-            else:
-                return dict([(k.replace('__from_list__', ''),
-                              load_as_dic(k, val)) for k in val])
-        else:
-            return val.value
+    sess = _get_session(chkfile)
+    if sess is not None:
+        return sess.load(key)
 
     with h5py.File(chkfile, 'r') as fh5:
-        return load_as_dic(key, fh5)
+        return _load_as_dic(key, fh5)
+
+def _load_as_dic(key, group):
+    if key in group:
+        val = group[key]
+    elif key + '__from_list__' in group:
+        key = key + '__from_list__'
+        val = group[key]
+    else:
+        return None
+
+    if isinstance(val, h5py.Group):
+        if key.endswith('__from_list__'):
+            return [_load_as_dic(k, val) for k in val]
+        else:
+            return dict([(k.replace('__from_list__', ''),
+                          _load_as_dic(k, val)) for k in val])
+    else:
+        return val.value
 
 def dump_chkfile_key(chkfile, key, value):
     dump(chkfile, key, value)
@@ -92,25 +99,10 @@ def dump(chkfile, key, value):
     >>> f['symm/Ci/op']
     <HDF5 dataset "op": shape (2,), type "|S1">
     '''
-    def save_as_group(key, value, root):
-        if isinstance(value, dict):
-            root1 = root.create_group(key)
-            for k in value:
-                save_as_group(k, value[k], root1)
-        elif isinstance(value, (tuple, list)):
-            root1 = root.create_group(key + '__from_list__')
-            for k, v in enumerate(value):
-                save_as_group(str(k), v, root1)
-        else:
-            try:
-                root[key] = value
-            except (TypeError, ValueError) as e:
-                if not (e.args[0] == "Object dtype dtype('O') has no native HDF5 equivalent" or
-                        e.args[0].startswith('could not broadcast input array')):
-                    raise e
-                root1 = root.create_group(key + '__from_list__')
-                for k, v in enumerate(value):
-                    save_as_group(str(k), v, root1)
+    sess = _get_session(chkfile)
+    if sess is not None:
+        sess.dump(key, value)
+        return
 
     if h5py.is_hdf5(chkfile):
         with h5py.File(chkfile, 'r+') as fh5:
@@ -118,10 +110,217 @@ def dump(chkfile, key, value):
                 del(fh5[key])
             elif key + '__from_list__' in fh5:
                 del(fh5[key+'__from_list__'])
-            save_as_group(key, value, fh5)
+            _save_as_group(key, value, fh5)
     else:
         with h5py.File(chkfile, 'w') as fh5:
-            save_as_group(key, value, fh5)
+            _save_as_group(key, value, fh5)
+
+def _save_as_group(key, value, root):
+    if isinstance(value, dict):
+        root1 = root.create_group(key)
+        for k in value:
+            _save_as_group(k, value[k], root1)
+    elif isinstance(value, (tuple, list)):
+        root1 = root.create_group(key + '__from_list__')
+        for k, v in enumerate(value):
+            _save_as_group(str(k), v, root1)
+    else:
+        try:
+            root[key] = value
+        except (TypeError, ValueError) as e:
+            if not (e.args[0] == "Object dtype dtype('O') has no native HDF5 equivalent" or
+                    e.args[0].startswith('could not broadcast input array')):
+                raise e
+            root1 = root.create_group(key + '__from_list__')
+            for k, v in enumerate(value):
+                _save_as_group(str(k), v, root1)
+
+
+# Chkfile sessions which are currently open, indexed by the absolute path
+_sessions = {}
+
+def _get_session(chkfile):
+    if chkfile and _sessions:
+        return _sessions.get(os.path.abspath(chkfile))
+
+def session(chkfile, compression=None, async_write=False):
+    '''Keep chkfile open and update the saved arrays in place.
+
+    While the session is open, :func:`dump` and :func:`load` of the same
+    chkfile are redirected to the session.  Datasets of unchanged shape and
+    dtype are overwritten in place and values which are identical to the last
+    written ones are not written again.  Opening a session for a chkfile which
+    is already in a session returns the existing session.
+
+    Args:
+        chkfile : str
+            Name of chkfile.  If chkfile is None or empty, the session does
+            nothing.
+
+    Kwargs:
+        compression : str or int
+            HDF5 compression filter (eg 'gzip', 'lzf' or the gzip level) for
+            the newly created array datasets.
+        async_write : bool
+            Whether to write the data in a background thread.
+
+    Examples:
+
+    >>> from pyscf import lib
+    >>> with lib.chkfile.session('tmp.chk', compression='gzip') as chk:
+    ...     for i in range(10):
+    ...         lib.chkfile.dump('tmp.chk', 'a', numpy.ones((4,4)) * i)
+    '''
+    sess = _get_session(chkfile)
+    if sess is None:
+        sess = ChkfileSession(chkfile, compression, async_write)
+    else:
+        sess._nref += 1
+    return sess
+
+class ChkfileSession(object):
+    '''An open chkfile.  See :func:`session`'''
+    def __init__(self, chkfile, compression=None, async_write=False):
+        self.chkfile = chkfile
+        self.compression = compression
+        self.async_write = async_write
+        self.fh5 = None
+        # Copies of the arrays last written to the file, indexed by the
+        # dataset path, to skip the writes of unchanged data
+        self._last = {}
+        self._nref = 1
+        self._bg = None
+        if chkfile:
+            if h5py.is_hdf5(chkfile):
+                self.fh5 = h5py.File(chkfile, 'r+')
+            else:
+                self.fh5 = h5py.File(chkfile, 'w')
+            _sessions[os.path.abspath(chkfile)] = self
+            if async_write:
+                self._bg = call_in_background(self._dump)
+                self._async_dump = self._bg.__enter__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def dump(self, key, value):
+        if self.fh5 is None:
+            return
+        if self._bg is not None:
+            self._async_dump(key, _copy(value))
+        else:
+            self._dump(key, value)
+
+    def _dump(self, key, value):
+        self._update(self.fh5, key, value)
+        self.fh5.flush()
+
+    def _update(self, root, key, value):
+        path = root.name.rstrip('/') + '/' + key
+        if isinstance(value, dict):
+            self._delete(root, key + '__from_list__')
+            if key in root and not isinstance(root[key], h5py.Group):
+                self._delete(root, key)
+            group = root.require_group(key)
+            for k in list(group.keys()):
+                if k.replace('__from_list__', '') not in value:
+                    self._delete(group, k)
+            for k in value:
+                self._update(group, k, value[k])
+            return
+
+        if not isinstance(value, (tuple, list)):
+            arr = numpy.asarray(value)
+            if arr.dtype.kind in 'biufc':
+                last = self._last.get(path)
+                if (isinstance(last, numpy.ndarray) and last.dtype == arr.dtype and
+                    last.shape == arr.shape and numpy.array_equal(last, arr)):
+                    return
+                self._delete(root, key + '__from_list__')
+                if (key in root and isinstance(root[key], h5py.Dataset) and
+                    root[key].shape == arr.shape and
+                    root[key].dtype == arr.dtype):
+                    root[key][...] = arr
+                else:
+                    self._delete(root, key)
+                    if self.compression is not None and arr.size > 1:
+                        root.create_dataset(key, data=arr,
+                                            compression=self.compression)
+                    else:
+                        root[key] = arr
+                self._last[path] = arr.copy()
+                return
+
+        last = self._last.get(path)
+        if isinstance(value, str) and isinstance(last, str) and last == value:
+            return
+        # Strings, lists etc. are rewritten
+        self._delete(root, key)
+        self._delete(root, key + '__from_list__')
+        _save_as_group(key, value, root)
+        if isinstance(value, str):
+            self._last[path] = value
+
+    def _delete(self, root, key):
+        if key in root:
+            del(root[key])
+            path = root.name.rstrip('/') + '/' + key
+            for k in [k for k in self._last
+                      if k == path or k.startswith(path+'/')]:
+                del(self._last[k])
+
+    def flush(self):
+        '''Wait for the background writes and flush the file'''
+        if self._bg is not None and self._bg.handler is not None:
+            self._bg.handler.join()
+        if self.fh5 is not None:
+            self.fh5.flush()
+        return self
+
+    def load(self, key):
+        self.flush()
+        return _load_as_dic(key, self.fh5)
+
+    def __contains__(self, key):
+        self.flush()
+        return key in self.fh5 or key + '__from_list__' in self.fh5
+
+    def close(self):
+        self._nref -= 1
+        if self._nref > 0 or self.fh5 is None:
+            return
+        try:
+            if self._bg is not None:
+                self._bg.__exit__(None, None, None)
+                self._bg = None
+        finally:
+            self.fh5.close()
+            self.fh5 = None
+            self._last = {}
+            del(_sessions[os.path.abspath(self.chkfile)])
+
+def _copy(value):
+    if isinstance(value, dict):
+        return dict([(k, _copy(v)) for k, v in value.items()])
+    elif isinstance(value, (tuple, list)):
+        return [_copy(v) for v in value]
+    elif isinstance(value, numpy.ndarray):
+        return value.copy()
+    else:
+        return value
+
+def _haskey(chkfile, key):
+    sess = _get_session(chkfile)
+    if sess is not None:
+        return key in sess
+    elif h5py.is_hdf5(chkfile):
+        with h5py.File(chkfile, 'r') as fh5:
+            return key in fh5
+    else:
+        return False
 
 
 def load_mol(chkfile):
@@ -143,24 +342,23 @@ def load_mol(chkfile):
     >>> lib.chkfile.load_mol('He.chk')
     <pyscf.gto.mole.Mole object at 0x7fdcd94d7f50>
     '''
+    molstr = load(chkfile, 'mol')
     try:
-        with h5py.File(chkfile, 'r') as fh5:
-            mol = pyscf.gto.loads(fh5['mol'].value)
+        mol = pyscf.gto.loads(molstr)
     except:
 # Compatibility to the old serialization format
 # TODO: remove it in future release
         from numpy import array
-        with h5py.File(chkfile, 'r') as fh5:
-            mol = pyscf.gto.Mole()
-            mol.output = '/dev/null'
-            moldic = eval(fh5['mol'].value)
-            for key in ('mass', 'grids', 'light_speed'):
-                if key in moldic:
-                    del(moldic[key])
-            mol.build(False, False, **moldic)
+        mol = pyscf.gto.Mole()
+        mol.output = '/dev/null'
+        moldic = eval(molstr)
+        for key in ('mass', 'grids', 'light_speed'):
+            if key in moldic:
+                del(moldic[key])
+        mol.build(False, False, **moldic)
     return mol
 
-def save_mol(mol, chkfile):
+def save_mol(mol, chkfile, overwrite=True):
     '''Save Mole object in chkfile
 
     Args:
@@ -169,9 +367,15 @@ def save_mol(mol, chkfile):
         chkfile : str
             Name of chkfile.
 
+    Kwargs:
+        overwrite : bool
+            If False, the Mole object is only saved when the chkfile does not
+            have the key "mol".
+
     Returns:
         No return value
     '''
-    dump(chkfile, 'mol', mol.dumps())
+    if overwrite or not _haskey(chkfile, 'mol'):
+        dump(chkfile, 'mol', mol.dumps())
 dump_mol = save_mol
 
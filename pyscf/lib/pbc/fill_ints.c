@@ -48,6 +48,27 @@ static void shift_bas(double *env_loc, double *env, double *Ls, int ptr, int iL)
         env_loc[ptr+2] = env[ptr+2] + Ls[iL*3+2];
 }
 
+/*
+ * rcut2 is the table of the squared distance cutoff for each (i,j) shell
+ * pair of shls_slice.  Beyond the cutoff, the product of the two shells is
+ * negligible.  rcut2 = NULL means no screening.
+ */
+static double pair_rcut2(double *rcut2, int *shls_slice, int ish, int jsh)
+{
+        if (rcut2 == NULL) {
+                return 1e200;
+        }
+        return rcut2[ish * (shls_slice[3] - shls_slice[2]) + jsh];
+}
+
+static double pair_dist2(double *env_loc, int iptrxyz, int jptrxyz)
+{
+        double dx = env_loc[iptrxyz+0] - env_loc[jptrxyz+0];
+        double dy = env_loc[iptrxyz+1] - env_loc[jptrxyz+1];
+        double dz = env_loc[iptrxyz+2] - env_loc[jptrxyz+2];
+        return dx * dx + dy * dy + dz * dz;
+}
+
 static void sort3c_kks1(double complex *out, double *bufr, double *bufi,
                         int *kptij_idx, int *shls_slice, int *ao_loc,
                         int nkpts, int nkpts_ij, int comp, int ish, int jsh,
@@ -110,7 +131,7 @@ static void sort3c_kks1(double complex *out, double *bufr, double *bufi,
 static void _nr3c_fill_kk(int (*intor)(), void (*fsort)(),
                           double complex *out, int nkpts_ij,
                           int nkpts, int comp, int nimgs, int ish, int jsh,
-                          double *buf, double *env_loc, double *Ls,
+                          double *buf, double *env_loc, double *Ls, double *rcut2,
                           double *expkL_r, double *expkL_i, int *kptij_idx,
                           int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                           int *atm, int natm, int *bas, int nbas, double *env)
@@ -125,6 +146,7 @@ static void _nr3c_fill_kk(int (*intor)(), void (*fsort)(),
         const double D1 = 1;
         const double ND1 = -1;
 
+        const double rij2 = pair_rcut2(rcut2, shls_slice, ish, jsh);
         jsh += jsh0;
         ish += ish0;
         int iptrxyz = atm[PTR_COORD+bas[ATOM_OF+ish*BAS_SLOTS]*ATM_SLOTS];
@@ -166,6 +188,11 @@ static void _nr3c_fill_kk(int (*intor)(), void (*fsort)(),
                                 pbuf = bufL;
         for (jL = 0; jL < nimgs; jL++) {
                 shift_bas(env_loc, env, Ls, jptrxyz, jL);
+                if (pair_dist2(env_loc, iptrxyz, jptrxyz) > rij2) {
+                        memset(pbuf, 0, sizeof(double) * dijm);
+                        pbuf += dijm;
+                        continue;
+                }
                 for (ksh = msh0; ksh < msh1; ksh++) {
                         shls[2] = ksh;
                         if ((*intor)(pbuf, NULL, shls, atm, natm, bas, nbas,
@@ -207,14 +234,14 @@ static void _nr3c_fill_kk(int (*intor)(), void (*fsort)(),
 /* ('...LM,kL,lM->...kl', int3c, exp_kL, exp_kL) */
 void PBCnr3c_fill_kks1(int (*intor)(), double complex *out, int nkpts_ij,
                        int nkpts, int comp, int nimgs, int ish, int jsh,
-                       double *buf, double *env_loc, double *Ls,
+                       double *buf, double *env_loc, double *Ls, double *rcut2,
                        double *expkL_r, double *expkL_i, int *kptij_idx,
                        int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                        int *atm, int natm, int *bas, int nbas, double *env)
 {
         _nr3c_fill_kk(intor, &sort3c_kks1, out,
                       nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                      buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                      buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                       shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
 }
 
@@ -292,7 +319,7 @@ static void sort3c_kks2_igtj(double complex *out, double *bufr, double *bufi,
 /* ('...LM,kL,lM->...kl', int3c, exp_kL, exp_kL) */
 void PBCnr3c_fill_kks2(int (*intor)(), double complex *out, int nkpts_ij,
                        int nkpts, int comp, int nimgs, int ish, int jsh,
-                       double *buf, double *env_loc, double *Ls,
+                       double *buf, double *env_loc, double *Ls, double *rcut2,
                        double *expkL_r, double *expkL_i, int *kptij_idx,
                        int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                        int *atm, int natm, int *bas, int nbas, double *env)
@@ -302,12 +329,12 @@ void PBCnr3c_fill_kks2(int (*intor)(), double complex *out, int nkpts_ij,
         if (ip > jp) {
                 _nr3c_fill_kk(intor, &sort3c_kks2_igtj, out,
                               nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                              buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                              buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                               shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
         } else if (ip == jp) {
                 _nr3c_fill_kk(intor, &sort3c_kks1, out,
                               nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                              buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                              buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                               shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
         }
 }
@@ -371,7 +398,7 @@ static void sort3c_ks1(double complex *out, double *bufr, double *bufi,
 static void _nr3c_fill_k(int (*intor)(), void (*fsort)(),
                          double complex *out, int nkpts_ij,
                          int nkpts, int comp, int nimgs, int ish, int jsh,
-                         double *buf, double *env_loc, double *Ls,
+                         double *buf, double *env_loc, double *Ls, double *rcut2,
                          double *expkL_r, double *expkL_i, int *kptij_idx,
                          int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                          int *atm, int natm, int *bas, int nbas, double *env)
@@ -384,6 +411,7 @@ static void _nr3c_fill_k(int (*intor)(), void (*fsort)(),
         const char TRANS_N = 'N';
         const double D1 = 1;
 
+        const double rij2 = pair_rcut2(rcut2, shls_slice, ish, jsh);
         jsh += jsh0;
         ish += ish0;
         int iptrxyz = atm[PTR_COORD+bas[ATOM_OF+ish*BAS_SLOTS]*ATM_SLOTS];
@@ -424,6 +452,11 @@ static void _nr3c_fill_k(int (*intor)(), void (*fsort)(),
                         pbuf = bufL;
         for (jL = 0; jL < nimgs; jL++) {
                 shift_bas(env_loc, env, Ls, jptrxyz, jL);
+                if (pair_dist2(env_loc, iptrxyz, jptrxyz) > rij2) {
+                        memset(pbuf, 0, sizeof(double) * dijm);
+                        pbuf += dijm;
+                        continue;
+                }
                 for (ksh = msh0; ksh < msh1; ksh++) {
                         shls[2] = ksh;
                         if ((*intor)(pbuf, NULL, shls, atm, natm, bas, nbas,
@@ -455,14 +488,14 @@ static void _nr3c_fill_k(int (*intor)(), void (*fsort)(),
 /* ('...LM,kL,kM->...k', int3c, exp_kL, exp_kL) */
 void PBCnr3c_fill_ks1(int (*intor)(), double complex *out, int nkpts_ij,
                       int nkpts, int comp, int nimgs, int ish, int jsh,
-                      double *buf, double *env_loc, double *Ls,
+                      double *buf, double *env_loc, double *Ls, double *rcut2,
                       double *expkL_r, double *expkL_i, int *kptij_idx,
                       int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                       int *atm, int natm, int *bas, int nbas, double *env)
 {
         _nr3c_fill_k(intor, sort3c_ks1, out,
                      nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                     buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                     buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                      shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
 }
 
@@ -574,7 +607,7 @@ static void sort3c_ks2_ieqj(double complex *out, double *bufr, double *bufi,
 /* ('...LM,kL,kM->...k', int3c, exp_kL, exp_kL) */
 void PBCnr3c_fill_ks2(int (*intor)(), double complex *out, int nkpts_ij,
                       int nkpts, int comp, int nimgs, int ish, int jsh,
-                      double *buf, double *env_loc, double *Ls,
+                      double *buf, double *env_loc, double *Ls, double *rcut2,
                       double *expkL_r, double *expkL_i, int *kptij_idx,
                       int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                       int *atm, int natm, int *bas, int nbas, double *env)
@@ -584,12 +617,12 @@ void PBCnr3c_fill_ks2(int (*intor)(), double complex *out, int nkpts_ij,
         if (ip > jp) {
                 _nr3c_fill_k(intor, &sort3c_ks2_igtj, out,
                              nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                             buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                             buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                              shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
         } else if (ip == jp) {
                 _nr3c_fill_k(intor, &sort3c_ks2_ieqj, out,
                              nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                             buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                             buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                              shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
         }
 }
@@ -642,7 +675,7 @@ static void sort3c_gs1(double *out, double *in, int *shls_slice, int *ao_loc,
 
 static void _nr3c_fill_g(int (*intor)(), void (*fsort)(), double *out, int nkpts_ij,
                          int nkpts, int comp, int nimgs, int ish, int jsh,
-                         double *buf, double *env_loc, double *Ls,
+                         double *buf, double *env_loc, double *Ls, double *rcut2,
                          double *expkL_r, double *expkL_i, int *kptij_idx,
                          int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                          int *atm, int natm, int *bas, int nbas, double *env)
@@ -653,6 +686,7 @@ static void _nr3c_fill_g(int (*intor)(), void (*fsort)(), double *out, int nkpts
         const int ksh1 = shls_slice[5];
         const size_t naok = ao_loc[ksh1] - ao_loc[ksh0];
 
+        const double rij2 = pair_rcut2(rcut2, shls_slice, ish, jsh);
         jsh += jsh0;
         ish += ish0;
         int iptrxyz = atm[PTR_COORD+bas[ATOM_OF+ish*BAS_SLOTS]*ATM_SLOTS];
@@ -688,6 +722,9 @@ static void _nr3c_fill_g(int (*intor)(), void (*fsort)(), double *out, int nkpts
                         shift_bas(env_loc, env, Ls, iptrxyz, iL);
                         for (jL = 0; jL < nimgs; jL++) {
                                 shift_bas(env_loc, env, Ls, jptrxyz, jL);
+                                if (pair_dist2(env_loc, iptrxyz, jptrxyz) > rij2) {
+                                        continue;
+                                }
                                 pbuf = bufL;
                                 for (ksh = msh0; ksh < msh1; ksh++) {
                                         shls[2] = ksh;
@@ -709,13 +746,13 @@ static void _nr3c_fill_g(int (*intor)(), void (*fsort)(), double *out, int nkpts
 /* ('...LM->...', int3c) */
 void PBCnr3c_fill_gs1(int (*intor)(), double *out, int nkpts_ij,
                       int nkpts, int comp, int nimgs, int ish, int jsh,
-                      double *buf, double *env_loc, double *Ls,
+                      double *buf, double *env_loc, double *Ls, double *rcut2,
                       double *expkL_r, double *expkL_i, int *kptij_idx,
                       int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                       int *atm, int natm, int *bas, int nbas, double *env)
 {
      _nr3c_fill_g(intor, &sort3c_gs1, out, nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                  buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                  buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                   shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
 }
 
@@ -808,7 +845,7 @@ static void sort3c_gs2_ieqj(double *out, double *in, int *shls_slice, int *ao_lo
 /* ('...LM->...', int3c) */
 void PBCnr3c_fill_gs2(int (*intor)(), double *out, int nkpts_ij,
                       int nkpts, int comp, int nimgs, int ish, int jsh,
-                      double *buf, double *env_loc, double *Ls,
+                      double *buf, double *env_loc, double *Ls, double *rcut2,
                       double *expkL_r, double *expkL_i, int *kptij_idx,
                       int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                       int *atm, int natm, int *bas, int nbas, double *env)
@@ -818,12 +855,12 @@ void PBCnr3c_fill_gs2(int (*intor)(), double *out, int nkpts_ij,
         if (ip > jp) {
              _nr3c_fill_g(intor, &sort3c_gs2_igtj, out,
                           nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                          buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                          buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                           shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
         } else if (ip == jp) {
              _nr3c_fill_g(intor, &sort3c_gs2_ieqj, out,
                           nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                          buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                          buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                           shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
         }
 }
@@ -848,7 +885,7 @@ int PBCsizeof_env(int *shls_slice,
 
 void PBCnr3c_drv(int (*intor)(), void (*fill)(), double complex *eri,
                  int nkpts_ij, int nkpts, int comp, int nimgs,
-                 double *Ls, double complex *expkL, int *kptij_idx,
+                 double *Ls, double *rcut2, double complex *expkL, int *kptij_idx,
                  int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                  int *atm, int natm, int *bas, int nbas, double *env)
 {
@@ -887,7 +924,7 @@ void PBCnr3c_drv(int (*intor)(), void (*fill)(), double complex *eri,
 
 #pragma omp parallel default(none) \
         shared(intor, fill, eri, nkpts_ij, nkpts, comp, nimgs, \
-               Ls, expkL_r, expkL_i, kptij_idx, shls_slice, ao_loc, cintopt, \
+               Ls, rcut2, expkL_r, expkL_i, kptij_idx, shls_slice, ao_loc, cintopt, \
                atm, natm, bas, nbas, env, count)
 {
         int ish, jsh, ij, i;
@@ -902,7 +939,7 @@ void PBCnr3c_drv(int (*intor)(), void (*fill)(), double complex *eri,
                 ish = ij / njsh;
                 jsh = ij % njsh;
                 (*fill)(intor, eri, nkpts_ij, nkpts, comp, nimgs, ish, jsh,
-                        buf, env_loc, Ls, expkL_r, expkL_i, kptij_idx,
+                        buf, env_loc, Ls, rcut2, expkL_r, expkL_i, kptij_idx,
                         shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
         }
         free(buf);
@@ -957,7 +994,7 @@ static void sort2c_ks1(double complex *out, double *bufr, double *bufi,
 }
 static void _nr2c_fill(int (*intor)(), double complex *out,
                        int nkpts, int comp, int nimgs, int jsh, int ish0,
-                       double *buf, double *env_loc, double *Ls,
+                       double *buf, double *env_loc, double *Ls, double *rcut2,
                        double *expkL_r, double *expkL_i,
                        int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                        int *atm, int natm, int *bas, int nbas, double *env)
@@ -969,9 +1006,11 @@ static void _nr2c_fill(int (*intor)(), double complex *out,
         const double D1 = 1;
         const double D0 = 0;
 
+        const int jsh_rel = jsh;
         ish0 += shls_slice[0];
         jsh += jsh0;
         int jptrxyz = atm[PTR_COORD+bas[ATOM_OF+jsh*BAS_SLOTS]*ATM_SLOTS];
+        int iptrxyz;
         const int dj = ao_loc[jsh+1] - ao_loc[jsh];
         int dimax = INTBUFMAX10 / dj;
         int ishloc[ish1-ish0+1];
@@ -999,6 +1038,13 @@ static void _nr2c_fill(int (*intor)(), double complex *out,
                         for (ish = msh0; ish < msh1; ish++) {
                                 shls[0] = ish;
                                 di = ao_loc[ish+1] - ao_loc[ish];
+                                iptrxyz = atm[PTR_COORD+bas[ATOM_OF+ish*BAS_SLOTS]*ATM_SLOTS];
+                                if (pair_dist2(env_loc, iptrxyz, jptrxyz) >
+                                    pair_rcut2(rcut2, shls_slice, ish-shls_slice[0], jsh_rel)) {
+                                        memset(pbuf, 0, sizeof(double) * di*dj*comp);
+                                        pbuf += di * dj * comp;
+                                        continue;
+                                }
                                 if ((*intor)(pbuf, NULL, shls, atm, natm, bas, nbas,
                                              env_loc, cintopt, cache)) {
                                         empty = 0;
@@ -1019,31 +1065,31 @@ static void _nr2c_fill(int (*intor)(), double complex *out,
 /* ('...M,kL->...k', int3c, exp_kL, exp_kL) */
 void PBCnr2c_fill_ks1(int (*intor)(), double complex *out,
                       int nkpts, int comp, int nimgs, int jsh,
-                      double *buf, double *env_loc, double *Ls,
+                      double *buf, double *env_loc, double *Ls, double *rcut2,
                       double *expkL_r, double *expkL_i,
                       int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                       int *atm, int natm, int *bas, int nbas, double *env)
 {
         _nr2c_fill(intor, out, nkpts, comp, nimgs, jsh, 0,
-                   buf, env_loc, Ls, expkL_r, expkL_i, shls_slice, ao_loc,
+                   buf, env_loc, Ls, rcut2, expkL_r, expkL_i, shls_slice, ao_loc,
                    cintopt, atm, natm, bas, nbas, env);
 }
 
 void PBCnr2c_fill_ks2(int (*intor)(), double complex *out,
                       int nkpts, int comp, int nimgs, int jsh,
-                      double *buf, double *env_loc, double *Ls,
+                      double *buf, double *env_loc, double *Ls, double *rcut2,
                       double *expkL_r, double *expkL_i,
                       int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                       int *atm, int natm, int *bas, int nbas, double *env)
 {
         _nr2c_fill(intor, out, nkpts, comp, nimgs, jsh, jsh,
-                   buf, env_loc, Ls, expkL_r, expkL_i, shls_slice, ao_loc,
+                   buf, env_loc, Ls, rcut2, expkL_r, expkL_i, shls_slice, ao_loc,
                    cintopt, atm, natm, bas, nbas, env);
 }
 
 void PBCnr2c_drv(int (*intor)(), void (*fill)(), double complex *out,
                  int nkpts, int comp, int nimgs,
-                 double *Ls, double complex *expkL,
+                 double *Ls, double *rcut2, double complex *expkL,
                  int *shls_slice, int *ao_loc, CINTOpt *cintopt,
                  int *atm, int natm, int *bas, int nbas, double *env)
 {
@@ -1062,7 +1108,7 @@ void PBCnr2c_drv(int (*intor)(), void (*fill)(), double complex *out,
 
 #pragma omp parallel default(none) \
         shared(intor, fill, out, nkpts, comp, nimgs, \
-               Ls, expkL_r, expkL_i, shls_slice, ao_loc, cintopt, \
+               Ls, rcut2, expkL_r, expkL_i, shls_slice, ao_loc, cintopt, \
                atm, natm, bas, nbas, env)
 {
         int jsh;
@@ -1075,7 +1121,7 @@ void PBCnr2c_drv(int (*intor)(), void (*fill)(), double complex *out,
 #pragma omp for schedule(dynamic)
         for (jsh = 0; jsh < njsh; jsh++) {
                 (*fill)(intor, out, nkpts, comp, nimgs, jsh,
-                        buf, env_loc, Ls, expkL_r, expkL_i,
+                        buf, env_loc, Ls, rcut2, expkL_r, expkL_i,
                         shls_slice, ao_loc, cintopt, atm, natm, bas, nbas, env);
         }
         free(buf);
@@ -58,7 +58,7 @@ def run3c(fill, kpts, shls_slice=None):
                        out.ctypes.data_as(ctypes.c_void_p),
                        ctypes.c_int(nkpts_ij), ctypes.c_int(nkpts),
                        ctypes.c_int(comp), ctypes.c_int(len(Ls)),
-                       Ls.ctypes.data_as(ctypes.c_void_p),
+                       Ls.ctypes.data_as(ctypes.c_void_p), lib.c_null_ptr(),
                        expkL.ctypes.data_as(ctypes.c_void_p),
                        kptij_idx.ctypes.data_as(ctypes.c_void_p),
                        (ctypes.c_int*6)(*shls_slice),
@@ -90,7 +90,7 @@ def run2c(intor, fill, kpts, shls_slice=None):
     drv = libpbc.PBCnr2c_drv
     drv(fintor, fill, out.ctypes.data_as(ctypes.c_void_p),
         ctypes.c_int(nkpts), ctypes.c_int(comp), ctypes.c_int(len(Ls)),
-        Ls.ctypes.data_as(ctypes.c_void_p),
+        Ls.ctypes.data_as(ctypes.c_void_p), lib.c_null_ptr(),
         expkL.ctypes.data_as(ctypes.c_void_p),
         (ctypes.c_int*4)(*(shls_slice[:4])),
         ao_loc.ctypes.data_as(ctypes.c_void_p), intopt,
@@ -39,6 +39,27 @@ class KnowValues(unittest.TestCase):
         self.assertTrue('x' in dat)
         self.assertTrue('y' in dat)
 
+    def test_session(self):
+        fchk = tempfile.NamedTemporaryFile()
+        for compression, async_write in ((None, False), ('gzip', True)):
+            with lib.chkfile.session(fchk.name, compression, async_write) as chk:
+                for i in range(3):
+                    a = numpy.random.random((6,6))
+                    lib.chkfile.save(fchk.name, 'a', {'x': a, 'e': i*1.})
+                    dat = lib.chkfile.load(fchk.name, 'a')
+                    self.assertTrue(numpy.all(a == dat['x']))
+                    self.assertEqual(dat['e'], i)
+                self.assertTrue(lib.chkfile.session(fchk.name) is chk)
+                chk.close()
+
+                lib.chkfile.save(fchk.name, 'a', {'y': [numpy.eye(3)]})
+                lib.chkfile.save(fchk.name, 'b', numpy.eye(3))
+                lib.chkfile.save(fchk.name, 'b', numpy.eye(4))
+            dat = lib.chkfile.load(fchk.name, 'a')
+            self.assertEqual(list(dat.keys()), ['y'])
+            self.assertTrue(isinstance(dat['y'], list))
+            self.assertTrue(numpy.all(lib.chkfile.load(fchk.name, 'b') == numpy.eye(4)))
+
 if __name__ == "__main__":
     print("Full Tests for lib.chkfile")
     unittest.main()
@@ -119,6 +119,7 @@ class Boys(ciah.CIAHOptimizer):
         self.init_guess = 'atomic'
 
         self.mo_coeff = numpy.asarray(mo_coeff, order='C')
+        self._mo_ints = None
         self._keys = set(self.__dict__.keys())
 
     def dump_flags(self):
@@ -141,9 +142,29 @@ class Boys(ciah.CIAHOptimizer):
         log.info('ah_trust_region = %s', self.ah_trust_region)
         log.info('init_guess = %s'     , self.init_guess     )
 
+    def get_mo_dipole(self, u=None):
+        '''Dipole integrals of the orbitals mo_coeff.dot(u).  The dipole and
+        r^2 integrals of mo_coeff are computed once and the dipole integrals
+        are rotated by u.  The result of the last u is kept because the cost
+        function and the gradients are often evaluated at the same u.
+        '''
+        if self._mo_ints is None or self._mo_ints[0] is not self.mo_coeff:
+            mo_coeff = self.mo_coeff
+            dip = dipole_integral(self.mol, mo_coeff)
+            r2 = self.mol.intor_symmetric('int1e_r2')
+            r2 = numpy.einsum('pi,pi->', mo_coeff, lib.dot(r2, mo_coeff))
+            self._mo_ints = [mo_coeff, dip, r2, None, None]
+        mo_coeff, dip0, r2, u_last, dip_last = self._mo_ints
+        if u is None:
+            return dip0
+        if u_last is not None and numpy.array_equal(u, u_last):
+            return dip_last
+        dip = lib.einsum('xpq,pi,qj->xij', dip0, u, u)
+        self._mo_ints[3:] = [numpy.array(u), dip]
+        return dip
+
     def gen_g_hop(self, u):
-        mo_coeff = lib.dot(self.mo_coeff, u)
-        dip = dipole_integral(self.mol, mo_coeff)
+        dip = self.get_mo_dipole(u)
         g0 = numpy.einsum('xii,xip->pi', dip, dip)
         g = -self.pack_uniq_var(g0-g0.T) * 2
 
@@ -199,19 +220,15 @@ class Boys(ciah.CIAHOptimizer):
         return g, h_op, h_diag
 
     def get_grad(self, u=None):
-        if u is None: u = numpy.eye(self.mo_coeff.shape[1])
-        mo_coeff = lib.dot(self.mo_coeff, u)
-        dip = dipole_integral(self.mol, mo_coeff)
+        dip = self.get_mo_dipole(u)
         g0 = numpy.einsum('xii,xip->pi', dip, dip)
         g = -self.pack_uniq_var(g0-g0.T) * 2
         return g
 
     def cost_function(self, u=None):
-        if u is None: u = numpy.eye(self.mo_coeff.shape[1])
-        mo_coeff = lib.dot(self.mo_coeff, u)
-        dip = dipole_integral(self.mol, mo_coeff)
-        r2 = self.mol.intor_symmetric('int1e_r2')
-        r2 = numpy.einsum('pi,pi->', mo_coeff, lib.dot(r2, mo_coeff))
+        dip = self.get_mo_dipole(u)
+        # sum_i <i|r^2|i> is invariant to the orbital rotation
+        r2 = self._mo_ints[2]
         val = r2 - numpy.einsum('xii,xii->', dip, dip)
         return val * 2
 
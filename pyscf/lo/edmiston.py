@@ -10,14 +10,75 @@ import time
 import numpy
 from functools import reduce
 
+from pyscf import lib
 from pyscf.lib import logger
 from pyscf.scf import hf
 from pyscf.lo import boys
 
 
 class EdmistonRuedenberg(boys.Boys):
+    '''Edmiston-Ruedenberg localization
+
+    Attributes:
+        with_df : DF object
+            If with_df is set (see :meth:`density_fit`), the Coulomb and
+            exchange matrices of the orbitals are computed with the density
+            fitting integrals.  The DF integrals are transformed to the MO
+            basis once and rotated in each iteration.
+    '''
+    def __init__(self, mol, mo_coeff=None):
+        boys.Boys.__init__(self, mol, mo_coeff)
+        self.with_df = None
+        self._keys = self._keys.union(['with_df'])
+        self._mo_cderi = None
+
+    def density_fit(self, auxbasis=None, with_df=None):
+        from pyscf import df
+        if with_df is None:
+            with_df = df.DF(self.mol)
+            with_df.max_memory = self.mol.max_memory
+            with_df.stdout = self.stdout
+            with_df.verbose = self.verbose
+            with_df.auxbasis = auxbasis
+        self.with_df = with_df
+        return self
+
+    def get_mo_cderi(self, u=None):
+        '''DF integrals L_{pq} of the orbitals mo_coeff.dot(u)'''
+        if self._mo_cderi is None or self._mo_cderi[0] is not self.mo_coeff:
+            from pyscf.ao2mo import _ao2mo
+            mo_coeff = numpy.asarray(self.mo_coeff, order='F')
+            nmo = mo_coeff.shape[1]
+            # MO DF integrals, their rotated copy and the J/K tensors
+            mem_need = (self.with_df.get_naoaux()*nmo**2*2 + nmo**3*2) * 8e-6
+            max_memory = self.mol.max_memory - lib.current_memory()[0]
+            if mem_need > max_memory:
+                logger.warn(self, 'Edmiston-Ruedenberg localization with DF '
+                            'needs about %d MB memory (available %d MB)',
+                            mem_need, max_memory)
+            cderi = [_ao2mo.nr_e2(eri1, mo_coeff, (0,nmo,0,nmo), 's2', 's1')
+                     for eri1 in self.with_df.loop()]
+            cderi = numpy.vstack(cderi).reshape(-1,nmo,nmo)
+            self._mo_cderi = (self.mo_coeff, cderi)
+        cderi = self._mo_cderi[1]
+        if u is None:
+            return cderi
+        else:
+            return lib.einsum('Lpq,pi,qj->Lij', cderi, u, u)
 
     def get_jk(self, u):
+        if self.with_df is not None:
+            cderi = self.get_mo_cderi(u)
+            naux, nmo = cderi.shape[:2]
+            cderi_diag = numpy.einsum('Lii->Li', cderi)
+            #:vj = numpy.einsum('Lii,Lpq->ipq', cderi, cderi)
+            vj = lib.dot(cderi_diag.T, cderi.reshape(naux,-1)).reshape(nmo,nmo,nmo)
+            #:vk = numpy.einsum('Lpi,Liq->ipq', cderi, cderi)
+            vk = numpy.empty((nmo,nmo,nmo))
+            for i in range(nmo):
+                vk[i] = lib.dot(cderi[:,i].T, cderi[:,i])
+            return vj, vk
+
         mo_coeff = numpy.dot(self.mo_coeff, u)
         nmo = mo_coeff.shape[1]
         dms = [numpy.einsum('i,j->ij', mo_coeff[:,i], mo_coeff[:,i]) for i in range(nmo)]
@@ -41,7 +102,8 @@ class EdmistonRuedenberg(boys.Boys):
         g0 = g0 + g0.T
         def h_op(x):
             x = self.unpack_uniq_var(x)
-            hx = numpy.einsum('iq,qp->pi', g0, x)
+            #:hx = numpy.einsum('iq,qp->pi', g0, x)
+            hx = lib.dot(x.T, g0.T)
             hx+= numpy.einsum('qi,iqp->pi', x, vk) * 2
             hx-= numpy.einsum('qp,piq->pi', x, vj) * 2
             hx-= numpy.einsum('qp,piq->pi', x, vk) * 2
@@ -20,76 +20,227 @@ from pyscf.lo import boys
 def atomic_pops(mol, mo_coeff, method='meta_lowdin'):
     '''kwarg method can be one of mulliken, lowdin, meta_lowdin
     '''
-    s = mol.intor_symmetric('int1e_ovlp')
+    lhs, rhs, atm_loc = atomic_pops_factors(mol, mo_coeff, method)
     nmo = mo_coeff.shape[1]
-    proj = numpy.empty((mol.natm,nmo,nmo))
+    proj = numpy.zeros((mol.natm,nmo,nmo))
+    for i in range(mol.natm):
+        p0, p1 = atm_loc[i], atm_loc[i+1]
+        if p0 < p1:
+            proj[i] = lib.dot(lhs[:,p0:p1], rhs[:,p0:p1].T)
+    return proj
+
+def atomic_pops_factors(mol, mo_coeff, method='meta_lowdin'):
+    '''Factorize the atomic population matrices.  The population matrix of
+    atom i is  pop[i] = lhs[:,p0:p1].dot(rhs[:,p0:p1].T)  with
+    p0, p1 = atm_loc[i], atm_loc[i+1].  The factors take nmo*nao (or
+    nmo*nao*2 for mulliken population) memory, while the population matrices
+    take natm*nmo*nmo.
 
+    Returns:
+        lhs, rhs, atm_loc
+    '''
+    s = mol.intor_symmetric('int1e_ovlp')
+    aoslices = mol.offset_nr_by_atom()
     if method.lower() == 'mulliken':
-        for i, (b0, b1, p0, p1) in enumerate(mol.offset_nr_by_atom()):
-            csc = reduce(numpy.dot, (mo_coeff[p0:p1].T, s[p0:p1], mo_coeff))
-            proj[i] = (csc + csc.T) * .5
+        # pop[i] = (csc + csc.T)/2 with csc = C[p0:p1].T S[p0:p1] C
+        nao = s.shape[0]
+        sc = lib.dot(s, mo_coeff)
+        idx = [numpy.append(numpy.arange(p0,p1), numpy.arange(p0,p1)+nao)
+               for b0, b1, p0, p1 in aoslices]
+        idx = numpy.hstack(idx).astype(int)
+        lhs = numpy.hstack((sc.T, mo_coeff.T))[:,idx]
+        rhs = numpy.hstack((mo_coeff.T, sc.T))[:,idx] * .5
+        atm_loc = numpy.append(0, numpy.cumsum(aoslices[:,3]-aoslices[:,2])*2)
 
     elif method.lower() in ('lowdin', 'meta_lowdin'):
         c = orth.restore_ao_character(mol, 'ANO')
         csc = reduce(lib.dot, (mo_coeff.T, s, orth.orth_ao(mol, method, c, s=s)))
-        for i, (b0, b1, p0, p1) in enumerate(mol.offset_nr_by_atom()):
-            proj[i] = numpy.dot(csc[:,p0:p1], csc[:,p0:p1].T)
+        lhs = rhs = csc
+        atm_loc = numpy.append(aoslices[:,2], aoslices[-1,3])
     else:
         raise KeyError('method = %s' % method)
 
-    return proj
+    return lhs, rhs, atm_loc
+
+def _atom_sum(mat, atm_loc):
+    '''Sum over the columns of each atom'''
+    natm = len(atm_loc) - 1
+    out = numpy.zeros((mat.shape[0],natm))
+    mask = atm_loc[:-1] < atm_loc[1:]
+    if mask.any():
+        out[:,mask] = numpy.add.reduceat(mat, atm_loc[:-1][mask], axis=1)
+    return out
+
+def jacobi_sweep(localizer, u0=None, max_sweep=20, conv_tol=None,
+                 screen=1e-4, verbose=None):
+    '''Maximize the Pipek-Mezey function with the 2x2 Jacobi rotations.
+
+    The pairs of orbitals which do not have population on common atoms
+    (sum_x sqrt(|Q^x_ii Q^x_jj|) < screen) are skipped.  The population
+    factors of the two orbitals are rotated after each 2x2 rotation thus the
+    population matrices are never constructed.
+
+    Returns:
+        The orthogonal matrix u that transforms localizer.mo_coeff to the
+        localized orbitals
+    '''
+    log = logger.new_logger(localizer, verbose)
+    if conv_tol is None: conv_tol = localizer.conv_tol
+    lhs0, rhs0, atm_loc = localizer.get_pop_factors()
+    nmo = lhs0.shape[0]
+    if u0 is None:
+        u = numpy.eye(nmo)
+    else:
+        u = numpy.array(u0)
+    lhs = lib.dot(u.T, lhs0)
+    rhs = lib.dot(u.T, rhs0)
+    mask = atm_loc[:-1] < atm_loc[1:]
+    loc = atm_loc[:-1][mask]
+
+    for isweep in range(max_sweep):
+        diag = _atom_sum(lhs*rhs, atm_loc)
+        sqrt_pop = numpy.sqrt(abs(diag))
+        pair_screen = lib.dot(sqrt_pop, sqrt_pop.T)
+        dcost = 0
+        nrot = 0
+        for i in range(1, nmo):
+            for j in numpy.where(pair_screen[i,:i] > screen)[0]:
+                qii = numpy.add.reduceat(lhs[i]*rhs[i], loc)
+                qjj = numpy.add.reduceat(lhs[j]*rhs[j], loc)
+                qij = numpy.add.reduceat(lhs[i]*rhs[j]+lhs[j]*rhs[i], loc) * .5
+                dq = qii - qjj
+                a = numpy.dot(qij, qij) - numpy.dot(dq, dq) * .25
+                b = numpy.dot(qij, dq)
+                rab = numpy.sqrt(a**2 + b**2)
+                if a + rab < conv_tol * 1e-2:
+                    continue
+                theta = numpy.arctan2(b, -a) * .25
+                c, s = numpy.cos(theta), numpy.sin(theta)
+                for mat in (lhs, rhs):
+                    mi = mat[i].copy()
+                    mat[i] = c * mi + s * mat[j]
+                    mat[j] = c * mat[j] - s * mi
+                ui = u[:,i].copy()
+                u[:,i] = c * ui + s * u[:,j]
+                u[:,j] = c * u[:,j] - s * ui
+                dcost += a + rab
+                nrot += 1
+        log.debug('Jacobi sweep %d  %d rotations  delta_f= %g', isweep, nrot, dcost)
+        if dcost < conv_tol:
+            break
+    return u
 
 
 class PipekMezey(boys.Boys):
+    '''Pipek-Mezey localization.
+
+    The atomic population matrices are never stored.  They are represented
+    by the factors of :func:`atomic_pops_factors` which are computed once for
+    mo_coeff and rotated by u in each iteration.
+
+    Attributes:
+        pop_method : str
+            Population analysis method, can be one of mulliken, lowdin,
+            meta_lowdin.  Default is meta_lowdin.
+        init_guess : str
+            In addition to the initial guess of :class:`boys.Boys`, "jacobi"
+            can be used to generate the initial guess with 2x2 Jacobi sweeps
+            (see :func:`jacobi_sweep`) starting from the atomic guess.
+    '''
     def __init__(self, mol, mo_coeff=None):
         boys.Boys.__init__(self, mol, mo_coeff)
         self.pop_method = 'meta_lowdin'
         self.conv_tol = 1e-6
         self._keys = self._keys.union(['pop_method'])
+        self._pop_factors = None
 
     def dump_flags(self):
         boys.Boys.dump_flags(self)
         logger.info(self, 'pop_method = %s',self.pop_method)
 
+    def get_pop_factors(self, u=None):
+        '''Factors of the atomic population matrices for the orbitals
+        mo_coeff.dot(u).  See also :func:`atomic_pops_factors`.
+        '''
+        # Population factors are computed once for each mo_coeff
+        if (self._pop_factors is None or
+            self._pop_factors[0] is not self.mo_coeff or
+            self._pop_factors[1] != self.pop_method):
+            self._pop_factors = (self.mo_coeff, self.pop_method,
+                                 atomic_pops_factors(self.mol, self.mo_coeff,
+                                                     self.pop_method))
+        lhs, rhs, atm_loc = self._pop_factors[2]
+        if u is not None:
+            if rhs is lhs:
+                lhs = rhs = lib.dot(u.T, lhs)
+            else:
+                lhs = lib.dot(u.T, lhs)
+                rhs = lib.dot(u.T, rhs)
+        return lhs, rhs, atm_loc
+
     def gen_g_hop(self, u):
-        mo_coeff = lib.dot(self.mo_coeff, u)
-        pop = atomic_pops(self.mol, mo_coeff, self.pop_method)
-        g0 = numpy.einsum('xii,xip->pi', pop, pop)
+        lhs, rhs, atm_loc = self.get_pop_factors(u)
+        natm = len(atm_loc) - 1
+        col_atm = numpy.repeat(numpy.arange(natm), numpy.diff(atm_loc))
+        diag = _atom_sum(lhs*rhs, atm_loc)
+        #:g0 = numpy.einsum('xii,xip->pi', pop, pop)
+        g0 = lib.dot(rhs, (lhs*diag[:,col_atm]).T)
         g = -self.pack_uniq_var(g0-g0.T) * 2
 
-        h_diag = numpy.einsum('xii,xpp->pi', pop, pop) * 2
+        #:h_diag = numpy.einsum('xii,xpp->pi', pop, pop) * 2
+        h_diag = lib.dot(diag, diag.T) * 2
         g_diag = g0.diagonal()
         h_diag-= g_diag + g_diag.reshape(-1,1)
-        h_diag+= numpy.einsum('xip,xip->pi', pop, pop) * 2
-        h_diag+= numpy.einsum('xip,xpi->pi', pop, pop) * 2
+        #:h_diag+= numpy.einsum('xip,xip->pi', pop, pop) * 2
+        #:h_diag+= numpy.einsum('xip,xpi->pi', pop, pop) * 2
+        for i in range(natm):
+            p0, p1 = atm_loc[i], atm_loc[i+1]
+            if p0 < p1:
+                pop = lib.dot(lhs[:,p0:p1], rhs[:,p0:p1].T)
+                h_diag += pop**2 * 4
         h_diag = -self.pack_uniq_var(h_diag) * 2
 
         g0 = g0 + g0.T
         def h_op(x):
             x = self.unpack_uniq_var(x)
-            norb = x.shape[0]
             hx = lib.dot(x.T, g0.T)
-            hx+= numpy.einsum('xip,xi->pi', pop, numpy.einsum('qi,xiq->xi', x, pop)) * 2
-            hx-= numpy.einsum('xpp,xip->pi', pop,
-                              lib.dot(pop.reshape(-1,norb), x).reshape(-1,norb,norb)) * 2
-            hx-= numpy.einsum('xip,xp->pi', pop, numpy.einsum('qp,xpq->xp', x, pop)) * 2
+            xrhs = lib.dot(x.T, rhs)
+            #:xpop = numpy.einsum('qi,xiq->xi', x, pop)
+            xpop = _atom_sum(lhs*xrhs, atm_loc)[:,col_atm]
+            #:hx+= numpy.einsum('xip,xi->pi', pop, xpop) * 2
+            hx+= lib.dot(rhs, (lhs*xpop).T) * 2
+            #:hx-= numpy.einsum('xpp,xip->pi', pop,
+            #:                  lib.dot(pop.reshape(-1,norb), x).reshape(-1,norb,norb)) * 2
+            hx-= lib.dot(xrhs*diag[:,col_atm], lhs.T) * 2
+            #:hx-= numpy.einsum('xip,xp->pi', pop, numpy.einsum('qp,xpq->xp', x, pop)) * 2
+            hx-= lib.dot(rhs*xpop, lhs.T) * 2
             return -self.pack_uniq_var(hx-hx.T)
 
         return g, h_op, h_diag
 
     def get_grad(self, u=None):
         if u is None: u = numpy.eye(self.mo_coeff.shape[1])
-        mo_coeff = lib.dot(self.mo_coeff, u)
-        pop = atomic_pops(self.mol, mo_coeff, self.pop_method)
-        g0 = numpy.einsum('xii,xip->pi', pop, pop)
+        lhs, rhs, atm_loc = self.get_pop_factors(u)
+        col_atm = numpy.repeat(numpy.arange(len(atm_loc)-1), numpy.diff(atm_loc))
+        diag = _atom_sum(lhs*rhs, atm_loc)
+        g0 = lib.dot(rhs, (lhs*diag[:,col_atm]).T)
         g = -self.pack_uniq_var(g0-g0.T) * 2
         return g
 
     def cost_function(self, u=None):
         if u is None: u = numpy.eye(self.mo_coeff.shape[1])
-        mo_coeff = lib.dot(self.mo_coeff, u)
-        pop = atomic_pops(self.mol, mo_coeff, self.pop_method)
-        return numpy.einsum('xii,xii->', pop, pop)
+        lhs, rhs, atm_loc = self.get_pop_factors(u)
+        diag = _atom_sum(lhs*rhs, atm_loc)
+        return numpy.einsum('ix,ix->', diag, diag)
+
+    def get_init_guess(self, key='atomic'):
+        if isinstance(key, str) and key.lower() == 'jacobi':
+            u0 = boys.Boys.get_init_guess(self, 'atomic')
+            return jacobi_sweep(self, u0)
+        else:
+            return boys.Boys.get_init_guess(self, key)
+
+    jacobi_sweep = jacobi_sweep
 
 PM = Pipek = PipekMezey
 
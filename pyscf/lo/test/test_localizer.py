@@ -2,6 +2,7 @@
 
 import unittest
 import numpy
+from functools import reduce
 from pyscf import gto, scf
 from pyscf.lo import boys, edmiston, pipek
 
@@ -51,6 +52,22 @@ class KnowValues(unittest.TestCase):
     #    z = numpy.einsum('xii,xii->', dip, dip)
     #    self.assertAlmostEqual(z, 79.73132964805923, 9)
 
+    def test_edmiston_df(self):
+        idx = numpy.array([17,20,21,22,23,30,36,41,42,47,48,49])-1
+        loc = edmiston.EdmistonRuedenberg(mol, mf.mo_coeff[:,idx])
+        u = loc.get_init_guess('atomic')
+        vj, vk = loc.get_jk(u)
+        vj1, vk1 = loc.density_fit().get_jk(u)
+        self.assertAlmostEqual(abs(vj-vj1).max(), 0, 2)
+        self.assertAlmostEqual(abs(vk-vk1).max(), 0, 2)
+
+    def test_boys_cached_dipole(self):
+        idx = numpy.array([17,20,21,22,23,30,36,41,42,47,48,49])-1
+        loc = boys.Boys(mol, mf.mo_coeff[:,idx])
+        u = loc.get_init_guess('atomic')
+        dip = boys.dipole_integral(mol, mf.mo_coeff[:,idx].dot(u))
+        self.assertAlmostEqual(abs(loc.get_mo_dipole(u) - dip).max(), 0, 12)
+
     def test_pipek(self):
         idx = numpy.array([17,20,21,22,23,30,36,41,42,47,48,49])-1
         loc = pipek.PipekMezey(mol, mf.mo_coeff[:,idx])
@@ -60,6 +77,22 @@ class KnowValues(unittest.TestCase):
         z = numpy.einsum('xii,xii->', pop, pop)
         self.assertAlmostEqual(z, 12, 4)
 
+    def test_pipek_jacobi(self):
+        idx = numpy.array([17,20,21,22,23,30,36,41,42,47,48,49])-1
+        mo = mf.mo_coeff[:,idx]
+        pop = pipek.atomic_pops(mol, mo, 'mulliken')
+        s = mol.intor_symmetric('int1e_ovlp')
+        for i, (b0, b1, p0, p1) in enumerate(mol.offset_nr_by_atom()):
+            csc = reduce(numpy.dot, (mo[p0:p1].T, s[p0:p1], mo))
+            self.assertAlmostEqual(abs(pop[i] - (csc+csc.T)*.5).max(), 0, 12)
+
+        loc = pipek.PipekMezey(mol, mo)
+        loc.init_guess = 'jacobi'
+        mo = loc.kernel()
+        pop = pipek.atomic_pops(mol, mo)
+        z = numpy.einsum('xii,xii->', pop, pop)
+        self.assertAlmostEqual(z, 12, 4)
+
     def test_1orbital(self):
         lmo = boys.Boys(mol, mf.mo_coeff[:,:1]).kernel()
         self.assertTrue(numpy.all(mf.mo_coeff[:,:1] == lmo))
@@ -11,6 +11,7 @@ import h5py
 from pyscf.lib.chkfile import load
 from pyscf.lib.chkfile import dump, save
 from pyscf.lib.chkfile import load_mol, save_mol
+from pyscf.lib.chkfile import session
 
 
 def load_mcscf(chkfile):
@@ -30,24 +31,12 @@ def dump_mcscf(mc, chkfile=None, key='mcscf',
     if mo_coeff is None: mo_coeff = mc.mo_coeff
     #if ci_vector is None: ci_vector = mc.ci
 
-    if h5py.is_hdf5(chkfile):
-        fh5 = h5py.File(chkfile)
-        if key in fh5:
-            del(fh5[key])
-    else:
-        fh5 = h5py.File(chkfile, 'w')
-
-    if 'mol' not in fh5:
-        fh5['mol'] = mc.mol.dumps()
-    elif overwrite_mol:
-        del(fh5['mol'])
-        fh5['mol'] = mc.mol.dumps()
-
-    fh5[key+'/mo_coeff'] = mo_coeff
+    save_mol(mc.mol, chkfile, overwrite_mol)
 
+    mcscf_dic = {'mo_coeff': mo_coeff}
     def store(subkey, val):
         if val is not None:
-            fh5[key+'/'+subkey] = val
+            mcscf_dic[subkey] = val
     store('e_tot', e_tot)
     store('e_cas', e_cas)
     store('ci', ci_vector)
@@ -56,4 +45,4 @@ def dump_mcscf(mc, chkfile=None, key='mcscf',
     store('mo_occ', mo_occ)
     store('mo_energy', mo_energy)
     store('casdm1', casdm1)
-    fh5.close()
+    dump(chkfile, key, mcscf_dic)
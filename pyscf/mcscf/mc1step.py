@@ -664,11 +664,13 @@ class CASSCF(casci.CASCI):
             self.check_sanity()
         self.dump_flags()
 
-        self.converged, self.e_tot, self.e_cas, self.ci, \
-                self.mo_coeff, self.mo_energy = \
-                _kern(self, mo_coeff,
-                      tol=self.conv_tol, conv_tol_grad=self.conv_tol_grad,
-                      ci0=ci0, callback=callback, verbose=self.verbose)
+        # Keep chkfile open for the intermediates saved in each macro iteration
+        with chkfile.session(self.chkfile):
+            self.converged, self.e_tot, self.e_cas, self.ci, \
+                    self.mo_coeff, self.mo_energy = \
+                    _kern(self, mo_coeff,
+                          tol=self.conv_tol, conv_tol_grad=self.conv_tol_grad,
+                          ci0=ci0, callback=callback, verbose=self.verbose)
         logger.note(self, 'CASSCF energy = %.15g', self.e_tot)
         self._finalize()
         return self.e_tot, self.e_cas, self.ci, self.mo_coeff, self.mo_energy
@@ -417,10 +417,12 @@ class CASSCF(casci_uhf.CASCI):
             self.check_sanity()
         self.dump_flags()
 
-        self.converged, self.e_tot, e_cas, self.ci, self.mo_coeff = \
-                _kern(self, mo_coeff,
-                      tol=self.conv_tol, conv_tol_grad=self.conv_tol_grad,
-                      ci0=ci0, callback=callback, verbose=self.verbose)
+        # Keep chkfile open for the intermediates saved in each macro iteration
+        with chkfile.session(self.chkfile):
+            self.converged, self.e_tot, e_cas, self.ci, self.mo_coeff = \
+                    _kern(self, mo_coeff,
+                          tol=self.conv_tol, conv_tol_grad=self.conv_tol_grad,
+                          ci0=ci0, callback=callback, verbose=self.verbose)
         logger.note(self, 'CASSCF energy = %.15g', self.e_tot)
         #if self.verbose >= logger.INFO:
         #    self.analyze(mo_coeff, self.ci, verbose=self.verbose)
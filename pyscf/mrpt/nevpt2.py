@@ -26,39 +26,51 @@ NUMERICAL_ZERO = 1e-14
 # h2e is the CAS space 2e integrals in  notation # a' -> p # b' -> q # c' -> r
 # d' -> s
 
-def make_a16(h1e, h2e, dms, civec, norb, nelec, link_index=None):
-    dm3 = dms['3']
-    #dm4 = dms['4']
+def _make_f3(h2e, dms, civec, norb, nelec, link_index=None):
+    '''The eri-4pdm contractions f3ca and f3ac'''
     if 'f3ca' in dms and 'f3ac' in dms:
-        f3ca = dms['f3ca']
-        f3ac = dms['f3ac']
+        return dms['f3ca'], dms['f3ac']
+    if isinstance(nelec, (int, numpy.integer)):
+        neleca = nelecb = nelec//2
     else:
-        if isinstance(nelec, (int, numpy.integer)):
-            neleca = nelecb = nelec//2
-        else:
-            neleca, nelecb = nelec
-        if link_index is None:
-            link_indexa = fci.cistring.gen_linkstr_index(range(norb), neleca)
-            link_indexb = fci.cistring.gen_linkstr_index(range(norb), nelecb)
-        else:
-            link_indexa, link_indexb = link_index
-        eri = h2e.transpose(0,2,1,3)
-        f3ca = _contract4pdm('NEVPTkern_cedf_aedf', eri, civec, norb, nelec,
-                             (link_indexa,link_indexb))
-        f3ac = _contract4pdm('NEVPTkern_aedf_ecdf', eri, civec, norb, nelec,
-                             (link_indexa,link_indexb))
+        neleca, nelecb = nelec
+    if link_index is None:
+        link_indexa = fci.cistring.gen_linkstr_index(range(norb), neleca)
+        link_indexb = fci.cistring.gen_linkstr_index(range(norb), nelecb)
+    else:
+        link_indexa, link_indexb = link_index
+    eri = h2e.transpose(0,2,1,3)
+    f3ca = _contract4pdm('NEVPTkern_cedf_aedf', eri, civec, norb, nelec,
+                         (link_indexa,link_indexb))
+    f3ac = _contract4pdm('NEVPTkern_aedf_ecdf', eri, civec, norb, nelec,
+                         (link_indexa,link_indexb))
+    return f3ca, f3ac
+
+# The a16 and a22 intermediates can be generated in blocks of their first
+# index [p0:p1].  All RDMs and f3 intermediates are then sliced on their
+# second index.
+def make_a16(h1e, h2e, dms, civec, norb, nelec, link_index=None,
+             p0=0, p1=None):
+    if p1 is None:
+        p1 = norb
+    dm3 = dms['3'][:,p0:p1]
+    #dm4 = dms['4']
+    f3ca, f3ac = _make_f3(h2e, dms, civec, norb, nelec, link_index)
+    f3ca = f3ca[:,p0:p1]
+    f3ac = f3ac[:,p0:p1]
+    h2e_tr = numpy.einsum('jbij->bi', h2e)
 
-    a16 = -numpy.einsum('ib,rpqiac->pqrabc', h1e, dm3)
-    a16 += numpy.einsum('ia,rpqbic->pqrabc', h1e, dm3)
-    a16 -= numpy.einsum('ci,rpqbai->pqrabc', h1e, dm3)
+    a16 = -lib.einsum('ib,rpqiac->pqrabc', h1e, dm3)
+    a16 += lib.einsum('ia,rpqbic->pqrabc', h1e, dm3)
+    a16 -= lib.einsum('ci,rpqbai->pqrabc', h1e, dm3)
 
 # qjkiac = acqjki + delta(ja)qcki + delta(ia)qjkc - delta(qc)ajki - delta(kc)qjai
     #:a16 -= numpy.einsum('kbij,rpqjkiac->pqrabc', h2e, dm4)
     a16 -= f3ca.transpose(1,4,0,2,5,3) # c'a'acb'b -> a'b'c'abc
-    a16 -= numpy.einsum('kbia,rpqcki->pqrabc', h2e, dm3)
-    a16 -= numpy.einsum('kbaj,rpqjkc->pqrabc', h2e, dm3)
-    a16 += numpy.einsum('cbij,rpqjai->pqrabc', h2e, dm3)
-    fdm2 = numpy.einsum('kbij,rpajki->prab'  , h2e, dm3)
+    a16 -= lib.einsum('kbia,rpqcki->pqrabc', h2e, dm3)
+    a16 -= lib.einsum('kbaj,rpqjkc->pqrabc', h2e, dm3)
+    a16 += lib.einsum('cbij,rpqjai->pqrabc', h2e, dm3)
+    fdm2 = lib.einsum('kbij,rpajki->prab'  , h2e, dm3)
     for i in range(norb):
         a16[:,i,:,:,:,i] += fdm2
 
@@ -68,49 +80,41 @@ def make_a16(h1e, h2e, dms, civec, norb, nelec, link_index=None):
     #:a16 -= numpy.einsum('kcij,rpqbajki->pqrabc', h2e, dm4)
     a16 -= f3ca.transpose(1,2,0,4,3,5) # c'a'b'bac -> a'b'c'abc
 
-    a16 += numpy.einsum('jbij,rpqiac->pqrabc', h2e, dm3)
-    a16 -= numpy.einsum('cjka,rpqbjk->pqrabc', h2e, dm3)
-    a16 += numpy.einsum('jcij,rpqbai->pqrabc', h2e, dm3)
+    #:a16 += numpy.einsum('jbij,rpqiac->pqrabc', h2e, dm3)
+    a16 += lib.einsum('bi,rpqiac->pqrabc', h2e_tr, dm3)
+    a16 -= lib.einsum('cjka,rpqbjk->pqrabc', h2e, dm3)
+    #:a16 += numpy.einsum('jcij,rpqbai->pqrabc', h2e, dm3)
+    a16 += lib.einsum('ci,rpqbai->pqrabc', h2e_tr, dm3)
     return a16
 
-def make_a22(h1e, h2e, dms, civec, norb, nelec, link_index=None):
-    dm2 = dms['2']
-    dm3 = dms['3']
+def make_a22(h1e, h2e, dms, civec, norb, nelec, link_index=None,
+             p0=0, p1=None):
+    if p1 is None:
+        p1 = norb
+    dm2 = dms['2'][:,p0:p1]
+    dm3 = dms['3'][:,p0:p1]
     #dm4 = dms['4']
-    if 'f3ca' in dms and 'f3ac' in dms:
-        f3ca = dms['f3ca']
-        f3ac = dms['f3ac']
-    else:
-        if isinstance(nelec, (int, numpy.integer)):
-            neleca = nelecb = nelec//2
-        else:
-            neleca, nelecb = nelec
-        if link_index is None:
-            link_indexa = fci.cistring.gen_linkstr_index(range(norb), neleca)
-            link_indexb = fci.cistring.gen_linkstr_index(range(norb), nelecb)
-        else:
-            link_indexa, link_indexb = link_index
-        eri = h2e.transpose(0,2,1,3)
-        f3ca = _contract4pdm('NEVPTkern_cedf_aedf', eri, civec, norb, nelec,
-                             (link_indexa,link_indexb))
-        f3ac = _contract4pdm('NEVPTkern_aedf_ecdf', eri, civec, norb, nelec,
-                             (link_indexa,link_indexb))
-
-    a22 = -numpy.einsum('pb,kipjac->ijkabc', h1e, dm3)
-    a22 -= numpy.einsum('pa,kibjpc->ijkabc', h1e, dm3)
-    a22 += numpy.einsum('cp,kibjap->ijkabc', h1e, dm3)
-    a22 += numpy.einsum('cqra,kibjqr->ijkabc', h2e, dm3)
-    a22 -= numpy.einsum('qcpq,kibjap->ijkabc', h2e, dm3)
+    f3ca, f3ac = _make_f3(h2e, dms, civec, norb, nelec, link_index)
+    f3ca = f3ca[:,p0:p1]
+    f3ac = f3ac[:,p0:p1]
+    h2e_tr = numpy.einsum('qcpq->cp', h2e)
+
+    a22 = -lib.einsum('pb,kipjac->ijkabc', h1e, dm3)
+    a22 -= lib.einsum('pa,kibjpc->ijkabc', h1e, dm3)
+    a22 += lib.einsum('cp,kibjap->ijkabc', h1e, dm3)
+    a22 += lib.einsum('cqra,kibjqr->ijkabc', h2e, dm3)
+    #:a22 -= numpy.einsum('qcpq,kibjap->ijkabc', h2e, dm3)
+    a22 -= lib.einsum('cp,kibjap->ijkabc', h2e_tr, dm3)
 
 # qjprac = acqjpr + delta(ja)qcpr + delta(ra)qjpc - delta(qc)ajpr - delta(pc)qjar
     #a22 -= numpy.einsum('pqrb,kiqjprac->ijkabc', h2e, dm4)
     a22 -= f3ac.transpose(1,5,0,2,4,3) # c'a'acbb'
-    fdm2 = numpy.einsum('pqrb,kiqcpr->ikbc', h2e, dm3)
+    fdm2 = lib.einsum('pqrb,kiqcpr->ikbc', h2e, dm3)
     for i in range(norb):
         a22[:,i,:,i,:,:] -= fdm2
-    a22 -= numpy.einsum('pqab,kiqjpc->ijkabc', h2e, dm3)
-    a22 += numpy.einsum('pcrb,kiajpr->ijkabc', h2e, dm3)
-    a22 += numpy.einsum('cqrb,kiqjar->ijkabc', h2e, dm3)
+    a22 -= lib.einsum('pqab,kiqjpc->ijkabc', h2e, dm3)
+    a22 += lib.einsum('pcrb,kiajpr->ijkabc', h2e, dm3)
+    a22 += lib.einsum('cqrb,kiqjar->ijkabc', h2e, dm3)
 
     #a22 -= numpy.einsum('pqra,kibjqcpr->ijkabc', h2e, dm4)
     a22 -= f3ac.transpose(1,3,0,4,2,5) # c'a'bb'ac -> a'b'c'abc
@@ -118,14 +122,15 @@ def make_a22(h1e, h2e, dms, civec, norb, nelec, link_index=None):
     #a22 += numpy.einsum('rcpq,kibjaqrp->ijkabc', h2e, dm4)
     a22 += f3ca.transpose(1,3,0,4,2,5) # c'a'bb'ac -> a'b'c'abc
 
-    a22 += 2.0*numpy.einsum('jb,kiac->ijkabc', h1e, dm2)
-    a22 += 2.0*numpy.einsum('pjrb,kiprac->ijkabc', h2e, dm3)
-    fdm2  = numpy.einsum('pa,kipc->ikac', h1e, dm2)
-    fdm2 -= numpy.einsum('cp,kiap->ikac', h1e, dm2)
-    fdm2 -= numpy.einsum('cqra,kiqr->ikac', h2e, dm2)
-    fdm2 += numpy.einsum('qcpq,kiap->ikac', h2e, dm2)
-    fdm2 += numpy.einsum('pqra,kiqcpr->ikac', h2e, dm3)
-    fdm2 -= numpy.einsum('rcpq,kiaqrp->ikac', h2e, dm3)
+    a22 += 2.0*lib.einsum('jb,kiac->ijkabc', h1e, dm2)
+    a22 += 2.0*lib.einsum('pjrb,kiprac->ijkabc', h2e, dm3)
+    fdm2  = lib.einsum('pa,kipc->ikac', h1e, dm2)
+    fdm2 -= lib.einsum('cp,kiap->ikac', h1e, dm2)
+    fdm2 -= lib.einsum('cqra,kiqr->ikac', h2e, dm2)
+    #:fdm2 += numpy.einsum('qcpq,kiap->ikac', h2e, dm2)
+    fdm2 += lib.einsum('cp,kiap->ikac', h2e_tr, dm2)
+    fdm2 += lib.einsum('pqra,kiqcpr->ikac', h2e, dm3)
+    fdm2 -= lib.einsum('rcpq,kiaqrp->ikac', h2e, dm3)
     for i in range(norb):
         a22[:,i,:,:,i,:] += fdm2 * 2
 
@@ -164,19 +169,23 @@ def make_a25(h1e,h2e,dm1,dm2):
     return a25
 
 def make_hdm3(dm1,dm2,dm3,hdm1,hdm2):
-    delta = numpy.eye(dm3.shape[0])
-    hdm3 = - numpy.einsum('pb,qrac->pqrabc',delta,hdm2)\
-          - numpy.einsum('br,pqac->pqrabc',delta,hdm2)\
-          + numpy.einsum('bq,prac->pqrabc',delta,hdm2)*2.0\
-          + numpy.einsum('ap,bqcr->pqrabc',delta,dm2)*2.0\
-          - numpy.einsum('ap,cr,bq->pqrabc',delta,delta,dm1)*4.0\
-          + numpy.einsum('cr,bqap->pqrabc',delta,dm2)*2.0\
-          - numpy.einsum('bqapcr->pqrabc',dm3)\
-          + numpy.einsum('ar,pc,bq->pqrabc',delta,delta,dm1)*2.0\
-          - numpy.einsum('ar,bqcp->pqrabc',delta,dm2)
+    # The delta terms are added in place to avoid the temporary arrays of
+    # the size of the 3-pdm
+    norb = dm1.shape[0]
+    hdm3 = numpy.empty_like(dm3)
+    numpy.negative(dm3.transpose(3,1,5,2,0,4), out=hdm3) # bqapcr
+    for i in range(norb):
+        hdm3[i,:,:,:,i,:] -= hdm2                            # pb,qrac
+        hdm3[:,:,i,:,i,:] -= hdm2                            # br,pqac
+        hdm3[:,i,:,:,i,:] += hdm2 * 2.0                      # bq,prac
+        hdm3[i,:,:,i,:,:] += dm2.transpose(1,3,0,2) * 2.0    # ap,bqcr
+        hdm3[:,:,i,:,:,i] += dm2.transpose(3,1,2,0) * 2.0    # cr,bqap
+        hdm3[:,:,i,i,:,:] -= dm2.transpose(3,1,0,2)          # ar,bqcp
+        for j in range(norb):
+            hdm3[i,:,j,i,:,j] -= dm1.T * 4.0                 # ap,cr,bq
+            hdm3[i,:,j,j,:,i] += dm1.T * 2.0                 # ar,pc,bq
     return hdm3
 
-
 def make_hdm2(dm1,dm2):
     delta = numpy.eye(dm2.shape[0])
     dm2 = numpy.einsum('ikjl->ijkl',dm2) -numpy.einsum('jk,il->ijkl',delta,dm1)
@@ -293,19 +302,41 @@ def Sr(mc,ci,dms, eris=None, verbose=None):
         h1e_v = eris['h1eff'][nocc:,ncore:nocc] - numpy.einsum('mbbn->mn',h2e_v)
 
 
+    ncas = mc.ncas
+    nvirt = h2e_v.shape[0]
     if hasattr(mc.fcisolver, 'nevpt_intermediate'):
         a16 = mc.fcisolver.nevpt_intermediate('A16',mc.ncas,mc.nelecas,ci)
     else:
-        a16 = make_a16(h1e,h2e, dms, ci, mc.ncas, mc.nelecas)
+        a16 = None
+        dms = dict(dms)
+        dms['f3ca'], dms['f3ac'] = _make_f3(h2e, dms, ci, ncas, mc.nelecas)
     a17 = make_a17(h1e,h2e,dm2,dm3)
     a19 = make_a19(h1e,h2e,dm1,dm2)
 
-    ener = numpy.einsum('ipqr,pqrabc,iabc->i',h2e_v,a16,h2e_v)\
-        +  numpy.einsum('ipqr,pqra,ia->i',h2e_v,a17,h1e_v)*2.0\
+    # a16 and dm3 are generated and contracted with h2e_v in blocks of their
+    # first index
+    #:ener = numpy.einsum('ipqr,pqrabc,iabc->i',h2e_v,a16,h2e_v)
+    #:norm = numpy.einsum('ipqr,rpqbac,iabc->i',h2e_v,dm3,h2e_v)
+    h2e_v2 = h2e_v.reshape(nvirt,-1)
+    ener = numpy.zeros(nvirt)
+    norm = numpy.zeros(nvirt)
+    for p0, p1 in lib.prange(0, ncas, _blksize(mc, ncas)):
+        if a16 is None:
+            a16blk = make_a16(h1e,h2e, dms, ci, ncas, mc.nelecas, p0=p0, p1=p1)
+        else:
+            a16blk = a16[p0:p1]
+        v = h2e_v[:,p0:p1].reshape(nvirt,-1)
+        ener += numpy.einsum('ix,ix->i', h2e_v2,
+                             numpy.dot(v, a16blk.reshape(-1,ncas**3)))
+        a16blk = None
+        dm3blk = dm3[:,p0:p1].transpose(1,2,0,4,3,5).reshape(-1,ncas**3)
+        norm += numpy.einsum('ix,ix->i', h2e_v2, numpy.dot(v, dm3blk))
+        dm3blk = None
+
+    ener += numpy.einsum('ipqr,pqra,ia->i',h2e_v,a17,h1e_v)*2.0\
         +  numpy.einsum('ip,pa,ia->i',h1e_v,a19,h1e_v)
 
-    norm = numpy.einsum('ipqr,rpqbac,iabc->i',h2e_v,dm3,h2e_v)\
-        +  numpy.einsum('ipqr,rpqa,ia->i',h2e_v,dm2,h1e_v)*2.0\
+    norm += numpy.einsum('ipqr,rpqa,ia->i',h2e_v,dm2,h1e_v)*2.0\
         +  numpy.einsum('ip,pa,ia->i',h1e_v,dm1,h1e_v)
 
     return _norm_to_energy(norm, ener, mc.mo_energy[mc.ncore+mc.ncas:])
@@ -334,31 +365,63 @@ def Si(mc, ci, dms, eris=None, verbose=None):
         h2e_v = eris['ppaa'][ncore:nocc,:ncore].transpose(0,2,1,3)
         h1e_v = eris['h1eff'][ncore:nocc,:ncore]
 
+    ncas = mc.ncas
+    ncore = mc.ncore
     if hasattr(mc.fcisolver, 'nevpt_intermediate'):
         #mc.fcisolver.make_a22(mc.ncas, state)
         a22 = mc.fcisolver.nevpt_intermediate('A22',mc.ncas,mc.nelecas,ci)
     else:
-        a22 = make_a22(h1e,h2e, dms, ci, mc.ncas, mc.nelecas)
+        a22 = None
+        dms = dict(dms)
+        dms['f3ca'], dms['f3ac'] = _make_f3(h2e, dms, ci, ncas, mc.nelecas)
     a23 = make_a23(h1e,h2e,dm1,dm2,dm3)
     a25 = make_a25(h1e,h2e,dm1,dm2)
     delta = numpy.eye(mc.ncas)
-    dm3_h = numpy.einsum('abef,cd->abcdef',dm2,delta)*2\
-            - dm3.transpose(0,1,3,2,4,5)
     dm2_h = numpy.einsum('ab,cd->abcd',dm1,delta)*2\
             - dm2.transpose(0,1,3,2)
     dm1_h = 2*delta- dm1.transpose(1,0)
 
-    ener = numpy.einsum('qpir,pqrabc,baic->i',h2e_v,a22,h2e_v)\
-        +  numpy.einsum('qpir,pqra,ai->i',h2e_v,a23,h1e_v)*2.0\
+    # a22 and dm3_h are generated and contracted with h2e_v in blocks of
+    # their first index
+    #:dm3_h = numpy.einsum('abef,cd->abcdef',dm2,delta)*2\
+    #:        - dm3.transpose(0,1,3,2,4,5)
+    #:ener = numpy.einsum('qpir,pqrabc,baic->i',h2e_v,a22,h2e_v)
+    #:norm = numpy.einsum('qpir,rpqbac,baic->i',h2e_v,dm3_h,h2e_v)
+    h2e_v1 = h2e_v.transpose(2,1,0,3)
+    h2e_v2 = h2e_v1.reshape(ncore,-1)
+    ener = numpy.zeros(ncore)
+    norm = numpy.zeros(ncore)
+    for p0, p1 in lib.prange(0, ncas, _blksize(mc, ncas)):
+        if a22 is None:
+            a22blk = make_a22(h1e,h2e, dms, ci, ncas, mc.nelecas, p0=p0, p1=p1)
+        else:
+            a22blk = a22[p0:p1]
+        v = h2e_v1[:,p0:p1].reshape(ncore,-1)
+        ener += numpy.einsum('ix,ix->i', h2e_v2,
+                             numpy.dot(v, a22blk.reshape(-1,ncas**3)))
+        a22blk = None
+        dm3_h = numpy.einsum('abef,cd->abcdef',dm2[:,p0:p1],delta)*2
+        dm3_h -= dm3[:,p0:p1].transpose(0,1,3,2,4,5)
+        dm3_h = dm3_h.transpose(1,2,0,4,3,5).reshape(-1,ncas**3)
+        norm += numpy.einsum('ix,ix->i', h2e_v2, numpy.dot(v, dm3_h))
+        dm3_h = None
+
+    ener += numpy.einsum('qpir,pqra,ai->i',h2e_v,a23,h1e_v)*2.0\
         +  numpy.einsum('pi,pa,ai->i',h1e_v,a25,h1e_v)
 
-    norm = numpy.einsum('qpir,rpqbac,baic->i',h2e_v,dm3_h,h2e_v)\
-        +  numpy.einsum('qpir,rpqa,ai->i',h2e_v,dm2_h,h1e_v)*2.0\
+    norm += numpy.einsum('qpir,rpqa,ai->i',h2e_v,dm2_h,h1e_v)*2.0\
         +  numpy.einsum('pi,pa,ai->i',h1e_v,dm1_h,h1e_v)
 
     return _norm_to_energy(norm, ener, -mc.mo_energy[:mc.ncore])
 
 
+def _blksize(mc, ncas):
+    '''Number of the first indices of the 6-index intermediates in each
+    block.  A few arrays of size blksize*ncas**5 are held at the same time.'''
+    max_memory = max(400, mc.max_memory-lib.current_memory()[0])
+    return max(1, min(ncas, int(max_memory*.15e6/8/ncas**5)))
+
+
 def Sijrs(mc, eris, verbose=None):
     mo_core, mo_cas, mo_virt = _extract_orbs(mc, mc.mo_coeff)
     ncore = mo_core.shape[1]
@@ -715,6 +778,9 @@ class NEVPT(lib.StreamObject):
             norm_Si   , e_Si    = Si(self, self.load_ci(), dms, eris)
             logger.note(self, "Si    (+1)',   E = %.14f",  e_Si  )
             time1 = log.timer("space Si (+1)'", *time1)
+        # f3ca and f3ac are only needed by Sr and Si
+        dms.pop('f3ca', None)
+        dms.pop('f3ac', None)
         norm_Sijrs, e_Sijrs = Sijrs(self, eris)
         logger.note(self, "Sijrs (0)  ,   E = %.14f", e_Sijrs)
         time1 = log.timer('space Sijrs (0)', *time1)
@@ -86,6 +86,14 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(e, -0.033866295344083322, 7)
         self.assertAlmostEqual(norm, 0.074269050656629421, 7)
 
+    def test_a16_a22_blocks(self):
+        for make in (nevpt2.make_a16, nevpt2.make_a22):
+            a = make(h1e, h2e, dms, mc.ci, norb, nelec)
+            ablk = numpy.vstack([make(h1e, h2e, dms, mc.ci, norb, nelec,
+                                      p0=p0, p1=min(norb,p0+4))
+                                 for p0 in range(0, norb, 4)])
+            self.assertAlmostEqual(abs(a-ablk).max(), 0, 12)
+
     def test_energy(self):
         e = nevpt2.NEVPT(mc).kernel()
         self.assertAlmostEqual(e, -0.10315217594326213, 7)
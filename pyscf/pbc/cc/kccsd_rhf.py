@@ -6,6 +6,7 @@
 
 import time
 import tempfile
+import collections
 import numpy
 import numpy as np
 import kpoint_helper
@@ -19,6 +20,9 @@ import pyscf.cc
 import pyscf.cc.ccsd
 from pyscf.pbc.cc.kccsd import get_moidx
 from pyscf.pbc.cc import kintermediates_rhf as imdk
+from pyscf.pbc.df import df
+from pyscf.pbc.df import mdf
+from pyscf.pbc.lib.kpt_misc import gamma_point
 from pyscf.lib import linalg_helper
 
 #einsum = np.einsum
@@ -147,12 +151,13 @@ def update_amps(cc, t1, t2, eris):
                 t1new[ka] += -einsum('klic,klac->ia',Sooov,tau_term_1)
 
     # T2 equation
-    t2new = np.array(eris.oovv).conj()
+    t2new = np.empty(t2.shape, dtype=eris.oovv.dtype)
     for ki in range(nkpts):
       for kj in range(nkpts):
         for ka in range(nkpts):
             # Chemist's notation for momentum conserving t2(ki,kj,ka,kb)
             kb = kconserv[ki,ka,kj]
+            t2new[ki,kj,ka] = np.conj(eris.oovv[ki,kj,ka])
 
             for kl in range(nkpts):
                 # kk - ki + kl = kj
@@ -350,7 +355,6 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
         self.emp2 = 0
         foo = eris.fock[:,:nocc,:nocc].copy()
         fvv = eris.fock[:,nocc:,nocc:].copy()
-        eris_oovv = np.array(eris.oovv).copy()
         eia = numpy.zeros((nocc,nvir))
         eijab = numpy.zeros((nocc,nocc,nvir,nvir))
 
@@ -362,8 +366,10 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
                 eia = np.diagonal(foo[ki]).reshape(-1,1) - np.diagonal(fvv[ka])
                 ejb = np.diagonal(foo[kj]).reshape(-1,1) - np.diagonal(fvv[kb])
                 eijab = lib.direct_sum('ia,jb->ijab',eia,ejb)
-                woovv[ki,kj,ka] = (2*eris_oovv[ki,kj,ka] - eris_oovv[ki,kj,kb].transpose(0,1,3,2))
-                t2[ki,kj,ka] = eris_oovv[ki,kj,ka] / eijab
+                oovv_ijab = np.array(eris.oovv[ki,kj,ka])
+                oovv_ijba = np.array(eris.oovv[ki,kj,kb]).transpose(0,1,3,2)
+                woovv[ki,kj,ka] = (2*oovv_ijab - oovv_ijba)
+                t2[ki,kj,ka] = oovv_ijab / eijab
 
         t2 = numpy.conj(t2)
         self.emp2 = numpy.einsum('pqrijab,pqrijab',t2,woovv).real
@@ -966,6 +972,16 @@ class _ERIS:
         nUnique_klist = khelper.nUnique
 
         log = logger.Logger(cc.stdout, cc.verbose)
+        with_df = cc._scf.with_df
+        # The k-point blocked storage requires the 3-index tensors of GDF.
+        # MDF has the additional long-range part which is not included.
+        with_gdf = (isinstance(with_df, df.GDF) and
+                    not isinstance(with_df, mdf.MDF))
+        if method == 'kblock' and not with_gdf:
+            raise NotImplementedError('k-point blocked ERIs for %s. '
+                                      'They are only available with GDF.'
+                                      % with_df.__class__)
+        kblocked = (method == 'kblock' or method != 'hdf5' and with_gdf)
         if (method == 'incore' and (mem_incore+mem_now < cc.max_memory)
             or cc.mol.incore_anyway):
             log.info('using incore ERI storage')
@@ -1000,6 +1016,27 @@ class _ERIS:
             self.voov = eri[:,:,:,nocc:,:nocc,:nocc,nocc:].copy() / nkpts
             self.vovv = eri[:,:,:,nocc:,:nocc,nocc:,nocc:].copy() / nkpts
             self.vvvv = eri[:,:,:,nocc:,nocc:,nocc:,nocc:].copy() / nkpts
+        elif kblocked:
+            log.info('using k-point blocked ERI storage')
+            _tmpfile1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+            self.feri1 = h5py.File(_tmpfile1.name)
+            cput1 = time.clock(), time.time()
+            mo3c = _make_mo3c(with_df, mo_coeff, cc.kpts, self.feri1,
+                              max(2000, cc.max_memory-mem_now))
+            cput1 = log.timer_debug1('transforming 3-index tensors', *cput1)
+
+            if mo_coeff.dtype == np.float and gamma_point(cc.kpts):
+                self.dtype = numpy.double
+            else:
+                self.dtype = numpy.complex128
+            # Half of the available memory for the cached blocks
+            max_memory = max(0, cc.max_memory-lib.current_memory()[0]) * .5
+            labels = ('oooo', 'ooov', 'oovv', 'ovov', 'voov', 'vovv', 'vvvv')
+            cache = _BlockCache(max_memory)
+            for label in labels:
+                setattr(self, label, _KptBlockedERI(label, mo3c, nocc, nmo,
+                                                    kconserv, self.dtype,
+                                                    cache))
         else:
             log.info('using HDF5 ERI storage')
             _tmpfile1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
@@ -1091,6 +1128,137 @@ class _ERIS:
 
         log.timer('CCSD integral transformation', *cput0)
 
+def _make_mo3c(with_df, mo_coeff, kpts, feri, max_memory=2000):
+    '''MO 3-index tensors L_{pq}(ki,kj) of GDF for all pairs of k-points.
+    They are saved in feri['mo3c/%d' % (ki*nkpts+kj)] with the shape
+    (naux,nmo,nmo).  (pq|rs) = sum_L L_{pq}(kp,kq) L_{rs}(kr,ks)
+    '''
+    nkpts, nao, nmo = mo_coeff.shape
+    for ki in range(nkpts):
+        for kj in range(nkpts):
+            kptij = numpy.asarray((kpts[ki], kpts[kj]))
+            Lij = []
+            for LpqR, LpqI in with_df.sr_loop(kptij, max_memory, False):
+                if gamma_point(kptij):
+                    Lpq = LpqR.reshape(-1,nao,nao)
+                else:
+                    Lpq = (LpqR+LpqI*1j).reshape(-1,nao,nao)
+                LpqR = LpqI = None
+                Lij.append(lib.einsum('Lmn,mp,nq->Lpq', Lpq,
+                                      mo_coeff[ki].conj(), mo_coeff[kj]))
+            feri['mo3c/%d' % (ki*nkpts+kj)] = numpy.vstack(Lij)
+    return feri['mo3c']
+
+class _BlockCache(object):
+    '''Least-recently-used cache of the (k1,k2,k3) integral blocks shared by
+    all integral types of _ERIS.
+
+    Attributes:
+        max_memory : float
+            Memory (in MB) the cached blocks can take
+    '''
+    def __init__(self, max_memory):
+        self.max_memory = max_memory
+        self.size = 0
+        self._blocks = collections.OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._blocks
+
+    def __getitem__(self, key):
+        blk = self._blocks.pop(key)
+        self._blocks[key] = blk
+        return blk
+
+    def __setitem__(self, key, blk):
+        if key in self._blocks:
+            self.size -= self._blocks.pop(key).nbytes
+        self._blocks[key] = blk
+        self.size += blk.nbytes
+        while self.size > self.max_memory*1e6 and len(self._blocks) > 1:
+            self.size -= self._blocks.popitem(last=False)[1].nbytes
+
+class _KptBlockedERI(object):
+    '''Integrals <k1 k2|k3 k4> / nkpts (physicist's notation) of one
+    integral type (eg 'ovov').  The blocks are generated on demand from
+    the MO 3-index tensors and kept in a LRU cache.
+
+    The object can be indexed the same way as the (nkpts,nkpts,nkpts,...)
+    array of the incore _ERIS, eg eris.ovov[ki,kj,ka] or
+    numpy.array(eris.oooo).
+
+    When a block (k1,k2,k3) is not in the cache, the blocks (k1,k2,:) are
+    generated together since the innermost loops of update_amps and the
+    intermediates run over the last k-point index.
+    '''
+    def __init__(self, label, mo3c, nocc, nmo, kconserv, dtype, cache):
+        self.label = label
+        self.mo3c = mo3c
+        self.kconserv = kconserv
+        self.dtype = numpy.dtype(dtype)
+        self.cache = cache
+        self.nkpts = nkpts = len(kconserv)
+        orb = {'o': slice(0, nocc), 'v': slice(nocc, nmo)}
+        self.slices = [orb[x] for x in label]
+        nmos = [s.stop - s.start for s in self.slices]
+        self.shape = (nkpts,) * 3 + tuple(nmos)
+        self.ndim = len(self.shape)
+
+    def _load3c(self, ki, kj, si, sj):
+        return numpy.asarray(self.mo3c['%d' % (ki*self.nkpts+kj)][:,si,sj])
+
+    def _make_row(self, k1, k2):
+        '''Generate the blocks (k1,k2,:)'''
+        nkpts = self.nkpts
+        s1, s2, s3, s4 = self.slices
+        n1, n2, n3, n4 = self.shape[3:]
+        blks = []
+        for k3 in range(nkpts):
+            k4 = self.kconserv[k1,k3,k2]
+            L13 = self._load3c(k1, k3, s1, s3).reshape(-1,n1*n3)
+            L24 = self._load3c(k2, k4, s2, s4).reshape(-1,n2*n4)
+            blk = lib.dot(L13.T, L24, 1./nkpts).reshape(n1,n3,n2,n4)
+            blk = blk.transpose(0,2,1,3)
+            if self.dtype == numpy.double:
+                blk = blk.real
+            blks.append(numpy.asarray(blk, order='C'))
+            self.cache[self.label,k1,k2,k3] = blks[-1]
+        return blks
+
+    def get_block(self, k1, k2, k3):
+        key = (self.label, k1, k2, k3)
+        if key in self.cache:
+            return self.cache[key]
+        else:
+            return self._make_row(k1, k2)[k3]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        kidx = [numpy.arange(self.nkpts)[k] for k in key[:3]]
+        kidx += [numpy.arange(self.nkpts)] * (3 - len(kidx))
+        orbkey = key[3:]
+        if all(numpy.ndim(k) == 0 for k in kidx):
+            return self.get_block(*kidx)[orbkey]
+
+        klsts = [numpy.atleast_1d(k) for k in kidx]
+        out = numpy.empty([len(k) for k in klsts] + list(self.shape[3:]),
+                          dtype=self.dtype)
+        for i, k1 in enumerate(klsts[0]):
+            for j, k2 in enumerate(klsts[1]):
+                for k, k3 in enumerate(klsts[2]):
+                    out[i,j,k] = self.get_block(k1, k2, k3)
+        out = out[tuple([0 if numpy.ndim(k) == 0 else slice(None)
+                         for k in kidx])]
+        nkdim = sum([numpy.ndim(k) for k in kidx])
+        return out[(slice(None),)*nkdim + orbkey]
+
+    def __array__(self, dtype=None):
+        out = self[:]
+        if dtype is not None:
+            out = out.astype(dtype)
+        return out
+
 def verify_eri_symmetry(nmo, nkpts, kconserv, eri):
     # Check ERI symmetry
     maxdiff = 0.0
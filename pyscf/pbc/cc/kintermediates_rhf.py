@@ -92,11 +92,12 @@ def Lvv(t1,t2,eris,kconserv):
 def cc_Woooo(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
 
-    Wklij = np.array(eris.oooo, copy=True)
+    Wklij = np.empty(eris.oooo.shape, dtype=eris.oooo.dtype)
     for kk in range(nkpts):
         for kl in range(kk+1):
             for ki in range(nkpts):
                 kj = kconserv[kk,ki,kl]
+                Wklij[kk,kl,ki] = eris.oooo[kk,kl,ki]
                 Wklij[kk,kl,ki] += einsum('klic,jc->klij',eris.ooov[kk,kl,ki],t1[kj])
                 Wklij[kk,kl,ki] += einsum('lkjc,ic->klij',eris.ooov[kl,kk,kj],t1[ki])
 
@@ -169,11 +170,12 @@ def cc_Wvvvv(t1,t2,eris,kconserv):
 
 def cc_Wvoov(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
-    Wakic = np.array(eris.voov, copy=True)
+    Wakic = np.empty(eris.voov.shape, dtype=eris.voov.dtype)
     for ka in range(nkpts):
         for kk in range(nkpts):
             for ki in range(nkpts):
                 kc = kconserv[ka,ki,kk]
+                Wakic[ka,kk,ki] = eris.voov[ka,kk,ki]
                 Wakic[ka,kk,ki] -= einsum('lkic,la->akic',eris.ooov[ka,kk,ki],t1[ka])
                 Wakic[ka,kk,ki] += einsum('akdc,id->akic',eris.vovv[ka,kk,ki],t1[ki])
                 # ==== Beginning of change ====
@@ -247,20 +249,22 @@ def cc_Wvovo(t1,t2,eris,kconserv):
 def Wooov(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
 
-    Wklid = np.array(eris.ooov)
+    Wklid = np.empty(eris.ooov.shape, dtype=eris.ooov.dtype)
     for kk in range(nkpts):
         for kl in range(nkpts):
             for ki in range(nkpts):
+                Wklid[kk,kl,ki] = eris.ooov[kk,kl,ki]
                 Wklid[kk,kl,ki] += einsum('ic,klcd->klid',t1[ki],eris.oovv[kk,kl,ki])
     return Wklid
 
 def Wvovv(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
 
-    Walcd = np.array(eris.vovv)
+    Walcd = np.empty(eris.vovv.shape, dtype=eris.vovv.dtype)
     for ka in range(nkpts):
         for kl in range(nkpts):
             for kc in range(nkpts):
+                Walcd[ka,kl,kc] = eris.vovv[ka,kl,kc]
                 Walcd[ka,kl,kc] += -einsum('ka,klcd->alcd',t1[ka],eris.oovv[ka,kl,kc])
     return Walcd
 
@@ -300,11 +304,12 @@ def Wovvo(t1,t2,eris,kconserv):
 def W1ovov(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
 
-    Wkbid = np.array(eris.ovov, copy=True)
+    Wkbid = np.empty(eris.ovov.shape, dtype=eris.ovov.dtype)
     for kk in range(nkpts):
         for kb in range(nkpts):
             for ki in range(nkpts):
                 kd = kconserv[kk,ki,kb]
+                Wkbid[kk,kb,ki] = eris.ovov[kk,kb,ki]
                 #   kk + kl - kc - kd = 0
                 # => kc = kk - kd + kl
                 for kl in range(nkpts):
@@ -331,11 +336,12 @@ def Wovov(t1,t2,eris,kconserv):
 def Woooo(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
 
-    Wklij = np.array(eris.oooo, copy=True)
+    Wklij = np.empty(eris.oooo.shape, dtype=eris.oooo.dtype)
     for kk in range(nkpts):
         for kl in range(nkpts):
             for ki in range(nkpts):
                 kj = kconserv[kk,ki,kl]
+                Wklij[kk,kl,ki] = eris.oooo[kk,kl,ki]
                 for kc in range(nkpts):
                     #kd = kconserv[kk,kc,kl]
                     Wklij[kk,kl,ki] += einsum('klcd,ijcd->klij',eris.oovv[kk,kl,kc],t2[ki,kj,kc])
@@ -347,11 +353,12 @@ def Woooo(t1,t2,eris,kconserv):
 def Wvvvv(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
 
-    Wabcd = np.array(eris.vvvv, copy=True)
+    Wabcd = np.empty(eris.vvvv.shape, dtype=eris.vvvv.dtype)
     for ka in range(nkpts):
         for kb in range(nkpts):
             for kc in range(nkpts):
                 kd = kconserv[ka,kc,kb]
+                Wabcd[ka,kb,kc] = eris.vvvv[ka,kb,kc]
                 for kk in range(nkpts):
                     # kk + kl - kc - kd = 0
                     # => kl = kc - kk + kd
@@ -104,6 +104,32 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(escf,hf_311, 9)
         self.assertAlmostEqual(ecc, cc_311, 6)
 
+    def test_kblocked_eris(self):
+        L = 7.0
+        ngs = 4
+        cell = make_test_cell.test_cell_n1(L,ngs)
+        kpts = cell.make_kpts((2,1,1), wrap_around=True)
+        kmf = pbchf.KRHF(cell, kpts, exxdiv=None).density_fit()
+        kmf.conv_tol = 1e-12
+        kmf.scf()
+        cc = pyscf.pbc.cc.kccsd_rhf.RCCSD(kmf)
+        eris0 = pyscf.pbc.cc.kccsd_rhf._ERIS(cc, method='hdf5')
+        eris1 = pyscf.pbc.cc.kccsd_rhf._ERIS(cc, method='kblock')
+        for label in ('oooo', 'ooov', 'oovv', 'ovov', 'voov', 'vovv', 'vvvv'):
+            ref = np.asarray(getattr(eris0, label))
+            self.assertAlmostEqual(abs(np.asarray(getattr(eris1, label))-ref).max(), 0, 9)
+        ecc0 = cc.kernel(eris=eris0)[0]
+        ecc1 = cc.kernel(eris=eris1)[0]
+        self.assertAlmostEqual(ecc0, ecc1, 7)
+
+        kmf = pbchf.KRHF(cell, kpts, exxdiv=None)
+        kmf.mo_coeff = cc.mo_coeff
+        kmf.mo_occ = cc.mo_occ
+        kmf.mo_energy = cc.mo_energy
+        cc = pyscf.pbc.cc.kccsd_rhf.RCCSD(kmf)
+        self.assertRaises(NotImplementedError,
+                          pyscf.pbc.cc.kccsd_rhf._ERIS, cc, method='kblock')
+
 if __name__ == '__main__':
     print("Full kpoint test")
     unittest.main()
@@ -99,6 +99,9 @@ def wrap_int3c(cell, auxcell, intor='int3c2e_sph', aosym='s1', comp=1,
                                  auxcell._atm, auxcell._bas, auxcell._env)
     Ls = cell.get_lattice_Ls()
     nimgs = len(Ls)
+    # The (i[l]j[m]|L) integrals are skipped if the distance between the
+    # shells i[l] and j[m] is larger than the cutoff of the shell pair
+    rcut2 = cell.pair_rcut()**2
 
     kpti = kptij_lst[:,0]
     kptj = kptij_lst[:,1]
@@ -133,6 +136,8 @@ def wrap_int3c(cell, auxcell, intor='int3c2e_sph', aosym='s1', comp=1,
     libpbc.CINTdel_pairdata_optimizer(cintopt)
 
     def int3c(shls_slice, out):
+        pair_rcut2 = numpy.asarray(rcut2[shls_slice[0]:shls_slice[1],
+                                         shls_slice[2]:shls_slice[3]], order='C')
         shls_slice = (shls_slice[0], shls_slice[1],
                       nbas+shls_slice[2], nbas+shls_slice[3],
                       nbas*2+shls_slice[4], nbas*2+shls_slice[5])
@@ -141,6 +146,7 @@ def wrap_int3c(cell, auxcell, intor='int3c2e_sph', aosym='s1', comp=1,
             ctypes.c_int(nkptij), ctypes.c_int(nkpts),
             ctypes.c_int(comp), ctypes.c_int(nimgs),
             Ls.ctypes.data_as(ctypes.c_void_p),
+            pair_rcut2.ctypes.data_as(ctypes.c_void_p),
             expkL.ctypes.data_as(ctypes.c_void_p),
             kptij_idx.ctypes.data_as(ctypes.c_void_p),
             (ctypes.c_int*6)(*shls_slice),
@@ -289,10 +289,18 @@ def intor_cross(intor, cell1, cell2, comp=1, hermi=0, kpts=None, kpt=None):
 
     Ls = cell1.get_lattice_Ls(rcut=max(cell1.rcut, cell2.rcut))
     expkL = np.asarray(np.exp(1j*np.dot(kpts_lst, Ls.T)), order='C')
+    # Skip the images of which the overlap to the shells in cell #0 are
+    # negligible.  Coulomb-type operators decay as 1/R and the lattice sum
+    # cannot be truncated by the overlap of the shell pair.
+    if _is_coulomb_intor(intor):
+        rcut2 = lib.c_null_ptr()
+    else:
+        rcut2 = np.asarray(pair_rcut(cell1, cell2)**2, order='C')
+        rcut2 = rcut2.ctypes.data_as(ctypes.c_void_p)
     drv = libpbc.PBCnr2c_drv
     drv(fintor, fill, out.ctypes.data_as(ctypes.c_void_p),
         ctypes.c_int(nkpts), ctypes.c_int(comp), ctypes.c_int(len(Ls)),
-        Ls.ctypes.data_as(ctypes.c_void_p),
+        Ls.ctypes.data_as(ctypes.c_void_p), rcut2,
         expkL.ctypes.data_as(ctypes.c_void_p),
         (ctypes.c_int*4)(*(shls_slice[:4])),
         ao_loc.ctypes.data_as(ctypes.c_void_p), intopt,
@@ -317,6 +325,11 @@ def intor_cross(intor, cell1, cell2, comp=1, hermi=0, kpts=None, kpt=None):
     return mat
 
 
+def _is_coulomb_intor(intor):
+    '''Whether the 2-center integral involves a long-range (1/r) operator'''
+    return ('2c2e' in intor or 'rinv' in intor or 'nuc' in intor)
+
+
 def get_nimgs(cell, precision=None):
     r'''Choose number of basis function images in lattice sums
     to include for given precision in overlap, using
@@ -356,6 +369,50 @@ def bas_rcut(cell, bas_id, precision=1e-8):
     rcut = _estimate_rcut(es, l, cs, precision)
     return rcut.max()
 
+def pair_rcut(cell1, cell2=None, precision=None):
+    r'''Estimate for each shell pair the largest distance between the two
+    shell centers to reach the precision in the product of the two shells
+
+    precision ~ c_i c_j (\pi/(a_i+a_j))^{3/2} r^{l_i+l_j} e^{-a_i a_j/(a_i+a_j) r^2}
+
+    Returns:
+        (cell1.nbas, cell2.nbas) array
+    '''
+    if cell2 is None:
+        cell2 = cell1
+    if precision is None:
+        precision = min(cell1.precision, cell2.precision)
+
+    def primitives(cell):
+        es = []
+        cs = []
+        ls = []
+        bas_id = []
+        for ib in range(cell.nbas):
+            e = cell.bas_exp(ib)
+            es.append(e)
+            cs.append(abs(cell.bas_ctr_coeff(ib)).max(axis=1))
+            ls.append([cell.bas_angular(ib)] * len(e))
+            bas_id.append([ib] * len(e))
+        return (np.hstack(es), np.hstack(cs), np.hstack(ls),
+                np.hstack(bas_id).astype(int))
+
+    e1, c1, l1, bas1 = primitives(cell1)
+    e2, c2, l2, bas2 = primitives(cell2)
+    aij = e1[:,None] + e2
+    theta = e1[:,None] * e2 / aij
+    lij = l1[:,None] + l2
+    fac = np.log((c1[:,None]*c2+1e-200) * (np.pi/aij)**1.5 / precision)
+    r0 = np.sqrt(np.maximum(fac, 0) / theta)
+    rcut = np.sqrt(np.maximum(fac + lij*np.log(np.maximum(r0, 1)), 0) / theta)
+
+    # max over the primitives of each shell
+    off1 = np.append(0, np.where(bas1[1:] != bas1[:-1])[0] + 1)
+    off2 = np.append(0, np.where(bas2[1:] != bas2[:-1])[0] + 1)
+    rcut = np.maximum.reduceat(rcut, off1, axis=0)
+    rcut = np.maximum.reduceat(rcut, off2, axis=1)
+    return rcut
+
 def _estimate_ke_cutoff(alpha, l, c, precision=1e-8, weight=1.):
     '''Energy cutoff estimation'''
     log_k0 = 2.5 + np.log(alpha) / 2
@@ -1067,6 +1124,13 @@ class Cell(mole.Mole):
 
     make_kpts = make_kpts
 
+    def space_group_ops(self, tol=1e-5):
+        '''Space group operations (rot, trans) in fractional coordinates.
+        See also :func:`pyscf.pbc.symm.geom.search_space_group_ops`
+        '''
+        from pyscf.pbc.symm import geom
+        return geom.search_space_group_ops(self, tol)
+
     def copy(self):
         return copy(self)
 
@@ -1087,6 +1151,7 @@ class Cell(mole.Mole):
         return self
 
     bas_rcut = bas_rcut
+    pair_rcut = pair_rcut
 
     get_lattice_Ls = pbctools.get_lattice_Ls
 
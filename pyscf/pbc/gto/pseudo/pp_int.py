@@ -256,7 +256,7 @@ def _int_vnl(cell, fakecell, hl_blocks, kpts):
         drv = libpbc.PBCnr2c_drv
         drv(fintor, fill, out.ctypes.data_as(ctypes.c_void_p),
             ctypes.c_int(nkpts), ctypes.c_int(comp), ctypes.c_int(nimgs),
-            Ls.ctypes.data_as(ctypes.c_void_p),
+            Ls.ctypes.data_as(ctypes.c_void_p), lib.c_null_ptr(),
             expkL.ctypes.data_as(ctypes.c_void_p),
             (ctypes.c_int*4)(*(shls_slice[:4])),
             ao_loc.ctypes.data_as(ctypes.c_void_p), intopt,
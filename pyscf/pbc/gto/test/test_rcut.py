@@ -34,6 +34,32 @@ class KnownValues(unittest.TestCase):
             self.assertTrue(abs(t1-t0).max() < prec*1e-1)
             self.assertTrue(abs(s1-s0).max() < prec*1e-2)
 
+    def test_pair_rcut(self):
+        rcut = cell.pair_rcut()
+        self.assertEqual(rcut.shape, (cell.nbas, cell.nbas))
+        self.assertAlmostEqual(abs(rcut - rcut.T).max(), 0, 12)
+        self.assertTrue((cell.pair_rcut(precision=1e-6) <= rcut).all())
+
+    def test_j2c_no_screening(self):
+        from pyscf.pbc.gto import cell as cell_module
+        kpts = cell.make_kpts([2,1,1])
+        j2c = cell.pbc_intor('int2c2e_sph', hermi=1, kpts=kpts)
+        s1 = cell.pbc_intor('int1e_ovlp_sph', hermi=1, kpts=kpts)
+        pair_rcut = cell_module.pair_rcut
+        try:
+            # Without the pair screening all images of the lattice sum are
+            # included
+            cell_module.pair_rcut = lambda *args, **kwargs: \
+                    numpy.ones_like(pair_rcut(*args, **kwargs)) * 1e9
+            j2c_ref = cell.pbc_intor('int2c2e_sph', hermi=1, kpts=kpts)
+            s1_ref = cell.pbc_intor('int1e_ovlp_sph', hermi=1, kpts=kpts)
+        finally:
+            cell_module.pair_rcut = pair_rcut
+        self.assertAlmostEqual(abs(numpy.asarray(j2c) -
+                                   numpy.asarray(j2c_ref)).max(), 0, 12)
+        self.assertAlmostEqual(abs(numpy.asarray(s1) -
+                                   numpy.asarray(s1_ref)).max(), 0, 9)
+
 if __name__ == '__main__':
     print("Test rcut and the errorsin pbc.gto.cell")
     unittest.main()
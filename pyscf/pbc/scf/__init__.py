@@ -11,6 +11,7 @@ from pyscf.pbc.scf import uhf
 from pyscf.pbc.scf import khf
 krhf = khf
 from pyscf.pbc.scf import kuhf
+from pyscf.pbc.scf import khf_ksymm
 from pyscf.pbc.scf import newton_ah
 from pyscf.pbc.scf import addons
 from pyscf.pbc.scf.x2c import sfx2c1e, sfx2c
@@ -20,5 +21,6 @@ UHF = uhf.UHF
 
 KRHF = krhf.KRHF
 KUHF = kuhf.KUHF
+KsymAdaptedKRHF = khf_ksymm.KsymAdaptedKRHF
 
 newton = newton_ah.newton
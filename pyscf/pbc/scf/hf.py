@@ -448,8 +448,7 @@ class SCF(hf.SCF):
     def dump_chk(self, envs):
         hf.SCF.dump_chk(self, envs)
         if self.chkfile:
-            with h5py.File(self.chkfile) as fh5:
-                fh5['scf/kpt'] = self.kpt
+            lib.chkfile.dump(self.chkfile, 'scf/kpt', self.kpt)
         return self
 
     def _is_mem_enough(self):
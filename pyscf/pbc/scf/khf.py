@@ -532,8 +532,7 @@ class KSCF(hf.SCF):
     def dump_chk(self, envs):
         hf.SCF.dump_chk(self, envs)
         if self.chkfile:
-            with h5py.File(self.chkfile) as fh5:
-                fh5['scf/kpts'] = self.kpts
+            lib.chkfile.dump(self.chkfile, 'scf/kpts', self.kpts)
         return self
 
     def mulliken_meta(self, cell=None, dm=None, verbose=logger.DEBUG,
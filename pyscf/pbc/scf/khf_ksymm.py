@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Hartree-Fock for periodic systems with k-point sampling in the irreducible
+Brillouin zone (IBZ)
+
+The orbitals, density matrices and Fock matrices are only computed at the
+irreducible k-points.  The density matrices are transformed to the full
+k-point mesh by the space group operations for the J/K builds, and the J/K
+matrices are evaluated at the irreducible k-points only.
+
+See Also:
+    pyscf.pbc.symm.kpts_symm
+'''
+
+import time
+import numpy as np
+from pyscf import lib
+from pyscf.scf import hf
+from pyscf.lib import logger
+from pyscf.pbc.scf import khf
+from pyscf.pbc.symm import geom
+from pyscf.pbc.symm import kpts_symm
+from pyscf.pbc import tools
+
+
+def get_occ(mf, mo_energy_kpts=None, mo_coeff_kpts=None):
+    '''Label the occupancies for each orbital of the irreducible k-points.
+    Each irreducible k-point is counted as many times as the number of
+    k-points in its star.
+    '''
+    if mo_energy_kpts is None: mo_energy_kpts = mf.mo_energy
+
+    nkpts = len(mf.kpts_bz)
+    nocc = (mf.cell.nelectron * nkpts) // 2
+    kstar = np.asarray(np.round(mf.kpts_weights * nkpts), dtype=int)
+
+    mo_energy = np.hstack(mo_energy_kpts)
+    degen = np.hstack([[kstar[k]] * len(e) for k, e in enumerate(mo_energy_kpts)])
+    idx = np.argsort(mo_energy)
+    mo_energy = mo_energy[idx]
+    count = np.cumsum(degen[idx])
+    homo = np.searchsorted(count, nocc)
+    fermi = mo_energy[homo]
+    mo_occ_kpts = []
+    for mo_e in mo_energy_kpts:
+        mo_occ_kpts.append((mo_e <= fermi).astype(np.double) * 2)
+
+    if homo+1 < mo_energy.size:
+        logger.info(mf, 'HOMO = %.12g  LUMO = %.12g',
+                    mo_energy[homo], mo_energy[homo+1])
+        if mo_energy[homo]+1e-3 > mo_energy[homo+1]:
+            logger.warn(mf, 'HOMO %.12g == LUMO %.12g',
+                        mo_energy[homo], mo_energy[homo+1])
+    else:
+        logger.info(mf, 'HOMO = %.12g', mo_energy[homo])
+    return mo_occ_kpts
+
+
+def energy_elec(mf, dm_kpts=None, h1e_kpts=None, vhf_kpts=None):
+    '''Electronic energy with the weights of the irreducible k-points.
+    See also :func:`khf.energy_elec`
+    '''
+    if dm_kpts is None: dm_kpts = mf.make_rdm1()
+    if h1e_kpts is None: h1e_kpts = mf.get_hcore()
+    if vhf_kpts is None: vhf_kpts = mf.get_veff(mf.cell, dm_kpts)
+
+    weights = mf.kpts_weights
+    e1 = np.einsum('k,kij,kji', weights, dm_kpts, h1e_kpts)
+    e_coul = np.einsum('k,kij,kji', weights, dm_kpts, vhf_kpts) * 0.5
+    if abs(e_coul.imag) > 1.e-7:
+        raise RuntimeError("Coulomb energy has imaginary part, "
+                           "something is wrong!", e_coul.imag)
+    e1 = e1.real
+    e_coul = e_coul.real
+    logger.debug(mf, 'E_coul = %.15g', e_coul)
+    return e1+e_coul, e_coul
+
+
+class KsymAdaptedKSCF(khf.KSCF):
+    '''KRHF with k-point symmetry.
+
+    Attributes:
+        kpts : (nibz,3) ndarray
+            The irreducible k-points.  When kpts is assigned, it should be the
+            full k-point mesh, which will be reduced to the irreducible
+            k-points.
+        time_reversal_symm : bool
+            Whether to use the time reversal symmetry to reduce k-points.
+            Default is True.
+
+    Saved results
+
+        kpts_bz : (nkpts,3) ndarray
+            The full k-point mesh
+        kpts_weights : (nibz,) ndarray
+            The weights of the irreducible k-points.  The weights sum to 1.
+        bz2ibz, bz_ops, bz_time_rev :
+            Mapping between the full k-point mesh and the irreducible
+            k-points.  See :func:`kpts_symm.make_ibz_kpts`
+        space_group_ops : list of (rot, trans)
+            Space group operations compatible with the k-point mesh
+
+    Examples:
+
+    >>> cell = gto.M(atom='He 0 0 0', a=numpy.eye(3)*3, basis='6-31g')
+    >>> mf = KsymAdaptedKRHF(cell, cell.make_kpts([3,3,3]))
+    >>> len(mf.kpts)
+    4
+    '''
+    def __init__(self, cell, kpts=np.zeros((1,3)), exxdiv='ewald'):
+        self.time_reversal_symm = True
+        self.space_group_ops = None
+        khf.KSCF.__init__(self, cell, kpts, exxdiv)
+        self._keys = self._keys.union(['time_reversal_symm', 'space_group_ops',
+                                       'kpts_ibz', 'kpts_weights', 'bz2ibz',
+                                       'bz_ops', 'bz_time_rev'])
+
+    @property
+    def kpts(self):
+        return self.kpts_ibz
+    @kpts.setter
+    def kpts(self, x):
+        self.with_df.kpts = np.reshape(x, (-1,3))
+        self.build_ibz()
+
+    @property
+    def kpts_bz(self):
+        return self.with_df.kpts
+
+    def build_ibz(self, ops=None):
+        '''Reduce the full k-point mesh to the irreducible k-points'''
+        if ops is None:
+            if self.space_group_ops is None:
+                self.space_group_ops = geom.search_space_group_ops(self.cell)
+            ops = self.space_group_ops
+        (self.kpts_ibz, self.kpts_weights, self.bz2ibz, self.bz_ops,
+         self.bz_time_rev, self.space_group_ops) = \
+                kpts_symm.make_ibz_kpts(self.cell, self.kpts_bz, ops,
+                                        self.time_reversal_symm)
+        return self
+
+    def dump_flags(self):
+        hf.SCF.dump_flags(self)
+        logger.info(self, '\n')
+        logger.info(self, '******** PBC SCF flags ********')
+        logger.info(self, 'N kpts = %d', len(self.kpts_bz))
+        logger.info(self, 'N irreducible kpts = %d', len(self.kpts_ibz))
+        logger.info(self, 'N space group operations = %d',
+                    len(self.space_group_ops))
+        logger.debug(self, 'irreducible kpts = %s', self.kpts_ibz)
+        logger.debug(self, 'kpts weights = %s', self.kpts_weights)
+        logger.info(self, 'Exchange divergence treatment (exxdiv) = %s', self.exxdiv)
+        if isinstance(self.exxdiv, str) and self.exxdiv.lower() == 'ewald':
+            madelung = tools.pbc.madelung(self.cell, [self.kpts_bz])
+            logger.info(self, '    madelung (= occupied orbital energy shift) = %s', madelung)
+            logger.info(self, '    Total energy shift due to Ewald probe charge'
+                        ' = -1/2 * Nelec*madelung/cell.vol = %.12g',
+                        madelung*self.cell.nelectron * -.5)
+        logger.info(self, 'DF object = %s', self.with_df)
+        self.with_df.dump_flags()
+        return self
+
+    def transform_dm(self, dm_kpts):
+        '''Density matrices on the full k-point mesh'''
+        return kpts_symm.transform_dm(self.cell, dm_kpts, self.kpts_ibz,
+                                      self.kpts_bz, self.bz2ibz, self.bz_ops,
+                                      self.bz_time_rev, self.space_group_ops)
+
+    def transform_mo_coeff(self, mo_coeff_kpts):
+        '''Orbitals on the full k-point mesh'''
+        return kpts_symm.transform_mo_coeff(self.cell, mo_coeff_kpts,
+                                            self.kpts_ibz, self.kpts_bz,
+                                            self.bz2ibz, self.bz_ops,
+                                            self.bz_time_rev,
+                                            self.space_group_ops)
+
+    def transform_fock(self, fock_kpts):
+        '''Fock matrices on the full k-point mesh'''
+        return kpts_symm.transform_fock(self.cell, fock_kpts, self.kpts_ibz,
+                                        self.kpts_bz, self.bz2ibz, self.bz_ops,
+                                        self.bz_time_rev, self.space_group_ops)
+
+    def get_j(self, cell=None, dm_kpts=None, hermi=1, kpts=None, kpts_band=None):
+        return self.get_jk(cell, dm_kpts, hermi, kpts, kpts_band, with_k=False)[0]
+
+    def get_jk(self, cell=None, dm_kpts=None, hermi=1, kpts=None, kpts_band=None,
+               with_k=True):
+        if cell is None: cell = self.cell
+        if dm_kpts is None: dm_kpts = self.make_rdm1()
+        if kpts is not None and kpts is not self.kpts_ibz:
+            # The density matrices are given on an arbitrary k-point mesh
+            if with_k:
+                return khf.KSCF.get_jk(self, cell, dm_kpts, hermi, kpts, kpts_band)
+            else:
+                return khf.KSCF.get_j(self, cell, dm_kpts, hermi, kpts, kpts_band), None
+
+        cpu0 = (time.clock(), time.time())
+        dm_bz = self.transform_dm(dm_kpts)
+        if kpts_band is None:
+            kpts_band = self.kpts_ibz
+        vj, vk = self.with_df.get_jk(dm_bz, hermi, self.kpts_bz, kpts_band,
+                                     with_k=with_k, exxdiv=self.exxdiv)
+        logger.timer(self, 'vj and vk', *cpu0)
+        return vj, vk
+
+    get_occ = get_occ
+    energy_elec = energy_elec
+
+    def get_fermi(self, mo_energy_kpts=None, mo_occ_kpts=None):
+        if mo_energy_kpts is None: mo_energy_kpts = self.mo_energy
+        if mo_occ_kpts is None: mo_occ_kpts = self.mo_occ
+        return max([e[occ > 0].max() for e, occ in
+                    zip(mo_energy_kpts, mo_occ_kpts) if (occ > 0).any()])
+
+    def density_fit(self, auxbasis=None, with_df=None):
+        from pyscf.pbc.df import df, df_jk
+        if with_df is None:
+            # DF integrals are needed for all k-points of the full mesh
+            with_df = df.DF(self.cell, self.kpts_bz)
+            with_df.max_memory = self.max_memory
+            with_df.stdout = self.stdout
+            with_df.verbose = self.verbose
+            with_df.auxbasis = auxbasis
+        return df_jk.density_fit(self, auxbasis, with_df=with_df)
+
+    def mix_density_fit(self, auxbasis=None, with_df=None):
+        from pyscf.pbc.df import mdf, mdf_jk
+        if with_df is None:
+            with_df = mdf.MDF(self.cell, self.kpts_bz)
+            with_df.max_memory = self.max_memory
+            with_df.stdout = self.stdout
+            with_df.verbose = self.verbose
+            with_df.auxbasis = auxbasis
+        return mdf_jk.density_fit(self, auxbasis, with_df=with_df)
+
+    def to_khf(self):
+        '''Convert to the KRHF object of the full k-point mesh.  The orbitals
+        of the irreducible k-points are transformed to all k-points.
+        '''
+        mf = khf.KRHF(self.cell, self.kpts_bz, self.exxdiv)
+        mf.with_df = self.with_df
+        mf.verbose = self.verbose
+        mf.stdout = self.stdout
+        mf.max_memory = self.max_memory
+        mf.conv_tol = self.conv_tol
+        mf.conv_tol_grad = self.conv_tol_grad
+        mf.max_cycle = self.max_cycle
+        if self.mo_coeff is not None:
+            mf.mo_coeff = self.transform_mo_coeff(self.mo_coeff)
+            mf.mo_energy = [self.mo_energy[k] for k in self.bz2ibz]
+            mf.mo_occ = [self.mo_occ[k] for k in self.bz2ibz]
+            mf.e_tot = self.e_tot
+            mf.converged = self.converged
+        return mf
+
+    def stability(self, internal=True, external=False, verbose=None):
+        '''Stability analysis on the full k-point mesh.  The instabilities
+        may break the k-point symmetry.  The returned orbitals are those of
+        the full k-point mesh (see :meth:`to_khf`).
+        '''
+        return self.to_khf().stability(internal, external, verbose)
+
+    def newton(self):
+        '''Second order SCF solver for the full k-point mesh.  The orbital
+        rotations are not restricted by the k-point symmetry.  The orbitals
+        of the irreducible k-points are transformed to the full k-point mesh
+        as the initial guess.
+        '''
+        return self.to_khf().newton()
+
+KsymAdaptedKRHF = KsymAdaptedKSCF
+
+
+if __name__ == '__main__':
+    from pyscf.pbc import gto
+    cell = gto.Cell()
+    cell.atom = '''
+    C 0.,  0.,  0.
+    C 0.8917,  0.8917,  0.8917
+    '''
+    cell.a = '''0.      1.7834  1.7834
+                1.7834  0.      1.7834
+                1.7834  1.7834  0.    '''
+    cell.basis = 'gth-szv'
+    cell.pseudo = 'gth-pade'
+    cell.gs = [5] * 3
+    cell.verbose = 5
+    cell.build()
+    kpts = cell.make_kpts([3,3,3])
+    mf = KsymAdaptedKRHF(cell, kpts)
+    mf.kernel()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import unittest
+import numpy as np
+
+from pyscf.pbc import gto as pbcgto
+from pyscf.pbc.scf import khf
+from pyscf.pbc.scf import khf_ksymm
+
+cell = pbcgto.Cell()
+cell.unit = 'A'
+cell.atom = 'C 0.,  0.,  0.; C 0.8917,  0.8917,  0.8917'
+cell.a = '''0.      1.7834  1.7834
+            1.7834  0.      1.7834
+            1.7834  1.7834  0.    '''
+cell.basis = 'gth-szv'
+cell.pseudo = 'gth-pade'
+cell.gs = [4] * 3
+cell.verbose = 7
+cell.output = '/dev/null'
+cell.build()
+
+class KnowValues(unittest.TestCase):
+    def test_krhf_ksymm(self):
+        kpts = cell.make_kpts([2,2,2])
+        kmf = khf.KRHF(cell, kpts, exxdiv='vcut_sph')
+        eref = kmf.scf()
+
+        kmf1 = khf_ksymm.KsymAdaptedKRHF(cell, kpts, exxdiv='vcut_sph')
+        self.assertEqual(len(kmf1.kpts), 3)
+        e1 = kmf1.scf()
+        self.assertAlmostEqual(e1, eref, 8)
+
+        dm_bz = kmf1.transform_dm(kmf1.make_rdm1())
+        self.assertAlmostEqual(abs(dm_bz - kmf.make_rdm1()).max(), 0, 5)
+
+    def test_get_bands(self):
+        kpts = cell.make_kpts([2,2,2])
+        kmf = khf_ksymm.KsymAdaptedKRHF(cell, kpts).run()
+        kmf1 = khf.KRHF(cell, kpts).run()
+        e = kmf.get_bands(kpts[1])[0]
+        e1 = kmf1.get_bands(kpts[1])[0]
+        self.assertAlmostEqual(abs(e - e1).max(), 0, 6)
+
+    def test_to_khf(self):
+        kpts = cell.make_kpts([2,2,2])
+        kmf = khf_ksymm.KsymAdaptedKRHF(cell, kpts, exxdiv='vcut_sph').run()
+        kmf1 = kmf.to_khf()
+        self.assertEqual(len(kmf1.mo_coeff), 8)
+        dm_bz = kmf.transform_dm(kmf.make_rdm1())
+        self.assertAlmostEqual(abs(kmf1.make_rdm1() - dm_bz).max(), 0, 9)
+        self.assertAlmostEqual(kmf1.energy_tot(), kmf.e_tot, 8)
+
+        mo = kmf.stability()
+        self.assertEqual(len(mo), 8)
+
+        mf2 = kmf.newton()
+        mf2.kernel(mf2.mo_coeff, mf2.mo_occ)
+        self.assertAlmostEqual(mf2.e_tot, kmf.e_tot, 8)
+
+
+if __name__ == '__main__':
+    print("Full Tests for pbc.scf.khf_ksymm")
+    unittest.main()
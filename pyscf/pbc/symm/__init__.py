@@ -0,0 +1,13 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+'''
+Space group symmetry of crystals and the k-point symmetry.
+'''
+
+from pyscf.pbc.symm import geom
+from pyscf.pbc.symm import kpts_symm
+
+from pyscf.pbc.symm.geom import search_space_group_ops
+from pyscf.pbc.symm.kpts_symm import make_ibz_kpts, transform_dm, transform_fock, \
+        transform_mo_coeff
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Space group operations of crystals
+
+The operations are represented in the fractional (scaled) coordinates of the
+lattice.  An operation is a pair (rot, trans), rot being a 3x3 integer matrix
+and trans a fractional translation.  It maps the atom at the fractional
+coordinates f to rot.dot(f) + trans (modulo lattice translations).
+'''
+
+import numpy
+from pyscf import lib
+from pyscf.lib import logger
+
+TOLERANCE = 1e-5
+
+def search_space_group_ops(cell, tol=TOLERANCE):
+    '''Search the space group operations of the given cell.
+
+    The candidate rotations are the integer matrices (elements -1, 0, 1)
+    which keep the lattice metric invariant.  For each of them, the
+    fractional translation is searched among the vectors which map the atoms
+    of the least populated species onto each other.  Only one translation is
+    kept for each rotation.  Pure lattice translations of supercells are not
+    included.
+
+    Kwargs:
+        tol : float
+            Tolerance (in Bohr) to match the atomic positions
+
+    Returns:
+        A list of (rot, trans).  The identity operation is always the first
+        one in the list.
+
+    Examples:
+
+    >>> cell = gto.M(atom='He 0 0 0', a=numpy.eye(3)*3)
+    >>> len(search_space_group_ops(cell))
+    48
+    '''
+    a = cell.lattice_vectors()
+    identity = (numpy.eye(3, dtype=int), numpy.zeros(3))
+    if cell.dimension < 3:
+        logger.debug(cell, 'Space group symmetry is not searched for '
+                     'low-dimensional system')
+        return [identity]
+
+    metric = numpy.dot(a, a.T)
+    rots = lib.cartesian_prod([(-1,0,1)]*9).reshape(-1,3,3)
+    rot_metric = numpy.einsum('nji,jk,nkl->nil', rots, metric, rots)
+    mask = abs(rot_metric - metric).reshape(-1,9).max(axis=1) < tol * abs(metric).max()
+    rots = rots[mask]
+
+    atm_ids = _atom_species(cell)
+    scaled = numpy.dot(cell.atom_coords(), numpy.linalg.inv(a))
+    # Atoms of the least populated species to generate trial translations
+    counts = numpy.bincount(atm_ids)
+    ref_ids = numpy.where(atm_ids == numpy.argmin(counts))[0]
+
+    ops = [identity]
+    for rot in rots:
+        if abs(rot - identity[0]).sum() == 0:
+            continue
+        rot_scaled = numpy.dot(scaled, rot.T)
+        for i in ref_ids:
+            trans = scaled[i] - rot_scaled[ref_ids[0]]
+            trans -= numpy.floor(trans + tol)
+            if atom_perm(cell, rot, trans, tol, atm_ids, scaled) is not None:
+                ops.append((rot, trans))
+                break
+    logger.debug(cell, 'Number of space group operations %d', len(ops))
+    return ops
+
+def atom_perm(cell, rot, trans, tol=TOLERANCE, atm_ids=None, scaled=None):
+    '''Map the atoms of the cell under the operation (rot, trans).
+
+    Returns:
+        perm, shifts.  The atom a is mapped to the atom perm[a] in the
+        lattice cell shifts[a], i.e.
+        rot.dot(f_a) + trans = f_perm[a] + shifts[a].  None is returned if the
+        operation is not a symmetry operation of the cell.
+    '''
+    a = cell.lattice_vectors()
+    if atm_ids is None:
+        atm_ids = _atom_species(cell)
+    if scaled is None:
+        scaled = numpy.dot(cell.atom_coords(), numpy.linalg.inv(a))
+    new_scaled = numpy.dot(scaled, numpy.asarray(rot).T) + trans
+    diff = new_scaled[:,None,:] - scaled
+    shifts = numpy.round(diff)
+    dist = lib.norm(numpy.dot(diff - shifts, a), axis=2)
+    dist[atm_ids[:,None] != atm_ids] = 1e9
+    perm = numpy.argmin(dist, axis=1)
+    natm = len(perm)
+    if (dist[numpy.arange(natm),perm] > tol).any():
+        return None
+    return perm, shifts[numpy.arange(natm),perm].astype(int)
+
+def cart_rotation(cell, rot):
+    '''Rotation matrix in Cartesian coordinates for the rotation rot given
+    in the fractional coordinates.
+    '''
+    a = cell.lattice_vectors()
+    return numpy.dot(a.T, numpy.dot(rot, numpy.linalg.inv(a.T)))
+
+def _atom_species(cell):
+    '''Integer label for each atom. Atoms with the same label have the same
+    nuclear charge and basis set.'''
+    symbs = [cell.atom_symbol(i) for i in range(cell.natm)]
+    uniq_symbs = sorted(set(symbs))
+    return numpy.asarray([uniq_symbs.index(s) for s in symbs])
+
+
+if __name__ == '__main__':
+    from pyscf.pbc import gto
+    cell = gto.M(atom='C 0 0 0; C .8917 .8917 .8917',
+                 a='''0. 1.7834 1.7834
+                      1.7834 0. 1.7834
+                      1.7834 1.7834 0.''', basis='gth-szv',
+                 pseudo='gth-pade', gs=[5]*3)
+    print(len(search_space_group_ops(cell)))
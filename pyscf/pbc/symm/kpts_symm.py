@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Irreducible Brillouin zone (IBZ) and the transformation of k-point matrices
+under space group operations.
+
+For the space group operation g = (R, t) which maps the atom a to the atom b
+in the lattice cell L_a (R r_a + t = r_b + L_a), the Bloch AO basis
+phi^k_mu(r) = sum_T exp(ik.T) phi_mu(r-T) is transformed as
+
+    O_g phi^k_mu = exp(-i Rk.L_a) sum_mu' phi^{Rk}_mu' D_mu'mu
+
+D is the rotation matrix of the real spherical (or Cartesian) functions.
+The density matrix and the Fock matrix at Rk are then
+
+    dm(Rk) = U dm(k) U^dagger,     fock(Rk) = U^{-dagger} fock(k) U^{-1}
+
+with U = D * exp(-i Rk.L_a).  Time reversal symmetry gives
+dm(-k) = dm(k).conj().
+'''
+
+from functools import reduce
+import numpy
+import scipy.linalg
+from pyscf import lib
+from pyscf.gto import mole
+from pyscf.pbc.symm import geom
+from pyscf.pbc.lib.kpt_misc import KPT_DIFF_TOL
+
+
+def make_ibz_kpts(cell, kpts, ops=None, time_reversal=True, tol=KPT_DIFF_TOL):
+    '''Reduce the k-points to the irreducible Brillouin zone.
+
+    The operations which do not map the k-point mesh onto itself are
+    discarded.
+
+    Args:
+        kpts : (nkpts,3) ndarray
+            The full k-point mesh, in Cartesian coordinates
+
+    Kwargs:
+        ops : list of (rot, trans)
+            Space group operations.  If not given, they are searched by
+            :func:`geom.search_space_group_ops`
+        time_reversal : bool
+            Whether to include the time reversal symmetry k -> -k
+
+    Returns:
+        kpts_ibz : (nibz,3) ndarray
+            The irreducible k-points.
+        weights : (nibz,) ndarray
+            The weight of each irreducible k-point.  The weights sum to 1.
+        bz2ibz : (nkpts,) int ndarray
+            The irreducible k-point each k-point is mapped from.
+        bz_ops : (nkpts,) int ndarray
+            Index of the operation (in the returned ops) which maps
+            kpts_ibz[bz2ibz[k]] to kpts[k].
+        bz_time_rev : (nkpts,) bool ndarray
+            Whether the time reversal has to be applied after the operation.
+        ops : list of (rot, trans)
+            The operations which are compatible with the k-point mesh.
+    '''
+    if ops is None:
+        ops = geom.search_space_group_ops(cell)
+    kpts = numpy.reshape(kpts, (-1,3))
+    nkpts = len(kpts)
+    scaled_kpts = cell.get_scaled_kpts(kpts)
+
+    def kpt_index(new_kpts):
+        diff = cell.get_scaled_kpts(new_kpts)[:,None,:] - scaled_kpts
+        diff = abs(diff - numpy.round(diff)).sum(axis=2)
+        idx = numpy.argmin(diff, axis=1)
+        if (diff[numpy.arange(len(idx)),idx] > tol).any():
+            return None
+        return idx
+
+    kmaps = []
+    compatible_ops = []
+    for rot, trans in ops:
+        r_cart = geom.cart_rotation(cell, rot)
+        idx = kpt_index(numpy.dot(kpts, r_cart.T))
+        if idx is not None:
+            kmaps.append(idx)
+            compatible_ops.append((rot, trans))
+    ops = compatible_ops
+    if time_reversal:
+        tr_idx = kpt_index(-kpts)
+        if tr_idx is None:
+            time_reversal = False
+        else:
+            kmaps_tr = [tr_idx[idx] for idx in kmaps]
+
+    bz2ibz = numpy.empty(nkpts, dtype=int)
+    bz_ops = numpy.empty(nkpts, dtype=int)
+    bz_time_rev = numpy.zeros(nkpts, dtype=bool)
+    seen = numpy.zeros(nkpts, dtype=bool)
+    ibz_idx = []
+    for k in range(nkpts):
+        if seen[k]:
+            continue
+        n = len(ibz_idx)
+        ibz_idx.append(k)
+        for i, idx in enumerate(kmaps):
+            k1 = idx[k]
+            if not seen[k1]:
+                seen[k1] = True
+                bz2ibz[k1] = n
+                bz_ops[k1] = i
+            if time_reversal:
+                k1 = kmaps_tr[i][k]
+                if not seen[k1]:
+                    seen[k1] = True
+                    bz2ibz[k1] = n
+                    bz_ops[k1] = i
+                    bz_time_rev[k1] = True
+
+    weights = numpy.bincount(bz2ibz).astype(float) / nkpts
+    return kpts[ibz_idx], weights, bz2ibz, bz_ops, bz_time_rev, ops
+
+def ao_rotation_matrix(cell, op):
+    '''AO transformation matrix D (without the Bloch phase) for the space
+    group operation op.  D_mu'mu is nonzero only if mu' is on the image atom
+    of mu.
+
+    Returns:
+        D : (nao,nao) ndarray
+        Ls : (nao,3) ndarray
+            The lattice translation (in Bohr) L_a for each AO.
+    '''
+    rot, trans = op
+    perm, shifts = geom.atom_perm(cell, rot, trans)
+    r_cart = geom.cart_rotation(cell, rot)
+    Ls = numpy.dot(shifts, cell.lattice_vectors())
+
+    ao_loc = cell.ao_loc_nr()
+    aoslices = cell.aoslice_by_atom(ao_loc)
+    nao = ao_loc[-1]
+    dmat = numpy.zeros((nao,nao))
+    ao_Ls = numpy.empty((nao,3))
+    dl_cache = {}
+    for ia in range(cell.natm):
+        ib = perm[ia]
+        sh0, sh1, p0, p1 = aoslices[ia]
+        ao_Ls[p0:p1] = Ls[ia]
+        shift = aoslices[ib][0] - sh0
+        for ish in range(sh0, sh1):
+            l = cell.bas_angular(ish)
+            if l not in dl_cache:
+                dl_cache[l] = _real_harmonics_rotation(l, r_cart, cell.cart)
+            dl = dl_cache[l]
+            nd = dl.shape[0]
+            i0 = ao_loc[ish]
+            j0 = ao_loc[ish+shift]
+            for i in range(cell.bas_nctr(ish)):
+                dmat[j0+i*nd:j0+(i+1)*nd,i0+i*nd:i0+(i+1)*nd] = dl
+    return dmat, ao_Ls
+
+def _real_harmonics_rotation(l, r_cart, cart=False):
+    '''Matrix D_m'm which satisfies Y_m(R^{-1} r) = sum_m' Y_m'(r) D_m'm,
+    fitted on a set of points.
+    '''
+    if l == 0:
+        return numpy.eye(1)
+    ncart = (l+1)*(l+2)//2
+    r = numpy.random.RandomState(1).random_sample((ncart*4,3)) - .5
+    y0 = _real_harmonics(l, r, cart)
+    y1 = _real_harmonics(l, numpy.dot(r, r_cart), cart)
+    return scipy.linalg.lstsq(y0, y1)[0]
+
+def _real_harmonics(l, r, cart=False):
+    lxyz = [(lx, ly, l-lx-ly) for lx in reversed(range(l+1))
+            for ly in reversed(range(l-lx+1))]
+    ys = numpy.asarray([r[:,0]**lx * r[:,1]**ly * r[:,2]**lz
+                        for lx, ly, lz in lxyz]).T
+    if not cart:
+        ys = numpy.dot(ys, mole.cart2sph(l))
+    return ys
+
+def _transform_matrices(cell, kpts_ibz, kpts, bz2ibz, bz_ops, ops):
+    '''Bloch transformation matrix U for each k-point of the full mesh'''
+    dmats = {}
+    us = []
+    for k, kpt in enumerate(kpts):
+        g = bz_ops[k]
+        if g not in dmats:
+            dmats[g] = ao_rotation_matrix(cell, ops[g])
+        dmat, ao_Ls = dmats[g]
+        r_cart = geom.cart_rotation(cell, ops[g][0])
+        rkpt = numpy.dot(r_cart, kpts_ibz[bz2ibz[k]])
+        us.append(dmat * numpy.exp(-1j * numpy.dot(ao_Ls, rkpt)))
+    return us
+
+def transform_dm(cell, dm_ibz, kpts_ibz, kpts, bz2ibz, bz_ops, bz_time_rev,
+                 ops):
+    '''Generate the density matrices on the full k-point mesh from the
+    density matrices of the irreducible k-points.
+
+    Args:
+        dm_ibz : (nibz,nao,nao) ndarray or (nset,nibz,nao,nao) ndarray
+
+    Returns:
+        dm_kpts : (nkpts,nao,nao) or (nset,nkpts,nao,nao) ndarray
+    '''
+    dm_ibz = numpy.asarray(dm_ibz)
+    if dm_ibz.ndim == 4:
+        return lib.asarray([transform_dm(cell, dm, kpts_ibz, kpts, bz2ibz,
+                                         bz_ops, bz_time_rev, ops)
+                            for dm in dm_ibz])
+
+    us = _transform_matrices(cell, kpts_ibz, kpts, bz2ibz, bz_ops, ops)
+    dm_kpts = []
+    for k, u in enumerate(us):
+        dm = reduce(numpy.dot, (u, dm_ibz[bz2ibz[k]], u.conj().T))
+        if bz_time_rev[k]:
+            dm = dm.conj()
+        dm_kpts.append(dm)
+    return _to_real_if_possible(dm_kpts, dm_ibz)
+
+def transform_mo_coeff(cell, mo_ibz, kpts_ibz, kpts, bz2ibz, bz_ops,
+                       bz_time_rev, ops):
+    '''Generate the orbitals on the full k-point mesh from the orbitals of
+    the irreducible k-points.  The density matrices of the generated
+    orbitals are the same as those of :func:`transform_dm`.
+
+    Returns:
+        mo_kpts : list of (nao,nmo) ndarray
+    '''
+    us = _transform_matrices(cell, kpts_ibz, kpts, bz2ibz, bz_ops, ops)
+    mo_kpts = []
+    for k, u in enumerate(us):
+        mo = numpy.dot(u, mo_ibz[bz2ibz[k]])
+        if bz_time_rev[k]:
+            mo = mo.conj()
+        mo_kpts.append(mo)
+    return mo_kpts
+
+def transform_fock(cell, fock_ibz, kpts_ibz, kpts, bz2ibz, bz_ops,
+                   bz_time_rev, ops):
+    '''Generate the Fock matrices (or any other operator in AO
+    representation) on the full k-point mesh from the matrices of the
+    irreducible k-points.
+    '''
+    fock_ibz = numpy.asarray(fock_ibz)
+    if fock_ibz.ndim == 4:
+        return lib.asarray([transform_fock(cell, f, kpts_ibz, kpts, bz2ibz,
+                                           bz_ops, bz_time_rev, ops)
+                            for f in fock_ibz])
+
+    us = _transform_matrices(cell, kpts_ibz, kpts, bz2ibz, bz_ops, ops)
+    fock_kpts = []
+    for k, u in enumerate(us):
+        uinv = numpy.linalg.inv(u)
+        f = reduce(numpy.dot, (uinv.conj().T, fock_ibz[bz2ibz[k]], uinv))
+        if bz_time_rev[k]:
+            f = f.conj()
+        fock_kpts.append(f)
+    return _to_real_if_possible(fock_kpts, fock_ibz)
+
+def symmetrize_dm(cell, dm_kpts, kpts_ibz, kpts, bz2ibz, bz_ops, bz_time_rev,
+                  ops):
+    '''Project the density matrices of the full k-point mesh onto the
+    irreducible k-points, averaging over the star of each irreducible
+    k-point.
+
+    Returns:
+        dm_ibz : (nibz,nao,nao) ndarray
+    '''
+    dm_kpts = numpy.asarray(dm_kpts)
+    us = _transform_matrices(cell, kpts_ibz, kpts, bz2ibz, bz_ops, ops)
+    nibz = len(kpts_ibz)
+    dm_ibz = numpy.zeros((nibz,)+dm_kpts.shape[1:], dtype=numpy.complex128)
+    for k, u in enumerate(us):
+        dm = dm_kpts[k]
+        if bz_time_rev[k]:
+            dm = dm.conj()
+        uinv = numpy.linalg.inv(u)
+        dm_ibz[bz2ibz[k]] += reduce(numpy.dot, (uinv, dm, uinv.conj().T))
+    dm_ibz /= numpy.bincount(bz2ibz)[:,None,None]
+    return _to_real_if_possible(dm_ibz, dm_kpts)
+
+def _to_real_if_possible(mats, ref):
+    mats = lib.asarray(mats)
+    if ref.dtype == numpy.double and abs(mats.imag).max() < 1e-9:
+        mats = mats.real.copy()
+    return mats
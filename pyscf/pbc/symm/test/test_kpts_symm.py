@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import unittest
+import numpy
+from pyscf.pbc import gto
+from pyscf.pbc.symm import geom
+from pyscf.pbc.symm import kpts_symm
+
+cell = gto.Cell()
+cell.unit = 'A'
+cell.atom = 'C 0.,  0.,  0.; C 0.8917,  0.8917,  0.8917'
+cell.a = '''0.      1.7834  1.7834
+            1.7834  0.      1.7834
+            1.7834  1.7834  0.    '''
+cell.basis = {'C': [[0, (.8, 1)], [1, (.6, 1)], [2, (.9, 1)]]}
+cell.gs = [5] * 3
+cell.verbose = 0
+cell.build()
+
+class KnowValues(unittest.TestCase):
+    def test_space_group_ops(self):
+        ops = geom.search_space_group_ops(cell)
+        self.assertEqual(len(ops), 48)
+        self.assertTrue(abs(ops[0][0] - numpy.eye(3)).sum() == 0)
+        for rot, trans in ops:
+            self.assertTrue(geom.atom_perm(cell, rot, trans) is not None)
+
+    def test_ibz_kpts(self):
+        kpts = cell.make_kpts([3,3,3])
+        kibz, weights, bz2ibz, bz_ops, bz_tr, ops = \
+                kpts_symm.make_ibz_kpts(cell, kpts)
+        self.assertEqual(len(kibz), 4)
+        self.assertAlmostEqual(weights.sum(), 1, 12)
+        self.assertTrue(numpy.allclose(sorted(weights*27), [1, 6, 8, 12]))
+
+    def test_transform_ovlp(self):
+        kpts = cell.make_kpts([3,3,3])
+        kibz, weights, bz2ibz, bz_ops, bz_tr, ops = \
+                kpts_symm.make_ibz_kpts(cell, kpts)
+        s_bz = cell.pbc_intor('int1e_ovlp_sph', hermi=1, kpts=kpts)
+        s_ibz = cell.pbc_intor('int1e_ovlp_sph', hermi=1, kpts=kibz)
+        s1 = kpts_symm.transform_fock(cell, s_ibz, kibz, kpts, bz2ibz,
+                                      bz_ops, bz_tr, ops)
+        self.assertAlmostEqual(abs(s1 - numpy.asarray(s_bz)).max(), 0, 9)
+
+        dm_bz = numpy.asarray([numpy.linalg.inv(s) for s in s_bz])
+        dm_ibz = kpts_symm.symmetrize_dm(cell, dm_bz, kibz, kpts, bz2ibz,
+                                         bz_ops, bz_tr, ops)
+        dm1 = kpts_symm.transform_dm(cell, dm_ibz, kibz, kpts, bz2ibz,
+                                     bz_ops, bz_tr, ops)
+        self.assertAlmostEqual(abs(dm1 - dm_bz).max(), 0, 9)
+
+
+if __name__ == '__main__':
+    print("Full Tests for pbc.symm.kpts_symm")
+    unittest.main()
@@ -57,8 +57,29 @@ def mm_charge(scf_method, coords, charges, unit=None):
     method_class = scf_method.__class__
 
     class QMMM(method_class, _QMMM):
+        '''
+        Attributes:
+            mm_coords : 2D array
+                MM particle coordinates (in Bohr).  They can be updated
+                between MD steps.
+            mm_charges : 1D array
+                MM particle charges
+            mm_far_field : float
+                The MM charges farther than mm_far_field (in Bohr) from the
+                center of the QM region are treated by the multipole
+                expansion (up to quadrupole) of the electron-charge
+                interaction.  Default is None, all MM charges are treated
+                exactly.  The nuclear gradients are not available with the
+                multipole expansion.
+        '''
         def __init__(self):
             self.__dict__.update(scf_method.__dict__)
+            self.mm_coords = coords
+            self.mm_charges = charges
+            self.mm_far_field = None
+            self._mm_cache = None
+            self._keys = self._keys.union(['mm_coords', 'mm_charges',
+                                           'mm_far_field'])
 
         def get_hcore(self, mol=None):
             if mol is None: mol = self.mol
@@ -67,33 +88,37 @@ def mm_charge(scf_method, coords, charges, unit=None):
             else:  # DO NOT modify post-HF objects to avoid the MM charges applied twice
                 raise RuntimeError('mm_charge function cannot be applied on post-HF methods')
 
+            coords = numpy.asarray(self.mm_coords)
+            charges = numpy.asarray(self.mm_charges)
             if pyscf.DEBUG:
                 v = 0
                 for i,q in enumerate(charges):
                     mol.set_rinv_origin(coords[i])
                     v += mol.intor('int1e_rinv') * -q
-            else:
-                fakemol = _make_fakemol(coords)
-                if mol.cart:
-                    intor = 'int3c2e_cart'
-                else:
-                    intor = 'int3c2e_sph'
-                j3c = df.incore.aux_e2(mol, fakemol, intor=intor, aosym='s2ij')
-                v = lib.unpack_tril(numpy.einsum('xk,k->x', j3c, -charges))
-            return h1e + v
+                return h1e + v
+
+# The MM potential is reused as long as the QM basis, QM geometry and MM
+# charges are not changed
+            key = (mol._atm, mol._bas, mol._env, coords, charges)
+            cache = self._mm_cache
+            if (cache is None or cache[2] != self.mm_far_field or
+                not all(numpy.array_equal(a, b) for a, b in zip(cache[0], key))):
+                v = get_mm_potential(mol, coords, charges, self.mm_far_field,
+                                     self.max_memory)
+                key = [numpy.array(x) for x in key]
+                self._mm_cache = cache = (key, v, self.mm_far_field)
+            return h1e + cache[1]
 
         def energy_nuc(self):
 # nuclei lattice interaction
             nuc = self.mol.energy_nuc()
-            for j in range(self.mol.natm):
-                q2, r2 = self.mol.atom_charge(j), self.mol.atom_coord(j)
-                r = lib.norm(r2-coords, axis=1)
-                nuc += q2*(charges/r).sum()
+            nuc += energy_nuc_mm(self.mol, self.mm_coords, self.mm_charges)
             return nuc
 
         def nuc_grad_method(self):
             scf_grad = method_class.nuc_grad_method(self)
-            return mm_charge_grad(scf_grad, coords, charges, 'Bohr')
+            return mm_charge_grad(scf_grad, self.mm_coords, self.mm_charges,
+                                  'Bohr')
 
     return QMMM()
 
@@ -128,6 +153,9 @@ def mm_charge_grad(scf_grad, coords, charges, unit=None):
     [[-0.25912357 -0.29235976 -0.38245077]
      [-1.70497052 -1.89423883  1.2794798 ]]
     '''
+    if getattr(scf_grad._scf, 'mm_far_field', None) is not None:
+        raise NotImplementedError('Nuclear gradients with mm_far_field. '
+                                  'Set mm_far_field to None for gradients.')
     if unit is None:
         unit = scf_grad.mol.unit
     if unit.startswith(('B','b','au','AU')):
@@ -153,57 +181,120 @@ def mm_charge_grad(scf_grad, coords, charges, unit=None):
                     mol.set_rinv_origin(coords[i])
                     v += mol.intor('int1e_iprinv', comp=3) * q
             else:
-                fakemol = _make_fakemol(coords)
-                j3c = df.incore.aux_e2(mol, fakemol, intor='int3c2e_ip1',
-                                       aosym='s1', comp=3).reshape(3,nao,nao,-1)
-                v = numpy.einsum('ipqk,k->ipq', j3c, charges)
-            return scf_grad.get_hcore(mol) - v
+                v = numpy.zeros((3,nao,nao))
+                intor = mol._add_suffix('int3c2e_ip1')
+                blksize = _mm_blksize(self.max_memory, nao*nao*3)
+                for p0, p1 in lib.prange(0, charges.size, blksize):
+                    fakemol = gto.fakemol_for_charges(coords[p0:p1])
+                    j3c = df.incore.aux_e2(mol, fakemol, intor=intor,
+                                           aosym='s1', comp=3)
+                    v += lib.dot(j3c.reshape(-1,p1-p0),
+                                 charges[p0:p1]).reshape(3,nao,nao)
+            return g_qm - v
 
         def grad_nuc(self, mol=None, atmlst=None):
             if mol is None: mol = scf_grad.mol
             g_qm = scf_grad.grad_nuc(mol, atmlst)
 # nuclei lattice interaction
-            g_mm = numpy.empty((mol.natm,3))
-            for i in range(mol.natm):
-                q1 = mol.atom_charge(i)
-                r1 = mol.atom_coord(i)
-                r = lib.norm(r1-coords, axis=1)
-                g_mm[i] = -q1 * numpy.einsum('i,ix,i->x', charges, r1-coords, 1/r**3)
+            g_mm = numpy.zeros((mol.natm,3))
+            qm_coords = mol.atom_coords()
+            qm_charges = mol.atom_charges()
+            blksize = _mm_blksize(self.max_memory, mol.natm*4)
+            for p0, p1 in lib.prange(0, charges.size, blksize):
+                rr = qm_coords[:,None,:] - coords[p0:p1]
+                r = lib.norm(rr, axis=2)
+                g_mm -= numpy.einsum('ij,ijx->ix', charges[p0:p1]/r**3, rr)
+            g_mm *= qm_charges[:,None]
             if atmlst is not None:
                 g_mm = g_mm[atmlst]
             return g_qm + g_mm
     return QMMM()
 
+def get_mm_potential(mol, coords, charges, far_field=None, max_memory=2000):
+    '''The potential -sum_k q_k <i|1/|r-R_k||j> of the MM charges in AO
+    basis.
+
+    The integrals are evaluated for batches of MM charges so that the
+    3-center integrals do not exceed max_memory.  If far_field is given, the
+    MM charges farther than far_field (in Bohr) from the center of the QM
+    region are treated by the multipole expansion up to quadrupole.
+    '''
+    coords = numpy.asarray(coords).reshape(-1,3)
+    charges = numpy.asarray(charges).ravel()
+    nao = mol.nao_nr()
+
+    if far_field is None:
+        far = numpy.zeros(charges.size, dtype=bool)
+    else:
+        center = mol.atom_coords().mean(axis=0)
+        far = lib.norm(coords-center, axis=1) > far_field
+    near = ~far
+
+    v = numpy.zeros(nao*(nao+1)//2)
+    if near.any():
+        near_coords = coords[near]
+        near_charges = charges[near]
+        intor = mol._add_suffix('int3c2e')
+        blksize = _mm_blksize(max_memory, nao*(nao+1)//2)
+        for p0, p1 in lib.prange(0, near_charges.size, blksize):
+            fakemol = gto.fakemol_for_charges(near_coords[p0:p1])
+            j3c = df.incore.aux_e2(mol, fakemol, intor=intor, aosym='s2ij')
+            v -= lib.dot(j3c, near_charges[p0:p1])
+    v = lib.unpack_tril(v)
+
+    if far.any():
+        v += _multipole_potential(mol, coords[far], charges[far], center)
+    return v
+
+def _multipole_potential(mol, coords, charges, center):
+    '''Multipole expansion of -sum_k q_k/|r-R_k| around the center
+
+    1/|r-R| = 1/|d| + s.d/|d|^3 + 1/2 s(3dd-|d|^2)s/|d|^5 + ...
+    with d = R - center, s = r - center
+    '''
+    d = coords - center
+    r = lib.norm(d, axis=1)
+    q_r = charges / r
+    t0 = q_r.sum()
+    t1 = numpy.einsum('k,kx->x', q_r/r**2, d)
+    t2 = numpy.einsum('k,kx,ky->xy', q_r/r**4*1.5, d, d)
+    t2 -= numpy.eye(3) * (q_r/r**2).sum() * .5
+
+    nao = mol.nao_nr()
+    orig = mol._env[gto.PTR_COMMON_ORIG:gto.PTR_COMMON_ORIG+3].copy()
+    mol.set_common_orig(center)
+    v = mol.intor_symmetric('int1e_ovlp') * t0
+    v += numpy.einsum('x,xij->ij', t1, mol.intor_symmetric('int1e_r', comp=3))
+    rr = mol.intor_symmetric('int1e_rr', comp=9)
+    v += lib.dot(t2.ravel(), rr.reshape(9,-1)).reshape(nao,nao)
+    mol.set_common_orig(orig)
+    return -v
+
+def energy_nuc_mm(mol, coords, charges, max_memory=2000):
+    '''Interaction energy between the QM nuclei and the MM charges'''
+    coords = numpy.asarray(coords).reshape(-1,3)
+    charges = numpy.asarray(charges).ravel()
+    qm_coords = mol.atom_coords()
+    qm_charges = mol.atom_charges()
+    e = 0
+    blksize = _mm_blksize(max_memory, mol.natm*4)
+    for p0, p1 in lib.prange(0, charges.size, blksize):
+        r = lib.norm(qm_coords[:,None,:] - coords[p0:p1], axis=2)
+        e += numpy.einsum('i,ij,j->', qm_charges, 1./r, charges[p0:p1])
+    return e
+
+def _mm_blksize(max_memory, size_per_charge):
+    mem_avail = max(max_memory - lib.current_memory()[0], max_memory*.2)
+    return max(1, int(mem_avail*1e6/8/size_per_charge))
+
 # A tag to label the derived class
 class _QMMM:
     pass
 class _QMMMGrad:
     pass
 
-def _make_fakemol(coords):
-    nbas = coords.shape[0]
-    fakeatm = numpy.zeros((nbas,gto.ATM_SLOTS), dtype=numpy.int32)
-    fakebas = numpy.zeros((nbas,gto.BAS_SLOTS), dtype=numpy.int32)
-    fakeenv = [0] * gto.PTR_ENV_START
-    ptr = gto.PTR_ENV_START
-    fakeatm[:,gto.PTR_COORD] = numpy.arange(ptr, ptr+nbas*3, 3)
-    fakeenv.append(coords.ravel())
-    ptr += nbas*3
-    fakebas[:,gto.ATOM_OF] = numpy.arange(nbas)
-    fakebas[:,gto.NPRIM_OF] = 1
-    fakebas[:,gto.NCTR_OF] = 1
 # approximate point charge with gaussian distribution exp(-1e16*r^2)
-    fakebas[:,gto.PTR_EXP] = ptr
-    fakebas[:,gto.PTR_COEFF] = ptr+1
-    expnt = 1e16
-    fakeenv.append([expnt, 1/(2*numpy.sqrt(numpy.pi)*gto.mole._gaussian_int(2,expnt))])
-    ptr += 2
-    fakemol = gto.Mole()
-    fakemol._atm = fakeatm
-    fakemol._bas = fakebas
-    fakemol._env = numpy.hstack(fakeenv)
-    fakemol._built = True
-    return fakemol
+_make_fakemol = gto.fakemol_for_charges
 
 if __name__ == '__main__':
     from pyscf import scf, cc, grad
@@ -30,6 +30,29 @@ class KnowValues(unittest.TestCase):
         hfg = itrf.mm_charge_grad(grad.RHF(mf), coords, charges).run()
         self.assertAlmostEqual(numpy.linalg.norm(hfg.de), 30.316453059873059, 9)
 
+    def test_far_field(self):
+        numpy.random.seed(1)
+        coords = numpy.random.random((200,3)) * 20 + 30
+        coords[:20] = numpy.random.random((20,3)) * 2 + 2
+        charges = numpy.random.random(200) - .5
+        mf = itrf.mm_charge(scf.RHF(mol), coords, charges, unit='Bohr')
+        h1 = mf.get_hcore()
+        e1 = mf.energy_nuc()
+        mf.mm_far_field = 20.
+        h2 = mf.get_hcore()
+        self.assertTrue(abs(h1-h2).max() < 1e-4)
+        v = itrf.get_mm_potential(mol, coords, charges, max_memory=.1)
+        self.assertAlmostEqual(abs(h1-scf.RHF(mol).get_hcore()-v).max(), 0, 9)
+        enuc = mol.energy_nuc()
+        for i in range(mol.natm):
+            r = numpy.linalg.norm(coords-mol.atom_coord(i), axis=1)
+            enuc += mol.atom_charge(i) * (charges/r).sum()
+        self.assertAlmostEqual(e1, enuc, 9)
+
+        self.assertRaises(NotImplementedError, mf.nuc_grad_method)
+        self.assertRaises(NotImplementedError, itrf.mm_charge_grad,
+                          grad.RHF(mf), coords, charges)
+
 
 if __name__ == "__main__":
     print("Full Tests for qmmm")
@@ -6,6 +6,7 @@
 #   *   (Koh: get_vxc cannot generate correct J,K matrix from complex density matrix)
 #
 
+import copy
 import numpy as np
 import scipy, time
 import scipy.linalg
@@ -17,6 +18,10 @@ import sys
 
 FSPERAU = 0.0241888
 
+# Record of the propagation data |t, dipole(x,y,z), energy| in the binary
+# trajectory file
+TRAJ_DTYPE = np.dtype([('t', '<f8'), ('dipole', '<f8', (3,)), ('energy', '<f8')])
+
 def transmat(M,U,inv = 1):
     if inv == 1:
         # U.t() * M * U
@@ -40,6 +45,83 @@ def matrixpower(A,p,PrintCondition=False):
             s[i] = np.power(10.0,-14.0)
     return np.dot(u,np.dot(np.diag(np.power(s,p)),v))
 
+def cache_ao_numint(ni, max_memory=2000):
+    """
+    Return a copy of the NumInt object ni which evaluates the AO values on
+    the grids only once and keeps them in memory for the following calls.
+    If the AO values do not fit in max_memory (MB), they are evaluated on
+    the fly as usual.
+    """
+    ni = copy.copy(ni)
+    block_loop = ni.block_loop
+    cache = {}
+    def cached_block_loop(mol, grids, nao, deriv=0, max_memory=max_memory,
+                          non0tab=None, blksize=None, buf=None):
+        key = (deriv, nao)
+        if key not in cache or cache[key][0] is not grids:
+            if grids.coords is None:
+                grids.build(with_non0tab=True)
+            comp = (deriv+1)*(deriv+2)*(deriv+3)//6
+            if comp*grids.weights.size*nao*8e-6 > max_memory:
+                return block_loop(mol, grids, nao, deriv, max_memory,
+                                  non0tab, blksize, buf)
+            # block_loop overwrites the same buffer for every block
+            cache[key] = (grids, [(ao.copy(), mask, weight, coords)
+                                  for ao, mask, weight, coords in
+                                  block_loop(mol, grids, nao, deriv,
+                                             max_memory, non0tab, blksize)])
+        return iter(cache[key][1])
+    ni.block_loop = cached_block_loop
+    return ni
+
+class Trajectory(object):
+    """
+    Buffered writer of the propagation data |t, dipole(x,y,z), energy|.
+    The records are kept in memory and written to disk every buffersize
+    steps.  In binary mode the file is a sequence of TRAJ_DTYPE records
+    which can be read by load_trajectory.  Otherwise each record is a line
+    of text.
+    """
+    def __init__(self, filename, binary=True, buffersize=1000):
+        self.binary = binary
+        self.buf = np.empty(max(1, buffersize), dtype=TRAJ_DTYPE)
+        self.n = 0
+        if binary:
+            self.f = open(filename, "ab")
+        else:
+            self.f = open(filename, "a")
+
+    def append(self, t, dipole, energy):
+        self.buf[self.n] = (t, dipole, energy)
+        self.n += 1
+        if self.n == len(self.buf):
+            self.flush()
+
+    def flush(self):
+        if self.n > 0:
+            if self.binary:
+                self.f.write(self.buf[:self.n].tobytes())
+            else:
+                self.f.write("".join(["%.10g %.7e %.7e %.7e %.12g\n" %
+                                      ((r["t"],) + tuple(r["dipole"]) + (r["energy"],))
+                                      for r in self.buf[:self.n]]))
+            self.n = 0
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+def load_trajectory(filename):
+    """
+    Read the binary trajectory file written by the propagation.
+
+    Returns:
+        traj: numpy record array
+            with fields t, dipole (x,y,z) and energy
+    """
+    return np.fromfile(filename, dtype=TRAJ_DTYPE)
+
 
 
 class RTTDSCF(lib.StreamObject):
@@ -74,6 +156,9 @@ class RTTDSCF(lib.StreamObject):
         self.ks  = ks
         self.eri3c = None
         self.eri2c = None
+        self._cderi = None
+        # AO values on the DFT grids are computed once for all steps
+        self._numint = cache_ao_numint(ks._numint, ks.max_memory)
         self.s = ks.mol.intor_symmetric('int1e_ovlp')
         self.x = matrixpower(self.s,-1./2.)
         self._keys = set(self.__dict__.keys())
@@ -119,6 +204,17 @@ class RTTDSCF(lib.StreamObject):
         eri2c = df.incore.fill_2c2e(mol,auxmol)
         self.eri3c = eri3c.copy()
         self.eri2c = eri2c.copy()
+        # Cholesky decomposed 3c integrals,  (ij|kl) = sum_p cderi[p,i,j] cderi[p,k,l]
+        try:
+            low = scipy.linalg.cholesky(eri2c, lower=True)
+            cderi = scipy.linalg.solve_triangular(low, eri3c.reshape(-1,naux).T,
+                                                  lower=True)
+        except scipy.linalg.LinAlgError:
+            w, v = scipy.linalg.eigh(eri2c)
+            idx = w > 1e-14
+            v = v[:,idx] / np.sqrt(w[idx])
+            cderi = np.dot(v.T, eri3c.reshape(-1,naux).T)
+        self._cderi = cderi.reshape(-1,nao,nao)
         return eri3c, eri2c
 
 
@@ -178,7 +274,7 @@ class RTTDSCF(lib.StreamObject):
                 Exact Exchange in AO basis
         """
 
-        nelec, excsum, vxc = self.ks._numint.nr_vxc(self.ks.mol, \
+        nelec, excsum, vxc = self._numint.nr_vxc(self.ks.mol, \
         self.ks.grids, self.ks.xc, dm)
         self.exc = excsum
         vxc  = vxc.astype(complex)
@@ -217,9 +313,10 @@ class RTTDSCF(lib.StreamObject):
             jmat: float or complex
                 Coulomb matrix in AO basis
         """
-        rho = np.einsum("ijp,ij->p", self.eri3c, dm)
-        rho = np.linalg.solve(self.eri2c, rho)
-        jmat = np.einsum("p,ijp->ij", rho, self.eri3c)
+        naux = self._cderi.shape[0]
+        cderi = self._cderi.reshape(naux,-1)
+        rho = np.dot(cderi, dm.T.ravel())
+        jmat = np.dot(rho, cderi).reshape(dm.shape)
         return jmat
 
     def get_k(self,dm):
@@ -233,11 +330,21 @@ class RTTDSCF(lib.StreamObject):
             kmat: float or complex
                 Exact Exchange in AO basis
         """
-        naux = self.auxmol.nao_nr()
-        nao = self.ks.mol.nao_nr()
-        kpj = np.einsum("ijp,jk->ikp", self.eri3c, dm)
-        pik = np.linalg.solve(self.eri2c, kpj.reshape(-1,naux).T.conj())
-        kmat = np.einsum("pik,kjp->ij", pik.reshape(naux,nao,nao), self.eri3c)
+        naux, nao = self._cderi.shape[:2]
+        cderi = self._cderi.reshape(-1,nao)
+        # kmat = sum_p cderi[p] dm.conj() cderi[p]
+        if np.allclose(dm, dm.T.conj()):
+            # The density matrix is factorized by its (occupied) natural
+            # orbitals so that only the occupied space enters the product
+            w, c = scipy.linalg.eigh(dm)
+            idx = abs(w) > 1e-12 * max(1, abs(w).max())
+            c = c[:,idx].conj()
+            y = np.dot(cderi, c).reshape(naux,nao,-1).transpose(1,0,2)
+            y = y.reshape(nao,-1)
+            kmat = np.dot(y * np.tile(w[idx], naux), y.T.conj())
+        else:
+            y = np.dot(cderi, dm.conj()).reshape(naux,nao,nao)
+            kmat = np.einsum("pik,pkj->ij", y, self._cderi)
         return kmat
 
     def initialcondition(self,prm):
@@ -312,13 +419,23 @@ class RTTDSCF(lib.StreamObject):
 
         self.params["StatusEvery"] = 5000
         self.params["Print"]=0
+
+        # Adaptive time step of the MAGNUS propagator
+        self.params["StepTol"] = 1e-6
+        self.params["dtMin"] = 1e-4
+        self.params["dtMax"] = 0.2
+
+        # Output
+        self.params["BinaryOutput"] = 1
+        self.params["FlushEvery"] = 1000
         # Here they should be read from disk.
         if(prm != None):
             for line in prm.splitlines():
                 s = line.split()
                 if len(s) > 1:
                     if s[0] == "MaxIter" or s[0] == str("ApplyImpulse") or \
-                    s[0] == str("ApplyCw") or s[0] == str("StatusEvery"):
+                    s[0] == str("ApplyCw") or s[0] == str("StatusEvery") or \
+                    s[0] == "BinaryOutput" or s[0] == "FlushEvery":
                         self.params[s[0]] = int(s[1])
                     elif s[0] == "Model" or s[0] == "Method":
                         self.params[s[0]] = s[1].upper()
@@ -342,6 +459,12 @@ class RTTDSCF(lib.StreamObject):
         logger.log(self,"ApplyImpulse: %d", self.params["ApplyImpulse"])
         logger.log(self,"ApplyCw: %d", self.params["ApplyCw"])
         logger.log(self,"StatusEvery: %d", self.params["StatusEvery"])
+        if self.params["Method"] == "MAGNUS":
+            logger.log(self,"StepTol: %.2e", self.params["StepTol"])
+            logger.log(self,"dtMin: %.2e", self.params["dtMin"])
+            logger.log(self,"dtMax: %.2f", self.params["dtMax"])
+        logger.log(self,"BinaryOutput: %d", self.params["BinaryOutput"])
+        logger.log(self,"FlushEvery: %d", self.params["FlushEvery"])
         logger.log(self,"=============================\n\n")
 
         return
@@ -501,6 +624,69 @@ class RTTDSCF(lib.StreamObject):
             raise Exception("Unknown Method...")
         return
 
+    def expstep(self, fmat, dm_lao, tmid, dt):
+        """
+        Propagate the density with the exponential of the Fock matrix
+        dm_lao -> U dm_lao U^+,  U = exp(-i F dt)
+
+        Args:
+            fmat: complex
+                Fock matrix in Lowdin AO basis, without the field
+            dm_lao: complex
+                Density in LAO basis.
+            tmid: float
+                time at which the field is evaluated
+            dt: float
+                time step
+        Returns:
+            n_dm_lao: complex
+                Density in LAO basis.
+            IsOn: bool
+                On whether field is on or off
+        """
+        # As in tddftstep, the propagation uses the complex conjugate of
+        # the Fock matrix from fockbuild
+        fmat, IsOn = self.field.applyfield(fmat.conj(), self.x, tmid)
+        w, v = scipy.linalg.eigh(0.5*(fmat+fmat.T.conj()))
+        u = np.dot(v*np.exp(-1j*dt*w), v.T.conj())
+        n_dm_lao = transmat(dm_lao, u, -1)
+        return 0.5*(n_dm_lao+n_dm_lao.T.conj()), IsOn
+
+    def magnusstep(self, fmat, fmat_prev, dm_lao, tnow, dt, dt_prev):
+        """
+        Second order Magnus (exponential midpoint) step.  The Fock matrix at
+        the midpoint is predicted by the linear extrapolation of the Fock
+        matrices of the last two steps, then corrected by the average of
+        the Fock matrices at tnow and tnow+dt.
+
+        Args:
+            fmat: complex
+                Fock matrix in Lowdin AO basis at tnow
+            fmat_prev: complex
+                Fock matrix in Lowdin AO basis of the previous step
+            dm_lao: complex
+                Density in LAO basis at tnow
+            tnow: float
+                current time in A.U.
+            dt: float
+                time step
+            dt_prev: float
+                time step of the previous step
+        Returns:
+            n_dm_lao: complex
+                Density in LAO basis at tnow+dt
+            err: float
+                Largest difference between the predicted and the corrected
+                densities, the estimation of the local error of the step
+        """
+        tmid = tnow + 0.5*dt
+        fmid = fmat + (fmat - fmat_prev) * (0.5*dt/dt_prev)
+        dm_pred = self.expstep(fmid, dm_lao, tmid, dt)[0]
+        fnew = self.fockbuild(dm_pred)[0]
+        n_dm_lao = self.expstep(0.5*(fmat+fnew), dm_lao, tmid, dt)[0]
+        err = abs(n_dm_lao - dm_pred).max()
+        return n_dm_lao, err
+
 
     def dipole(self, rho, c_am):
         """
@@ -571,18 +757,21 @@ class RTTDSCF(lib.StreamObject):
 
         """
         np.set_printoptions(precision = 7)
-        tore = str(tnow)+" "+str(self.dipole(rho, c_am).real).rstrip("]").lstrip("[")+\
-         " " +str(self.energy(transmat(rho,v_lm,-1),fmat, jmat, kmat))
+        dipole = self.dipole(rho, c_am).real
+        e_tot = self.energy(transmat(rho,v_lm,-1),fmat, jmat, kmat)
+        tore = str(tnow)+" "+str(dipole).rstrip("]").lstrip("[")+\
+         " " +str(e_tot)
 
         if it%self.params["StatusEvery"] ==0 or it == self.params["MaxIter"]-1:
-            logger.log(self, "t: %f fs    Energy: %f a.u.   Total Density: %f",\
-            tnow*FSPERAU,self.energy(transmat(rho,v_lm,-1),fmat, jmat, kmat), \
-            2*np.trace(rho))
-            logger.log(self, "Dipole moment(X, Y, Z, au): %8.5f, %8.5f, %8.5f",\
-             self.dipole(rho, c_am).real[0],self.dipole(rho, c_am).real[1],\
-             self.dipole(rho, c_am).real[2])
+            self.logstatus(tnow, dipole, e_tot, 2*np.trace(rho))
         return tore
 
+    def logstatus(self, tnow, dipole, e_tot, ne):
+        logger.log(self, "t: %f fs    Energy: %f a.u.   Total Density: %f",\
+        tnow*FSPERAU, e_tot, ne)
+        logger.log(self, "Dipole moment(X, Y, Z, au): %8.5f, %8.5f, %8.5f",\
+         dipole[0], dipole[1], dipole[2])
+
     def prop(self, fmat, c_am, v_lm, rho, output):
         """
         The main tdscf propagation loop.
@@ -599,28 +788,72 @@ class RTTDSCF(lib.StreamObject):
                 name of the file with result of propagation
         Saved results:
             f: file
-                output file with |t, dipole(x,y,z), energy|
+                output file with |t, dipole(x,y,z), energy|.  Binary
+                records of TRAJ_DTYPE (see load_trajectory) if
+                params["BinaryOutput"] is set, otherwise text.
         """
         it = 0
         tnow = 0
-        rhom12 = rho.copy()
-        n_occ = int(sum(self.ks.mo_occ)/2)
-        f = open(output,"a")
+        f = Trajectory(output, self.params["BinaryOutput"],
+                       self.params["FlushEvery"])
         logger.log(self,"\n\nPropagation Begins")
         start = time.time()
-        while (it<self.params["MaxIter"]):
-            rho, rhom12, c_am, v_lm, fmat, jmat, kmat = self.tddftstep(fmat, c_am, v_lm, rho, rhom12, tnow)
-            # rho = newrho.copy()
-            # rhom12 = newrhom12.copy()
-            #self.log.append(self.loginstant(it))
-            f.write(self.loginstant(rho, c_am, v_lm, fmat, jmat, kmat, tnow, it)+"\n")
-            # Do logging.
-            tnow = tnow + self.params["dt"]
-            if it%self.params["StatusEvery"] ==0 or \
-            it == self.params["MaxIter"]-1:
-                end = time.time()
-                logger.log(self, "%f hr/ps", \
-                (end - start)/(60*60*tnow * FSPERAU * 0.001))
-            it = it + 1
+        if self.params["Method"] == "MMUT":
+            rhom12 = rho.copy()
+            while (it<self.params["MaxIter"]):
+                rho, rhom12, c_am, v_lm, fmat, jmat, kmat = self.tddftstep(fmat, c_am, v_lm, rho, rhom12, tnow)
+                dipole = self.dipole(rho, c_am).real
+                e_tot = self.energy(transmat(rho,v_lm,-1),fmat, jmat, kmat)
+                f.append(tnow, dipole, e_tot)
+                # Do logging.
+                status = (it%self.params["StatusEvery"] ==0 or
+                          it == self.params["MaxIter"]-1)
+                if status:
+                    self.logstatus(tnow, dipole, e_tot, 2*np.trace(rho))
+                tnow = tnow + self.params["dt"]
+                if status:
+                    end = time.time()
+                    logger.log(self, "%f hr/ps", \
+                    (end - start)/(60*60*tnow * FSPERAU * 0.001))
+                it = it + 1
+
+        elif self.params["Method"] == "MAGNUS":
+            dt = self.params["dt"]
+            tol = self.params["StepTol"]
+            dtmin = self.params["dtMin"]
+            dtmax = self.params["dtMax"]
+            # Keep the initial step size until the field is switched off
+            tfield = self.field.tOn + 7.0*self.field.tau
+            dm_lao = transmat(rho,v_lm,-1)
+            fmat, jmat, kmat = self.fockbuild(dm_lao)
+            fmat_prev, dt_prev = fmat, dt
+            while (it<self.params["MaxIter"]):
+                if tnow < tfield:
+                    dt = min(dt, self.params["dt"])
+                while True:
+                    n_dm_lao, err = self.magnusstep(fmat, fmat_prev, dm_lao,
+                                                    tnow, dt, dt_prev)
+                    if err <= tol or dt <= dtmin:
+                        break
+                    dt = max(0.5*dt, dtmin)
+                fmat_prev, dt_prev = fmat, dt
+                dm_lao = n_dm_lao
+                fmat, jmat, kmat = self.fockbuild(dm_lao)
+                tnow = tnow + dt
+                dipole = self.field.expectation(dm_lao, self.x).real
+                e_tot = self.energy(dm_lao, fmat, jmat, kmat)
+                f.append(tnow, dipole, e_tot)
+                # Local error of the second order step is O(dt^3)
+                dt *= min(2.0, max(0.5, 0.9*(tol/max(err,1e-16))**(1./3)))
+                dt = min(max(dt, dtmin), dtmax)
+                if it%self.params["StatusEvery"] ==0 or \
+                it == self.params["MaxIter"]-1:
+                    self.logstatus(tnow, dipole, e_tot, 2*np.trace(dm_lao))
+                    end = time.time()
+                    logger.log(self, "dt: %f  %f hr/ps", dt_prev, \
+                    (end - start)/(60*60*tnow * FSPERAU * 0.001))
+                it = it + 1
+        else:
+            raise Exception("Unknown Method...")
 
         f.close()
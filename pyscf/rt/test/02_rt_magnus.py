@@ -0,0 +1,53 @@
+import numpy as np
+import sys, re
+import pyscf
+import pyscf.dft
+from  pyscf import gto
+from pyscf.rt import tdscf
+np.set_printoptions(linewidth=220, suppress = True,precision = 7)
+
+def TestMagnus():
+    """
+    Tests the adaptive Magnus propagator against MMUT. TDDFT (B3LYP)
+    """
+    prm = '''
+    Model	TDDFT
+    Method	%s
+    dt	0.02
+    MaxIter	%d
+    ExDir	1.0
+    EyDir	1.0
+    EzDir	1.0
+    FieldAmplitude	0.01
+    FieldFreq	0.9202
+    ApplyImpulse	1
+    ApplyCw		0
+    StatusEvery	50
+    StepTol	1e-6
+    dtMax	0.1
+    '''
+    geom = """
+    H 0. 0. 0.
+    H 0. 0. 0.9
+    H 2.0 0.  0
+    H 2.0 0.9 0
+    """
+    output = re.sub("py","dat",sys.argv[0])
+    mol = gto.Mole()
+    mol.atom = geom
+    mol.basis = 'sto-3g'
+    mol.build()
+    ks = pyscf.dft.RKS(mol)
+    ks.xc='B3LYP'
+    ks.kernel()
+    tdscf.RTTDSCF(ks, prm % ("MMUT", 200), output+".mmut")
+    tdscf.RTTDSCF(ks, prm % ("MAGNUS", 100), output+".magnus")
+    mmut = tdscf.load_trajectory(output+".mmut")
+    magnus = tdscf.load_trajectory(output+".magnus")
+    t = magnus["t"][magnus["t"] < mmut["t"][-1]]
+    for x in range(3):
+        diff = abs(np.interp(t, mmut["t"], mmut["dipole"][:,x]) -
+                   magnus["dipole"][:len(t),x]).max()
+        print("Dipole %s, max difference MMUT vs MAGNUS: %g" % ("xyz"[x], diff))
+    return
+TestMagnus()
@@ -54,6 +54,17 @@ class VHFOpt(object):
     def direct_scf_tol(self, v):
         self._this.contents.direct_scf_cutoff = v
 
+    @property
+    def q_cond(self):
+        '''The (nbas,nbas) Schwarz conditions of the shell pairs, or None if
+        they were not initialized'''
+        if not self._this or not self._this.contents.q_cond:
+            return None
+        nbas = self._this.contents.nbas
+        ptr = ctypes.cast(self._this.contents.q_cond,
+                          ctypes.POINTER(ctypes.c_double))
+        return numpy.ctypeslib.as_array(ptr, shape=(nbas,nbas)).copy()
+
     def set_dm(self, dm, atm, bas, env):
         if self._dmcondname is not None:
             c_atm = numpy.asarray(atm, dtype=numpy.int32, order='C')
@@ -14,23 +14,32 @@ from pyscf.lib import logger
 
 
 def solve(fvind, mo_energy, mo_occ, h1, s1=None,
-          max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN):
+          max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN,
+          block=False):
     '''
     Args:
         fvind : function
             Given density matrix, compute (ij|kl)D_{lk}*2 - (ij|kl)D_{jk}
+
+    Kwargs:
+        block : bool
+            If True, the equations of each perturbation (the first dimension
+            of h1) are solved in its own Krylov subspace.  The converged
+            perturbations are removed from the following iterations.  fvind
+            should accept an arbitrary number of perturbations.
     '''
     if s1 is None:
         return solve_nos1(fvind, mo_energy, mo_occ, h1,
-                          max_cycle, tol, hermi, verbose)
+                          max_cycle, tol, hermi, verbose, block)
     else:
         return solve_withs1(fvind, mo_energy, mo_occ, h1, s1,
-                            max_cycle, tol, hermi, verbose)
+                            max_cycle, tol, hermi, verbose, block)
 kernel = solve
 
 # h1 shape is (:,nvir,nocc)
 def solve_nos1(fvind, mo_energy, mo_occ, h1,
-               max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN):
+               max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN,
+               block=False):
     '''For field independent basis. First order overlap matrix is zero'''
     log = logger.new_logger(verbose=verbose)
     t0 = (time.clock(), time.time())
@@ -40,18 +49,28 @@ def solve_nos1(fvind, mo_energy, mo_occ, h1,
     e_ai = 1 / lib.direct_sum('a-i->ai', e_a, e_i)
     mo1base = h1 * -e_ai
 
-    def vind_vo(mo1):
-        v = fvind(mo1.reshape(h1.shape)).reshape(h1.shape)
-        v *= e_ai
-        return v.ravel()
-    mo1 = lib.krylov(vind_vo, mo1base.ravel(),
+    if block:
+        nvir, nocc = e_ai.shape
+        def vind_vo(mo1):
+            v = fvind(mo1.reshape(-1,nvir,nocc)).reshape(-1,nvir,nocc)
+            v *= e_ai
+            return v.reshape(len(mo1),-1)
+        mo1 = krylov(vind_vo, mo1base.reshape(-1,nvir*nocc),
                      tol=tol, max_cycle=max_cycle, hermi=hermi, verbose=log)
+    else:
+        def vind_vo(mo1):
+            v = fvind(mo1.reshape(h1.shape)).reshape(h1.shape)
+            v *= e_ai
+            return v.ravel()
+        mo1 = lib.krylov(vind_vo, mo1base.ravel(),
+                         tol=tol, max_cycle=max_cycle, hermi=hermi, verbose=log)
     log.timer('krylov solver in CPHF', *t0)
     return mo1.reshape(h1.shape), None
 
 # h1 shape is (:,nvir+nocc,nocc)
 def solve_withs1(fvind, mo_energy, mo_occ, h1, s1,
-                 max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN):
+                 max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN,
+                 block=False):
     '''For field dependent basis. First order overlap matrix is non-zero.
     The first order orbitals are set to
     C^1_{ij} = -1/2 S1
@@ -75,13 +94,22 @@ def solve_withs1(fvind, mo_energy, mo_occ, h1, s1,
     mo1base[:,viridx] *= -e_ai
     mo1base[:,occidx] = -s1[:,occidx] * .5
 
-    def vind_vo(mo1):
-        v = fvind(mo1.reshape(h1.shape)).reshape(-1,nmo,nocc)
-        v[:,viridx,:] *= e_ai
-        v[:,occidx,:] = 0
-        return v.ravel()
-    mo1 = lib.krylov(vind_vo, mo1base.ravel(),
+    if block:
+        def vind_vo(mo1):
+            v = fvind(mo1.reshape(-1,nmo,nocc)).reshape(-1,nmo,nocc)
+            v[:,viridx,:] *= e_ai
+            v[:,occidx,:] = 0
+            return v.reshape(len(mo1),-1)
+        mo1 = krylov(vind_vo, mo1base.reshape(-1,nmo*nocc),
                      tol=tol, max_cycle=max_cycle, hermi=hermi, verbose=log)
+    else:
+        def vind_vo(mo1):
+            v = fvind(mo1.reshape(h1.shape)).reshape(-1,nmo,nocc)
+            v[:,viridx,:] *= e_ai
+            v[:,occidx,:] = 0
+            return v.ravel()
+        mo1 = lib.krylov(vind_vo, mo1base.ravel(),
+                         tol=tol, max_cycle=max_cycle, hermi=hermi, verbose=log)
     mo1 = mo1.reshape(mo1base.shape)
     log.timer('krylov solver in CPHF', *t0)
 
@@ -96,6 +124,84 @@ def solve_withs1(fvind, mo_energy, mo_occ, h1, s1,
     else:
         return mo1.reshape(h1.shape), mo_e1.reshape(nocc,nocc)
 
+def krylov(aop, b, tol=1e-9, max_cycle=20, lindep=1e-15, hermi=False,
+           verbose=logger.WARN):
+    '''Solve (1+a) x_k = b_k for multiple right hand sides b_k.  Each b_k
+    has its own Krylov subspace (see :func:`lib.krylov`).  The new trial
+    vectors of all unconverged right hand sides are passed to aop in one
+    call.  A right hand side is removed from the iterations once its
+    residual is smaller than tol.
+
+    Args:
+        aop : function(x) => array_like_x
+            x is a 2D array.  Each row of x is a trial vector.
+        b : 2D array
+            Each row is a right hand side.
+
+    Returns:
+        x : 2D array like b
+    '''
+    log = logger.new_logger(verbose=verbose)
+    b = numpy.asarray(b)
+    nrhs = len(b)
+    max_cycle = min(max_cycle, b.shape[1])
+
+    xs = [[bk] for bk in b]
+    innerprod = [[numpy.dot(bk.conj(), bk).real] for bk in b]
+    active = [k for k in range(nrhs) if innerprod[k][0] > lindep]
+    ax = [[] for k in range(nrhs)]
+    if active:
+        for k, axk in zip(active, aop(b[active])):
+            ax[k].append(axk)
+    h = [None] * nrhs
+    for k in active:
+        h[k] = numpy.empty((max_cycle,max_cycle), dtype=ax[k][0].dtype)
+
+    for cycle in range(max_cycle):
+        if not active:
+            break
+        new_active = []
+        for k in active:
+            x1 = ax[k][-1].copy()
+# Schmidt orthogonalization
+            for i in range(cycle+1):
+                s12 = h[k][i,cycle] = numpy.dot(xs[k][i].conj(), ax[k][-1])
+                x1 -= (s12/innerprod[k][i]) * xs[k][i]
+            h[k][cycle,cycle] += innerprod[k][cycle]
+            innerprod[k].append(numpy.dot(x1.conj(), x1).real)
+            if innerprod[k][-1] > lindep and innerprod[k][-1] > tol**2:
+                xs[k].append(x1)
+                new_active.append(k)
+        log.debug('krylov cycle %d  %d unconverged vectors  max|r| = %g',
+                  cycle, len(new_active),
+                  numpy.sqrt(max([innerprod[k][-1] for k in active])))
+        active = new_active
+        if active and cycle+1 < max_cycle:
+            for k, axk in zip(active, aop(numpy.asarray([xs[k][-1] for k in active]))):
+                ax[k].append(axk)
+        else:
+            break
+
+    x = numpy.zeros_like(b)
+    for k in range(nrhs):
+        nd = len(ax[k])
+        if nd == 0:
+            continue
+        hk = h[k][:nd,:nd]
+        for i in range(nd):
+            for j in range(i):
+                if hermi:
+                    hk[i,j] = hk[j,i].conj()
+                else:
+                    hk[i,j] = numpy.dot(xs[k][i].conj(), ax[k][j])
+        g = numpy.zeros(nd, dtype=hk.dtype)
+        g[0] = innerprod[k][0]
+        c = numpy.linalg.solve(hk, g)
+        for i in range(nd):
+            x[k] += c[i] * xs[k][i]
+    return x
+
+
 if __name__ == '__main__':
     numpy.random.seed(1)
     nd = 3
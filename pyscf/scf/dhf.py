@@ -9,6 +9,7 @@ Dirac Hartree-Fock
 
 import time
 from functools import reduce
+from multiprocessing.pool import ThreadPool
 import numpy
 import scipy.linalg
 from pyscf import lib
@@ -61,34 +62,25 @@ def kernel(mf, conv_tol=1e-9, conv_tol_grad=None,
                      callback=callback, conv_check=conv_check)
 
 def get_jk_coulomb(mol, dm, hermi=1, coulomb_allow='SSSS',
-                   opt_llll=None, opt_ssll=None, opt_ssss=None):
-    if coulomb_allow.upper() == 'LLLL':
-        logger.info(mol, 'Coulomb integral: (LL|LL)')
-        j1, k1 = _call_veff_llll(mol, dm, hermi, opt_llll)
-        n2c = j1.shape[1]
-        vj = numpy.zeros_like(dm)
-        vk = numpy.zeros_like(dm)
-        vj[...,:n2c,:n2c] = j1
-        vk[...,:n2c,:n2c] = k1
-    elif coulomb_allow.upper() == 'SSLL' \
-      or coulomb_allow.upper() == 'LLSS':
-        logger.info(mol, 'Coulomb integral: (LL|LL) + (SS|LL)')
-        vj, vk = _call_veff_ssll(mol, dm, hermi, opt_ssll)
-        j1, k1 = _call_veff_llll(mol, dm, hermi, opt_llll)
-        n2c = j1.shape[1]
-        vj[...,:n2c,:n2c] += j1
-        vk[...,:n2c,:n2c] += k1
-    else: # coulomb_allow == 'SSSS'
-        logger.info(mol, 'Coulomb integral: (LL|LL) + (SS|LL) + (SS|SS)')
-        vj, vk = _call_veff_ssll(mol, dm, hermi, opt_ssll)
-        j1, k1 = _call_veff_llll(mol, dm, hermi, opt_llll)
-        n2c = j1.shape[1]
-        vj[...,:n2c,:n2c] += j1
-        vk[...,:n2c,:n2c] += k1
-        j1, k1 = _call_veff_ssss(mol, dm, hermi, opt_ssss)
-        vj[...,n2c:,n2c:] += j1
-        vk[...,n2c:,n2c:] += k1
-    return vj, vk
+                   opt_llll=None, opt_ssll=None, opt_ssss=None,
+                   ssss_approx=None, concurrent=False):
+    '''Dirac-Coulomb J/K matrices
+
+    Kwargs:
+        coulomb_allow : str
+            'LLLL', 'SSLL' or 'SSSS'.  The integral blocks to include.
+        ssss_approx : str
+            None to compute the (SS|SS) contributions with all integrals.
+            'atom' to keep the one-center (SS|SS) integrals only and to
+            approximate the inter-atomic Coulomb interactions by the point
+            charges of the small components.
+        concurrent : bool
+            Whether to evaluate the integral blocks at the same time, each
+            in a separate group of OpenMP threads.
+    '''
+    blocks = _coulomb_blocks(mol, coulomb_allow, ssss_approx)
+    opts = (opt_llll, opt_ssll, opt_ssss, None)
+    return _get_jk_blocks(mol, dm, hermi, blocks, opts, concurrent)
 
 def get_jk(mol, dm, hermi=1, coulomb_allow='SSSS'):
     return get_jk_coulomb(mol, dm, hermi=hermi, coulomb_allow=coulomb_allow)
@@ -241,6 +233,14 @@ class UHF(hf.SCF):
             Default is False.
         with_breit : bool, for Dirac-Hartree-Fock only
             Gaunt + gauge term.  Default is False.
+        ssss_approx : str, for Dirac-Hartree-Fock only
+            None to compute (SS|SS) with all integrals.  'atom' to keep the
+            one-center (SS|SS) integrals and to model the inter-atomic
+            (SS|SS) Coulomb interactions by the small component charges of
+            atoms.  Default is None.
+        concurrent_jk : bool, for Dirac-Hartree-Fock only
+            Evaluate the LLLL, SSLL, SSSS and Gaunt integral blocks at the
+            same time, each in a separate group of threads.  Default is True.
 
     Examples:
 
@@ -259,6 +259,8 @@ class UHF(hf.SCF):
         self._coulomb_now = 'SSSS' # 'SSSS' ~ LLLL+LLSS+SSSS
         self.with_gaunt = False
         self.with_breit = False
+        self.ssss_approx = None
+        self.concurrent_jk = True
 
         self.opt = (None, None, None, None) # (opt_llll, opt_ssll, opt_ssss, opt_gaunt)
         self._keys = set(self.__dict__.keys())
@@ -267,6 +269,8 @@ class UHF(hf.SCF):
         hf.SCF.dump_flags(self)
         logger.info(self, 'with_ssss %s, with_gaunt %s, with_breit %s',
                     self.with_ssss, self.with_gaunt, self.with_breit)
+        logger.info(self, 'ssss_approx %s, concurrent_jk %s',
+                    self.ssss_approx, self.concurrent_jk)
         logger.info(self, 'light speed = %s', lib.param.LIGHT_SPEED)
         return self
 
@@ -367,22 +371,17 @@ class UHF(hf.SCF):
         stdout_bak,  mol.stdout  = mol.stdout , self.stdout
         if self.direct_scf and self.opt[0] is None:
             self.opt = self.init_direct_scf(mol)
-        opt_llll, opt_ssll, opt_ssss, opt_gaunt = self.opt
-
-        vj, vk = get_jk_coulomb(mol, dm, hermi, self._coulomb_now,
-                                opt_llll, opt_ssll, opt_ssss)
-
+        blocks = _coulomb_blocks(mol, self._coulomb_now, self.ssss_approx)
         if self.with_breit:
             if 'SSSS' in self._coulomb_now.upper() or not self.with_ssss:
-                vj1, vk1 = _call_veff_gaunt_breit(mol, dm, hermi, opt_gaunt, True)
                 logger.info(self, 'Add Breit term')
-                vj += vj1
-                vk += vk1
+                blocks.append('BREIT')
         elif self.with_gaunt and 'SS' in self._coulomb_now.upper():
             logger.info(self, 'Add Gaunt term')
-            vj1, vk1 = _call_veff_gaunt_breit(mol, dm, hermi, opt_gaunt, False)
-            vj += vj1
-            vk += vk1
+            blocks.append('GAUNT')
+
+        vj, vk = _get_jk_blocks(mol, dm, hermi, blocks, self.opt,
+                                self.concurrent_jk)
 
         mol.verbose = verbose_bak
         mol.stdout  = stdout_bak
@@ -484,6 +483,143 @@ class RHF(UHF):
         return mo_occ
 
 
+# Relative costs of the integral blocks, to distribute the threads when the
+# blocks are evaluated concurrently
+_JK_BLOCK_COST = {'LLLL': 1., 'SSLL': 2., 'SSSS': 3., 'SSSS_ATOM': .5,
+                  'GAUNT': 3., 'BREIT': 4.}
+
+def _coulomb_blocks(mol, coulomb_allow, ssss_approx=None):
+    coulomb_allow = coulomb_allow.upper()
+    if coulomb_allow == 'LLLL':
+        logger.info(mol, 'Coulomb integral: (LL|LL)')
+        return ['LLLL']
+    elif coulomb_allow == 'SSLL' or coulomb_allow == 'LLSS':
+        logger.info(mol, 'Coulomb integral: (LL|LL) + (SS|LL)')
+        return ['LLLL', 'SSLL']
+    elif ssss_approx is not None and ssss_approx.upper() == 'ATOM':
+        logger.info(mol, 'Coulomb integral: (LL|LL) + (SS|LL) + atomic (SS|SS)')
+        return ['LLLL', 'SSLL', 'SSSS_ATOM']
+    else: # coulomb_allow == 'SSSS'
+        logger.info(mol, 'Coulomb integral: (LL|LL) + (SS|LL) + (SS|SS)')
+        return ['LLLL', 'SSLL', 'SSSS']
+
+def _get_jk_blocks(mol, dm, hermi, blocks, opts, concurrent=False):
+    '''Sum the J/K matrices of the integral blocks.  The blocks whose
+    contributions are estimated to be smaller than direct_scf_tol are
+    skipped.'''
+    opt_llll, opt_ssll, opt_ssss, opt_gaunt = opts
+    est = _estimate_blocks(mol, dm, opt_llll, opt_ssss)
+    if est is not None:
+        tol = opt_llll.direct_scf_tol
+        skipped = [b for b in blocks if est[b] < tol]
+        if skipped:
+            logger.debug(mol, 'Skip %s, estimated |V| = %s below %g', skipped,
+                         ['%.3g' % est[b] for b in skipped], tol)
+        blocks = [b for b in blocks if est[b] >= tol]
+
+    def get_block(block):
+        if block == 'LLLL':
+            return _call_veff_llll(mol, dm, hermi, opt_llll)
+        elif block == 'SSLL':
+            return _call_veff_ssll(mol, dm, hermi, opt_ssll)
+        elif block == 'SSSS':
+            return _call_veff_ssss(mol, dm, hermi, opt_ssss)
+        elif block == 'SSSS_ATOM':
+            return _call_veff_ssss_atom(mol, dm, hermi)
+        elif block == 'GAUNT':
+            return _call_veff_gaunt_breit(mol, dm, hermi, opt_gaunt, False)
+        else:
+            return _call_veff_gaunt_breit(mol, dm, hermi, opt_gaunt, True)
+
+    nthreads = lib.num_threads()
+    # Without enough threads for all blocks, the blocks are computed one
+    # after another, each with all threads
+    if concurrent and nthreads >= len(blocks) > 1:
+        threads = _split_threads(nthreads, [_JK_BLOCK_COST[b] for b in blocks])
+        def run(args):
+            block, n = args
+            lib.num_threads(n)
+            return get_block(block)
+        pool = ThreadPool(len(blocks))
+        try:
+            jks = pool.map(run, zip(blocks, threads))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        jks = [get_block(b) for b in blocks]
+
+    vj = numpy.zeros(numpy.shape(dm), dtype=numpy.complex)
+    vk = numpy.zeros(numpy.shape(dm), dtype=numpy.complex)
+    n2c = vj.shape[-1] // 2
+    for block, (j1, k1) in zip(blocks, jks):
+        if block == 'LLLL':
+            vj[...,:n2c,:n2c] += j1
+            vk[...,:n2c,:n2c] += k1
+        elif block == 'SSSS' or block == 'SSSS_ATOM':
+            vj[...,n2c:,n2c:] += j1
+            vk[...,n2c:,n2c:] += k1
+        else:
+            vj += j1
+            vk += k1
+    return vj, vk
+
+def _split_threads(nthreads, costs):
+    '''Distribute the threads to the tasks in proportion to their costs.
+    Each task has at least one thread and the total number of threads is
+    nthreads (which should not be less than the number of tasks).'''
+    costs = numpy.asarray(costs, dtype=float)
+    assert(nthreads >= len(costs))
+    extra = (nthreads - len(costs)) * costs / costs.sum()
+    threads = 1 + numpy.floor(extra).astype(int)
+    rest = extra - numpy.floor(extra)
+    for i in numpy.argsort(-rest)[:nthreads-threads.sum()]:
+        threads[i] += 1
+    return threads
+
+def _estimate_blocks(mol, dm, opt_llll, opt_ssss):
+    '''Estimate the largest J/K matrix element of each integral block from
+    the Schwarz conditions and the norms of the density matrix blocks.
+    Returns None if the Schwarz conditions are not available.'''
+    if opt_llll is None or opt_ssss is None:
+        return None
+    q_ll = opt_llll.q_cond
+    q_ss = opt_ssss.q_cond  # scaled by (.5/c)**2
+    if q_ll is None or q_ss is None:
+        return None
+
+    dm = numpy.asarray(dm)
+    n2c = dm.shape[-1] // 2
+    dm = abs(dm.reshape(-1,n2c*2,n2c*2)).max(axis=0)
+    ao_loc = mol.ao_loc_2c()
+    nf = ao_loc[1:] - ao_loc[:-1]
+    nf = numpy.outer(nf, nf)
+    # The largest element of each shell block times the number of the
+    # elements in the block bounds the sum over the block
+    def shell_max(d):
+        d = numpy.maximum.reduceat(d, ao_loc[:-1], axis=0)
+        return numpy.maximum.reduceat(d, ao_loc[:-1], axis=1) * nf
+    d_ll = shell_max(dm[:n2c,:n2c])
+    d_ss = shell_max(dm[n2c:,n2c:])
+    d_sl = shell_max(numpy.maximum(dm[n2c:,:n2c], dm[:n2c,n2c:].T))
+    # J_ij <= q_ij sum_kl q_kl d_kl,  K_ij <= q_ik sum_kl q_lj d_kl
+    def jk_bound(qij, qkl, d):
+        return qij.max() * max((qkl*d).sum(), numpy.dot(d.sum(axis=0), qkl).max())
+
+    est = {}
+    est['LLLL'] = jk_bound(q_ll, q_ll, d_ll)
+    est['SSLL'] = max(jk_bound(q_ll, q_ss, d_ss), jk_bound(q_ss, q_ll, d_ll),
+                      jk_bound(q_ss, q_ll, d_sl))
+    est['SSSS'] = est['SSSS_ATOM'] = jk_bound(q_ss, q_ss, d_ss)
+    # The Gaunt and Breit operators are not positive definite.  The Schwarz
+    # inequality does not hold for them, so they are never skipped unless
+    # the density matrix is zero.
+    if dm.any():
+        est['GAUNT'] = est['BREIT'] = numpy.inf
+    else:
+        est['GAUNT'] = est['BREIT'] = 0
+    return est
+
 def _jk_triu_(vj, vk, hermi):
     if hermi == 0:
         if vj.ndim == 2:
@@ -561,6 +697,50 @@ def _call_veff_ssss(mol, dm, hermi=1, mf_opt=None):
                                 mol._atm, mol._bas, mol._env, mf_opt) * c1**4
     return _jk_triu_(vj, vk, hermi)
 
+def _call_veff_ssss_atom(mol, dm, hermi=1):
+    '''(SS|SS) contributions of the one-center integrals.  The inter-atomic
+    (SS|SS) Coulomb interactions are approximated by the interactions
+    between the small component charges of atoms.'''
+    from pyscf.scf.x2c import _atom_mol
+    c1 = .5 / lib.param.LIGHT_SPEED
+    if isinstance(dm, numpy.ndarray) and dm.ndim == 2:
+        n_dm = 1
+        n2c = dm.shape[0] // 2
+        dms = [dm[n2c:,n2c:]]
+    else:
+        n_dm = len(dm)
+        n2c = dm[0].shape[0] // 2
+        dms = [dmi[n2c:,n2c:] for dmi in dm]
+    vj = numpy.zeros((n_dm,n2c,n2c), dtype=numpy.complex)
+    vk = numpy.zeros((n_dm,n2c,n2c), dtype=numpy.complex)
+    s = mol.intor_symmetric('int1e_spsp_spinor') * c1**2
+    aoslices = mol.offset_2c_by_atom()
+    charges = numpy.empty((n_dm,mol.natm))
+    for ia in range(mol.natm):
+        p0, p1 = aoslices[ia][2:]
+        amol = _atom_mol(mol, ia)
+        dm_a = [dmi[p0:p1,p0:p1].copy() for dmi in dms]
+        vjk = _vhf.rdirect_mapdm('int2e_spsp1spsp2_spinor', 's8',
+                                 ('ji->s2kl', 'jk->s1il'), dm_a, 1,
+                                 amol._atm, amol._bas, amol._env) * c1**4
+        vjk = vjk.reshape(2,n_dm,p1-p0,p1-p0)
+        vj_a, vk_a = _jk_triu_(vjk[0], vjk[1], hermi)
+        vj[:,p0:p1,p0:p1] = vj_a
+        vk[:,p0:p1,p0:p1] = vk_a
+        charges[:,ia] = numpy.einsum('xij,ji->x', dm_a, s[p0:p1,p0:p1]).real
+
+    coords = mol.atom_coords()
+    rr = numpy.linalg.norm(coords[:,None,:] - coords, axis=2)
+    rr[numpy.diag_indices_from(rr)] = 1e200
+    vq = numpy.dot(charges, 1./rr)
+    for ia in range(mol.natm):
+        p0, p1 = aoslices[ia][2:]
+        vj[:,p0:p1,p0:p1] += numpy.einsum('x,ij->xij', vq[:,ia], s[p0:p1,p0:p1])
+    if n_dm == 1:
+        vj = vj.reshape(n2c,n2c)
+        vk = vk.reshape(n2c,n2c)
+    return vj, vk
+
 def _call_veff_gaunt_breit(mol, dm, hermi=1, mf_opt=None, with_breit=False):
     if with_breit:
         intor_prefix = 'int2e_breit_'
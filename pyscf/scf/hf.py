@@ -120,63 +120,69 @@ Keyword argument "init_dm" is replaced by "dm0"''')
     logger.info(mf, 'init E= %.15g', e_tot)
 
     if dump_chk:
-        # Explicit overwrite the mol object in chkfile
-        # Note in pbc.scf, mf.mol == mf.cell, cell is saved under key "mol"
-        chkfile.save_mol(mol, mf.chkfile)
-
-    scf_conv = False
-    cycle = 0
-    cput1 = logger.timer(mf, 'initialize scf', *cput0)
-    while not scf_conv and cycle < max(1, mf.max_cycle):
-        dm_last = dm
-        last_hf_e = e_tot
-
-        fock = mf.get_fock(h1e, s1e, vhf, dm, cycle, mf_diis)
-        mo_energy, mo_coeff = mf.eig(fock, s1e)
-        mo_occ = mf.get_occ(mo_energy, mo_coeff)
-        dm = mf.make_rdm1(mo_coeff, mo_occ)
-        # attach mo_coeff and mo_occ to dm to improve DFT get_veff efficiency
-        dm = lib.tag_array(dm, mo_coeff=mo_coeff, mo_occ=mo_occ)
-        vhf = mf.get_veff(mol, dm, dm_last, vhf)
-        e_tot = mf.energy_tot(dm, h1e, vhf)
-
-        fock = mf.get_fock(h1e, s1e, vhf, dm)  # = h1e + vhf, no DIIS
-        norm_gorb = numpy.linalg.norm(mf.get_grad(mo_coeff, mo_occ, fock))
-        norm_ddm = numpy.linalg.norm(dm-dm_last)
-        logger.info(mf, 'cycle= %d E= %.15g  delta_E= %4.3g  |g|= %4.3g  |ddm|= %4.3g',
-                    cycle+1, e_tot, e_tot-last_hf_e, norm_gorb, norm_ddm)
-
-        if (abs(e_tot-last_hf_e) < conv_tol and norm_gorb < conv_tol_grad):
-            scf_conv = True
-
-        if dump_chk:
-            mf.dump_chk(locals())
-
-        if callable(callback):
-            callback(locals())
-
-        cput1 = logger.timer(mf, 'cycle= %d'%(cycle+1), *cput1)
-        cycle += 1
-
-    if conv_check:
-        # An extra diagonalization, to remove level shift
-        #fock = mf.get_fock(h1e, s1e, vhf, dm)  # = h1e + vhf
-        mo_energy, mo_coeff = mf.eig(fock, s1e)
-        mo_occ = mf.get_occ(mo_energy, mo_coeff)
-        dm, dm_last = mf.make_rdm1(mo_coeff, mo_occ), dm
-        dm = lib.tag_array(dm, mo_coeff=mo_coeff, mo_occ=mo_occ)
-        vhf = mf.get_veff(mol, dm, dm_last, vhf)
-        e_tot, last_hf_e = mf.energy_tot(dm, h1e, vhf), e_tot
-
-        fock = mf.get_fock(h1e, s1e, vhf, dm)
-        norm_gorb = numpy.linalg.norm(mf.get_grad(mo_coeff, mo_occ, fock))
-        norm_ddm = numpy.linalg.norm(dm-dm_last)
-        scf_conv = (abs(e_tot-last_hf_e) < conv_tol*10 and
-                    norm_gorb < conv_tol_grad*3)
-        logger.info(mf, 'Extra cycle  E= %.15g  delta_E= %4.3g  |g|= %4.3g  |ddm|= %4.3g',
-                    e_tot, e_tot-last_hf_e, norm_gorb, norm_ddm)
+        chk_session = chkfile.session(mf.chkfile, mf.chkfile_compression,
+                                      mf.chkfile_async)
+    else:
+        chk_session = chkfile.session(None)
+    with chk_session:
         if dump_chk:
-            mf.dump_chk(locals())
+            # Explicit overwrite the mol object in chkfile
+            # Note in pbc.scf, mf.mol == mf.cell, cell is saved under key "mol"
+            chkfile.save_mol(mol, mf.chkfile)
+
+        scf_conv = False
+        cycle = 0
+        cput1 = logger.timer(mf, 'initialize scf', *cput0)
+        while not scf_conv and cycle < max(1, mf.max_cycle):
+            dm_last = dm
+            last_hf_e = e_tot
+
+            fock = mf.get_fock(h1e, s1e, vhf, dm, cycle, mf_diis)
+            mo_energy, mo_coeff = mf.eig(fock, s1e)
+            mo_occ = mf.get_occ(mo_energy, mo_coeff)
+            dm = mf.make_rdm1(mo_coeff, mo_occ)
+            # attach mo_coeff and mo_occ to dm to improve DFT get_veff efficiency
+            dm = lib.tag_array(dm, mo_coeff=mo_coeff, mo_occ=mo_occ)
+            vhf = mf.get_veff(mol, dm, dm_last, vhf)
+            e_tot = mf.energy_tot(dm, h1e, vhf)
+
+            fock = mf.get_fock(h1e, s1e, vhf, dm)  # = h1e + vhf, no DIIS
+            norm_gorb = numpy.linalg.norm(mf.get_grad(mo_coeff, mo_occ, fock))
+            norm_ddm = numpy.linalg.norm(dm-dm_last)
+            logger.info(mf, 'cycle= %d E= %.15g  delta_E= %4.3g  |g|= %4.3g  |ddm|= %4.3g',
+                        cycle+1, e_tot, e_tot-last_hf_e, norm_gorb, norm_ddm)
+
+            if (abs(e_tot-last_hf_e) < conv_tol and norm_gorb < conv_tol_grad):
+                scf_conv = True
+
+            if dump_chk:
+                mf.dump_chk(locals())
+
+            if callable(callback):
+                callback(locals())
+
+            cput1 = logger.timer(mf, 'cycle= %d'%(cycle+1), *cput1)
+            cycle += 1
+
+        if conv_check:
+            # An extra diagonalization, to remove level shift
+            #fock = mf.get_fock(h1e, s1e, vhf, dm)  # = h1e + vhf
+            mo_energy, mo_coeff = mf.eig(fock, s1e)
+            mo_occ = mf.get_occ(mo_energy, mo_coeff)
+            dm, dm_last = mf.make_rdm1(mo_coeff, mo_occ), dm
+            dm = lib.tag_array(dm, mo_coeff=mo_coeff, mo_occ=mo_occ)
+            vhf = mf.get_veff(mol, dm, dm_last, vhf)
+            e_tot, last_hf_e = mf.energy_tot(dm, h1e, vhf), e_tot
+
+            fock = mf.get_fock(h1e, s1e, vhf, dm)
+            norm_gorb = numpy.linalg.norm(mf.get_grad(mo_coeff, mo_occ, fock))
+            norm_ddm = numpy.linalg.norm(dm-dm_last)
+            scf_conv = (abs(e_tot-last_hf_e) < conv_tol*10 and
+                        norm_gorb < conv_tol_grad*3)
+            logger.info(mf, 'Extra cycle  E= %.15g  delta_E= %4.3g  |g|= %4.3g  |ddm|= %4.3g',
+                        e_tot, e_tot-last_hf_e, norm_gorb, norm_ddm)
+            if dump_chk:
+                mf.dump_chk(locals())
     logger.timer(mf, 'scf_cycle', *cput0)
     return scf_conv, e_tot, mo_energy, mo_coeff, mo_occ
 
@@ -1027,6 +1033,12 @@ class SCF(lib.StreamObject):
             Allowed memory in MB.  Default equals to :class:`Mole.max_memory`
         chkfile : str
             checkpoint file to save MOs, orbital energies etc.
+        chkfile_compression : str or int
+            HDF5 compression filter ('gzip', 'lzf' or the gzip level) for the
+            arrays saved in chkfile.  Default is None (no compression)
+        chkfile_async : bool
+            Whether to write chkfile in a background thread during the SCF
+            iterations.  Default is False
         conv_tol : float
             converge threshold.  Default is 1e-10
         conv_tol_grad : float
@@ -1093,6 +1105,8 @@ class SCF(lib.StreamObject):
 # filename to self.chkfile
         self._chkfile = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
         self.chkfile = self._chkfile.name
+        self.chkfile_compression = None
+        self.chkfile_async = False
         self.conv_tol = 1e-9
         self.conv_tol_grad = None
         self.max_cycle = 50
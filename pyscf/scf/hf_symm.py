@@ -23,6 +23,7 @@ from pyscf.lib import logger
 from pyscf.scf import hf
 from pyscf.scf import rohf
 from pyscf.scf import chkfile
+from pyscf.scf import _vhf
 
 # mo_energy, mo_coeff, mo_occ are all in nosymm representation
 
@@ -277,6 +278,159 @@ def eig(mf, h, s):
     c = lib.tag_array(c, orbsym=numpy.hstack(orbsym))
     return e, c
 
+def ao_symm_ops(mol):
+    '''The symmetry operations of mol.groupname (or its D2h/C2v subgroup for
+    linear molecules) represented as signed permutations of AOs,
+    g|mu> = sign[mu] |perm[mu]>.
+
+    Returns:
+        perms : (nop,nao) int array
+        signs : (nop,nao) array
+        atm_perms : (nop,natm) int array, the atom that each atom is
+            mapped to.
+    '''
+    gpname = mol.groupname
+    if gpname == 'Dooh':
+        gpname = 'D2h'
+    elif gpname == 'Coov':
+        gpname = 'C2v'
+    ops = symm.param.OPERATOR_TABLE[gpname]
+    atom_coords = mol.atom_coords()
+    aoslice = mol.aoslice_by_atom()
+    ao_loc = mol.ao_loc_nr()
+    nao = ao_loc[-1]
+
+    perms = []
+    signs = []
+    atm_perms = []
+    for op in ops:
+        opmat = symm.param.D2H_OPS[op]
+        op_coords = numpy.dot(atom_coords, opmat)
+        dc = abs(op_coords[:,None,:] - atom_coords).sum(axis=2)
+        atm_perm = dc.argmin(axis=1)
+        if (dc.min(axis=1) > symm.geom.TOLERANCE).any():
+            raise RuntimeError('Molecule geometry is not invariant under '
+                               'operation %s of %s' % (op, gpname))
+
+        perm = numpy.empty(nao, dtype=int)
+        sign = numpy.empty(nao)
+        for ia, ja in enumerate(atm_perm):
+            p0, p1 = aoslice[ia,2:]
+            q0, q1 = aoslice[ja,2:]
+            assert(p1-p0 == q1-q0)
+            perm[p0:p1] = numpy.arange(q0, q1)
+        for ib in range(mol.nbas):
+            l = mol.bas_angular(ib)
+            if mol.cart:
+                s = [opmat[0,0]**x * opmat[1,1]**y * opmat[2,2]**(l-x-y)
+                     for x in range(l, -1, -1) for y in range(l-x, -1, -1)]
+            else:
+                s = [-1 if symm.basis.tot_parity_odd(op, l, m) else 1
+                     for m in range(-l, l+1)]
+            sign[ao_loc[ib]:ao_loc[ib+1]] = numpy.tile(s, mol.bas_nctr(ib))
+        perms.append(perm)
+        signs.append(sign)
+        atm_perms.append(atm_perm)
+    return numpy.asarray(perms), numpy.asarray(signs), numpy.asarray(atm_perms)
+
+def _uniq_atom_pairs(atm_perms):
+    '''Symmetry-unique atom pairs (A >= B) and the number of pairs in the
+    orbit of each unique pair.'''
+    natm = atm_perms.shape[1]
+    a_idx, b_idx = numpy.tril_indices(natm)
+    ga = atm_perms[:,a_idx]
+    gb = atm_perms[:,b_idx]
+    keys = numpy.maximum(ga, gb) * natm + numpy.minimum(ga, gb)
+    # The pair with the smallest key in an orbit represents the orbit
+    uniq = keys.min(axis=0) == a_idx * natm + b_idx
+    keys = numpy.sort(keys, axis=0)
+    orbit_size = numpy.count_nonzero(keys[1:] != keys[:-1], axis=0) + 1
+    return a_idx[uniq], b_idx[uniq], orbit_size[uniq]
+
+def _is_totally_symmetric(dms, perms, signs, tol=1e-10):
+    for perm, sign in zip(perms, signs):
+        dm1 = dms[:,perm[:,None],perm] * numpy.einsum('i,j->ij', sign, sign)
+        if abs(dm1 - dms).max() > tol:
+            return False
+    return True
+
+def get_jk(mol, dm, hermi=1, vhfopt=None):
+    '''J, K matrices computed with the symmetry of the molecule.
+
+    Only the 2-electron integrals (ij|kl) with i on atom A and j on atom B
+    are evaluated for the symmetry-unique atom pairs (A,B).  The J and K
+    contributions of the unique pairs are weighted by the size of the orbits
+    of the pairs, then the full J, K matrices are generated by applying the
+    symmetry operations on them.  This requires the density matrices being
+    totally symmetric and hermitian.  For other density matrices, the
+    function :func:`hf.get_jk` is called.
+
+    See also the function :func:`hf.get_jk`
+    '''
+    dm = numpy.asarray(dm, order='C')
+    nao = dm.shape[-1]
+    dms = dm.reshape(-1,nao,nao)
+    if not mol.symmetry or hermi != 1 or dm.dtype != numpy.double:
+        return hf.get_jk(mol, dm, hermi, vhfopt)
+    perms, signs, atm_perms = ao_symm_ops(mol)
+    # Integrals are computed with 4-fold permutation symmetry in this function
+    # while hf.get_jk has 8-fold symmetry.  Small groups do not benefit.
+    if len(perms) <= 2 or not _is_totally_symmetric(dms, perms, signs):
+        return hf.get_jk(mol, dm, hermi, vhfopt)
+
+    nop = len(perms)
+    atm_a, atm_b, orbit_size = _uniq_atom_pairs(atm_perms)
+    logger.debug1(mol, 'symmetry-unique atom pairs %d / %d',
+                  len(atm_a), mol.natm*(mol.natm+1)//2)
+    aoslice = mol.aoslice_by_atom()
+    if mol.cart:
+        intor = 'int2e_cart'
+    else:
+        intor = 'int2e_sph'
+    # The density matrices are sliced for each atom pair.  The Schwarz
+    # inequality, which does not depend on the density matrices, is the
+    # only screening condition.
+    opt = _vhf.VHFOpt(mol, intor, 'CVHFnr_schwarz_cond', 'CVHFsetnr_direct_scf')
+    if vhfopt is not None:
+        opt.direct_scf_tol = vhfopt.direct_scf_tol
+
+    # Skeleton J, K matrices, from which the full J, K matrices are generated
+    nset = len(dms)
+    vj = numpy.zeros_like(dms)
+    vk = numpy.zeros_like(dms)
+    for ia, ja, nrep in zip(atm_a, atm_b, orbit_size):
+        ish0, ish1, i0, i1 = aoslice[ia]
+        jsh0, jsh1, j0, j1 = aoslice[ja]
+        shls_slice = (ish0, ish1, jsh0, jsh1, 0, mol.nbas, 0, mol.nbas)
+        fac = float(nrep) / nop
+        if ia == ja:
+            # i and j both run over the AOs of atom A.  K[j,:] is included
+            # in K[i,:]
+            jkdescript = ('lk->s1ij', 'jk->s1il') * nset
+            dms1 = [x for dm1 in dms for x in (dm1, dm1[j0:j1])]
+        else:
+            jkdescript = ('lk->s1ij', 'jk->s1il', 'li->s1kj') * nset
+            dms1 = [x for dm1 in dms for x in (dm1, dm1[j0:j1], dm1[:,i0:i1])]
+        vs = _vhf.direct_bindm(intor, 's2kl', jkdescript, dms1, 1, mol._atm,
+                               mol._bas, mol._env, opt, shls_slice)
+        nv = len(vs) // nset
+        for k in range(nset):
+            vj[k,i0:i1,j0:j1] += vs[k*nv  ] * fac
+            vk[k,i0:i1      ] += vs[k*nv+1] * fac
+            if ia != ja:
+                vj[k,j0:j1,i0:i1] += vs[k*nv].T * fac
+                vk[k,j0:j1] += vs[k*nv+2].T * fac
+
+    vj_skel, vk_skel = vj, vk
+    vj = numpy.zeros_like(dms)
+    vk = numpy.zeros_like(dms)
+    for perm, sign in zip(perms, signs):
+        ss = numpy.einsum('i,j->ij', sign, sign)
+        idx = (slice(None), perm[:,None], perm)
+        vj[idx] += vj_skel * ss
+        vk[idx] += vk_skel * ss
+    return vj.reshape(dm.shape), vk.reshape(dm.shape)
+
 
 class RHF(hf.RHF):
     __doc__ = hf.SCF.__doc__ + '''
@@ -316,6 +470,19 @@ class RHF(hf.RHF):
 
     eig = eig
 
+    def get_jk(self, mol=None, dm=None, hermi=1):
+        if mol is None: mol = self.mol
+        if dm is None: dm = self.make_rdm1()
+        if (not mol.symmetry or self._eri is not None or
+            mol.incore_anyway or self._is_mem_enough()):
+            return hf.RHF.get_jk(self, mol, dm, hermi)
+        cpu0 = (time.clock(), time.time())
+        if self.direct_scf and self.opt is None:
+            self.opt = self.init_direct_scf(mol)
+        vj, vk = get_jk(mol, dm, hermi, self.opt)
+        logger.timer(self, 'vj and vk', *cpu0)
+        return vj, vk
+
     def get_grad(self, mo_coeff, mo_occ, fock=None):
         g = hf.RHF.get_grad(self, mo_coeff, mo_occ, fock)
         if self.mol.symmetry:
@@ -462,6 +629,19 @@ class ROHF(rohf.ROHF):
 
     eig = eig
 
+    def get_jk(self, mol=None, dm=None, hermi=1):
+        if mol is None: mol = self.mol
+        if dm is None: dm = self.make_rdm1()
+        if (not mol.symmetry or self._eri is not None or
+            mol.incore_anyway or self._is_mem_enough()):
+            return rohf.ROHF.get_jk(self, mol, dm, hermi)
+        cpu0 = (time.clock(), time.time())
+        if self.direct_scf and self.opt is None:
+            self.opt = self.init_direct_scf(mol)
+        vj, vk = get_jk(mol, dm, hermi, self.opt)
+        logger.timer(self, 'vj and vk', *cpu0)
+        return vj, vk
+
     def get_grad(self, mo_coeff, mo_occ, fock=None):
         g = rohf.ROHF.get_grad(self, mo_coeff, mo_occ, fock)
         if self.mol.symmetry:
@@ -10,6 +10,7 @@ Non-relativistic analytical nuclear gradients
 import time
 import numpy
 from pyscf import lib
+from pyscf import gto
 from pyscf.lib import logger
 from pyscf.scf import _vhf
 
@@ -36,34 +37,105 @@ def grad_elec(grad_mf, mo_energy=None, mo_coeff=None, mo_occ=None, atmlst=None):
 
     if atmlst is None:
         atmlst = range(mol.natm)
-    offsetdic = mol.offset_nr_by_atom()
-    de = numpy.zeros((len(atmlst),3))
-    for k, ia in enumerate(atmlst):
-        shl0, shl1, p0, p1 = offsetdic[ia]
+    atmlst = numpy.asarray(atmlst, dtype=int)
+    aoslices = mol.aoslice_by_atom()
 # h1, s1, vhf are \nabla <i|h|j>, the nuclear gradients = -\nabla
-        vrinv = grad_mf._grad_rinv(mol, ia)
-        de[k] += numpy.einsum('xij,ij->x', f1[:,p0:p1], dm0[p0:p1]) * 2
-        de[k] += numpy.einsum('xij,ij->x', vrinv, dm0) * 2
-        de[k] -= numpy.einsum('xij,ij->x', s1[:,p0:p1], dme0[p0:p1]) * 2
+    de = numpy.einsum('xij,ij->ix', f1, dm0)
+    de-= numpy.einsum('xij,ij->ix', s1, dme0)
+    # Sum over the AOs of each atom.  Atoms without basis functions have
+    # empty slices and are excluded from reduceat.
+    de_atm = numpy.zeros((mol.natm,3))
+    mask = aoslices[:,2] < aoslices[:,3]
+    if mask.any():
+        de_atm[mask] = numpy.add.reduceat(de, aoslices[mask,2])
+    de = de_atm[atmlst] * 2
+    if _grad_rinv_overridden(grad_mf):
+        # Subclasses may modify the nuclear attraction (eg by the
+        # _grad_rinv hook) which is not covered by grad_rinv_dm
+        for k, ia in enumerate(atmlst):
+            vrinv = grad_mf._grad_rinv(mol, ia)
+            de[k] += numpy.einsum('xij,ij->x', vrinv, dm0) * 2
+    else:
+        de += grad_rinv_dm(mol, dm0, atmlst, grad_mf.max_memory) * 2
     log.debug('gradients of electronic part')
     log.debug(str(de))
     return de
 
 def grad_nuc(mol, atmlst=None):
-    gs = numpy.zeros((mol.natm,3))
-    for j in range(mol.natm):
-        q2 = mol.atom_charge(j)
-        r2 = mol.atom_coord(j)
-        for i in range(mol.natm):
-            if i != j:
-                q1 = mol.atom_charge(i)
-                r1 = mol.atom_coord(i)
-                r = numpy.sqrt(numpy.dot(r1-r2,r1-r2))
-                gs[j] -= q1 * q2 * (r2-r1) / r**3
+    coords = mol.atom_coords()
+    charges = mol.atom_charges()
+    rr = coords[:,None,:] - coords
+    r = numpy.sqrt(numpy.einsum('ijx,ijx->ij', rr, rr))
+    r[numpy.diag_indices(mol.natm)] = numpy.inf
+    #:gs[j] -= q1 * q2 * (r2-r1) / r**3
+    gs = -numpy.einsum('i,j,ijx->ix', charges, charges, rr/r[:,:,None]**3)
     if atmlst is not None:
         gs = gs[atmlst]
     return gs
 
+def grad_rinv_dm(mol, dm, atmlst=None, max_memory=2000):
+    r'''Contract the nuclear attraction derivatives
+    -Z_A <\nabla i|1/|r-R_A||j> with the density matrix for all atoms in
+    atmlst.  It is the same to summing over  einsum('xij,ij->x',
+    _grad_rinv(mol, ia), dm)  for each atom.  The integrals of all atoms are
+    evaluated in one batch of 3-center integrals (\nabla i j|A) with
+    point-charge functions placed on the nuclei.
+
+    Returns:
+        (len(atmlst),3) array
+    '''
+    from pyscf.df import incore
+    if atmlst is None:
+        atmlst = range(mol.natm)
+    atmlst = numpy.asarray(atmlst, dtype=int)
+    coords = mol.atom_coords()[atmlst]
+    charges = mol.atom_charges()[atmlst]
+    nao = mol.nao_nr()
+    dm = numpy.asarray(dm).ravel()
+    intor = mol._add_suffix('int3c2e_ip1')
+    mem_avail = max(max_memory - lib.current_memory()[0], max_memory*.2)
+    blksize = max(1, int(mem_avail*1e6/8/(nao*nao*3)))
+    de = numpy.empty((len(atmlst),3))
+    for p0, p1 in lib.prange(0, len(atmlst), blksize):
+        fakemol = gto.fakemol_for_charges(coords[p0:p1])
+        j3c = incore.aux_e2(mol, fakemol, intor, aosym='s1', comp=3)
+        j3c = j3c.reshape(3,nao*nao,p1-p0)
+        de[p0:p1] = numpy.einsum('xpk,p->kx', j3c, dm)
+    return de * -charges[:,None]
+
+def _grad_rinv_overridden(grad_mf):
+    f = getattr(grad_mf._grad_rinv, '__func__', None)
+    return f is not Gradients.__dict__['_grad_rinv']
+
+def grad_batch(scf_methods, nworkers=None):
+    '''Nuclear gradients for a list of converged SCF objects (eg of the
+    conformers of a molecule).  The gradients of different SCF objects are
+    evaluated in a pool of nworkers threads.  The OpenMP threads are evenly
+    shared by the workers.
+
+    Returns:
+        A list of gradients, one for each SCF object
+    '''
+    from multiprocessing.pool import ThreadPool
+    nthreads = lib.num_threads()
+    if nworkers is None:
+        nworkers = nthreads
+    nworkers = max(1, min(nworkers, len(scf_methods)))
+    omp_threads = max(1, nthreads // nworkers)
+
+    def kernel(mf):
+        # omp_set_num_threads only affects the calling thread
+        lib.num_threads(omp_threads)
+        return mf.nuc_grad_method().kernel()
+
+    if nworkers == 1:
+        return [mf.nuc_grad_method().kernel() for mf in scf_methods]
+    pool = ThreadPool(nworkers)
+    try:
+        return pool.map(kernel, scf_methods)
+    finally:
+        pool.close()
+
 
 def get_hcore(mol):
     h =(mol.intor('int1e_ipkin', comp=3)
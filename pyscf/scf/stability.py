@@ -12,6 +12,7 @@ JCP, 104, 9047
 See also tddft/rhf.py and scf/newton_ah.py
 '''
 
+from functools import reduce
 import numpy
 import scipy
 from pyscf import lib
@@ -21,19 +22,87 @@ from pyscf.scf import hf, hf_symm, uhf_symm
 from pyscf.scf.newton_ah import _gen_rhf_response, _gen_uhf_response
 
 def rhf_stability(mf, internal=True, external=False, verbose=None):
+    '''Internal and external stability analysis of RHF/RKS.  The internal,
+    real -> complex and RHF/RKS -> UHF/UKS problems are solved together.  In
+    each iteration, the J/K matrices of the trial vectors of all problems
+    are computed in one call of mf.get_jk.
+
+    Returns:
+        mo_i : the orbitals rotated along the lowest internal instability,
+            or mf.mo_coeff if the wavefunction is stable.
+        mo_e : the (alpha, beta) orbitals of the RHF/RKS -> UHF/UKS
+            instability, or (mf.mo_coeff, mf.mo_coeff).
+    '''
     mo_i = mo_e = None
+    if not (internal or external):
+        return mo_i, mo_e
+
+    log = logger.new_logger(mf, verbose)
+    names, hdiags, hop = _gen_hop_rhf_batch(mf, internal, external)
+    es, vs = _davidson_batch(hop, _init_guess(hdiags), hdiags, log,
+                             names=names)
+    for name, e in zip(names, es):
+        log.debug('rhf_stability: lowest eig of %s H = %s', name, e)
+
     if internal:
-        mo_i = rhf_internal(mf, verbose=verbose)
+        e, v = es.pop(0), vs.pop(0)
+        if e < -1e-5:
+            log.note('RHF/RKS wavefunction has an internal instablity')
+            mo_i = _rotate_mo(mf.mo_coeff, mf.mo_occ, v)
+        else:
+            log.note('RHF/RKS wavefunction is stable in the intenral stablity analysis')
+            mo_i = mf.mo_coeff
     if external:
-        mo_e = rhf_external(mf, verbose=verbose)
+        if es[0] < -1e-5:
+            log.note('RHF/RKS wavefunction has a real -> complex instablity')
+        else:
+            log.note('RHF/RKS wavefunction is stable in the real -> complex stablity analysis')
+        if es[1] < -1e-5:
+            log.note('RHF/RKS wavefunction has a RHF/RKS -> UHF/UKS instablity.')
+            mo_e = (_rotate_mo(mf.mo_coeff, mf.mo_occ, vs[1]), mf.mo_coeff)
+        else:
+            log.note('RHF/RKS wavefunction is stable in the RHF/RKS -> UHF/UKS stablity analysis')
+            mo_e = (mf.mo_coeff, mf.mo_coeff)
     return mo_i, mo_e
 
 def uhf_stability(mf, internal=True, external=False, verbose=None):
+    '''Internal and external stability analysis of UHF/UKS.  The internal,
+    real -> complex and UHF/UKS -> GHF/GKS problems are solved together and
+    share one J/K build per iteration, see :func:`rhf_stability`.
+    '''
     mo_i = mo_e = None
+    if not (internal or external):
+        return mo_i, mo_e
+
+    log = logger.new_logger(mf, verbose)
+    names, hdiags, hop = _gen_hop_uhf_batch(mf, internal, external)
+    es, vs = _davidson_batch(hop, _init_guess(hdiags), hdiags, log,
+                             names=names)
+    for name, e in zip(names, es):
+        log.debug('uhf_stability: lowest eig of %s H = %s', name, e)
+
     if internal:
-        mo_i = uhf_internal(mf, verbose=verbose)
+        e, v = es.pop(0), vs.pop(0)
+        if e < -1e-5:
+            log.note('UHF/UKS wavefunction has an internal instablity.')
+            nocca = numpy.count_nonzero(mf.mo_occ[0]> 0)
+            nvira = numpy.count_nonzero(mf.mo_occ[0]==0)
+            mo_i = (_rotate_mo(mf.mo_coeff[0], mf.mo_occ[0], v[:nocca*nvira]),
+                    _rotate_mo(mf.mo_coeff[1], mf.mo_occ[1], v[nocca*nvira:]))
+        else:
+            log.note('UHF/UKS wavefunction is stable in the intenral stablity analysis')
+            mo_i = mf.mo_coeff
     if external:
-        mo_e = uhf_external(mf, verbose=verbose)
+        if es[0] < -1e-5:
+            log.note('UHF/UKS wavefunction has a real -> complex instablity')
+        else:
+            log.note('UHF/UKS wavefunction is stable in the real -> complex stablity analysis')
+        if es[1] < -1e-5:
+            log.note('UHF/UKS wavefunction has an UHF/UKS -> GHF/GKS instablity.')
+            mo_e = _rotate_mo_uhf2ghf(mf, vs[1])
+        else:
+            log.note('UHF/UKS wavefunction is stable in the UHF/UKS -> GHF/GKS stablity analysis')
+            mo_e = scipy.linalg.block_diag(*mf.mo_coeff)
     return mo_i, mo_e
 
 def rohf_stability(mf, internal=True, external=False, verbose=None):
@@ -356,27 +425,351 @@ def uhf_external(mf, with_symmetry=True, verbose=None):
         x0[numpy.argmin(hdiag2)] = 1
     e3, v = lib.davidson(hop2, x0, precond, tol=1e-4, verbose=log)
     log.debug('uhf_external: lowest eigs of H = %s', e3)
-    mo = scipy.linalg.block_diag(*mf.mo_coeff)
     if e3 < -1e-5:
         log.note('UHF/UKS wavefunction has an UHF/UKS -> GHF/GKS instablity.')
-        occidxa = numpy.where(mf.mo_occ[0]> 0)[0]
-        viridxa = numpy.where(mf.mo_occ[0]==0)[0]
-        occidxb = numpy.where(mf.mo_occ[1]> 0)[0]
-        viridxb = numpy.where(mf.mo_occ[1]==0)[0]
-        nocca = len(occidxa)
-        nvira = len(viridxa)
-        noccb = len(occidxb)
-        nvirb = len(viridxb)
-        nmo = nocca + nvira
-        dx = numpy.zeros((nmo*2,nmo*2))
-        dx[viridxa[:,None],nmo+occidxb] = v[:nvira*noccb].reshape(nvira,noccb)
-        dx[nmo+viridxb[:,None],occidxa] = v[nvira*noccb:].reshape(nvirb,nocca)
-        u = newton_ah.expmat(dx - dx.T)
-        mo = numpy.dot(mo, u)
+        mo = _rotate_mo_uhf2ghf(mf, v)
     else:
         log.note('UHF/UKS wavefunction is stable in the UHF/UKS -> GHF/GKS stablity analysis')
+        mo = scipy.linalg.block_diag(*mf.mo_coeff)
     return mo
 
+def _rotate_mo_uhf2ghf(mf, v):
+    mo = scipy.linalg.block_diag(*mf.mo_coeff)
+    occidxa = numpy.where(mf.mo_occ[0]> 0)[0]
+    viridxa = numpy.where(mf.mo_occ[0]==0)[0]
+    occidxb = numpy.where(mf.mo_occ[1]> 0)[0]
+    viridxb = numpy.where(mf.mo_occ[1]==0)[0]
+    nocca = len(occidxa)
+    nvira = len(viridxa)
+    noccb = len(occidxb)
+    nvirb = len(viridxb)
+    nmo = nocca + nvira
+    dx = numpy.zeros((nmo*2,nmo*2))
+    dx[viridxa[:,None],nmo+occidxb] = v[:nvira*noccb].reshape(nvira,noccb)
+    dx[nmo+viridxb[:,None],occidxa] = v[nvira*noccb:].reshape(nvirb,nocca)
+    u = newton_ah.expmat(dx - dx.T)
+    return numpy.dot(mo, u)
+
+
+def stable_opt_internal(mf, max_cycle=5, verbose=None):
+    '''Follow the lowest mode of the internal instability.  The orbitals
+    are rotated along the unstable mode and the SCF is restarted from the
+    rotated orbitals, until the wavefunction is stable in the internal
+    stability analysis or max_cycle is reached.
+
+    Returns:
+        The SCF object mf, updated in place
+    '''
+    log = logger.new_logger(mf, verbose)
+    for cycle in range(max_cycle):
+        mo_i = mf.stability(internal=True, external=False, verbose=log.verbose)[0]
+        if mo_i is mf.mo_coeff:
+            break
+        log.note('Follow the internal instability, restart SCF (cycle %d)', cycle+1)
+        dm0 = mf.make_rdm1(mo_i, mf.mo_occ)
+        mf.kernel(dm0)
+    else:
+        log.warn('Wavefunction is not stable after %d cycles of instability '
+                 'following', max_cycle)
+    return mf
+
+
+def _gen_hop_rhf_batch(mf, internal=True, external=False, with_symmetry=True):
+    '''Orbital Hessians of the RHF/RKS stability problems.  The returned
+    function hop takes a list of (problem_id, x) and evaluates the Hessian
+    vector products of all trial vectors together.
+
+    Returns:
+        names, hdiags, hop
+    '''
+    mol = mf.mol
+    mo_coeff = mf.mo_coeff
+    mo_occ = mf.mo_occ
+    occidx = numpy.where(mo_occ==2)[0]
+    viridx = numpy.where(mo_occ==0)[0]
+    nocc = len(occidx)
+    nvir = len(viridx)
+    orbv = mo_coeff[:,viridx]
+    orbo = mo_coeff[:,occidx]
+    sym = with_symmetry and mol.symmetry
+    if sym:
+        orbsym = hf_symm.get_orbsym(mol, mo_coeff)
+        sym_forbid = orbsym[viridx].reshape(-1,1) != orbsym[occidx]
+
+    h1e = mf.get_hcore()
+    dm0 = mf.make_rdm1(mo_coeff, mo_occ)
+    fock_ao = h1e + mf.get_veff(mol, dm0)
+    fock = reduce(numpy.dot, (mo_coeff.T, fock_ao, mo_coeff))
+    foo = fock[occidx[:,None],occidx]
+    fvv = fock[viridx[:,None],viridx]
+    hdiag = fvv.diagonal().reshape(-1,1) - foo.diagonal()
+    if sym:
+        hdiag[sym_forbid] = 0
+    hdiag = hdiag.ravel()
+
+    # (name, sign of the transposed part of dm1, J factor, K factor, scale)
+    problems = []
+    if internal:
+        problems.append(('internal', 1, 1., -.5, 2.))
+    if external:
+        problems.append(('real -> complex', -1, 0., -.5, 1.))
+        problems.append(('RHF/RKS -> UHF/UKS', 1, 0., -.5, 1.))
+
+    if hasattr(mf, 'xc') and hasattr(mf, '_numint'):
+        # The XC kernel is evaluated on the grid when a response function is
+        # created.  Only the functions of the requested problems are made.
+        def gen_vresp(name):
+            if name == 'internal':
+                return _gen_rhf_response(mf, singlet=None, hermi=1)
+            elif name == 'real -> complex':
+                return _gen_rhf_response(mf, singlet=None, hermi=2)
+            else:
+                return _gen_rhf_response(mf, singlet=False, hermi=1)
+        vresp = [gen_vresp(p[0]) for p in problems]
+    else:
+        vresp = None
+
+    def hop(xs):
+        x1s = []
+        dm1s = []
+        for k, x1 in xs:
+            x1 = x1.reshape(nvir,nocc)
+            if sym:
+                x1 = x1.copy()
+                x1[sym_forbid] = 0
+            d1 = reduce(numpy.dot, (orbv, x1*2, orbo.T))
+            x1s.append(x1)
+            dm1s.append(d1 + problems[k][1] * d1.T)
+
+        if vresp is None:
+            # J/K of all problems in one build
+            vj, vk = mf.get_jk(mol, numpy.asarray(dm1s), hermi=0)
+            v1s = [problems[k][2] * vj[i] + problems[k][3] * vk[i]
+                   for i, (k, x1) in enumerate(xs)]
+        else:
+            v1s = [vresp[k](dm1) for (k, x1), dm1 in zip(xs, dm1s)]
+
+        x2s = []
+        for (k, x), x1, v1 in zip(xs, x1s, v1s):
+            x2 = numpy.dot(fvv, x1) - numpy.dot(x1, foo)
+            x2 += reduce(numpy.dot, (orbv.T, v1, orbo))
+            if sym:
+                x2[sym_forbid] = 0
+            x2s.append(x2.ravel() * problems[k][4])
+        return x2s
+
+    return [p[0] for p in problems], [hdiag*p[4] for p in problems], hop
+
+def _gen_hop_uhf_batch(mf, internal=True, external=False, with_symmetry=True):
+    '''Orbital Hessians of the UHF/UKS stability problems, see
+    :func:`_gen_hop_rhf_batch`.  The UHF/UKS -> GHF/GKS problem does not
+    include the spin flip of the GHF solution.'''
+    mol = mf.mol
+    mo_coeff = mf.mo_coeff
+    mo_occ = mf.mo_occ
+    occidxa = numpy.where(mo_occ[0]>0)[0]
+    occidxb = numpy.where(mo_occ[1]>0)[0]
+    viridxa = numpy.where(mo_occ[0]==0)[0]
+    viridxb = numpy.where(mo_occ[1]==0)[0]
+    orboa = mo_coeff[0][:,occidxa]
+    orbob = mo_coeff[1][:,occidxb]
+    orbva = mo_coeff[0][:,viridxa]
+    orbvb = mo_coeff[1][:,viridxb]
+    sym = with_symmetry and mol.symmetry
+    if sym:
+        orbsyma, orbsymb = uhf_symm.get_orbsym(mol, mo_coeff)
+        orbsyma_o = orbsyma[occidxa]
+        orbsyma_v = orbsyma[viridxa]
+        orbsymb_o = orbsymb[occidxb]
+        orbsymb_v = orbsymb[viridxb]
+
+    h1e = mf.get_hcore()
+    dm0 = mf.make_rdm1(mo_coeff, mo_occ)
+    fock_ao = h1e + mf.get_veff(mol, dm0)
+    focka = reduce(numpy.dot, (mo_coeff[0].T, fock_ao[0], mo_coeff[0]))
+    fockb = reduce(numpy.dot, (mo_coeff[1].T, fock_ao[1], mo_coeff[1]))
+    fooa = focka[occidxa[:,None],occidxa]
+    fvva = focka[viridxa[:,None],viridxa]
+    foob = fockb[occidxb[:,None],occidxb]
+    fvvb = fockb[viridxb[:,None],viridxb]
+
+    # The two channels (orbv, orbo, fvv, foo, sym_forbid) of the rotations
+    if sym:
+        forbid = lambda symv, symo: symv.reshape(-1,1) != symo
+        same_spin = ((orbva, orboa, fvva, fooa, forbid(orbsyma_v, orbsyma_o)),
+                     (orbvb, orbob, fvvb, foob, forbid(orbsymb_v, orbsymb_o)))
+        spin_flip = ((orbva, orbob, fvva, foob, forbid(orbsyma_v, orbsymb_o)),
+                     (orbvb, orboa, fvvb, fooa, forbid(orbsymb_v, orbsyma_o)))
+    else:
+        same_spin = ((orbva, orboa, fvva, fooa, None),
+                     (orbvb, orbob, fvvb, foob, None))
+        spin_flip = ((orbva, orbob, fvva, foob, None),
+                     (orbvb, orboa, fvvb, fooa, None))
+
+    # (name, channels, sign of the transposed part of dm1, J factor, K factor)
+    problems = []
+    if internal:
+        problems.append(('internal', same_spin, 1, 1., -1.))
+    if external:
+        problems.append(('real -> complex', same_spin, -1, 0., -1.))
+        problems.append(('UHF/UKS -> GHF/GKS', spin_flip, 1, 0., -1.))
+
+    def get_hdiag(channels):
+        hdiag = []
+        for orbv, orbo, fvv, foo, sym_forbid in channels:
+            h = fvv.diagonal().reshape(-1,1) - foo.diagonal()
+            if sym:
+                h[sym_forbid] = 0
+            hdiag.append(h.ravel())
+        return numpy.hstack(hdiag)
+
+    if hasattr(mf, 'xc') and hasattr(mf, '_numint'):
+        # Only the response functions of the requested problems are made,
+        # see _gen_hop_rhf_batch
+        def gen_vresp(name):
+            if name == 'internal':
+                return _gen_uhf_response(mf, hermi=1)
+            elif name == 'real -> complex':
+                return _gen_uhf_response(mf, with_j=False, hermi=2)
+            else:
+                return _gen_uhf_response(mf, with_j=False, hermi=0)
+        vresp = [gen_vresp(p[0]) for p in problems]
+    else:
+        vresp = None
+
+    def hop(xs):
+        x1s = []
+        dm1s = []
+        for k, x in xs:
+            ((orbv0, orbo0, fvv0, foo0, forbid0),
+             (orbv1, orbo1, fvv1, foo1, forbid1)) = problems[k][1]
+            n0 = orbv0.shape[1] * orbo0.shape[1]
+            x10 = x[:n0].reshape(orbv0.shape[1],orbo0.shape[1])
+            x11 = x[n0:].reshape(orbv1.shape[1],orbo1.shape[1])
+            if sym:
+                x10 = x10.copy()
+                x11 = x11.copy()
+                x10[forbid0] = 0
+                x11[forbid1] = 0
+            d10 = reduce(numpy.dot, (orbv0, x10, orbo0.T))
+            d11 = reduce(numpy.dot, (orbv1, x11, orbo1.T))
+            if problems[k][0] == 'UHF/UKS -> GHF/GKS':
+                dm1 = (d10 + d11.T, d11 + d10.T)
+            else:
+                dm1 = (d10 + problems[k][2] * d10.T,
+                       d11 + problems[k][2] * d11.T)
+            x1s.append((x10, x11))
+            dm1s.append(numpy.asarray(dm1))
+
+        if vresp is None:
+            # J/K of all problems in one build
+            vj, vk = mf.get_jk(mol, numpy.asarray(dm1s), hermi=0)
+            v1s = [problems[k][3] * (vj[i,0] + vj[i,1]) + problems[k][4] * vk[i]
+                   for i, (k, x) in enumerate(xs)]
+        else:
+            v1s = [vresp[k](dm1) for (k, x), dm1 in zip(xs, dm1s)]
+
+        x2s = []
+        for (k, x), x1, v1 in zip(xs, x1s, v1s):
+            x2 = []
+            for (orbv, orbo, fvv, foo, sym_forbid), x1c, v1c in zip(problems[k][1], x1, v1):
+                x2c = numpy.dot(fvv, x1c) - numpy.dot(x1c, foo)
+                x2c += reduce(numpy.dot, (orbv.T, v1c, orbo))
+                if sym:
+                    x2c[sym_forbid] = 0
+                x2.append(x2c.ravel())
+            x2s.append(numpy.hstack(x2))
+        return x2s
+
+    return [p[0] for p in problems], [get_hdiag(p[1]) for p in problems], hop
+
+def _init_guess(hdiags):
+    x0s = []
+    for hdiag in hdiags:
+        x0 = numpy.zeros_like(hdiag)
+        x0[hdiag>1e-5] = 1. / hdiag[hdiag>1e-5]
+        x0s.append(x0)
+    return x0s
+
+def _davidson_batch(hop, x0s, hdiags, log, tol=1e-4, max_cycle=50,
+                    max_space=12, lindep=1e-14, names=None):
+    '''Lowest eigenpairs of several symmetric problems.  The Davidson
+    iterations of all problems run in lockstep so that hop evaluates the
+    trial vectors of all problems at once.
+
+    Args:
+        hop : function
+            Takes a list of (problem_id, x) and returns the list of Hx
+        x0s : list of initial guess vectors, one for each problem
+        hdiags : list of the diagonal of H, one for each problem
+
+    Kwargs:
+        names : list of the names of the problems, for the log messages
+
+    Returns:
+        e : list of the lowest eigenvalues
+        v : list of the corresponding eigenvectors
+    '''
+    nprob = len(x0s)
+    if names is None:
+        names = ['problem %d' % k for k in range(nprob)]
+    xs = [x0/numpy.linalg.norm(x0) for x0 in x0s]
+    space = [[] for k in range(nprob)]
+    hspace = [[] for k in range(nprob)]
+    es = [None] * nprob
+    vs = [None] * nprob
+    conv = [False] * nprob
+    active = list(range(nprob))
+    for icyc in range(max_cycle):
+        axs = hop([(k, xs[k]) for k in active])
+        for k, ax in zip(list(active), axs):
+            space[k].append(xs[k])
+            hspace[k].append(ax)
+            v = numpy.asarray(space[k])
+            av = numpy.asarray(hspace[k])
+            h = numpy.dot(v, av.T)
+            w, c = scipy.linalg.eigh((h + h.T) * .5)
+            x = numpy.dot(c[:,0], v)
+            ax = numpy.dot(c[:,0], av)
+            r = ax - w[0] * x
+            rnorm = numpy.linalg.norm(r)
+            de = w[0] - es[k] if es[k] is not None else w[0]
+            es[k], vs[k] = w[0], x
+            log.debug1('davidson_batch %d  problem %d  e = %.12g  de = %.6g  |r| = %.6g',
+                       icyc, k, w[0], de, rnorm)
+            if abs(de) < tol and rnorm < numpy.sqrt(tol):
+                conv[k] = True
+                active.remove(k)
+                continue
+
+            if len(space[k]) >= max_space:
+                space[k] = [x]
+                hspace[k] = [ax]
+            hdiagd = hdiags[k] - w[0]
+            hdiagd[abs(hdiagd)<1e-8] = 1e-8
+            t = r / hdiagd
+            for i in range(2):
+                for xi in space[k]:
+                    t -= numpy.dot(xi, t) * xi
+            tnorm = numpy.linalg.norm(t)
+            if tnorm**2 < lindep:
+                # No new direction.  The residual tells whether it converged.
+                conv[k] = rnorm < numpy.sqrt(tol)
+                active.remove(k)
+            else:
+                xs[k] = t / tnorm
+        if not active:
+            break
+
+    if all(conv):
+        log.debug('davidson_batch converged in %d cycles, e = %s', icyc+1, es)
+    else:
+        for k in range(nprob):
+            if not conv[k]:
+                log.warn('davidson_batch: %s not converged in %d cycles, '
+                         'e = %s', names[k], icyc+1, es[k])
+    return es, vs
+
 
 if __name__ == '__main__':
     from pyscf import gto, scf, dft
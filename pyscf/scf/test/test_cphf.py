@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import unittest
+import numpy
+from pyscf import lib
+from pyscf.scf import cphf
+
+numpy.random.seed(4)
+nocc, nvir = 3, 5
+nmo = nocc + nvir
+nset = 4
+mo_energy = numpy.sort(numpy.random.random(nmo)) - .5
+mo_energy[nocc:] += 1
+mo_occ = numpy.zeros(nmo)
+mo_occ[:nocc] = 2
+# A linear response kernel which couples all orbital pairs
+a = numpy.random.random((nmo*nocc,nmo*nocc)) * .05
+a = a + a.T
+
+def fvind(mo1):
+    mo1 = mo1.reshape(-1,nmo*nocc)
+    return numpy.dot(mo1, a.T).reshape(-1,nmo,nocc)
+
+def fvind_vo(mo1):
+    mo1 = mo1.reshape(-1,nvir*nocc)
+    a_vo = a.reshape(nmo,nocc,nmo,nocc)[nocc:,:,nocc:].reshape(nvir*nocc,-1)
+    return numpy.dot(mo1, a_vo.T).reshape(-1,nvir,nocc)
+
+class KnowValues(unittest.TestCase):
+    def test_krylov(self):
+        n = 30
+        a = numpy.random.random((n,n)) * .1
+        b = numpy.random.random((nset,n))
+        b[2] = 0
+        aop = lambda x: numpy.dot(x, a.T)
+        x = cphf.krylov(aop, b, tol=1e-12, max_cycle=n)
+        for k in range(nset):
+            ref = lib.krylov(lambda x: numpy.dot(a, x), b[k], tol=1e-12,
+                             max_cycle=n)
+            self.assertAlmostEqual(abs(x[k] - ref).max(), 0, 9)
+        self.assertAlmostEqual(abs(x + aop(x) - b).max(), 0, 7)
+
+    def test_solve_nos1_block(self):
+        h1 = numpy.random.random((nset,nvir,nocc))
+        mo1_ref = cphf.solve(fvind_vo, mo_energy, mo_occ, h1,
+                             max_cycle=50, tol=1e-12)[0]
+        mo1 = cphf.solve(fvind_vo, mo_energy, mo_occ, h1,
+                         max_cycle=50, tol=1e-12, block=True)[0]
+        self.assertAlmostEqual(abs(mo1 - mo1_ref).max(), 0, 7)
+        for k in range(nset):
+            mo1k = cphf.solve(fvind_vo, mo_energy, mo_occ, h1[k:k+1],
+                              max_cycle=50, tol=1e-12)[0]
+            self.assertAlmostEqual(abs(mo1[k] - mo1k[0]).max(), 0, 9)
+
+    def test_solve_withs1_block(self):
+        h1 = numpy.random.random((nset,nmo,nocc))
+        s1 = numpy.random.random((nset,nmo,nocc)) * .1
+        mo1_ref, e1_ref = cphf.solve(fvind, mo_energy, mo_occ, h1, s1,
+                                     max_cycle=50, tol=1e-12)
+        mo1, e1 = cphf.solve(fvind, mo_energy, mo_occ, h1, s1,
+                             max_cycle=50, tol=1e-12, block=True)
+        self.assertAlmostEqual(abs(mo1 - mo1_ref).max(), 0, 7)
+        self.assertAlmostEqual(abs(e1 - e1_ref).max(), 0, 7)
+
+
+if __name__ == "__main__":
+    print("Full Tests for cphf")
+    unittest.main()
@@ -136,6 +136,66 @@ class KnowValues(unittest.TestCase):
         self.assertTrue(numpy.allclose(vj0, vj1))
         self.assertTrue(numpy.allclose(vk0, vk1))
 
+    def test_concurrent_jk(self):
+        n4c = mol.nao_2c() * 2
+        numpy.random.seed(1)
+        dm = numpy.random.random((n4c,n4c))+numpy.random.random((n4c,n4c))*1j
+        dm = dm + dm.T.conj()
+        vj0, vk0 = scf.dhf.get_jk_coulomb(mol, dm)
+        vj1, vk1 = scf.dhf.get_jk_coulomb(mol, dm, concurrent=True)
+        self.assertAlmostEqual(abs(vj0-vj1).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk0-vk1).max(), 0, 9)
+
+        mf1 = scf.dhf.UHF(mol)
+        mf1.with_gaunt = True
+        mf1.concurrent_jk = False
+        vj0, vk0 = mf1.get_jk(mol, dm)
+        mf1.concurrent_jk = True
+        vj1, vk1 = mf1.get_jk(mol, dm)
+        self.assertAlmostEqual(abs(vj0-vj1).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk0-vk1).max(), 0, 9)
+
+    def test_estimate_blocks(self):
+        n2c = mol.nao_2c()
+        numpy.random.seed(1)
+        dm = numpy.random.random((n2c*2,n2c*2))+numpy.random.random((n2c*2,n2c*2))*1j
+        dm = dm + dm.T.conj()
+        mf1 = scf.dhf.UHF(mol)
+        opt_llll, opt_ssll, opt_ssss, opt_gaunt = mf1.init_direct_scf(mol)
+        est = scf.dhf._estimate_blocks(mol, dm, opt_llll, opt_ssss)
+        vj, vk = scf.dhf._call_veff_llll(mol, dm)
+        self.assertTrue(est['LLLL'] >= max(abs(vj).max(), abs(vk).max()))
+        vj, vk = scf.dhf._call_veff_ssll(mol, dm)
+        self.assertTrue(est['SSLL'] >= max(abs(vj).max(), abs(vk).max()))
+        vj, vk = scf.dhf._call_veff_ssss(mol, dm)
+        self.assertTrue(est['SSSS'] >= max(abs(vj).max(), abs(vk).max()))
+        self.assertEqual(est['GAUNT'], numpy.inf)
+        est = scf.dhf._estimate_blocks(mol, dm*0, opt_llll, opt_ssss)
+        self.assertEqual(est['GAUNT'], 0)
+
+    def test_split_threads(self):
+        threads = scf.dhf._split_threads(3, [1, 1, 10])
+        self.assertEqual(list(threads), [1, 1, 1])
+        threads = scf.dhf._split_threads(8, [1, 2, 3, 4])
+        self.assertEqual(list(threads), [1, 2, 2, 3])
+
+    def test_ssss_atom(self):
+        # For one atom, the one-center (SS|SS) integrals are exact
+        mol1 = gto.M(atom='Ne', basis='cc-pvdz', verbose=0)
+        n4c = mol1.nao_2c() * 2
+        numpy.random.seed(1)
+        dm = numpy.random.random((n4c,n4c))+numpy.random.random((n4c,n4c))*1j
+        dm = dm + dm.T.conj()
+        vj0, vk0 = scf.dhf.get_jk_coulomb(mol1, dm)
+        vj1, vk1 = scf.dhf.get_jk_coulomb(mol1, dm, ssss_approx='atom')
+        self.assertAlmostEqual(abs(vj0-vj1).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk0-vk1).max(), 0, 9)
+
+        mf1 = scf.dhf.UHF(mol)
+        mf1.conv_tol_grad = 1e-5
+        mf1.ssss_approx = 'atom'
+        self.assertAlmostEqual(mf1.kernel(), -76.081567907064198, 5)
+
     def test_time_rev_matrix(self):
         s = mol.intor_symmetric('int1e_ovlp_spinor')
         ts = scf.dhf.time_reversal_matrix(mol, s)
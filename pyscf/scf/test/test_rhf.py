@@ -189,6 +189,27 @@ class KnowValues(unittest.TestCase):
         mf.irrep_nelec = {'A1g':6, 'A1u':3, 'E1ux':2, 'E1uy':2}
         self.assertAlmostEqual(mf.scf(), -108.21954550790898, 9)
 
+    def test_hf_symm_get_jk(self):
+        dm = n2mf.make_rdm1()
+        dms = numpy.array((dm, dm*.3))
+        vj, vk = scf.hf_symm.get_jk(n2sym, dms)
+        vj0, vk0 = scf.hf.get_jk(n2sym, dms)
+        self.assertAlmostEqual(abs(vj-vj0).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk-vk0).max(), 0, 9)
+
+        numpy.random.seed(1)
+        nao = n2sym.nao_nr()
+        dm = numpy.random.random((nao,nao))
+        dm = dm + dm.T
+        vj, vk = scf.hf_symm.get_jk(n2sym, dm)
+        vj0, vk0 = scf.hf.get_jk(n2sym, dm)
+        self.assertAlmostEqual(abs(vj-vj0).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk-vk0).max(), 0, 9)
+
+        mf = scf.hf_symm.RHF(n2sym)
+        mf.max_memory = 1
+        self.assertAlmostEqual(mf.scf(), -108.9298383856092, 8)
+
     def test_dot_eri_dm(self):
         numpy.random.seed(1)
         nao = mol.nao_nr()
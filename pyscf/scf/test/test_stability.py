@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import unittest
+import tempfile
 import numpy
 from pyscf import lib, gto, scf
 from pyscf import ao2mo
@@ -174,6 +175,81 @@ class KnownValues(unittest.TestCase):
         w = mf.stability(internal=True, external=False)[0]
         self.assertAlmostEqual(lib.finger(w), -11.241785180215988, 6)
 
+    def test_rhf_batch_hop(self):
+        mol = gto.M(atom='O 0 0 0; O 0 0 1.2222', basis='631g*', verbose=0)
+        mf = scf.RHF(mol).run(conv_tol=1e-14)
+        names, hdiags, hop = stability._gen_hop_rhf_batch(mf, True, True)
+        g, hop0, hdiag0 = scf.newton_ah.gen_g_hop_rhf(mf, mf.mo_coeff, mf.mo_occ)
+        hop1, hdiag1, hop2, hdiag2 = stability._gen_hop_rhf_external(mf)
+        numpy.random.seed(1)
+        xs = [numpy.random.random(hdiag.size) for hdiag in hdiags]
+        x2s = hop(list(enumerate(xs)))
+        for x, x2, hopref in zip(xs, x2s, (hop0, hop1, hop2)):
+            self.assertAlmostEqual(abs(x2 - hopref(x)).max(), 0, 9)
+        self.assertAlmostEqual(abs(hdiags[0] - hdiag0).max(), 0, 9)
+        self.assertAlmostEqual(abs(hdiags[2] - hdiag2).max(), 0, 9)
+
+    def test_uhf_batch_hop(self):
+        mol = gto.M(atom='O 0 0 0; O 0 0 1.2222', basis='631g*', spin=2, verbose=0)
+        mf = scf.UHF(mol).run(conv_tol=1e-14)
+        names, hdiags, hop = stability._gen_hop_uhf_batch(mf, True, True)
+        g, hop0, hdiag0 = scf.newton_ah.gen_g_hop_uhf(mf, mf.mo_coeff, mf.mo_occ)
+        hop1, hdiag1, hop2, hdiag2 = stability._gen_hop_uhf_external(mf)
+        numpy.random.seed(1)
+        xs = [numpy.random.random(hdiag.size) for hdiag in hdiags]
+        x2s = hop(list(enumerate(xs)))
+        for x, x2, hopref in zip(xs, x2s, (hop0, hop1, hop2)):
+            self.assertAlmostEqual(abs(x2 - hopref(x)).max(), 0, 9)
+        self.assertAlmostEqual(abs(hdiags[0] - hdiag0).max(), 0, 9)
+        self.assertAlmostEqual(abs(hdiags[2] - hdiag2).max(), 0, 9)
+
+    def test_batch_response_internal_only(self):
+        from pyscf import dft
+        mol = gto.M(atom='H 0 0 0; H 0 0 1.', basis='631g', verbose=0)
+        mf = dft.RKS(mol).run()
+        ncall = []
+        gen_response = stability._gen_rhf_response
+        try:
+            def counter(*args, **kwargs):
+                ncall.append(1)
+                return gen_response(*args, **kwargs)
+            stability._gen_rhf_response = counter
+            stability._gen_hop_rhf_batch(mf, True, False)
+        finally:
+            stability._gen_rhf_response = gen_response
+        self.assertEqual(len(ncall), 1)
+
+    def test_davidson_batch_not_converged(self):
+        numpy.random.seed(1)
+        a = numpy.random.random((30,30)) * .1
+        h = a + a.T + numpy.diag(numpy.arange(30.))
+        hop = lambda xs: [numpy.dot(h, x) for k, x in xs]
+        hdiag = h.diagonal().copy()
+        x0 = numpy.ones(30)
+        with tempfile.TemporaryFile('w+') as f:
+            log = lib.logger.Logger(f, 4)
+            stability._davidson_batch(hop, [x0], [hdiag], log, max_cycle=2,
+                                      names=['test'])
+            f.seek(0)
+            self.assertTrue('test not converged' in f.read())
+
+        with tempfile.TemporaryFile('w+') as f:
+            log = lib.logger.Logger(f, 5)
+            e = stability._davidson_batch(hop, [x0], [hdiag], log,
+                                          max_cycle=100)[0]
+            f.seek(0)
+            self.assertTrue('davidson_batch converged' in f.read())
+        self.assertAlmostEqual(e[0], numpy.linalg.eigh(h)[0][0], 4)
+
+    def test_stable_opt_internal(self):
+        mol = gto.M(atom='H 0 0 0; H 0 0 2.5', basis='631g', verbose=0)
+        mf = scf.UHF(mol).run()
+        e0 = mf.e_tot
+        stability.stable_opt_internal(mf)
+        self.assertTrue(mf.e_tot < e0 - 1e-3)
+        mo_i = mf.stability(internal=True, external=False)[0]
+        self.assertTrue(mo_i is mf.mo_coeff)
+
 if __name__ == "__main__":
     print("Full Tests for stability")
     unittest.main()
@@ -47,6 +47,51 @@ class KnowValues(unittest.TestCase):
         e = myx2c.kernel()
         self.assertAlmostEqual(e, -76.075431226329414, 9)
 
+    def test_local1e(self):
+        scf.x2c.clear_cache()
+        myx2c = scf.x2c.sfx2c1e(scf.RHF(mol))
+        e_ref = myx2c.kernel()
+        myx2c.with_x2c.approx = 'local1e'
+        e = myx2c.kernel()
+        self.assertAlmostEqual(e, -76.075411606939, 8)
+        self.assertTrue(abs(e - e_ref) > 1e-5)
+        # X and R of O and H, the two H atoms share the same blocks
+        self.assertEqual(len(scf.x2c._atom_xr_cache), 2)
+
+        myx2c = scf.x2c.UHF(mol)
+        myx2c.with_x2c.approx = 'local1e'
+        e = myx2c.kernel()
+        self.assertAlmostEqual(e, -76.075413759089, 8)
+
+    def test_hcore_cache(self):
+        scf.x2c.clear_cache()
+        x2cobj = scf.x2c.SpinFreeX2C(mol)
+        x2cobj.get_hcore()
+        self.assertEqual(len(scf.x2c._hcore_cache), 0)
+
+        cache_size = scf.x2c.HCORE_CACHE_SIZE
+        try:
+            scf.x2c.HCORE_CACHE_SIZE = 1
+            h1 = x2cobj.get_hcore()
+            self.assertEqual(len(scf.x2c._hcore_cache), 1)
+            h1[:] = 0
+            h1 = scf.x2c.SpinFreeX2C(mol).get_hcore()
+            self.assertEqual(len(scf.x2c._hcore_cache), 1)
+            self.assertAlmostEqual(abs(h1 - x2cobj._get_hcore(mol)).max(), 0, 12)
+
+            x2cobj.exp_drop = 0.1
+            h1 = x2cobj.get_hcore()
+            self.assertEqual(len(scf.x2c._hcore_cache), 2)
+            self.assertAlmostEqual(abs(h1 - x2cobj._get_hcore(mol)).max(), 0, 12)
+
+            # Each hcore takes 8*24*24 bytes
+            scf.x2c.HCORE_CACHE_SIZE = h1.nbytes * 1.5e-6
+            x2cobj.get_hcore()
+            self.assertEqual(len(scf.x2c._hcore_cache), 1)
+        finally:
+            scf.x2c.HCORE_CACHE_SIZE = cache_size
+            scf.x2c.clear_cache()
+
 
 if __name__ == "__main__":
     print("Full Tests for x2c")
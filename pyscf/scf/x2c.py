@@ -2,6 +2,8 @@
 
 
 import time
+import hashlib
+import collections
 from functools import reduce
 import copy
 import numpy
@@ -13,6 +15,12 @@ from pyscf.scf import hf
 from pyscf.scf import dhf
 from pyscf.scf import _vhf
 
+# Max memory (in MB) of the X2C hcore matrices kept in the molecule cache.
+# The cache is switched off by default.  It can be enabled when the same
+# geometries are computed repeatedly, eg in a scanner which revisits the
+# geometries.  The least recently used matrices are released first.
+HCORE_CACHE_SIZE = 0
+
 
 def sfx2c1e(mf):
     '''Spin-free X2C.
@@ -76,10 +84,19 @@ class _X2C_HF:
 class X2C(lib.StreamObject):
     '''2-component X2c (including spin-free and spin-dependent terms) in
     the j-adapted spinor basis.
+
+    Attributes:
+        approx : str
+            '1e' for the X2C transformation of the whole molecule.  'atom1e'
+            uses the atom-blocked X matrix which is computed with the
+            molecular potential.  'local1e' uses the atom-blocked X and R
+            matrices of the free atoms.  They are cached by the element and
+            the basis, thus the X2C transformation is computed only once for
+            each kind of atom.
     '''
     def __init__(self, mol=None):
         self.exp_drop = 0.2
-        self.approx = '1e'  # 'atom1e'
+        self.approx = '1e'  # 'atom1e', 'local1e'
         self.xuncontract = True
         self.basis = None
         self.mol = mol
@@ -113,8 +130,32 @@ class X2C(lib.StreamObject):
     def get_hcore(self, mol=None):
         '''2-component X2c hcore Hamiltonian (including spin-free and
         spin-dependent terms) in the j-adapted spinor basis.
+
+        If HCORE_CACHE_SIZE is set, the hcore matrices are cached and keyed
+        by the geometry, the basis and the X2C settings.  Calling this
+        function again for the same molecule (eg in a new SCF object or a
+        scanner which revisits a geometry) does not redo the X2C
+        transformation.
         '''
         if mol is None: mol = self.mol
+        if HCORE_CACHE_SIZE <= 0:
+            return self._get_hcore(mol)
+
+        key = self._hcore_key(mol)
+        h1 = _hcore_cache.pop(key, None)
+        if h1 is None:
+            h1 = self._get_hcore(mol)
+        _hcore_cache[key] = h1
+        _trim_hcore_cache(HCORE_CACHE_SIZE)
+        return h1.copy()
+
+    def _hcore_key(self, mol):
+        c = lib.param.LIGHT_SPEED
+        settings = (self.__class__.__name__, self.approx.upper(),
+                    self.xuncontract, self.exp_drop, self.basis, c, mol.cart)
+        return _hash_mol(mol, repr(settings))
+
+    def _get_hcore(self, mol):
         xmol, contr_coeff_nr = self.get_xmol(mol)
         c = lib.param.LIGHT_SPEED
         assert('1E' in self.approx.upper())
@@ -135,6 +176,9 @@ class X2C(lib.StreamObject):
                 w1 = xmol.intor('int1e_spnucsp_spinor', shls_slice=shls_slice)
                 x[p0:p1,p0:p1] = _x2c1e_xmatrix(t1, v1, w1, s1, c)
             h1 = _get_hcore_fw(t, v, w, s, x, c)
+        elif 'LOCAL' in self.approx.upper():
+            x, r = _local_xr(xmol, xmol.offset_2c_by_atom(), True, c)
+            h1 = _get_hcore_fw(t, v, w, s, x, c, r)
         else:
             h1 = _x2c1e_get_hcore(t, v, w, s, c)
 
@@ -159,7 +203,9 @@ class SpinFreeX2C(X2C):
         '''1-component X2c hcore Hamiltonian  (spin-free part only) in the
         real spherical GTO basis.
         '''
-        if mol is None: mol = self.mol
+        return X2C.get_hcore(self, mol)
+
+    def _get_hcore(self, mol):
         xmol, contr_coeff = self.get_xmol(mol)
         c = lib.param.LIGHT_SPEED
         assert('1E' in self.approx.upper())
@@ -180,6 +226,9 @@ class SpinFreeX2C(X2C):
                 w1 = xmol.intor('int1e_pnucp', shls_slice=shls_slice)
                 x[p0:p1,p0:p1] = _x2c1e_xmatrix(t1, v1, w1, s1, c)
             h1 = _get_hcore_fw(t, v, w, s, x, c)
+        elif 'LOCAL' in self.approx.upper():
+            x, r = _local_xr(xmol, xmol.offset_nr_by_atom(), False, c)
+            h1 = _get_hcore_fw(t, v, w, s, x, c, r)
         else:
             h1 = _x2c1e_get_hcore(t, v, w, s, c)
 
@@ -452,19 +501,23 @@ def _invsqrt(a, tol=1e-14):
     idx = e > tol
     return numpy.dot(v[:,idx]/numpy.sqrt(e[idx]), v[:,idx].T.conj())
 
-def _get_hcore_fw(t, v, w, s, x, c):
-    s1 = s + reduce(numpy.dot, (x.T.conj(), t, x)) * (.5/c**2)
+def _get_hcore_fw(t, v, w, s, x, c, r=None):
     tx = numpy.dot(t, x)
     h1 =(v + tx + tx.T.conj() - numpy.dot(x.T.conj(), tx) +
          reduce(numpy.dot, (x.T.conj(), w, x)) * (.25/c**2))
+    if r is None:
+        s1 = s + reduce(numpy.dot, (x.T.conj(), t, x)) * (.5/c**2)
+        r = _get_r(s, s1)
+    h1 = reduce(numpy.dot, (r.T.conj(), h1, r))
+    return h1
 
+def _get_r(s, s1):
     # R^dag \tilde{S} R = S
     # R = S^{-1/2} [S^{-1/2}\tilde{S}S^{-1/2}]^{-1/2} S^{1/2}
     sa = _invsqrt(s)
     sb = _invsqrt(reduce(numpy.dot, (sa, s1, sa)))
     r = reduce(numpy.dot, (sa, sb, sa, s))
-    h1 = reduce(numpy.dot, (r.T.conj(), h1, r))
-    return h1
+    return r
 
 def _x2c1e_xmatrix(t, v, w, s, c):
     nao = s.shape[0]
@@ -537,6 +590,95 @@ def _x2c1e_get_hcore(t, v, w, s, c):
     return h1
 
 
+# The X2C hcore of molecules, keyed by _hash_mol
+_hcore_cache = collections.OrderedDict()
+# X and R matrices of free atoms, keyed by _hash_atom
+_atom_xr_cache = {}
+
+def clear_cache():
+    '''Release the cached X2C hcore matrices and the atomic X and R
+    matrices.'''
+    _hcore_cache.clear()
+    _atom_xr_cache.clear()
+
+def _trim_hcore_cache(max_memory):
+    '''Release the least recently used hcore matrices until the cache takes
+    less than max_memory MB'''
+    size = sum(h.nbytes for h in _hcore_cache.values())
+    while size > max_memory*1e6:
+        size -= _hcore_cache.popitem(last=False)[1].nbytes
+
+def _hash_mol(mol, *args):
+    '''A key which identifies the geometry, the basis and the nuclear model
+    of mol'''
+    key = hashlib.sha1()
+    for x in (mol._atm, mol._bas, mol._env):
+        key.update(numpy.ascontiguousarray(x).tobytes())
+    for x in args:
+        key.update(str(x).encode())
+    return key.hexdigest()
+
+def _atom_mol(mol, ia):
+    '''The Mole object of the free atom ia'''
+    amol = copy.copy(mol)
+    amol._atm = mol._atm[ia:ia+1].copy()
+    bas = mol._bas[mol._bas[:,mole.ATOM_OF] == ia].copy()
+    bas[:,mole.ATOM_OF] = 0
+    amol._bas = bas
+    return amol
+
+def _hash_atom(mol, ia, *args):
+    '''A key which identifies the element, the nuclear model and the basis of
+    atom ia.  It does not depend on the position of the atom.'''
+    key = hashlib.sha1()
+    atm = mol._atm[ia]
+    env = mol._env
+    key.update(numpy.asarray((atm[mole.CHARGE_OF], atm[mole.NUC_MOD_OF],
+                              mol.cart)).tobytes())
+    key.update(env[atm[mole.PTR_ZETA]:atm[mole.PTR_ZETA]+1].tobytes())
+    for b in mol._bas[mol._bas[:,mole.ATOM_OF] == ia]:
+        nprim = b[mole.NPRIM_OF]
+        nctr = b[mole.NCTR_OF]
+        key.update(numpy.asarray(b[mole.ANG_OF:mole.KAPPA_OF+1]).tobytes())
+        key.update(env[b[mole.PTR_EXP]:b[mole.PTR_EXP]+nprim].tobytes())
+        key.update(env[b[mole.PTR_COEFF]:b[mole.PTR_COEFF]+nprim*nctr].tobytes())
+    for x in args:
+        key.update(str(x).encode())
+    return key.hexdigest()
+
+def _local_xr(xmol, atom_slices, spinor, c):
+    '''Atom-blocked X and R matrices.  Each block is the X2C transformation
+    of the free atom, which is computed once for each kind of atom.'''
+    if spinor:
+        nao = xmol.nao_2c()
+        dtype = numpy.complex
+    else:
+        nao = xmol.nao_nr()
+        dtype = numpy.double
+    x = numpy.zeros((nao,nao), dtype=dtype)
+    r = numpy.zeros((nao,nao), dtype=dtype)
+    for ia in range(xmol.natm):
+        ish0, ish1, p0, p1 = atom_slices[ia]
+        key = _hash_atom(xmol, ia, spinor, c)
+        if key not in _atom_xr_cache:
+            amol = _atom_mol(xmol, ia)
+            if spinor:
+                s1 = amol.intor_symmetric('int1e_ovlp_spinor')
+                t1 = amol.intor_symmetric('int1e_spsp_spinor') * .5
+                v1 = amol.intor_symmetric('int1e_nuc_spinor')
+                w1 = amol.intor_symmetric('int1e_spnucsp_spinor')
+            else:
+                s1 = amol.intor_symmetric('int1e_ovlp')
+                t1 = amol.intor_symmetric('int1e_kin')
+                v1 = amol.intor_symmetric('int1e_nuc')
+                w1 = amol.intor_symmetric('int1e_pnucp')
+            x1 = _x2c1e_xmatrix(t1, v1, w1, s1, c)
+            st = s1 + reduce(numpy.dot, (x1.T.conj(), t1, x1)) * (.5/c**2)
+            _atom_xr_cache[key] = (x1, _get_r(s1, st))
+        x[p0:p1,p0:p1], r[p0:p1,p0:p1] = _atom_xr_cache[key]
+    return x, r
+
+
 def _proj_dmll(mol_nr, dm_nr, mol):
     from pyscf.scf import addons
     proj = addons.project_mo_nr2r(mol_nr, 1, mol)
@@ -575,5 +717,7 @@ if __name__ == '__main__':
     print('E(X2C1E) = %.12g' % method.kernel())
     method.with_x2c.approx = 'atom1e'
     print('E(X2C1E) = %.12g' % method.kernel())
+    method.with_x2c.approx = 'local1e'
+    print('E(X2C1E) = %.12g' % method.kernel())
 
 
@@ -472,6 +472,16 @@ class SymmSys(object):
             u, idx = numpy.unique(dists, return_inverse=True)
             for i, s in enumerate(u):
                 self.group_atoms_by_distance.append(index[idx == i])
+        self._kdtrees = None
+
+    def _get_kdtrees(self):
+        '''k-d trees of the coordinates of each group of atoms, for fast
+        lookup of the coordinates in symmetric_for'''
+        if self._kdtrees is None:
+            from scipy.spatial import cKDTree
+            self._kdtrees = [cKDTree(self.atoms[lst,1:])
+                             for lst in self.group_atoms_by_distance]
+        return self._kdtrees
 
     def cartesian_tensor(self, n):
         z = self.atoms[:,0]
@@ -485,11 +495,11 @@ class SymmSys(object):
         return e[-ncart:], c[:,-ncart:]
 
     def symmetric_for(self, op):
-        for lst in self.group_atoms_by_distance:
+        for lst, tree in zip(self.group_atoms_by_distance, self._get_kdtrees()):
             r0 = self.atoms[lst,1:]
             r1 = numpy.dot(r0, op)
 # FIXME: compare whehter two sets of coordinates are identical
-            yield all((_vec_in_vecs(x, r0) for x in r1))
+            yield _vecs_in_kdtree(r1, tree)
 
     def has_icenter(self):
         return all(self.symmetric_for(-1))
@@ -503,35 +513,42 @@ class SymmSys(object):
 
     def search_possible_rotations(self, zaxis=None):
         '''If zaxis is given, the rotation axis is parallel to zaxis'''
-        maybe_cn = []
+        vecs = []
+        ns = []
         for lst in self.group_atoms_by_distance:
             natm = len(lst)
             if natm > 1:
                 coords = self.atoms[lst,1:]
 # possible C2 axis
-                for i in range(1, natm):
-                    if abs(coords[0]+coords[i]).sum() > TOLERANCE:
-                        maybe_cn.append((coords[0]+coords[i], 2))
-                    else: # abs(coords[0]-coords[i]).sum() > TOLERANCE:
-                        maybe_cn.append((coords[0]-coords[i], 2))
+                maybe_c2 = coords[0] + coords[1:]
+                mask = abs(maybe_c2).sum(axis=1) <= TOLERANCE
+                maybe_c2[mask] = coords[0] - coords[1:][mask]
+                vecs.append(maybe_c2)
+                ns.append(numpy.repeat(2, natm-1))
 
 # atoms of equal distances may be associated with rotation axis > C2.
                 r0 = coords - coords[0]
                 distance = norm(r0, axis=1)
-                eq_distance = abs(distance[:,None] - distance) < TOLERANCE
-                for i in range(2, natm):
-                    for j in numpy.where(eq_distance[i,:i])[0]:
-                        cos = numpy.dot(r0[i],r0[j]) / (distance[i]*distance[j])
-                        ang = numpy.arccos(cos)
-                        nfrac = numpy.pi*2 / (numpy.pi-ang)
-                        n = int(numpy.around(nfrac))
-                        if abs(nfrac-n) < TOLERANCE:
-                            maybe_cn.append((numpy.cross(r0[i],r0[j]),n))
+                i, j = _pairs_of_equal_distance(distance)
+                mask = i >= 2
+                i, j = i[mask], j[mask]
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    cos = (numpy.einsum('ix,ix->i', r0[i], r0[j]) /
+                           (distance[i]*distance[j]))
+                    ang = numpy.arccos(cos)
+                    nfrac = numpy.pi*2 / (numpy.pi-ang)
+                    n = numpy.around(nfrac)
+                    mask = abs(nfrac-n) < TOLERANCE
+                vecs.append(numpy.cross(r0[i[mask]], r0[j[mask]]))
+                ns.append(n[mask].astype(int))
+
+        if len(vecs) == 0:
+            return []
 
         # remove zero-vectors and duplicated vectors
-        vecs = numpy.vstack([x[0] for x in maybe_cn])
+        vecs = numpy.vstack(vecs)
         idx = norm(vecs, axis=1) > TOLERANCE
-        ns = numpy.hstack([x[1] for x in maybe_cn])
+        ns = numpy.hstack(ns)
         vecs = _normalize(vecs[idx])
         ns = ns[idx]
 
@@ -539,23 +556,26 @@ class SymmSys(object):
             cos = numpy.dot(vecs, _normalize(zaxis))
             vecs = vecs[(abs(cos-1) < TOLERANCE) | (abs(cos+1) < TOLERANCE)]
             ns = ns[(abs(cos-1) < TOLERANCE) | (abs(cos+1) < TOLERANCE)]
-
-        possible_cn = []
-        seen = numpy.zeros(len(vecs), dtype=bool)
-        for k, v in enumerate(vecs):
-            if not seen[k]:
-                where1 = numpy.einsum('ix->i', abs(vecs[k:] - v)) < TOLERANCE
-                where1 = numpy.where(where1)[0] + k
-                where2 = numpy.einsum('ix->i', abs(vecs[k:] + v)) < TOLERANCE
-                where2 = numpy.where(where2)[0] + k
-                seen[where1] = True
-                seen[where2] = True
-
-                vk = _normalize((numpy.einsum('ix->x', vecs[where1]) -
-                                 numpy.einsum('ix->x', vecs[where2])))
-                for n in (set(ns[where1]) | set(ns[where2])):
-                    possible_cn.append((vk,n))
-        return possible_cn
+        if len(vecs) == 0:
+            return []
+
+        # Parallel and anti-parallel vectors are grouped together.  The
+        # vectors of each group are averaged, in the direction of the first
+        # vector of the group.
+        pvecs = _pesudo_vectors(vecs)
+        first, inverse = _uniq_vectors(pvecs)
+        vsum = numpy.zeros((len(first),3))
+        for x in range(3):
+            vsum[:,x] = numpy.bincount(inverse, weights=pvecs[:,x],
+                                       minlength=len(first))
+        sign = numpy.einsum('ix,ix->i', vecs[first], pvecs[first])
+        vk = _normalize(vsum) * numpy.sign(sign).reshape(-1,1)
+
+        # Unique (vector, n) pairs, ordered by the first appearance of the
+        # vectors and by n
+        nmax = ns.max() + 1
+        key = numpy.unique(inverse * nmax + ns)
+        return [(vk[k], n) for k, n in zip(key // nmax, key % nmax)]
 
     def search_c2x(self, zaxis, n):
         '''C2 axis which is perpendicular to z-axis'''
@@ -637,6 +657,59 @@ def _vec_in_vecs(vec, vecs):
     norm = numpy.sqrt(len(vecs))
     return min(numpy.einsum('ix->i', abs(vecs-vec))/norm) < TOLERANCE
 
+def _vecs_in_kdtree(vecs, tree):
+    '''Whether all vectors can be found in the k-d tree.  The same criterion
+    as _vec_in_vecs is used for each vector.'''
+    bound = TOLERANCE * numpy.sqrt(tree.n)
+    dist = tree.query(vecs, p=1, distance_upper_bound=bound)[0]
+    return bool(numpy.all(dist < bound))
+
+def _pairs_of_equal_distance(distance):
+    '''Pairs (i,j), j < i, of which |distance[i]-distance[j]| < TOLERANCE.
+    The pairs are ordered by i then by j.'''
+    idx = numpy.argsort(distance)
+    ds = distance[idx]
+    lo = numpy.searchsorted(ds, ds-TOLERANCE, side='right')
+    hi = numpy.searchsorted(ds, ds+TOLERANCE, side='left')
+    cnt = hi - lo
+    i = numpy.repeat(idx, cnt)
+    offset = numpy.arange(cnt.sum()) - numpy.repeat(numpy.cumsum(cnt)-cnt, cnt)
+    j = idx[numpy.repeat(lo, cnt) + offset]
+    mask = j < i
+    i, j = i[mask], j[mask]
+    order = numpy.lexsort((j, i))
+    return i[order], j[order]
+
+def _uniq_vectors(vs):
+    '''Group the vectors which are identical within TOLERANCE.  Two vectors
+    are connected if their L1 distance is smaller than TOLERANCE (the
+    criterion of _vec_in_vecs).  A group is the set of connected vectors.
+
+    Returns:
+        first : indices of the first vector of each group, in the order of
+            their appearance.
+        inverse : the group id of each vector
+    '''
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    vs = numpy.asarray(vs)
+    nvs = len(vs)
+    if nvs == 0:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    pairs = numpy.array(list(cKDTree(vs).query_pairs(TOLERANCE, p=1)),
+                        dtype=int).reshape(-1,2)
+    graph = coo_matrix((numpy.ones(len(pairs)), (pairs[:,0], pairs[:,1])),
+                       shape=(nvs,nvs))
+    ngroup, label = connected_components(graph, directed=False)
+    first = numpy.empty(ngroup, dtype=int)
+    first[label[::-1]] = numpy.arange(nvs)[::-1]
+    # Relabel the groups in the order of their first appearance
+    order = numpy.argsort(first)
+    relabel = numpy.empty(ngroup, dtype=int)
+    relabel[order] = numpy.arange(ngroup)
+    return first[order], relabel[label]
+
 def _search_i_group(rawsys):
     possible_cn = rawsys.search_possible_rotations()
     c5_axes = [c5 for c5, n in possible_cn
@@ -701,10 +774,12 @@ def _search_ot_group(rawsys):
         return gpname, _make_axes(zaxis, xaxis)
 
 def _degeneracy(e, decimals):
-    e = numpy.around(e, decimals)
-    u, idx = numpy.unique(e, return_inverse=True)
-    degen = [numpy.count_nonzero(idx==i) for i in range(len(u))]
-    return degen
+    '''Number of degenerate values in each group.  Sorted values are in the
+    same group if they are separated by less than 10**-decimals.'''
+    e = numpy.sort(e)
+    boundary = numpy.hstack(([0], numpy.where(numpy.diff(e) >= .1**decimals)[0]+1,
+                             [len(e)]))
+    return numpy.diff(boundary).tolist()
 
 def _pesudo_vectors(vs):
     idy0 = abs(vs[:,1])<TOLERANCE
@@ -719,14 +794,8 @@ def _pesudo_vectors(vs):
     return vs
 
 def _remove_dupvec(vs):
-    def rm_iter(vs):
-        if len(vs) <= 1:
-            return vs
-        else:
-            x = numpy.sum(abs(vs[1:]-vs[0]), axis=1)
-            rest = rm_iter(vs[1:][x>TOLERANCE])
-            return numpy.vstack((vs[0], rest))
-    return rm_iter(_pesudo_vectors(vs))
+    vs = _pesudo_vectors(vs)
+    return vs[_uniq_vectors(vs)[0]]
 
 def _make_axes(z, x):
     y = numpy.cross(z, x)
@@ -720,6 +720,52 @@ class KnowValues(unittest.TestCase):
         geom.TOLERANCE = tolbak
         self.assertEqual(l, 'Td')
 
+    def test_large_cluster(self):
+        g = numpy.arange(-9, 10)
+        coords = numpy.array([(x,y,z) for x in g for y in g for z in g
+                              if (x+y+z) % 2 == 0], dtype=float)
+        coords = coords[numpy.einsum('ix,ix->i', coords, coords) <= 8.1**2]
+        coords = numpy.dot(coords*1.8, u)
+        atoms = [['Cu', c] for c in coords]
+        self.assertEqual(len(atoms), 1061)
+        l, orig, axes = geom.detect_symm(atoms)
+        self.assertEqual(l, 'Oh')
+        l, axes = geom.subgroup(l, axes)
+        atoms = geom.shift_atom(atoms, orig, axes)
+        self.assertTrue(geom.check_given_symm('D2h', atoms))
+
+    def test_search_possible_rotations(self):
+        coords = numpy.dot(make60(1.5, 1), u)
+        rawsys = geom.SymmSys([['C', c] for c in coords])
+        possible_cn = rawsys.search_possible_rotations()
+        cn_axes = [(n, c) for c, n in possible_cn
+                   if n in (2, 3, 5) and rawsys.has_rotation(c, n)]
+        self.assertEqual(len([c for n, c in cn_axes if n == 5]), 6)
+        self.assertEqual(len([c for n, c in cn_axes if n == 3]), 10)
+        c2_axes = numpy.array([c for n, c in cn_axes if n == 2])
+        self.assertEqual(len(geom._remove_dupvec(c2_axes)), len(c2_axes))
+
+    def test_remove_dupvec(self):
+        # Nearly identical vectors on both sides of a rounding boundary
+        z = numpy.sqrt(1 - .400005**2 - .25)
+        vs = numpy.array([[.400005+1e-9, .5, z], [.400005-1e-9, .5, z],
+                          [-.400005, -.5, -z+1e-9], [0, 0, 1.]])
+        self.assertEqual(len(geom._remove_dupvec(vs)), 2)
+
+    def test_perturbed_ih_oh(self):
+        coords0 = numpy.dot(make60(1.5, 1), u)
+        numpy.random.seed(1)
+        for i in range(5):
+            coords = coords0 + (numpy.random.random(coords0.shape)-.5) * 5e-8
+            gpname, orig, axes = geom.detect_symm([['C', c] for c in coords])
+            self.assertEqual(gpname, 'Ih')
+
+        coords0 = numpy.dot(numpy.vstack((make8(1.5), make6(1.5))), u)
+        for i in range(5):
+            coords = coords0 + (numpy.random.random(coords0.shape)-.5) * 5e-8
+            gpname, orig, axes = geom.detect_symm([['C', c] for c in coords])
+            self.assertEqual(gpname, 'Oh')
+
 
 
 def ring(n, start=0):
@@ -61,19 +61,18 @@ def gen_tda_hop(mf, fock_ao=None, singlet=True, wfnsym=None, max_memory=2000):
 
     def vind(zs):
         nz = len(zs)
+        zs = numpy.asarray(zs).reshape(nz,nvir,nocc)
         if wfnsym is not None and mol.symmetry:
-            zs = numpy.copy(zs).reshape(-1,nvir,nocc)
+            zs = numpy.copy(zs)
             zs[:,sym_forbid] = 0
-        dmvo = numpy.empty((nz,nao,nao))
-        for i, z in enumerate(zs):
-            # *2 for double occupancy
-            dmvo[i] = reduce(numpy.dot, (orbv, z.reshape(nvir,nocc)*2, orbo.T))
+        # The transition densities of all trial vectors are generated
+        # together.  *2 for double occupancy
+        dmvo = lib.einsum('xai,pa,qi->xpq', zs*2, orbv, orbo)
         v1ao = vresp(dmvo)
         #v1vo = numpy.asarray([reduce(numpy.dot, (orbv.T, v, orbo)) for v in v1ao])
         v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir,nocc)
-        for i, z in enumerate(zs):
-            v1vo[i]+= numpy.einsum('ps,sq->pq', fvv, z.reshape(nvir,nocc))
-            v1vo[i]-= numpy.einsum('ps,rp->rs', foo, z.reshape(nvir,nocc))
+        v1vo += lib.einsum('ps,xsq->xpq', fvv, zs)
+        v1vo -= lib.einsum('ps,xrp->xrs', foo, zs)
         if wfnsym is not None and mol.symmetry:
             v1vo[:,sym_forbid] = 0
         return v1vo.reshape(nz,-1)
@@ -234,31 +233,28 @@ class TDHF(TDA):
 
         def vind(xys):
             nz = len(xys)
+            # shape(nz,2,nvir,nocc): 2 ~ X,Y
+            xys = numpy.asarray(xys).reshape(nz,2,nvir,nocc)
             if wfnsym is not None and mol.symmetry:
-                # shape(nz,2,nvir,nocc): 2 ~ X,Y
-                xys = numpy.copy(zs).reshape(nz,2,nvir,nocc)
+                xys = numpy.copy(xys)
                 xys[:,:,sym_forbid] = 0
-            dms = numpy.empty((nz,nao,nao))
-            for i in range(nz):
-                x, y = xys[i].reshape(2,nvir,nocc)
-                # *2 for double occupancy
-                dmx = reduce(numpy.dot, (orbv, x*2, orbo.T))
-                dmy = reduce(numpy.dot, (orbo, y.T*2, orbv.T))
-                dms[i] = dmx + dmy  # AX + BY
+            xs = xys[:,0]
+            ys = xys[:,1]
+            # *2 for double occupancy
+            dms = lib.einsum('xai,pa,qi->xpq', xs*2, orbv, orbo)
+            dms+= lib.einsum('xai,pi,qa->xpq', ys*2, orbo, orbv)  # AX + BY
 
             v1ao = vresp(dms)
             v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir,nocc)
             v1ov = _ao2mo.nr_e2(v1ao, mo_coeff, (0,nocc,nocc,nmo))
             v1ov = v1ov.reshape(-1,nocc,nvir).transpose(0,2,1)
             hx = numpy.empty((nz,2,nvir,nocc), dtype=v1vo.dtype)
-            for i in range(nz):
-                x, y = xys[i].reshape(2,nvir,nocc)
-                hx[i,0] = v1vo[i]
-                hx[i,0]+= numpy.einsum('ps,sq->pq', fvv, x)  # AX
-                hx[i,0]-= numpy.einsum('ps,rp->rs', foo, x)  # AX
-                hx[i,1] =-v1ov[i]
-                hx[i,1]-= numpy.einsum('ps,sq->pq', fvv, y)  #-AY
-                hx[i,1]+= numpy.einsum('ps,rp->rs', foo, y)  #-AY
+            hx[:,0] = v1vo
+            hx[:,0]+= lib.einsum('ps,xsq->xpq', fvv, xs)  # AX
+            hx[:,0]-= lib.einsum('ps,xrp->xrs', foo, xs)  # AX
+            hx[:,1] =-v1ov
+            hx[:,1]-= lib.einsum('ps,xsq->xpq', fvv, ys)  #-AY
+            hx[:,1]+= lib.einsum('ps,xrp->xrs', foo, ys)  #-AY
 
             if wfnsym is not None and mol.symmetry:
                 hx[:,:,sym_forbid] = 0
@@ -7,7 +7,6 @@
 # J. Mol. Struct. THEOCHEM, 914, 3
 #
 
-from functools import reduce
 import numpy
 from pyscf import lib
 from pyscf.dft import numint
@@ -57,17 +56,16 @@ class TDDFTNoHybrid(TDA):
 
         def vind(zs):
             nz = len(zs)
-            dmvo = numpy.empty((nz,nao,nao))
-            for i, z in enumerate(zs):
-                # *2 for double occupancy
-                dm = reduce(numpy.dot, (orbv, (dai*z).reshape(nvir,nocc)*2, orbo.T))
-                dmvo[i] = dm + dm.T # +cc for A+B and K_{ai,jb} in A == K_{ai,bj} in B
+            zs = numpy.asarray(zs).reshape(nz,-1)
+            # *2 for double occupancy
+            dmvo = lib.einsum('xai,pa,qi->xpq', (zs*dai*2).reshape(nz,nvir,nocc),
+                              orbv, orbo)
+            dmvo = dmvo + dmvo.transpose(0,2,1) # +cc for A+B and K_{ai,jb} in A == K_{ai,bj} in B
             v1ao = vresp(dmvo)
             v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
-            for i, z in enumerate(zs):
-                # numpy.sqrt(eai) * (eai*dai*z + v1vo)
-                v1vo[i] += edai*z
-                v1vo[i] *= dai
+            # numpy.sqrt(eai) * (eai*dai*z + v1vo)
+            v1vo += edai*zs
+            v1vo *= dai
             return v1vo.reshape(nz,-1)
 
         return vind, hdiag
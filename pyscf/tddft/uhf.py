@@ -3,7 +3,6 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
-from functools import reduce
 import numpy
 from pyscf import lib
 from pyscf.lib import logger
@@ -62,21 +61,18 @@ def gen_tda_hop(mf, fock_ao=None, wfnsym=None, max_memory=2000):
         if wfnsym is not None and mol.symmetry:
             zs = numpy.copy(zs)
             zs[:,sym_forbid] = 0
+        zs = numpy.asarray(zs).reshape(nz,-1)
+        zas = zs[:,:nocca*nvira].reshape(nz,nvira,nocca)
+        zbs = zs[:,nocca*nvira:].reshape(nz,nvirb,noccb)
         dmvo = numpy.empty((2,nz,nao,nao))
-        for i, z in enumerate(zs):
-            za = z[:nocca*nvira].reshape(nvira,nocca)
-            zb = z[nocca*nvira:].reshape(nvirb,noccb)
-            dmvo[0,i] = reduce(numpy.dot, (orbva, za, orboa.T))
-            dmvo[1,i] = reduce(numpy.dot, (orbvb, zb, orbob.T))
+        dmvo[0] = lib.einsum('xai,pa,qi->xpq', zas, orbva, orboa)
+        dmvo[1] = lib.einsum('xai,pa,qi->xpq', zbs, orbvb, orbob)
 
         v1ao = vresp(dmvo)
         v1a = _ao2mo.nr_e2(v1ao[0], mo_a, (nocca,nmo,0,nocca)).reshape(-1,nvira,nocca)
         v1b = _ao2mo.nr_e2(v1ao[1], mo_b, (noccb,nmo,0,noccb)).reshape(-1,nvirb,noccb)
-        for i, z in enumerate(zs):
-            za = z[:nocca*nvira].reshape(nvira,nocca)
-            zb = z[nocca*nvira:].reshape(nvirb,noccb)
-            v1a[i] += numpy.einsum('ai,ai->ai', e_ai_a, za)
-            v1b[i] += numpy.einsum('ai,ai->ai', e_ai_b, zb)
+        v1a += e_ai_a * zas
+        v1b += e_ai_b * zbs
         hx = numpy.hstack((v1a.reshape(nz,-1), v1b.reshape(nz,-1)))
         if wfnsym is not None and mol.symmetry:
             hx[:,sym_forbid] = 0
@@ -219,23 +215,21 @@ class TDHF(TDA):
 
         def vind(xys):
             nz = len(xys)
+            # shape(nz,2,-1): 2 ~ X,Y
+            xys = numpy.asarray(xys).reshape(nz,2,-1)
             if wfnsym is not None and mol.symmetry:
-                # shape(nz,2,-1): 2 ~ X,Y
-                xys = numpy.copy(zs).reshape(nz,2,-1)
-                xys[:,:,:,sym_forbid] = 0
+                xys = numpy.copy(xys)
+                xys[:,:,sym_forbid] = 0
+            xs, ys = xys.transpose(1,0,2)
+            xas = xs[:,:nocca*nvira].reshape(nz,nvira,nocca)
+            xbs = xs[:,nocca*nvira:].reshape(nz,nvirb,noccb)
+            yas = ys[:,:nocca*nvira].reshape(nz,nvira,nocca)
+            ybs = ys[:,nocca*nvira:].reshape(nz,nvirb,noccb)
             dms = numpy.empty((2,nz,nao,nao)) # 2 ~ alpha,beta
-            for i in range(nz):
-                x, y = xys[i].reshape(2,-1)
-                xa = x[:nocca*nvira].reshape(nvira,nocca)
-                xb = x[nocca*nvira:].reshape(nvirb,noccb)
-                ya = y[:nocca*nvira].reshape(nvira,nocca)
-                yb = y[nocca*nvira:].reshape(nvirb,noccb)
-                dmx = reduce(numpy.dot, (orbva, xa, orboa.T))
-                dmy = reduce(numpy.dot, (orboa, ya.T, orbva.T))
-                dms[0,i] = dmx + dmy  # AX + BY
-                dmx = reduce(numpy.dot, (orbvb, xb, orbob.T))
-                dmy = reduce(numpy.dot, (orbob, yb.T, orbvb.T))
-                dms[1,i] = dmx + dmy  # AX + BY
+            dms[0] = lib.einsum('xai,pa,qi->xpq', xas, orbva, orboa)
+            dms[0]+= lib.einsum('xai,pi,qa->xpq', yas, orboa, orbva)  # AX + BY
+            dms[1] = lib.einsum('xai,pa,qi->xpq', xbs, orbvb, orbob)
+            dms[1]+= lib.einsum('xai,pi,qa->xpq', ybs, orbob, orbvb)  # AX + BY
 
             v1ao  = vresp(dms)
             v1avo = _ao2mo.nr_e2(v1ao[0], mo_a, (nocca,nmo,0,nocca))
@@ -243,14 +237,12 @@ class TDHF(TDA):
             v1aov = _ao2mo.nr_e2(v1ao[0], mo_a, (0,nocca,nocca,nmo))
             v1bov = _ao2mo.nr_e2(v1ao[1], mo_b, (0,noccb,noccb,nmo))
             hx = numpy.empty((nz,2,nvira*nocca+nvirb*noccb), dtype=v1avo.dtype)
-            for i in range(nz):
-                x, y = xys[i].reshape(2,-1)
-                hx[i,0,:nvira*nocca] = v1avo[i].ravel()
-                hx[i,0,nvira*nocca:] = v1bvo[i].ravel()
-                hx[i,0]+= e_ai * x  # AX
-                hx[i,1,:nvira*nocca] =-v1aov[i].reshape(nocca,nvira).T.ravel()
-                hx[i,1,nvira*nocca:] =-v1bov[i].reshape(noccb,nvirb).T.ravel()
-                hx[i,1]-= e_ai * y  #-AY
+            hx[:,0,:nvira*nocca] = v1avo.reshape(nz,-1)
+            hx[:,0,nvira*nocca:] = v1bvo.reshape(nz,-1)
+            hx[:,0]+= e_ai * xs  # AX
+            hx[:,1,:nvira*nocca] =-v1aov.reshape(nz,nocca,nvira).transpose(0,2,1).reshape(nz,-1)
+            hx[:,1,nvira*nocca:] =-v1bov.reshape(nz,noccb,nvirb).transpose(0,2,1).reshape(nz,-1)
+            hx[:,1]-= e_ai * ys  #-AY
 
             if wfnsym is not None and mol.symmetry:
                 hx[:,:,sym_forbid] = 0
@@ -7,13 +7,20 @@ import numpy
 import time
 import pyscf
 from pyscf import lib
-from pyscf.dft import numint, gen_grid
+from pyscf import gto
+from pyscf.dft import numint
 
 '''
 Gaussian cube file format
+
+The grid is evaluated slab by slab (a slab being a few x-planes of the grid)
+with the AO screening table non0tab.  The text of each slab is formatted and
+written in a background thread while the next slab is being evaluated, so
+that the memory footprint does not grow with the size of the grid.
 '''
 
-def density(mol, outfile, dm, nx=80, ny=80, nz=80):
+def density(mol, outfile, dm, nx=80, ny=80, nz=80, max_memory=None,
+            slab_size=None):
     """Calculates electron density.
 
     Args:
@@ -27,53 +34,81 @@ def density(mol, outfile, dm, nx=80, ny=80, nz=80):
         ny (int): Number of grid point divisions in y direction.
         nz (int): Number of grid point divisions in z direction.
 
+    Kwargs:
+        slab_size (int): Number of x-planes evaluated in one pass.  It is
+            estimated from max_memory by default.
+    """
+    nao = mol.nao_nr()
+    def eval_blk(coords):
+        non0tab = numint.make_mask(mol, coords)
+        ao = numint.eval_ao(mol, coords, non0tab=non0tab)
+        return numint.eval_rho(mol, ao, dm, non0tab=non0tab).reshape(1,-1)
+
+    cube = Cube(mol, nx, ny, nz)
+    cube.write([outfile], ['Electron density in real space (e/Bohr^3)'],
+               eval_blk, nao+2, max_memory, slab_size)
+    return cube
+
+def orbital(mol, outfile, coeff, nx=80, ny=80, nz=80, max_memory=None,
+            slab_size=None):
+    """Calculates the values of one orbital on the cube grid.
 
+    Args:
+        mol (Mole): Molecule to calculate the orbital for.
+        outfile (str): Name of Cube file to be written.
+        coeff : 1D array
+            The coefficients of the orbital in AO basis.
+
+    Kwargs:
+        nx, ny, nz (int): Number of grid point divisions in x, y, z direction.
     """
+    coeff = numpy.asarray(coeff).reshape(-1,1)
+    return orbitals(mol, [outfile], coeff, nx, ny, nz, max_memory, slab_size)
 
-    coord = mol.atom_coords()
-    box = numpy.max(coord,axis=0) - numpy.min(coord,axis=0) + 6
-    boxorig = numpy.min(coord,axis=0) - 3
-    xs = numpy.arange(nx) * (box[0]/nx)
-    ys = numpy.arange(ny) * (box[1]/ny)
-    zs = numpy.arange(nz) * (box[2]/nz)
-    coords = lib.cartesian_prod([xs,ys,zs])
-    coords = numpy.asarray(coords, order='C') - (-boxorig)
-
-    ngrids = nx * ny * nz
-    blksize = min(8000, ngrids)
-    rho = numpy.empty(ngrids)
-    ao = None
-    for ip0, ip1 in gen_grid.prange(0, ngrids, blksize):
-        ao = numint.eval_ao(mol, coords[ip0:ip1], out=ao)
-        rho[ip0:ip1] = numint.eval_rho(mol, ao, dm)
-    rho = rho.reshape(nx,ny,nz)
-
-    with open(outfile, 'w') as f:
-        f.write('Electron density in real space (e/Bohr^3)\n')
-        f.write('PySCF Version: %s  Date: %s\n' % (pyscf.__version__, time.ctime()))
-        f.write('%5d' % mol.natm)
-        f.write('%12.6f%12.6f%12.6f\n' % tuple(boxorig.tolist()))
-        f.write('%5d%12.6f%12.6f%12.6f\n' % (nx, xs[1], 0, 0))
-        f.write('%5d%12.6f%12.6f%12.6f\n' % (ny, 0, ys[1], 0))
-        f.write('%5d%12.6f%12.6f%12.6f\n' % (nz, 0, 0, zs[1]))
-        for ia in range(mol.natm):
-            chg = mol.atom_charge(ia)
-            f.write('%5d%12.6f'% (chg, chg))
-            f.write('%12.6f%12.6f%12.6f\n' % tuple(coord[ia]))
+def orbitals(mol, outfiles, mo_coeff, nx=80, ny=80, nz=80, max_memory=None,
+             slab_size=None):
+    """Calculates the values of a batch of orbitals on the cube grid.  All
+    orbitals are evaluated in one pass over the grid and are written to
+    separated cube files.
+
+    Args:
+        mol (Mole): Molecule to calculate the orbitals for.
+        outfiles (list of str): Names of Cube files, one for each orbital.
+            A format string (e.g. 'mo_%d.cube') is also accepted.  It is
+            filled with the index of the orbital.
+        mo_coeff : 2D array
+            The coefficients of the orbitals (in columns) in AO basis.
+
+    Kwargs:
+        nx, ny, nz (int): Number of grid point divisions in x, y, z direction.
+        slab_size (int): Number of x-planes evaluated in one pass.  It is
+            estimated from max_memory by default.
 
-        for ix in range(nx):
-            for iy in range(ny):
-                for iz in range(0,nz,6):
-                    remainder  = (nz-iz)
-                    if (remainder > 6 ):
-                        fmt = '%13.5E' * 6 + '\n'
-                        f.write(fmt % tuple(rho[ix,iy,iz:iz+6].tolist()))
-                    else:
-                        fmt = '%13.5E' * remainder + '\n'
-                        f.write(fmt % tuple(rho[ix,iy,iz:iz+remainder].tolist()))
-                        break
-
-def mep(mol, outfile, dm, nx=80, ny=80, nz=80):
+    Examples:
+
+    >>> mf = scf.RHF(mol).run()
+    >>> cubegen.orbitals(mol, 'h2o_mo%d.cube', mf.mo_coeff[:,:10])
+    """
+    mo_coeff = numpy.asarray(mo_coeff)
+    if mo_coeff.ndim == 1:
+        mo_coeff = mo_coeff.reshape(-1,1)
+    nao, nmo = mo_coeff.shape
+    if isinstance(outfiles, str):
+        outfiles = [outfiles % i for i in range(nmo)]
+    assert(len(outfiles) == nmo)
+
+    def eval_blk(coords):
+        non0tab = numint.make_mask(mol, coords)
+        ao = numint.eval_ao(mol, coords, non0tab=non0tab)
+        return lib.dot(mo_coeff.T, ao.T)
+
+    cube = Cube(mol, nx, ny, nz)
+    cube.write(outfiles, ['Orbital value in real space'] * nmo,
+               eval_blk, nao+nmo*2, max_memory, slab_size)
+    return cube
+
+def mep(mol, outfile, dm, nx=80, ny=80, nz=80, max_memory=None,
+        slab_size=None):
     """Calculates the molecular electrostatic potential (MEP).
 
     Args:
@@ -87,63 +122,130 @@ def mep(mol, outfile, dm, nx=80, ny=80, nz=80):
         ny (int): Number of grid point divisions in y direction.
         nz (int): Number of grid point divisions in z direction.
 
-
+    Kwargs:
+        slab_size (int): Number of x-planes evaluated in one pass.  It is
+            estimated from max_memory by default.
     """
+    from pyscf.df import incore
+    nao = mol.nao_nr()
+    charges = mol.atom_charges()
+    atom_coords = mol.atom_coords()
+    # The potential of the electron density is evaluated with the integrals
+    # (ij|g) of the sharp Gaussian functions g placed on the grid points.
+    # The 2-fold symmetry of ij is used for the contraction with dm.
+    dm = numpy.asarray(dm)
+    dm_tril = lib.pack_tril(dm + dm.T)
+    idx = numpy.arange(nao)
+    dm_tril[idx*(idx+1)//2+idx] *= .5
+    intor = mol._add_suffix('int3c2e')
+
+    def eval_blk(coords):
+        # Nuclear potential at given points
+        rp = coords[None,:,:] - atom_coords[:,None,:]
+        Vnuc = numpy.dot(charges, 1./numpy.sqrt(numpy.einsum('zpx,zpx->zp', rp, rp)))
+        # Potential of electron density
+        fakemol = gto.fakemol_for_charges(coords)
+        Vele = lib.dot(dm_tril, incore.aux_e2(mol, fakemol, intor, aosym='s2ij'))
+        # MEP at each point
+        return (Vnuc - Vele).reshape(1,-1)
+
+    cube = Cube(mol, nx, ny, nz)
+    cube.write([outfile], ['Molecular electrostatic potential in real space'],
+               eval_blk, nao*(nao+1)//2+mol.natm+2, max_memory, slab_size)
+    return cube
 
-    coord = mol.atom_coords()
-    box = numpy.max(coord,axis=0) - numpy.min(coord,axis=0) + 6
-    boxorig = numpy.min(coord,axis=0) - 3
-    xs = numpy.arange(nx) * (box[0]/nx)
-    ys = numpy.arange(ny) * (box[1]/ny)
-    zs = numpy.arange(nz) * (box[2]/nz)
-    coords = lib.cartesian_prod([xs,ys,zs])
-    coords = numpy.asarray(coords, order='C') - (-boxorig)
-
-    # Nuclear potential at given points
-    Vnuc = 0
-    for i in range(mol.natm):
-       r = mol.atom_coord(i)
-       Z = mol.atom_charge(i)
-       rp = r - coords
-       Vnuc += Z / numpy.einsum('xi,xi->x', rp, rp)**.5
-
-    # Potential of electron density
-    Vele = []
-    for p in coords:
-        mol.set_rinv_orig_(p)
-        Vele.append(numpy.einsum('ij,ij', mol.intor('cint1e_rinv_sph'), dm))
-
-    # MEP at each point
-    MEP = Vnuc - Vele
-
-    MEP = numpy.asarray(MEP)
-    MEP = MEP.reshape(nx,ny,nz)
-
-    with open(outfile, 'w') as f:
-        f.write('Molecular electrostatic potential in real space\n')
+
+class Cube(object):
+    '''The grid of cube files.  The box encloses the molecule with 3 Bohr of
+    margin on each side.
+    '''
+    def __init__(self, mol, nx=80, ny=80, nz=80, margin=3.):
+        self.mol = mol
+        coord = mol.atom_coords()
+        self.box = numpy.max(coord,axis=0) - numpy.min(coord,axis=0) + margin*2
+        self.boxorig = numpy.min(coord,axis=0) - margin
+        self.nx = nx
+        self.ny = ny
+        self.nz = nz
+        self.xs = numpy.arange(nx) * (self.box[0]/nx)
+        self.ys = numpy.arange(ny) * (self.box[1]/ny)
+        self.zs = numpy.arange(nz) * (self.box[2]/nz)
+
+    def get_coords(self, ix0=0, ix1=None):
+        '''Coordinates of the grid points in the x-planes ix0:ix1'''
+        coords = lib.cartesian_prod([self.xs[ix0:ix1], self.ys, self.zs])
+        return numpy.asarray(coords, order='C') - (-self.boxorig)
+
+    def get_ngrids(self):
+        return self.nx * self.ny * self.nz
+
+    def write_header(self, f, comment):
+        mol = self.mol
+        coord = mol.atom_coords()
+        f.write(comment + '\n')
         f.write('PySCF Version: %s  Date: %s\n' % (pyscf.__version__, time.ctime()))
         f.write('%5d' % mol.natm)
-        f.write('%12.6f%12.6f%12.6f\n' % tuple(boxorig.tolist()))
-        f.write('%5d%12.6f%12.6f%12.6f\n' % (nx, xs[1], 0, 0))
-        f.write('%5d%12.6f%12.6f%12.6f\n' % (ny, 0, ys[1], 0))
-        f.write('%5d%12.6f%12.6f%12.6f\n' % (nz, 0, 0, zs[1]))
+        f.write('%12.6f%12.6f%12.6f\n' % tuple(self.boxorig.tolist()))
+        f.write('%5d%12.6f%12.6f%12.6f\n' % (self.nx, self.box[0]/self.nx, 0, 0))
+        f.write('%5d%12.6f%12.6f%12.6f\n' % (self.ny, 0, self.box[1]/self.ny, 0))
+        f.write('%5d%12.6f%12.6f%12.6f\n' % (self.nz, 0, 0, self.box[2]/self.nz))
         for ia in range(mol.natm):
             chg = mol.atom_charge(ia)
             f.write('%5d%12.6f'% (chg, chg))
             f.write('%12.6f%12.6f%12.6f\n' % tuple(coord[ia]))
 
-        for ix in range(nx):
-            for iy in range(ny):
-                for iz in range(0,nz,6):
-                    remainder  = (nz-iz)
-                    if (remainder > 6 ):
-                        fmt = '%13.5E' * 6 + '\n'
-                        f.write(fmt % tuple(MEP[ix,iy,iz:iz+6].tolist()))
-                    else:
-                        fmt = '%13.5E' * remainder + '\n'
-                        f.write(fmt % tuple(MEP[ix,iy,iz:iz+remainder].tolist()))
-                        break
+    def format_values(self, values):
+        '''Format the values of whole x-planes.  Each z-column is written in
+        lines of 6 numbers.
+        '''
+        nz = self.nz
+        values = numpy.asarray(values).reshape(-1,nz)
+        fmt = ('%13.5E' * 6 + '\n') * (nz // 6)
+        if nz % 6 > 0:
+            fmt += '%13.5E' * (nz % 6) + '\n'
+        return (fmt * len(values)) % tuple(values.ravel().tolist())
 
+    def write(self, outfiles, comments, eval_blk, nvec_per_point=1,
+              max_memory=None, slab_size=None):
+        '''Evaluate the grid slab by slab and write the values to cube files.
+
+        Args:
+            eval_blk : function(coords) => (nset,ngrids) array
+                Values of all cube files on the given grid points.
+            nvec_per_point : int
+                Number of doubles which eval_blk needs for each grid point.
+                It is used to estimate the size of the slab.
+            slab_size : int
+                Number of x-planes in a slab.  If not given, it is estimated
+                from max_memory.
+        '''
+        if slab_size is None:
+            if max_memory is None:
+                max_memory = self.mol.max_memory
+            mem_now = lib.current_memory()[0]
+            max_memory = max(2000, max_memory - mem_now)
+            plane = self.ny * self.nz
+            # Memory of evaluation and of the formatted text (~2 copies in flight)
+            blksize = int(max_memory*1e6/8/(nvec_per_point+len(outfiles)*8))
+            blknx = max(1, min(self.nx, blksize//plane))
+        else:
+            blknx = max(1, slab_size)
+
+        fs = [open(fname, 'w') for fname in outfiles]
+        try:
+            for f, comment in zip(fs, comments):
+                self.write_header(f, comment)
+
+            def write_blk(values):
+                for f, v in zip(fs, values):
+                    f.write(self.format_values(v))
+            with lib.call_in_background(write_blk) as async_write:
+                for ix0, ix1 in lib.prange(0, self.nx, blknx):
+                    values = eval_blk(self.get_coords(ix0, ix1))
+                    async_write(values)
+        finally:
+            for f in fs:
+                f.close()
 
 
 if __name__ == '__main__':
@@ -154,4 +256,4 @@ if __name__ == '__main__':
     mf.scf()
     cubegen.density(mol, 'h2o_den.cube', mf.make_rdm1())
     cubegen.mep(mol, 'h2o_pot.cube', mf.make_rdm1())
-
+    cubegen.orbitals(mol, 'h2o_mo%d.cube', mf.mo_coeff[:,:6])
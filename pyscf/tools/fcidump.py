@@ -1,9 +1,14 @@
 #!/usr/bin/env python
 
+import itertools
 from functools import reduce
 import numpy
+from pyscf import lib
+from pyscf import ao2mo
 
 DEFAULT_FLOAT_FORMAT = ' %.16g'
+# Number of integrals (lines) to process in each block
+BLKSIZE = 1 << 18
 
 def write_head(fout, nmo, nelec, ms=0, orbsym=None):
     if not isinstance(nelec, (int, numpy.number)):
@@ -19,43 +24,58 @@ def write_head(fout, nmo, nelec, ms=0, orbsym=None):
 
 
 def write_eri(fout, eri, nmo, tol=1e-15, float_format=DEFAULT_FLOAT_FORMAT):
+    '''Write the 4-fold (2D array) or 8-fold (1D array) symmetric 2-electron
+    integrals.  The integrals are processed in blocks of the pair index ij.
+    eri can be a h5py dataset.
+    '''
     npair = nmo*(nmo+1)//2
     output_format = float_format + ' %4d %4d %4d %4d\n'
+    idx, jdx = numpy.tril_indices(nmo)
     if eri.ndim == 2: # 4-fold symmetry
         assert(eri.size == npair**2)
-        ij = 0
-        for i in range(nmo):
-            for j in range(0, i+1):
-                kl = 0
-                for k in range(0, nmo):
-                    for l in range(0, k+1):
-                        if abs(eri[ij,kl]) > tol:
-                            fout.write(output_format % (eri[ij,kl], i+1, j+1, k+1, l+1))
-                        kl += 1
-                ij += 1
+        blksize = max(1, BLKSIZE//npair)
+        for ij0, ij1 in _prange(0, npair, blksize):
+            v = numpy.asarray(eri[ij0:ij1]).ravel()
+            mask = abs(v) > tol
+            ij, kl = numpy.divmod(numpy.where(mask)[0], npair)
+            ij += ij0
+            _write_lines(fout, output_format, v[mask],
+                         idx[ij], jdx[ij], idx[kl], jdx[kl])
     else:  # 8-fold symmetry
         assert(eri.size == npair*(npair+1)//2)
-        ij = 0
-        ijkl = 0
-        for i in range(nmo):
-            for j in range(0, i+1):
-                kl = 0
-                for k in range(0, i+1):
-                    for l in range(0, k+1):
-                        if ij >= kl:
-                            if abs(eri[ijkl]) > tol:
-                                fout.write(output_format % (eri[ijkl], i+1, j+1, k+1, l+1))
-                            ijkl += 1
-                        kl += 1
-                ij += 1
+        blksize = max(1, int(numpy.sqrt(BLKSIZE)))
+        for ij0, ij1 in _prange(0, npair, blksize):
+            p0 = ij0*(ij0+1)//2
+            p1 = ij1*(ij1+1)//2
+            v = numpy.asarray(eri[p0:p1])
+            # For row ij, kl runs over 0 .. ij
+            ij = numpy.repeat(numpy.arange(ij0, ij1), numpy.arange(ij0, ij1)+1)
+            kl = numpy.arange(p0, p1) - ij*(ij+1)//2
+            mask = abs(v) > tol
+            ij = ij[mask]
+            kl = kl[mask]
+            _write_lines(fout, output_format, v[mask],
+                         idx[ij], jdx[ij], idx[kl], jdx[kl])
+
+def _write_lines(fout, output_format, vals, i, j, k, l):
+    lines = [output_format % x for x in
+             zip(vals.tolist(), (i+1).tolist(), (j+1).tolist(),
+                 (k+1).tolist(), (l+1).tolist())]
+    fout.write(''.join(lines))
+
+def _prange(start, end, step):
+    for i in range(start, end, step):
+        yield i, min(i+step, end)
 
 def write_hcore(fout, h, nmo, tol=1e-15, float_format=DEFAULT_FLOAT_FORMAT):
-    h = h.reshape(nmo,nmo)
+    h = numpy.asarray(h).reshape(nmo,nmo)
     output_format = float_format + ' %4d %4d  0  0\n'
-    for i in range(nmo):
-        for j in range(0, i+1):
-            if abs(h[i,j]) > tol:
-                fout.write(output_format % (h[i,j], i+1, j+1))
+    idx, jdx = numpy.tril_indices(nmo)
+    v = h[idx,jdx]
+    mask = abs(v) > tol
+    lines = [output_format % x for x in
+             zip(v[mask].tolist(), (idx[mask]+1).tolist(), (jdx[mask]+1).tolist())]
+    fout.write(''.join(lines))
 
 
 def from_chkfile(output, chkfile, tol=1e-15, float_format=DEFAULT_FLOAT_FORMAT):
@@ -125,34 +145,107 @@ def read(filename):
     norb_pair = norb * (norb+1) // 2
     h1e = numpy.zeros((norb,norb))
     h2e = numpy.zeros(norb_pair*(norb_pair+1)//2)
-    dat = finp.readline().split()
-    while dat:
-        i, j, k, l = [int(x) for x in dat[1:5]]
-        if k != 0:
-            if i >= j:
-                ij = i * (i-1) // 2 + j-1
-            else:
-                ij = j * (j-1) // 2 + i-1
-            if k >= l:
-                kl = k * (k-1) // 2 + l-1
-            else:
-                kl = l * (l-1) // 2 + k-1
-            if ij >= kl:
-                h2e[ij*(ij+1)//2+kl] = float(dat[0])
-            else:
-                h2e[kl*(kl+1)//2+ij] = float(dat[0])
-        elif k == 0:
-            if j != 0:
-                h1e[i-1,j-1] = float(dat[0])
-            else:
-                dic['ECORE'] = float(dat[0])
-        dat = finp.readline().split()
+    while True:
+        # Parse the integrals in chunks of BLKSIZE lines
+        lines = list(itertools.islice(finp, BLKSIZE))
+        if not lines:
+            break
+        dat = ' '.join(lines)
+        if 'D' in dat or 'd' in dat:  # Fortran double precision exponent
+            dat = dat.replace('D', 'E').replace('d', 'e')
+        dat = numpy.array(dat.split(), dtype=float).reshape(-1,5)
+        val = dat[:,0]
+        i, j, k, l = dat[:,1:].T.astype(int)
+
+        mask = k != 0
+        ij = _pair_index(i[mask], j[mask])
+        kl = _pair_index(k[mask], l[mask])
+        ijkl = numpy.maximum(ij, kl)
+        ijkl = ijkl*(ijkl+1)//2 + numpy.minimum(ij, kl)
+        h2e[ijkl] = val[mask]
+
+        mask = (k == 0) & (j != 0)
+        h1e[i[mask]-1,j[mask]-1] = val[mask]
+
+        mask = (k == 0) & (j == 0)
+        if mask.any():
+            dic['ECORE'] = val[mask][-1]
 
     dic['H1'] = h1e
     dic['H2'] = h2e
     finp.close()
     return dic
 
+def _pair_index(i, j):
+    '''Compound index of the 1-based orbital indices i, j'''
+    ij = numpy.maximum(i, j)
+    return ij*(ij-1)//2 + numpy.minimum(i, j) - 1
+
+
+def write_binary(filename, h1e, h2e, nmo, nelec, nuc=0, ms=0, orbsym=None,
+                 isym=1):
+    '''Save the integrals in the binary (HDF5) variant of FCIDUMP.  The file
+    holds the header entries NORB, NELEC, MS2, ORBSYM, ISYM, ECORE, the
+    lower triangular part of the 1-electron integrals (H1) and the 8-fold
+    symmetric 2-electron integrals (H2) as packed arrays.
+    '''
+    import h5py
+    if not isinstance(nelec, (int, numpy.number)):
+        ms = abs(nelec[0] - nelec[1])
+        nelec = nelec[0] + nelec[1]
+    if orbsym is None or len(orbsym) == 0:
+        orbsym = [1] * nmo
+    npair = nmo*(nmo+1)//2
+    with h5py.File(filename, 'w') as f:
+        f['NORB'] = nmo
+        f['NELEC'] = nelec
+        f['MS2'] = ms
+        f['ORBSYM'] = numpy.asarray(orbsym, dtype=int)
+        f['ISYM'] = isym
+        f['ECORE'] = nuc
+        f['H1'] = lib.pack_tril(numpy.asarray(h1e).reshape(nmo,nmo))
+        h2e = numpy.asarray(h2e)
+        if h2e.size == npair*(npair+1)//2:
+            f['H2'] = h2e.ravel()
+        else:
+            f['H2'] = ao2mo.restore(8, h2e, nmo)
+
+def read_binary(filename):
+    '''Load the binary FCIDUMP saved by :func:`write_binary`.  Return the
+    same dictionary as :func:`read`.
+    '''
+    import h5py
+    dic = {}
+    with h5py.File(filename, 'r') as f:
+        for key in ('NORB', 'NELEC', 'MS2', 'ISYM'):
+            dic[key] = int(f[key][()])
+        dic['ECORE'] = float(f['ECORE'][()])
+        dic['ORBSYM'] = f['ORBSYM'][:].tolist()
+        dic['H1'] = lib.unpack_tril(f['H1'][:])
+        dic['H2'] = f['H2'][:]
+    return dic
+
+def text_to_binary(fcidump, binfile):
+    '''Convert the text FCIDUMP to the binary variant'''
+    dic = read(fcidump)
+    write_binary(binfile, dic['H1'], dic['H2'], dic['NORB'], dic['NELEC'],
+                 dic.get('ECORE', 0), dic['MS2'], dic['ORBSYM'],
+                 dic.get('ISYM', 1))
+
+def binary_to_text(binfile, fcidump, tol=1e-15,
+                   float_format=DEFAULT_FLOAT_FORMAT):
+    '''Convert the binary FCIDUMP to the text format.  The 2-electron
+    integrals are streamed from the binary file in blocks.'''
+    import h5py
+    with h5py.File(binfile, 'r') as f, open(fcidump, 'w') as fout:
+        nmo = int(f['NORB'][()])
+        write_head(fout, nmo, int(f['NELEC'][()]), int(f['MS2'][()]),
+                   f['ORBSYM'][:].tolist())
+        write_eri(fout, f['H2'], nmo, tol, float_format)
+        write_hcore(fout, lib.unpack_tril(f['H1'][:]), nmo, tol, float_format)
+        output_format = float_format + '  0  0  0  0\n'
+        fout.write(output_format % float(f['ECORE'][()]))
+
 if __name__ == '__main__':
     import sys
     # fcidump.py chkfile output
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import numpy
+from pyscf import lib
+from pyscf import gto, scf
+from pyscf.dft import numint
+from pyscf.tools import cubegen
+
+mol = gto.Mole()
+mol.atom = '''
+O  0.00000000,  0.000000,  0.000000
+H  0.761561,    0.478993,  0.000000
+H -0.761561,    0.478993,  0.000000'''
+mol.basis = '6-31g'
+mol.verbose = 0
+mol.build()
+mf = scf.RHF(mol).run()
+
+def read_cube(fname, nx, ny, nz):
+    with open(fname, 'r') as f:
+        lines = f.readlines()
+    natm = int(lines[2].split()[0])
+    dat = ' '.join(lines[6+natm:]).split()
+    return numpy.asarray(dat, dtype=float).reshape(nx,ny,nz)
+
+class KnowValues(unittest.TestCase):
+    def test_density(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        dm = mf.make_rdm1()
+        cube = cubegen.density(mol, ftmp.name, dm, 10, 11, 13)
+        rho = read_cube(ftmp.name, 10, 11, 13)
+        ao = numint.eval_ao(mol, cube.get_coords())
+        ref = numint.eval_rho(mol, ao, dm).reshape(10,11,13)
+        self.assertAlmostEqual(abs(rho-ref).max(), 0, 5)
+
+        # Evaluate the grid in slabs of 3 x-planes
+        ftmp1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        cubegen.density(mol, ftmp1.name, dm, 10, 11, 13, slab_size=3)
+        rho1 = read_cube(ftmp1.name, 10, 11, 13)
+        self.assertAlmostEqual(abs(rho1-rho).max(), 0, 12)
+
+    def test_orbitals(self):
+        nocc = mol.nelectron // 2
+        ftmps = [tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+                 for i in range(nocc)]
+        cube = cubegen.orbitals(mol, [f.name for f in ftmps],
+                                mf.mo_coeff[:,:nocc], 12, 9, 6)
+        rho = 0
+        for f in ftmps:
+            rho += read_cube(f.name, 12, 9, 6)**2 * 2
+        ao = numint.eval_ao(mol, cube.get_coords())
+        ref = numint.eval_rho(mol, ao, mf.make_rdm1()).reshape(12,9,6)
+        self.assertAlmostEqual(abs(rho-ref).max(), 0, 4)
+
+    def test_mep(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        dm = mf.make_rdm1()
+        cube = cubegen.mep(mol, ftmp.name, dm, 5, 4, 7)
+        mep = read_cube(ftmp.name, 5, 4, 7)
+        coords = cube.get_coords()
+        ref = []
+        for p in coords:
+            rp = mol.atom_coords() - p
+            vnuc = numpy.dot(mol.atom_charges(),
+                             1/numpy.einsum('xi,xi->x', rp, rp)**.5)
+            mol.set_rinv_origin(p)
+            ref.append(vnuc - numpy.einsum('ij,ij', mol.intor('int1e_rinv'), dm))
+        self.assertAlmostEqual(abs(mep.ravel()-ref).max(), 0, 5)
+
+
+if __name__ == "__main__":
+    print("Full Tests for cubegen")
+    unittest.main()
@@ -36,6 +36,39 @@ class KnowValues(unittest.TestCase):
         fcidump.from_integrals(tmpfcidump.name, h1, h2, h1.shape[0],
                                mol.nelectron, tol=1e-15)
 
+    def test_read(self):
+        tmpfcidump = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        h1 = reduce(numpy.dot, (mf.mo_coeff.T, mf.get_hcore(), mf.mo_coeff))
+        h2 = ao2mo.full(mf._eri, mf.mo_coeff)
+        nmo = h1.shape[0]
+        fcidump.from_integrals(tmpfcidump.name, h1, h2, nmo,
+                               mol.nelectron, nuc=mol.energy_nuc(), tol=1e-15)
+        result = fcidump.read(tmpfcidump.name)
+        self.assertEqual(result['NORB'], nmo)
+        self.assertAlmostEqual(result['ECORE'], mol.energy_nuc(), 12)
+        self.assertAlmostEqual(abs(numpy.tril(result['H1']-h1)).max(), 0, 12)
+        self.assertAlmostEqual(abs(result['H2']-ao2mo.restore(8, h2, nmo)).max(), 0, 12)
+
+    def test_binary(self):
+        tmpfcidump = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        tmpbin = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        tmpfcidump1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        h1 = reduce(numpy.dot, (mf.mo_coeff.T, mf.get_hcore(), mf.mo_coeff))
+        h2 = ao2mo.full(mf._eri, mf.mo_coeff)
+        nmo = h1.shape[0]
+        fcidump.from_integrals(tmpfcidump.name, h1, h2, nmo,
+                               mol.nelectron, nuc=mol.energy_nuc(), tol=1e-15)
+        fcidump.text_to_binary(tmpfcidump.name, tmpbin.name)
+        result = fcidump.read_binary(tmpbin.name)
+        self.assertAlmostEqual(abs(result['H1']-h1).max(), 0, 12)
+        self.assertAlmostEqual(abs(result['H2']-ao2mo.restore(8, h2, nmo)).max(), 0, 12)
+
+        fcidump.binary_to_text(tmpbin.name, tmpfcidump1.name)
+        result = fcidump.read(tmpfcidump1.name)
+        self.assertEqual(result['NELEC'], mol.nelectron)
+        self.assertAlmostEqual(result['ECORE'], mol.energy_nuc(), 12)
+        self.assertAlmostEqual(abs(result['H2']-ao2mo.restore(8, h2, nmo)).max(), 0, 12)
+
 if __name__ == "__main__":
     print("Full Tests for fcidump")
     unittest.main()